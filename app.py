@@ -9,11 +9,14 @@ from time import time
 import shutil                                                                   # import : pour la suppression de dossiers (clear cache)
 
 # Importer les classes de la logique métier (Le Cœur du RAG est dans main.py)
-from src.core.config import RAW_DIR                                             # from : importer la constante | src.core.config : configuration | RAW_DIR : chemin du dossier brut
+from src.core.config import RAW_DIR, DEFAULT_COLLECTION, WARMUP_QUERY_FILES, WARMUP_QPS # from : importer les constantes | src.core.config : configuration | RAW_DIR, DEFAULT_COLLECTION : chemin du dossier brut et collection par défaut | WARMUP_QUERY_FILES, WARMUP_QPS : préchauffage au démarrage
+from src.core.metrics import metrics                                            # from : importer le registre | src.core.metrics : métriques de performance affichées dans la barre latérale
 from src.core.schemas import GeneratedAnswer                                    # from : importer le schéma | src.core.schemas : notre objet réponse structurée
 from src.retrieval.cache import init_semantic_cache                             # from : importer le cache | src.retrieval.cache : fonction d'initialisation du cache
+from src.indexing.collection_registry import validate_collection_name           # from : importer la validation | src.indexing.collection_registry : noms de collections
 from main import VEVAgent                                                       # from : importer la classe de l'agent | main : fichier principal | VEVAgent : l'orchestrateur du RAG
 from clear_cache import clear_semantic_cache, clear_vector_db                   # from : importer les fonctions de nettoyage
+from warmup_cache import start_background_warmup                                # from : importer le préchauffage | warmup_cache : rejouer des questions dans ce processus
 
 # Étape 2 — Configuration de la page Streamlit
 st.set_page_config(page_title="VEV Agent", layout="wide")                       # st.set_page_config : configurer la page | page_title : titre onglet | layout="wide" : utilise toute la largeur
@@ -25,12 +28,14 @@ def initialize_agent() -> Optional[VEVAgent]:
     try:                                                                        # try : bloc de sécurité
         agent = VEVAgent()                                                      # agent : instance de l'agent (charge LLM, Embedder, LanceDB...)
         agent.cache = init_semantic_cache(embedder=agent.embedder)              # agent.cache : initialisation du cache GPTCache
+        if WARMUP_QUERY_FILES and agent.cache is not None:                      # if : préchauffage configuré
+            start_background_warmup(agent, WARMUP_QUERY_FILES, WARMUP_QPS)      # start_background_warmup : niveaux en mémoire (exact, résultats) remplis dans ce processus, sans bloquer le démarrage
         return agent                                                            # return : renvoyer l'agent prêt
     except RuntimeError:                                                        # except : si l'agent n'a pas pu démarrer (modèle LLM manquant)
         return None                                                             # return : renvoyer None
 
 # Étape 4 — Fonction pour gérer l'upload de documents locaux
-def handle_file_upload(agent: VEVAgent):                                        # def : définir la fonction | handle_file_upload : gestion de l'upload
+def handle_file_upload(agent: VEVAgent, collection: str):                       # def : définir la fonction | handle_file_upload : gestion de l'upload | collection : collection cible
     uploaded_file = st.sidebar.file_uploader(                                   # uploaded_file : objet fichier | st.sidebar.file_uploader : widget d'upload dans la barre latérale
         "Upload Document (Office, Web, Images, Audio, JSON...)",                # "Upload..." : label générique
         type=[                                                                  # type : liste exhaustive des extensions supportées
@@ -54,7 +59,7 @@ def handle_file_upload(agent: VEVAgent):
 
         with st.spinner(f"Indexing {uploaded_file.name}..."):                   # with st.spinner : afficher un spinner de chargement
             try:                                                                # try : tenter l'ingestion
-                agent.ingest_document(str(temp_path))                           # agent.ingest_document(...) : lancer le pipeline complet
+                agent.ingest_document(str(temp_path), collection=collection)    # agent.ingest_document(...) : lancer le pipeline complet dans la collection active
                 st.sidebar.success(f"Successfully indexed {uploaded_file.name}!") # st.sidebar.success : message de succès
             except Exception as e:                                              # except : si l'ingestion échoue
                 st.sidebar.error(f"Error during ingestion: {e}")                # st.sidebar.error : message d'erreur
@@ -86,9 +91,29 @@ if agent is None:
     st.error("FATAL ERROR: LLM Qwen model not loaded. Check if the GGUF file is in `models/llm/` and named correctly.") # st.error : message d'erreur critique
     st.stop()                                                                   # st.stop() : arrêter l'exécution Streamlit
 
+# --- Sidebar (Collection) ---
+st.sidebar.header("📚 Collection")                                               # st.sidebar.header : titre de la section collections
+if "collection_pending" in st.session_state:                                    # if : une collection vient d'être créée ou supprimée
+    st.session_state["collection"] = st.session_state.pop("collection_pending") # st.session_state["collection"] : sélectionner avant la création du widget
+collection = st.sidebar.selectbox("Collection active", agent.list_collections(), key="collection") # collection : collection interrogée et alimentée (une table LanceDB par équipe)
+
+with st.sidebar.expander("Gérer les collections"):                              # with st.sidebar.expander : bloc déroulant
+    new_collection = st.text_input("Nouvelle collection", key="new_collection") # new_collection : nom saisi
+    if st.button("➕ Créer", key="create_collection"):                           # if : bouton de création
+        try:                                                                    # try : nom potentiellement invalide
+            agent.get_store(new_collection)                                     # agent.get_store(...) : déclarer la collection et créer sa table
+            st.session_state["collection_pending"] = validate_collection_name(new_collection) # collection_pending : la sélectionner au prochain rendu
+            st.rerun()                                                          # st.rerun() : rafraîchir la liste
+        except ValueError as e:                                                 # except : nom refusé
+            st.error(f"❌ Erreur : {e}")                                         # st.error : message d'erreur
+    if collection != DEFAULT_COLLECTION and st.button(f"🗑️ Supprimer '{collection}'", key="drop_collection"): # if : suppression de la collection active (sauf défaut)
+        agent.drop_collection(collection)                                       # agent.drop_collection(...) : table + cache de la collection uniquement
+        st.session_state["collection_pending"] = DEFAULT_COLLECTION             # collection_pending : revenir à la collection par défaut
+        st.rerun()                                                              # st.rerun() : rafraîchir la liste
+
 # --- Sidebar (Ingestion) ---
 st.sidebar.header("📁 Ingestion & Indexation")                                  # st.sidebar.header : titre de la barre latérale
-handle_file_upload(agent)                                                       # handle_file_upload : afficher l'upload de fichier
+handle_file_upload(agent, collection)                                           # handle_file_upload : afficher l'upload de fichier (collection active)
 
 # Ingestion URL manuelle
 with st.sidebar.expander("Indexer une URL"):                                    # with st.sidebar.expander : créer un bloc déroulant
@@ -96,12 +121,34 @@ with st.sidebar.expander("Indexer une URL"):
     if st.button("Indexer URL"):                                                # if : bouton d'indexation
         if url_to_ingest.startswith("http"):                                    # if : vérification du format (doit commencer par http)
             with st.spinner(f"Indexing {url_to_ingest}..."):                    # with st.spinner : spinner de chargement
-                agent.ingest_document(url_to_ingest)                            # agent.ingest_document(...) : ingestion web
+                agent.ingest_document(url_to_ingest, collection=collection)     # agent.ingest_document(...) : ingestion web dans la collection active
                 st.success(f"URL successfully indexed: {url_to_ingest}")        # st.success : message de succès
         else:                                                                   # else : si le format n'est pas bon
             st.warning("Veuillez entrer une URL valide (commençant par http).") # st.warning : avertissement
 
-st.sidebar.markdown(f"**Status:** LanceDB contains {agent.vector_store.table.count_rows()} chunks.") # st.sidebar.markdown : afficher le nombre de chunks
+st.sidebar.markdown(f"**Status:** LanceDB collection '{collection}' contains {agent.get_store(collection).count_rows()} chunks.") # st.sidebar.markdown : afficher le nombre de chunks de la collection active
+
+# Gestion par document (suppression / réindexation sans vider toute la base)
+with st.sidebar.expander("Gérer les documents indexés"):                        # with st.sidebar.expander : bloc déroulant
+    indexed_sources = agent.get_store(collection).list_sources()                # indexed_sources : sources présentes dans la collection active
+    if not indexed_sources:                                                     # if : base vide
+        st.write("Aucun document indexé.")                                      # st.write : message informatif
+    else:                                                                       # else : au moins un document
+        selected_source = st.selectbox("Document", indexed_sources, key="source_select") # selected_source : document choisi
+        col_reindex, col_delete = st.columns(2)                                 # col_reindex, col_delete : deux boutons côte à côte
+        with col_reindex:                                                       # with : colonne de gauche
+            if st.button("🔄 Réindexer", key="reindex_source", use_container_width=True): # if : bouton de réindexation (upsert)
+                with st.spinner(f"Re-indexing {selected_source}..."):           # with st.spinner : spinner de chargement
+                    try:                                                        # try : tenter la réindexation
+                        agent.ingest_document(selected_source, collection=collection) # agent.ingest_document(...) : upsert par id déterministe
+                        st.success("✅ Document réindexé !")                     # st.success : message de succès
+                    except Exception as e:                                      # except : fichier disparu, URL injoignable...
+                        st.error(f"❌ Erreur : {e}")                             # st.error : message d'erreur
+        with col_delete:                                                        # with : colonne de droite
+            if st.button("🗑️ Supprimer", key="delete_source", use_container_width=True): # if : bouton de suppression
+                deleted = agent.delete_document(selected_source, collection=collection) # deleted : nombre de chunks supprimés
+                st.success(f"✅ {deleted} chunks supprimés.")                    # st.success : confirmation
+                st.rerun()                                                      # st.rerun() : rafraîchir la liste des documents
 
 # --- Clear Cache Section ---
 st.sidebar.markdown("---")
@@ -153,6 +200,9 @@ with st.sidebar.expander("Vider les Caches"):
         except Exception as e:
             st.error(f"❌ Erreur : {e}")
 
+# --- Métriques de performance ---
+with st.sidebar.expander("📈 Métriques du pipeline"):                            # with st.sidebar.expander : bloc déroulant
+    st.json(metrics.snapshot())                                                 # st.json : compteurs (HyDE évité / généré / en cache...) et coûts (secondes, tokens)
 # --- Chat Principal (Recherche) ---
 query = st.chat_input("Posez votre question à VEV Agent...")                    # query : champ de saisie du chat
 
@@ -163,15 +213,14 @@ if query:
     try:                                                                        # try : bloc de sécurité
         start_time_total = time()                                               # start_time_total : enregistrer le temps total
         
-        # Le pipeline d'appel : Cache -> HyDE -> LanceDB -> Rerank -> Qwen
-        response = agent.ask_query(query)                                       # response : appel à la fonction principale RAG
-        
-        end_time_total = time()                                                 # end_time_total : temps final
-        
         # Affichage de la réponse LLM
         with st.chat_message("assistant"):                                      # with st.chat_message("assistant") : bulle de réponse
-            st.info(response.answer)                                            # st.info : afficher la réponse générée par Qwen
-            
+            # Le pipeline d'appel : Cache -> HyDE -> LanceDB -> Rerank -> Qwen, la réponse s'affiche token par token
+            stream = agent.ask_query_stream(query, collection=collection)       # stream : appel à la fonction principale RAG (collection active), en streaming
+            st.write_stream(stream)                                             # st.write_stream : afficher la réponse de Qwen au fil du décodage
+            response = stream.answer                                            # response : réponse structurée, disponible une fois le flux terminé
+            end_time_total = time()                                             # end_time_total : temps final
+
             # Affichage des temps et statut
             st.caption(f"Process Time: {end_time_total - start_time_total:.2f}s | Status: Complete") # st.caption : afficher le temps de réponse
             
@@ -1,51 +1,115 @@
 # Objectif — Ce script gère l'orchestration du pipeline (Ingestion, Recherche, Génération) et définit la classe Agent.
 
 # Étape 1 — Importer les dépendances du système et du pipeline
+import json                                                                     # import : charger le module standard | json : affichage des métriques (CLI)
 import logging                                                                  # import : charger le module standard | logging : gestion des journaux d'événements
+import threading                                                                # import : charger le module standard | threading : événement d'arrêt de la génération HyDE
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError # from : importer depuis concurrent.futures | ThreadPoolExecutor : étapes concurrentes du pipeline | FutureTimeoutError : échéance HyDE dépassée
 from pathlib import Path                                                        # from : importer depuis un package | pathlib : gestion moderne des chemins | Path : classe objet chemin
 from time import time                                                           # from : importer depuis le module temps | time : fonction pour mesurer la durée d'exécution
-from typing import List                                                         # from : importer depuis le typage | typing : module types | List : type liste générique
+from typing import Callable, Dict, Iterator, List, Optional, Tuple              # from : importer depuis le typage | typing : module types | Callable, Dict, Iterator, List, Optional, Tuple : types génériques
 
 # Importer toutes les classes et Singletons du projet
-from src.core.config import RAW_DIR, RERANK_TOP_K                               # from : importer les constantes | src.core.config : configuration | RAW_DIR, RERANK_TOP_K : chemin du dossier brut et taille finale
+from src.core.config import RAW_DIR, RERANK_TOP_K, DEFAULT_COLLECTION, HYDE_DEADLINE_SECONDS, PIPELINE_WORKERS, QUERY_EXPANSION_MODE, LLM_CONTEXT_WINDOW, LLM_MAX_TOKENS, CONTEXT_TOKEN_BUDGET, NEIGHBOR_WINDOW # from : importer les constantes | src.core.config : configuration | HYDE_DEADLINE_SECONDS, PIPELINE_WORKERS : pipeline concurrent | QUERY_EXPANSION_MODE : HyDE ou multi-requêtes | LLM_CONTEXT_WINDOW, LLM_MAX_TOKENS, CONTEXT_TOKEN_BUDGET : budget du contexte
+from src.core.metrics import metrics                                            # from : importer le registre | src.core.metrics : métriques de performance (commande "metrics")
 from src.core.schemas import Chunk, GeneratedAnswer, SearchResult               # from : importer les schémas | src.core.schemas : nos structures de données
-from src.generation.llm_engine import llm_engine                                # from : importer le moteur LLM | src.generation.llm_engine : notre instance globale de Qwen (doit être chargée)
+from src.generation.context_packer import CHAT_TEMPLATE_TOKENS, CONTEXT_SEPARATOR, ContextPacker # from : importer le packer | src.generation.context_packer : contexte borné en tokens
+from src.generation.system_prompts import LLM_SYSTEM_PROMPT, RAG_FINAL_TEMPLATE # from : importer les prompts | src.generation.system_prompts : rôle de l'agent (message système) et prompt final
+from src.generation.llm_engine import LLMGenerationError                        # from : importer l'erreur | src.generation.llm_engine : génération impossible (modèle, llama.cpp, file pleine)
+from src.generation.llm_pool import llm_pool                                    # from : importer le pool LLM | src.generation.llm_pool : nos instances globales de Qwen (la première doit être chargée)
 from src.indexing.embedder import embedder                                      # from : importer l'embedder | src.indexing.embedder : notre instance FastEmbedder
 from src.indexing.chunker import SemanticChunker                                # from : importer le chunker | src.indexing.chunker : outil de découpage intelligent
+from src.indexing.collection_registry import validate_collection_name           # from : importer la validation | src.indexing.collection_registry : noms de collections
 from src.indexing.vector_store import VectorStore                               # from : importer la DB | src.indexing.vector_store : notre classe LanceDB
 from src.ingestion.loader_doc import load_document                              # from : importer l'ingestion | src.ingestion.loader_doc : fonction pour PDF/DOCX
 from src.ingestion.loader_web import load_url                                   # from : importer l'ingestion | src.ingestion.loader_web : fonction pour URL
-from src.retrieval.cache import init_semantic_cache                             # from : importer le cache | src.retrieval.cache : fonction d'initialisation du cache
+from src.retrieval.cache import LanceSemanticCache, drop_semantic_cache, init_semantic_cache # from : importer le cache | src.retrieval.cache : classe, suppression et initialisation du cache
+from src.retrieval.fusion import reciprocal_rank_fusion                         # from : importer la fusion | src.retrieval.fusion : RRF des variantes (mode multi-requêtes)
 from src.retrieval.query_expansion import QueryExpander                         # from : importer l'expander | src.retrieval.query_expansion : outil HyDE
 from src.retrieval.reranker import Reranker                                     # from : importer le reranker | src.retrieval.reranker : outil MXBai
+from src.retrieval.result_cache import RetrievalResultCache                     # from : importer le cache | src.retrieval.result_cache : contexte reranqué des questions voisines
 
 # Étape 2 — Configurer le logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s') # logging.basicConfig(...) : configuration de base | level : niveau d'affichage | format : format du message
 logger = logging.getLogger(__name__)                                            # logger : objet enregistreur
 
+# Étape 2 bis — Flux de réponse (streaming)
+class AnswerStream:                                                             # class : définir une classe | AnswerStream : morceaux de la réponse, puis réponse structurée
+    """Itérable des morceaux de texte de la réponse (st.write_stream, CLI) ; `answer` contient le GeneratedAnswer une fois le flux terminé."""
+
+    def __init__(self):                                                         # def : constructeur
+        self.pieces: Iterator[str] = iter(())                                   # self.pieces : générateur des morceaux (fourni par ask_query_stream)
+        self.answer: Optional[GeneratedAnswer] = None                           # self.answer : None tant que le flux n'est pas consommé
+
+    def __iter__(self) -> Iterator[str]:                                        # def : méthode spéciale | __iter__ : itérer sur les morceaux
+        return self.pieces                                                      # return : générateur (consommable une seule fois)
+
 # Étape 3 — Définir la classe de l'agent VEV RAG (Le Cerveau)
 class VEVAgent:                                                                 # class : définir une classe | VEVAgent : l'objet principal qui orchestre le RAG
 
     # Étape 3.1 — Constructeur (Initialisation de tous les outils)
     def __init__(self):                                                         # def : constructeur | self : instance
-        if llm_engine is None or embedder is None:                              # if : condition de vérification critique | llm_engine : moteur Qwen | or : ou | embedder : FastEmbedder
+        if llm_pool is None or embedder is None:                                # if : condition de vérification critique | llm_pool : instances de Qwen | or : ou | embedder : FastEmbedder
             logger.critical("Initialization failed: LLM or Embedder is missing. Check logs for details.") # logger.critical : message d'erreur fatal
             raise RuntimeError("Cannot start VEV Agent without core models.")   # raise : lever une erreur pour stopper l'exécution
 
         logger.info("Initializing RAG components...")                           # logger.info : début de l'initialisation
         self.embedder = embedder                                                # self.embedder : stocker l'embedder FastEmbedder
-        self.llm = llm_engine                                                   # self.llm : stocker le moteur Qwen
+        self.llm = llm_pool                                                     # self.llm : stocker le pool Qwen (même interface que le moteur, file d'attente partagée par les sessions)
         self.vector_store = VectorStore(embedder=self.embedder)                 # self.vector_store : stocker LanceDB (initialisé avec l'embedder)
+        self.stores: Dict[str, VectorStore] = {DEFAULT_COLLECTION: self.vector_store} # self.stores : une VectorStore par collection (ouverte à la demande)
         self.chunker = SemanticChunker(embedder=self.embedder)                  # self.chunker : stocker le SemanticChunker
         self.query_expander = QueryExpander(llm_engine=self.llm)                # self.query_expander : stocker l'outil HyDE
         self.reranker = Reranker()                                              # self.reranker : stocker le Reranker MXBai
+        self.context_packer = ContextPacker(count_tokens=lambda text: self.llm.count_tokens(text)) # self.context_packer : contexte du prompt final borné en tokens (tokenizer du GGUF)
         self.cache = None                                                       # self.cache : initialisé à None ici, puis chargé par app.py
+        self.caches: Dict[str, LanceSemanticCache] = {}                         # self.caches : caches sémantiques des autres collections (créés à la demande si self.cache est actif)
+        self.retrieval_cache = RetrievalResultCache()                           # self.retrieval_cache : contexte reranqué des questions récentes (toutes collections, clé = collection + vecteur)
+        self.pipeline_pool = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="vev-pipeline") # self.pipeline_pool : threads des étapes concurrentes de ask_query (cache, recherche, HyDE)
         logger.info("VEV Agent core initialized.")                              # logger.info : message de succès
 
+    # Étape 3.1 bis — Routage par collection (une table LanceDB et un cache par équipe)
+    def get_store(self, collection: Optional[str] = None) -> VectorStore:       # def : définir la méthode | get_store : VectorStore d'une collection | -> : retour | VectorStore
+        """Retourne (et ouvre si besoin) la VectorStore de la collection."""
+        name = validate_collection_name(collection or DEFAULT_COLLECTION)       # name : nom validé (défaut si absent)
+        if name not in self.stores:                                             # if : collection pas encore ouverte
+            self.stores[name] = VectorStore(embedder=self.embedder, collection=name) # self.stores[name] : ouvrir / créer sa table
+        return self.stores[name]                                                # return : la VectorStore de la collection
+
+    def get_cache(self, collection: Optional[str] = None) -> Optional[LanceSemanticCache]: # def : définir la méthode | get_cache : cache sémantique d'une collection | -> : retour | Optional[LanceSemanticCache]
+        """Retourne le cache de la collection (None si le cache est désactivé)."""
+        name = validate_collection_name(collection or DEFAULT_COLLECTION)       # name : nom validé
+        if name == DEFAULT_COLLECTION or self.cache is None:                    # if : collection par défaut, ou cache désactivé (app.py ne l'a pas chargé)
+            return self.cache                                                   # return : cache par défaut (ou None)
+        if name not in self.caches:                                             # if : cache de cette collection pas encore ouvert
+            self.caches[name] = init_semantic_cache(embedder=self.embedder, collection=name) # self.caches[name] : table semantic_cache_<collection>
+        return self.caches[name]                                                # return : cache de la collection
+
+    def list_collections(self) -> List[str]:                                    # def : définir la méthode | list_collections : noms des collections | -> : retour | List[str]
+        """Retourne les collections déclarées dans le registre."""
+        return self.vector_store.registry.names()                               # return : noms triés
+
+    def drop_collection(self, collection: str):                                 # def : définir la méthode | drop_collection : supprimer une collection entière
+        """Supprime la table et le cache d'une collection sans toucher aux autres."""
+        name = validate_collection_name(collection)                             # name : nom validé
+        if name == DEFAULT_COLLECTION:                                          # if : la collection par défaut se vide avec clear_cache.py
+            raise ValueError("The default collection cannot be dropped (use clear_cache.py --vector).") # raise : refuser
+        store = self.stores.pop(name, None)                                     # store : VectorStore ouverte de la collection (None si jamais ouverte)
+        if store is not None:                                                   # if : collection ouverte dans ce processus
+            store.close()                                                       # close : tampons abandonnés, aucune minuterie ne réessaiera d'écrire dans la table supprimée
+        self.vector_store.drop_collection(name)                                 # drop_collection(...) : supprimer la table de chaque shard et l'enregistrement
+        cache = self.caches.pop(name, None)                                     # cache : cache déjà ouvert de la collection
+        if cache is not None:                                                   # if : cache ouvert
+            cache.drop()                                                        # cache.drop() : supprimer sa table (et son niveau exact)
+        else:                                                                   # else : jamais ouvert dans ce processus
+            drop_semantic_cache(name)                                           # drop_semantic_cache : supprimer la table seulement si elle existe (pas de création pour rien)
+        self.retrieval_cache.clear(name)                                        # clear : oublier les résultats de la collection
+
     # Étape 3.2 — Méthode du Pipeline d'Ingestion
-    def ingest_document(self, path_or_url: str):                                # def : définir la méthode | ingest_document : charge et indexe un document
+    def ingest_document(self, path_or_url: str, flush: bool = True, collection: Optional[str] = None): # def : définir la méthode | ingest_document : charge et indexe un document | flush : écrire le tampon Arrow à la fin (False pour l'ingestion en masse) | collection : collection cible (défaut si None)
         """Pipeline complet : Charger -> Nettoyer -> Chunker -> Indexer."""
         start_time = time()                                                     # start_time : enregistrer le temps de début
+        store = self.get_store(collection)                                      # store : VectorStore de la collection cible
 
         # 1. Chargement de la source
         if path_or_url.startswith("http"):                                      # if : si le chemin commence par "http" (c'est une URL)
@@ -60,69 +124,208 @@ class VEVAgent:
             logger.error("No valid chunks created after processing.")           # logger.error : message d'échec
             return                                                              # return : sortir de la fonction
 
-        # 3. Indexation dans LanceDB (l'embedding est calculé ici)
-        self.vector_store.add_chunks(chunks)                                    # self.vector_store.add_chunks(...) : ajout à la DB (calcule les embeddings FastEmbed ici)
+        # 3. Indexation dans LanceDB (l'embedding est calculé ici) - Document déjà connu : upsert par id déterministe au lieu de tout reconstruire
+        source = metadata.source_path                                           # source : chemin absolu ou URL (clé de la source)
+        if store.has_source(source):                                            # if : réindexation d'un document existant
+            store.upsert_chunks(chunks)                                         # store.upsert_chunks(...) : merge_insert (mise à jour + suppression des chunks disparus)
+            self._invalidate_source(source, collection)                         # _invalidate_source : scores de reranking et réponses en cache périmés (texte des chunks changé)
+        else:                                                                   # else : nouveau document
+            store.add_chunks(chunks)                                            # store.add_chunks(...) : ajout à la DB (calcule les embeddings FastEmbed ici)
+            if flush:                                                           # if : ingestion unitaire (UI) -> le document doit être interrogeable tout de suite
+                store.flush()                                                   # store.flush() : écrire le tampon Arrow en un seul fragment
         
         end_time = time()                                                       # end_time : enregistrer le temps de fin
         logger.info(f"Ingestion successful ({len(chunks)} chunks). Time: {end_time - start_time:.2f}s") # logger.info : succès avec la durée
 
-    # Étape 3.3 — Méthode du Pipeline de Recherche (RAG)
-    def ask_query(self, query: str) -> GeneratedAnswer:                         # def : définir la méthode | ask_query : exécute la recherche et la génération | -> : retour | GeneratedAnswer : objet réponse structurée
-        """Pipeline complet : Cache -> HyDE -> Recherche -> Rerank -> Génération LLM."""
-        start_time = time()                                                     # start_time : enregistrer le temps de début
+    # Étape 3.2 bis — Suppression d'un document (sans vider toute la base)
+    def delete_document(self, path_or_url: str, collection: Optional[str] = None) -> int: # def : définir la méthode | delete_document : retire une source de l'index | collection : collection concernée | -> : retour | int : chunks supprimés
+        """Supprime tous les chunks d'une source (chemin local ou URL)."""
+        source = path_or_url if path_or_url.startswith("http") else str(Path(path_or_url).absolute()) # source : même normalisation que les loaders (chemin absolu)
+        deleted = self.get_store(collection).delete_source(source)              # deleted : nombre de chunks supprimés
+        self._invalidate_source(source, collection)                             # _invalidate_source : oublier les scores de reranking et les réponses construites sur la source
+        return deleted                                                          # return : nombre de chunks supprimés
+
+    def _invalidate_source(self, source: str, collection: Optional[str] = None): # def : méthode privée | _invalidate_source : purger les caches dérivés d'une source | collection : collection du document
+        """Retire des caches les données calculées sur les chunks d'une source supprimée ou réindexée."""
+        dropped = self.reranker.score_cache.invalidate_source(source)           # dropped : scores de reranking retirés
+        cache = self.get_cache(collection)                                      # cache : cache sémantique de la collection
+        invalidated = cache.invalidate_source(source) if cache else 0           # invalidated : réponses qui citaient la source (les autres restent en cache)
+        logger.info(f"Invalidated {dropped} cached rerank scores and {invalidated} cached answers for {source}") # logger.info : suivi
+
+    # Étape 3.2 ter — Recherche HyDE (exécutée dans un thread du pipeline)
+    def _hyde_search(self, query: str, store: VectorStore, stop_event: threading.Event) -> List[SearchResult]: # def : méthode privée | _hyde_search : générer le document hypothétique puis chercher avec | stop_event : interruption à l'échéance | -> : retour | List[SearchResult]
+        """Génère (ou relit du cache) le document HyDE et lance la recherche correspondante."""
+        document = self.query_expander.hypothetical_document(query, stop_event=stop_event) # document : document hypothétique (None si échec / interruption)
+        if not document:                                                        # if : pas de document
+            return []                                                           # return : aucun candidat supplémentaire
+        return store.search(document, top_k=RERANK_TOP_K * 2)                   # return : candidats trouvés avec le document hypothétique
+
+    def _multi_query_candidates(self, query: str, store: VectorStore, first_pass: List[SearchResult]) -> List[SearchResult]: # def : méthode privée | _multi_query_candidates : reformulations -> recherches -> fusion RRF | first_pass : résultats de la requête originale | -> : retour | candidats pour le Reranker
+        """Reformule la question (un appel LLM), encode les variantes en un lot, puis fusionne par RRF toutes les jambes de toutes les variantes."""
+        variants = self.query_expander.paraphrase_queries(query)                # variants : reformulations courtes (cache LRU par requête normalisée)
+        if not variants:                                                        # if : LLM indisponible ou sortie vide
+            return first_pass                                                   # return : première recherche inchangée
+        with metrics.timer("multi_query.search_seconds"):                       # with : coût encodage + recherches + fusion
+            vectors = self.embedder.embed_queries(variants)                     # vectors : un seul lot FastEmbed pour toutes les variantes
+            legs_per_variant = list(self.pipeline_pool.map(lambda args: store.search_legs(args[0], RERANK_TOP_K, query_vector=args[1]), zip(variants, vectors))) # legs_per_variant : [vectoriel, mots-clés] de chaque variante, en parallèle
+            legs = [leg for variant_legs in legs_per_variant for leg in variant_legs] # legs : toutes les jambes à plat
+            fused_ids, _ = reciprocal_rank_fusion(                              # fused_ids : ids triés par score RRF
+                [[r.chunk.id for r in first_pass]] + [[row['id'] for row in leg] for leg in legs], # listes : requête originale (déjà hybride) puis chaque jambe
+                weights=[2.0] + [1.0] * len(legs),                              # weights : la requête originale compte pour ses deux jambes
+            )
+        pool_ids = fused_ids[:RERANK_TOP_K * 2]                                 # pool_ids : même taille de pool qu'une recherche simple -> coût du Reranker inchangé
+        known = {r.chunk.id: r for r in first_pass}                             # known : candidats déjà formatés
+        rows = {row['id']: row for leg in legs for row in leg if row['id'] not in known} # rows : lignes brutes des nouveaux candidats
+        formatted = {r.chunk.id: r for r in store.format_results([rows[doc_id] for doc_id in pool_ids if doc_id in rows])} # formatted : nouveaux candidats convertis en SearchResult
+        metrics.observe("multi_query.new_candidates", len(formatted))           # metrics.observe : apport des reformulations
+        logger.info(f"Multi-query expansion: {len(variants)} variants, {len(legs)} ranked lists fused, {len(formatted)} new candidates.") # logger.info : bilan
+        return [known.get(doc_id) or formatted[doc_id] for doc_id in pool_ids]  # return : pool ordonné par RRF
+    # Étape 3.2 quater — Prompt final (RAG)
+    def _build_rag_prompt(self, query: str, context_str: str) -> str:           # def : méthode privée | _build_rag_prompt : instructions + contexte + question | -> : retour | str
+        return RAG_FINAL_TEMPLATE.format(context=context_str, query=query)      # return : message utilisateur (le rôle de l'agent est le message système commun, LLM_SYSTEM_PROMPT)
 
-        # 1. Vérification du Cache Sémantique (Accélérateur)
-        if self.cache:                                                          # if : si le cache est actif (doit être mis à jour par app.py)
-            cached_answer = self.cache.lookup(query)                            # cached_answer : essayer de trouver la réponse avec lookup() (LanceDB)
-            if cached_answer:                                                   # if : si une réponse est trouvée
+    # Étape 3.2 quinquies — Recherche, expansion et reranking (sautés si le cache des résultats répond)
+    def _retrieve(self, query: str, store: VectorStore, query_vector, search_future) -> List[SearchResult]: # def : méthode privée | _retrieve : contexte reranqué de la question | query_vector : vecteur de la question | search_future : première recherche déjà lancée | -> : retour | List[SearchResult]
+        """Première recherche -> (Rerank || HyDE si nécessaire) -> Fusion ; retourne les RERANK_TOP_K meilleurs chunks."""
+        # 1. Première recherche avec la requête originale (sert aussi à juger si HyDE est utile)
+        first_pass: List[SearchResult] = search_future.result()                 # first_pass : résultats de LanceDB pour la question
+
+        # 2. Expansion adaptative - HyDE EN ARRIÈRE-PLAN (le LLM écrit le document hypothétique pendant le reranking), ou reformulations fusionnées par RRF avant le reranking
+        hyde_future, hyde_stop, hyde_started = None, threading.Event(), time()  # hyde_future : recherche HyDE différée | hyde_stop : arrêt de la génération à l'échéance | hyde_started : départ de l'échéance
+        if self.query_expander.should_expand(first_pass):                       # if : première recherche peu sûre
+            if QUERY_EXPANSION_MODE == "multi_query":                           # if : mode multi-requêtes (reformulations courtes au lieu du document HyDE)
+                first_pass = self._multi_query_candidates(query, store, first_pass) # first_pass : candidats fusionnés par RRF (même taille, meilleur ordre)
+            else:                                                               # else : mode HyDE (défaut)
+                hyde_future = self.pipeline_pool.submit(self._hyde_search, query, store, hyde_stop) # submit : génération + recherche du document HyDE
+
+        # 3. Reranking (Raffinement) de la première recherche, sans attendre HyDE
+        scored = self.reranker.rerank(query, first_pass, top_k=len(first_pass), query_vector=query_vector) # scored : tous les candidats notés par le CrossEncoder
+
+        # 4. Fusion des résultats HyDE s'ils arrivent avant l'échéance, sinon réponse avec la première recherche seule
+        if hyde_future is not None:                                             # if : HyDE lancé
+            try:                                                                # try : attendre le reste de l'échéance
+                hyde_results = hyde_future.result(timeout=max(0.0, HYDE_DEADLINE_SECONDS - (time() - hyde_started))) # hyde_results : candidats trouvés avec le document hypothétique
+            except FutureTimeoutError:                                          # except : échéance dépassée
+                hyde_stop.set()                                                 # set() : interrompre la génération (libère le LLM pour la réponse finale)
+                metrics.incr("hyde.deadline_missed")                            # metrics.incr : HyDE abandonné
+                logger.warning(f"HyDE missed its {HYDE_DEADLINE_SECONDS}s deadline, answering from the original query only.") # logger.warning : repli
+                hyde_results = []                                               # hyde_results : aucun candidat supplémentaire
+            except Exception as e:                                              # except : échec de la recherche HyDE (embedding, LanceDB...)
+                metrics.incr("hyde.failures")                                   # metrics.incr : échec
+                logger.error(f"HyDE search failed, answering from the original query only: {e}") # logger.error : repli
+                hyde_results = []                                               # hyde_results : aucun candidat supplémentaire
+            seen = {r.chunk.id for r in scored}                                 # seen : chunks déjà notés
+            new_results = list({r.chunk.id: r for r in hyde_results if r.chunk.id not in seen}.values()) # new_results : nouveaux candidats seulement (dédupliqués par ID)
+            if new_results:                                                     # if : HyDE apporte des chunks inédits
+                scored += self.reranker.rerank(query, new_results, top_k=len(new_results), query_vector=query_vector) # scored : notés avec la même requête -> scores comparables
+
+        final_context = sorted(scored, key=lambda r: r.score, reverse=True)[:RERANK_TOP_K] # final_context : les 5 meilleurs documents (RERANK_TOP_K)
+        for i, result in enumerate(final_context):                              # for : rangs après fusion
+            result.rank = i + 1                                                 # result.rank : 1, 2, 3...
+        return final_context                                                    # return : contexte reranqué
+
+    # Étape 3.3 — Méthode du Pipeline de Recherche (RAG), commune à la réponse complète et au streaming
+    def _prepare_answer(self, query: str, collection: Optional[str], start_time: float) -> Tuple[Optional[GeneratedAnswer], str, Callable[[str], GeneratedAnswer]]: # def : méthode privée | _prepare_answer : tout le pipeline sauf la génération | start_time : début de la requête | -> : retour | (réponse immédiate ou None, prompt final, finish(texte) -> GeneratedAnswer)
+        """Pipeline : (Cache || Recherche) -> (Rerank || HyDE si nécessaire) -> Fusion -> Prompt ; le cache des résultats saute recherche, HyDE et rerank."""
+        store = self.get_store(collection)                                      # store : VectorStore de la collection interrogée (table plus petite = recherche plus rapide)
+        cache = self.get_cache(collection)                                      # cache : cache sémantique de la collection
+
+        # 1. Vérification du Cache Sémantique (Accélérateur) et première recherche EN PARALLÈLE - la recherche est perdue en cas de hit, mais le miss ne paie plus les deux étapes l'une après l'autre
+        cache_future = self.pipeline_pool.submit(cache.lookup, query) if cache else None # cache_future : lookup() (LanceDB) dans un thread du pipeline
+        corpus_version = store.corpus_version                                   # corpus_version : version interrogée (lue avant la recherche, enregistrée avec la réponse et les résultats)
+        query_vector = self.embedder.embed_query(query)                         # query_vector : encodé une fois (recherche + étage cosinus de la cascade)
+        cached_results = self.retrieval_cache.lookup(store.collection, query_vector, corpus_version) # cached_results : chunks reranqués d'une question voisine (un GEMV en mémoire)
+        search_future = self.pipeline_pool.submit(store.search, query, RERANK_TOP_K * 2, query_vector) if cached_results is None else None # search_future : recherche hybride de la requête originale | top_k * 2 : on prend 2x plus pour le Reranker | None : contexte déjà en cache
+        if cache_future:                                                        # if : si le cache est actif (doit être mis à jour par app.py)
+            cached = cache_future.result()                                      # cached : essayer de trouver la réponse avec lookup() (LanceDB)
+            if cached:                                                          # if : si une réponse est trouvée
                 logger.info("Cache hit! Returning cached answer.")              # logger.info : succès du cache
-                return GeneratedAnswer(query=query, answer=cached_answer, sources=[], processing_time=time() - start_time) # return : renvoyer la réponse du cache immédiatement
+                sources = store.fetch_results(cached["chunk_ids"], cached["scores"]) # sources : chunks du contexte d'origine, relus par id
+                return GeneratedAnswer(query=query, answer=cached["answer"], sources=sources, processing_time=time() - start_time), "", None # return : renvoyer la réponse du cache immédiatement
 
-        # 2. Transformation de Requête (HyDE)
-        queries_to_search = self.query_expander.expand_query(query)             # queries_to_search : requête originale + document HyDE généré
-        
-        # 3. Recherche Hybride (LanceDB)
-        all_results: List[SearchResult] = []                                    # all_results : liste pour stocker tous les résultats
-        for q in queries_to_search:                                             # for : boucle sur chaque requête (originale + HyDE)
-            results = self.vector_store.search(q, top_k=RERANK_TOP_K * 2)       # results : résultats de LanceDB | top_k * 2 : on prend 2x plus pour le Reranker
-            all_results.extend(results)                                         # all_results.extend(...) : ajouter à la liste principale
-
-        # 4. Reranking (Raffinement)
-        unique_results = list({r.chunk.id: r for r in all_results}.values())    # unique_results : astuce pour dédupliquer les chunks par leur ID
-        
-        final_context = self.reranker.rerank(query, unique_results)             # final_context : les 5 meilleurs documents (RERANK_TOP_K)
+        # 2. Contexte reranqué d'une question voisine (cache des résultats), sinon recherche + expansion + reranking
+        final_context = store.fetch_results(*cached_results) if cached_results else [] # final_context : chunks relus par id, scores du reranker mémorisés
+        if final_context:                                                       # if : question proche d'une question déjà traitée sur ce corpus
+            logger.info("Retrieval cache hit! Skipping search, HyDE and reranking.") # logger.info : succès du cache des résultats
+            for i, result in enumerate(final_context):                          # for : rangs d'origine
+                result.rank = i + 1                                             # result.rank : 1, 2, 3...
+        else:                                                                   # else : pipeline de recherche complet
+            search_future = search_future or self.pipeline_pool.submit(store.search, query, RERANK_TOP_K * 2, query_vector) # search_future : chunks en cache disparus entre-temps -> recherche
+            final_context = self._retrieve(query, store, query_vector, search_future) # final_context : les RERANK_TOP_K meilleurs chunks
+            self.retrieval_cache.put(store.collection, query_vector, final_context, corpus_version) # put : une reformulation réutilisera ce contexte
 
         if not final_context:                                                   # if : si aucun document pertinent n'a été trouvé
             answer = "Je n'ai pas trouvé d'information pertinente dans les documents indexés pour répondre à cette question." # answer : message d'échec
-            return GeneratedAnswer(query=query, answer=answer, sources=[], processing_time=time() - start_time) # return : réponse simple
-
-        # 5. Préparation du Contexte LLM
-        context_texts = [res.chunk.text for res in final_context]               # context_texts : extraire le texte des 5 meilleurs chunks
-        context_str = "\n---\n".join(context_texts)                             # context_str : fusionner les textes avec un séparateur
-
-        # 6. Génération Finale (RAG)
-        rag_prompt = (                                                          # rag_prompt : le prompt final envoyé à Qwen
-            "Tu es VEV Agent, un assistant expert en documentation. Utilise UNIQUEMENT le contexte fourni ci-dessous pour répondre à la question.\n" # Rôle et instruction stricte (Nouveau Nom Agent)
-            "Contexte:\n"
-            f"===\n{context_str}\n===\n"                                        # Contexte fusionné
-            f"Question: {query}\n"                                              # Question de l'utilisateur
-            "Réponse détaillée:"                                                # Instruction de début de réponse
-        )
-
-        final_answer = self.llm.generate(prompt=rag_prompt)                     # final_answer : appel au moteur Qwen
-        
-        # 7. Mise en Cache de la réponse
-        if self.cache:                                                          # if : si le cache est actif
-            self.cache.store(query, final_answer)                               # self.cache.store(...) : enregistrer la question/réponse (LanceDB)
-
-        # 8. Renvoyer la réponse structurée
-        end_time = time()                                                       # temps final
-        return GeneratedAnswer(                                                 # return : objet réponse complet
-            query=query,
-            answer=final_answer,
-            sources=final_context,
-            processing_time=end_time - start_time
-        )
+            return GeneratedAnswer(query=query, answer=answer, sources=[], processing_time=time() - start_time), "", None # return : réponse simple
+
+        # 3. Préparation du Contexte LLM - budget de tokens : ce qui reste de la fenêtre après les instructions, la question et la réponse (LLM_MAX_TOKENS)
+        overhead = self.llm.count_tokens(self._build_rag_prompt(query, "")) + self.llm.count_tokens(LLM_SYSTEM_PROMPT) + CHAT_TEMPLATE_TOKENS # overhead : prompt sans contexte + message système + balises du chat
+        budget = min(CONTEXT_TOKEN_BUDGET, LLM_CONTEXT_WINDOW - LLM_MAX_TOKENS - overhead) # budget : tokens disponibles pour les chunks
+        context_results = store.expand_with_neighbors(final_context, NEIGHBOR_WINDOW) # context_results : passages autour de chaque résultat (une requête par shard), résultats seuls si NEIGHBOR_WINDOW = 0
+        context_texts = self.context_packer.pack(query, context_results, budget) # context_texts : chunks entiers ou réduits à leurs phrases pertinentes, par pertinence
+        context_str = CONTEXT_SEPARATOR.join(context_texts)                     # context_str : fusionner les textes avec un séparateur
+
+        rag_prompt = self._build_rag_prompt(query, context_str)                 # rag_prompt : le prompt final envoyé à Qwen
+
+        def finish(final_answer: str, failed: bool = False) -> GeneratedAnswer: # def : fonction locale | finish : mise en cache et réponse structurée, une fois le texte généré | failed : la génération a échoué (LLMGenerationError)
+            # 5. Mise en Cache de la réponse
+            if failed:                                                          # if : réponse à ne pas réutiliser
+                metrics.incr("semantic_cache.errors_not_stored")                # metrics.incr : erreur non mise en cache
+            elif cache:                                                         # elif : si le cache est actif
+                cache.store(query, final_answer, final_context, corpus_version) # cache.store(...) : enregistrer la question/réponse, ses sources et la version du corpus (LanceDB)
+
+            # 6. Renvoyer la réponse structurée
+            end_time = time()                                                   # temps final
+            return GeneratedAnswer(                                             # return : objet réponse complet
+                query=query,
+                answer=final_answer,
+                sources=final_context,
+                processing_time=end_time - start_time
+            )
+        return None, rag_prompt, finish                                         # return : prompt prêt pour la génération (4.)
+
+    # Étape 3.3 bis — Réponse complète
+    def ask_query(self, query: str, collection: Optional[str] = None) -> GeneratedAnswer: # def : définir la méthode | ask_query : exécute la recherche et la génération | collection : collection interrogée | -> : retour | GeneratedAnswer : objet réponse structurée
+        """Pipeline complet : (Cache || Recherche) -> (Rerank || HyDE si nécessaire) -> Fusion -> Génération LLM."""
+        start_time = time()                                                     # start_time : enregistrer le temps de début
+        immediate, rag_prompt, finish = self._prepare_answer(query, collection, start_time) # immediate : réponse du cache ou message d'échec | rag_prompt, finish : génération à faire
+        if immediate is not None:                                               # if : rien à générer
+            return immediate                                                    # return : réponse immédiate
+
+        # 4. Génération Finale (RAG)
+        try:                                                                    # try : modèle indisponible, erreur llama.cpp ou file pleine
+            final_answer = self.llm.generate(prompt=rag_prompt, system=True)    # final_answer : appel au moteur Qwen (préfixe système réutilisé)
+        except LLMGenerationError as e:                                         # except : génération impossible
+            return finish(str(e), failed=True)                                  # return : message d'erreur, jamais mis en cache
+        return finish(final_answer)                                             # return : réponse mise en cache et structurée
+
+    # Étape 3.3 ter — Réponse en streaming (CLI, st.write_stream)
+    def ask_query_stream(self, query: str, collection: Optional[str] = None) -> "AnswerStream": # def : définir la méthode | ask_query_stream : même pipeline, texte rendu au fil du décodage | -> : retour | AnswerStream : itérable des morceaux, .answer à la fin
+        """Comme ask_query, mais les tokens de la réponse sont produits dès leur décodage ; le GeneratedAnswer est disponible dans .answer une fois le flux consommé."""
+        stream = AnswerStream()                                                 # stream : flux retourné à l'appelant
+
+        def pieces() -> Iterator[str]:                                          # def : générateur local | pieces : recherche puis tokens (exécuté à la première itération)
+            start_time = time()                                                 # start_time : enregistrer le temps de début
+            immediate, rag_prompt, finish = self._prepare_answer(query, collection, start_time) # immediate : réponse du cache ou message d'échec
+            if immediate is not None:                                           # if : rien à générer
+                stream.answer = immediate                                       # stream.answer : réponse immédiate
+                yield immediate.answer                                          # yield : texte entier d'un coup
+                return                                                          # return : fin du flux
+            generated = []                                                      # generated : morceaux déjà affichés
+            try:                                                                # try : modèle indisponible, erreur llama.cpp ou file pleine (éventuellement après un début de réponse)
+                for piece in self.llm.generate_stream(prompt=rag_prompt, system=True): # for : chaque token décodé par Qwen (préfixe système réutilisé)
+                    generated.append(piece)                                     # generated.append : texte complet pour le cache
+                    yield piece                                                 # yield : rendu immédiat
+            except LLMGenerationError as e:                                     # except : génération impossible
+                message = f"\n{e}" if generated else str(e)                     # message : à la suite du texte déjà affiché
+                generated.append(message)                                       # generated.append : réponse affichée complète
+                yield message                                                   # yield : message d'erreur
+                stream.answer = finish("".join(generated), failed=True)         # stream.answer : réponse structurée, jamais mise en cache
+                return                                                          # return : fin du flux
+            stream.answer = finish("".join(generated))                          # stream.answer : réponse mise en cache et structurée
+
+        stream.pieces = pieces()                                                # stream.pieces : générateur (la recherche démarre à la première itération)
+        return stream                                                           # return : flux
 
 # Étape 4 — Fonction run_cli() (Pour le débogage)
 def run_cli():                                                                  # def : définir la fonction CLI | run_cli : boucle de ligne de commande
@@ -133,22 +336,68 @@ def run_cli():
     except RuntimeError:                                                        # except : si l'initialisation échoue
         return                                                                  # return : arrêter la fonction
 
+    collection = DEFAULT_COLLECTION                                             # collection : collection active (changée avec "use <nom>")
     while True:                                                                 # while True : boucle infinie
-        user_input = input("\n[VEV]> ")                                         # user_input : demander l'entrée utilisateur
+        user_input = input(f"\n[VEV:{collection}]> ")                           # user_input : demander l'entrée utilisateur (collection active affichée)
         if user_input.lower() in ['quit', 'exit']:                              # if : si l'utilisateur veut quitter
             break                                                               # break : sortir de la boucle
 
+        if user_input.lower().startswith("use "):                               # if : changer de collection active
+            try:                                                                # try : nom potentiellement invalide
+                collection = validate_collection_name(user_input.split(" ", 1)[1]) # collection : nouvelle collection active
+                agent.get_store(collection)                                     # agent.get_store(...) : créer / ouvrir sa table
+            except ValueError as e:                                             # except : nom refusé ou modèle d'embedding incompatible
+                print(e)                                                        # print : message d'erreur
+            continue                                                            # continue : revenir au début de la boucle
+
+        if user_input.lower() == "metrics":                                     # if : afficher les métriques de performance
+            print(json.dumps(metrics.snapshot(), indent=2))                     # print : compteurs et coûts (HyDE, tokens...)
+            continue                                                            # continue : revenir au début de la boucle
+        if user_input.lower() == "collections":                                 # if : lister les collections
+            for name in agent.list_collections():                               # for : chaque collection
+                print(f"  - {name}")                                            # print : afficher la collection
+            continue                                                            # continue : revenir au début de la boucle
+
+        if user_input.lower().startswith("drop "):                              # if : supprimer une collection entière
+            try:                                                                # try : la collection par défaut est protégée
+                agent.drop_collection(user_input.split(" ", 1)[1])              # agent.drop_collection(...) : table + cache supprimés
+                print("Collection supprimée.")                                  # print : confirmation
+            except ValueError as e:                                             # except : refus
+                print(e)                                                        # print : message d'erreur
+            continue                                                            # continue : revenir au début de la boucle
+
         if user_input.lower().startswith("ingest "):                            # if : si l'utilisateur veut indexer
             source = user_input.split(" ", 1)[1].strip()                        # source : extraire le chemin/URL après "ingest "
-            if source:                                                          # if : si la source est non vide
-                agent.ingest_document(source)                                   # agent.ingest_document(...) : lancer le pipeline d'ingestion
+            if source and Path(source).is_dir():                                # if : un dossier complet -> ingestion en masse avec écritures groupées
+                for file_path in sorted(p for p in Path(source).iterdir() if p.is_file()): # for : chaque fichier du dossier
+                    try:                                                        # try : un fichier illisible ne doit pas bloquer le lot
+                        agent.ingest_document(str(file_path), flush=False, collection=collection) # agent.ingest_document(...) : le tampon Arrow s'écrit au seuil de taille ou de temps
+                    except Exception as e:                                      # except : fichier en erreur
+                        logger.error(f"Ingestion failed for {file_path}: {e}")  # logger.error : loguer et continuer
+                agent.get_store(collection).build_indices()                     # build_indices() : index FTS / scalaires reconstruits en arrière-plan (les questions restent possibles)
+            elif source:                                                        # elif : si la source est un fichier ou une URL
+                agent.ingest_document(source, collection=collection)            # agent.ingest_document(...) : lancer le pipeline d'ingestion
+            continue                                                            # continue : revenir au début de la boucle
+
+        if user_input.lower().startswith("delete "):                            # if : si l'utilisateur veut retirer un document
+            source = user_input.split(" ", 1)[1].strip()                        # source : chemin/URL après "delete "
+            if source:                                                          # if : source non vide
+                print(f"{agent.delete_document(source, collection=collection)} chunks supprimés.") # print : nombre de chunks retirés
+            continue                                                            # continue : revenir au début de la boucle
+
+        if user_input.lower() == "sources":                                     # if : lister les documents indexés
+            for indexed_source in agent.get_store(collection).list_sources():   # for : chaque source de la collection active
+                print(f"  - {indexed_source}")                                  # print : afficher la source
             continue                                                            # continue : revenir au début de la boucle
 
         if user_input.strip():                                                  # if : si c'est une question de recherche
             try:                                                                # try : tenter de répondre
-                response = agent.ask_query(user_input)                          # response : appel au pipeline RAG
+                stream = agent.ask_query_stream(user_input, collection=collection) # stream : pipeline RAG (collection active), réponse en streaming
                 print("\n🤖 Réponse VEV Agent:")                                # print : afficher le titre réponse
-                print(response.answer)                                          # print : afficher la réponse générée
+                for piece in stream:                                            # for : chaque token dès son décodage
+                    print(piece, end="", flush=True)                            # print : rendu progressif
+                print()                                                         # print : fin de la réponse
+                response = stream.answer                                        # response : réponse structurée (sources, temps)
                 print(f"\n[Temps: {response.processing_time:.2f}s | Sources utilisées ({len(response.sources)}):]") # print : afficher les métriques
                 for src in response.sources:                                    # for : boucle sur les sources
                     print(f"  - (Score {src.score:.4f}) {src.chunk.metadata.title} (Page {src.chunk.metadata.page_number})") # print : afficher les détails de la source
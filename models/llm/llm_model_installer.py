@@ -257,6 +257,59 @@ def change_active_model():
         print("Entree invalide.\n")
 
 
+def set_draft_model():
+    """Choisit le brouillon du decodage speculatif (LLM_DRAFT dans config.py)."""
+    models = list_installed_models()
+
+    print("Brouillon du decodage speculatif (le modele actif verifie les tokens proposes):")
+    print("  p. Prompt lookup (sans modele, recopie les passages du contexte)")
+    print("  n. Desactiver")
+    choice = input("Numero d'un petit modele du meme tokenizer, p ou n (0 pour annuler): ")
+
+    if choice == "0":
+        print("Annule.\n")
+        return
+
+    if choice.lower() == "p":
+        value = "prompt_lookup"
+    elif choice.lower() == "n":
+        value = ""
+    else:
+        try:
+            idx = int(choice) - 1
+        except ValueError:
+            print("Entree invalide.\n")
+            return
+        if not 0 <= idx < len(models):
+            print("Numero invalide.\n")
+            return
+        value = models[idx]
+
+    try:
+        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        match = re.search(r'LLM_MODEL_FILE\s*=\s*"([^"]*)"', content)
+        if match and value == match.group(1):
+            print(f"\nERREUR: {value} est le modele actif, choisissez un modele plus petit.\n")
+            return
+
+        content = re.sub(
+            r'(LLM_DRAFT\s*=\s*os\.getenv\("LLM_DRAFT",\s*)"[^"]*"',
+            lambda m: f'{m.group(1)}"{value}"',
+            content
+        )
+
+        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+        print(f"Config mise a jour:")
+        print(f"  - Brouillon: {value or 'desactive'}\n")
+
+    except Exception as e:
+        print(f"ERREUR lors de la mise a jour du config: {e}\n")
+
+
 def main_menu():
     """Menu principal."""
     while True:
@@ -267,6 +320,7 @@ def main_menu():
         print("2. Lister les modeles installes")
         print("3. Changer le modele actif")
         print("4. Supprimer un modele")
+        print("5. Choisir le brouillon du decodage speculatif")
         print("0. Quitter")
         print("="*60)
         
@@ -281,6 +335,8 @@ def main_menu():
             change_active_model()
         elif choice == "4":
             delete_model()
+        elif choice == "5":
+            set_draft_model()
         elif choice == "0":
             print("\nAu revoir!\n")
             break
@@ -1,6 +1,7 @@
 # Objectif — Centraliser tous les paramètres, chemins et constantes du projet VEV RAG
 
 # Étape 1 — Importer les outils de gestion de système et de chemin
+import json                                                                     # import : charger le module standard | json : lecture des options de stockage (variables d'env)
 import os                                                                       # import : charger le module standard | os : interaction avec le système d'exploitation (variables d'env)
 from pathlib import Path                                                        # from : importer depuis un package | pathlib : gestion moderne des chemins de fichiers | import : commande d'importation | Path : classe objet pour les chemins
 from dotenv import load_dotenv                                                  # from : importer depuis une librairie externe | dotenv : gestion des fichiers .env | import : commande | load_dotenv : fonction pour charger les variables
@@ -27,12 +28,81 @@ EMBEDDING_DIM = 768
 LLM_MODEL_FILE = "Qwen3-0.6B-Q8_0.gguf"                                         # LLM_MODEL_FILE : nom du fichier modèle compressé | gguf : assurez-vous d'avoir téléchargé ce fichier GGUF dans models/llm/ ou laissez None pour téléchargement auto
 LLM_CONTEXT_WINDOW = 4000                                                       # LLM_CONTEXT_WINDOW : nombre maximum de tokens en entrée (mémoire à court terme)
 LLM_MAX_TOKENS = 1000                                                           # LLM_MAX_TOKENS : nombre maximum de tokens générés en réponse
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))           # CONTEXT_TOKEN_BUDGET : tokens de contexte (chunks) du prompt final, plafonnés par la fenêtre moins LLM_MAX_TOKENS
+LLM_WORKERS = max(1, int(os.getenv("LLM_WORKERS", "1")))                        # LLM_WORKERS : instances du modèle chargées (une génération à la fois par instance)
+LLM_THREADS = int(os.getenv("LLM_THREADS", "0")) or max(1, (os.cpu_count() or 1) // LLM_WORKERS) # LLM_THREADS : threads de décodage par instance (0 = cœurs partagés entre les instances), et taille de la tranche de cœurs de chaque instance
+LLM_THREADS_BATCH = int(os.getenv("LLM_THREADS_BATCH", "0")) or LLM_THREADS     # LLM_THREADS_BATCH : threads du prefill (évaluation du prompt par lots) par instance
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "32"))                         # LLM_QUEUE_SIZE : générations en attente au plus (au-delà, la requête attend une place puis est refusée)
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))                 # LLM_QUEUE_TIMEOUT : secondes d'attente d'une place dans la file avant refus
+LLM_BATCH_SEQUENCES = max(1, int(os.getenv("LLM_BATCH_SEQUENCES", "1")))        # LLM_BATCH_SEQUENCES : générations décodées ensemble dans un même contexte par instance (1 = une à la fois, sans ordonnanceur)
+LLM_DRAFT = os.getenv("LLM_DRAFT", "")                                          # LLM_DRAFT : décodage spéculatif | "" : désactivé | "prompt_lookup" : brouillon copié du prompt (sans modèle) | fichier GGUF de models/llm/ (ex : Qwen3-0.6B-Q8_0.gguf) : petit modèle brouillon du même tokenizer
+LLM_DRAFT_TOKENS = int(os.getenv("LLM_DRAFT_TOKENS", "10"))                     # LLM_DRAFT_TOKENS : tokens proposés par le brouillon à chaque pas, vérifiés en un seul passage du modèle cible
+LLM_DRAFT_NGRAM = int(os.getenv("LLM_DRAFT_NGRAM", "3"))                        # LLM_DRAFT_NGRAM : longueur max du n-gramme recherché dans le prompt (prompt_lookup)
+LLM_PREFIX_CACHE = os.getenv("LLM_PREFIX_CACHE", "1") == "1"                    # LLM_PREFIX_CACHE : garder l'état KV du prompt système (RAM + disque) au lieu de le recalculer à chaque réponse
+LLM_PREFIX_CACHE_DIR = MODELS_DIR / "llm_cache"                                 # LLM_PREFIX_CACHE_DIR : états KV du prompt système persistés (un fichier par modèle / prompt / fenêtre / n_batch / version de llama-cpp-python)
+CONTEXT_MIN_CHUNK_TOKENS = 48                                                   # CONTEXT_MIN_CHUNK_TOKENS : en dessous, le reste du budget ne vaut pas un extrait de chunk
 
 # Étape 5 — Paramètres du Pipeline RAG
 CHUNK_SIZE = 500                                                                # CHUNK_SIZE : taille cible des morceaux de texte (en tokens ou caractères selon la méthode)
 CHUNK_OVERLAP = 50                                                              # CHUNK_OVERLAP : zone de recouvrement entre deux morceaux pour garder le contexte
 RETRIEVAL_TOP_K = 10                                                            # RETRIEVAL_TOP_K : nombre de documents bruts à récupérer par recherche vectorielle
 RERANK_TOP_K = 5                                                                # RERANK_TOP_K : nombre de documents finaux à garder après le tri intelligent (Reranking)
+NEIGHBOR_WINDOW = int(os.getenv("NEIGHBOR_WINDOW", "0"))                        # NEIGHBOR_WINDOW : chunks voisins (de chaque côté) recollés autour de chaque résultat final (0 = désactivé)
+HIERARCHICAL_TOP_DOCS = int(os.getenv("HIERARCHICAL_TOP_DOCS", "0"))            # HIERARCHICAL_TOP_DOCS : documents retenus par leur centroïde avant la recherche des chunks (0 = recherche à plat)
+
+# Reranker (CrossEncoder) : moteur d'inférence et lots triés par longueur
+RERANK_BACKEND = os.getenv("RERANK_BACKEND", "torch")                           # RERANK_BACKEND : "torch" (PyTorch), "onnx" (ONNX Runtime) ou "onnx-int8" (ONNX quantifié int8)
+RERANK_ONNX_INT8_FILE = os.getenv("RERANK_ONNX_INT8_FILE", "onnx/model_quantized.onnx") # RERANK_ONNX_INT8_FILE : fichier ONNX quantifié dans le dépôt du modèle
+RERANK_BATCH_SIZE = 16                                                          # RERANK_BATCH_SIZE : paires (requête, chunk) par passe du modèle
+RERANK_MAX_LENGTH = 512                                                         # RERANK_MAX_LENGTH : troncature des paires en tokens (un chunk de CHUNK_SIZE + la question)
+RERANK_TORCH_THREADS = int(os.getenv("RERANK_TORCH_THREADS", "0"))              # RERANK_TORCH_THREADS : threads PyTorch du reranker (0 = défaut de PyTorch)
+RERANK_CACHE_SIZE = 20000                                                       # RERANK_CACHE_SIZE : scores (requête normalisée, chunk, modèle) gardés en mémoire
+RERANK_CASCADE = os.getenv("RERANK_CASCADE", "0") == "1"                        # RERANK_CASCADE : étage cosinus avant le CrossEncoder (seule la bande incertaine est notée)
+RERANK_CASCADE_MARGIN = 0.15                                                    # RERANK_CASCADE_MARGIN : bande incertaine = cosinus >= cosinus du k-ième - marge
+RERANK_CASCADE_BATCH = 5                                                        # RERANK_CASCADE_BATCH : candidats notés par le CrossEncoder avant chaque test d'arrêt
+RERANK_CASCADE_GAP = 0.25                                                       # RERANK_CASCADE_GAP : arrêt si le k-ième score dépasse le meilleur du dernier lot de cet écart
+
+# HyDE adaptatif (document hypothétique généré seulement si la première recherche est peu sûre)
+HYDE_MAX_TOKENS = 160                                                           # HYDE_MAX_TOKENS : budget de génération du document hypothétique (un paragraphe suffit pour l'embedding)
+HYDE_TEMPERATURE = 0.7                                                          # HYDE_TEMPERATURE : créativité de la génération HyDE
+HYDE_MIN_TOP_SCORE = 0.55                                                       # HYDE_MIN_TOP_SCORE : meilleur score (1 - distance) au-dessus duquel la première recherche est jugée sûre
+HYDE_MIN_MARGIN = 0.03                                                          # HYDE_MIN_MARGIN : écart minimum entre le meilleur score et la moyenne du top-k pour éviter HyDE
+HYDE_CACHE_SIZE = 512                                                           # HYDE_CACHE_SIZE : nombre de documents hypothétiques gardés en mémoire (par requête normalisée)
+HYDE_DEADLINE_SECONDS = 6.0                                                     # HYDE_DEADLINE_SECONDS : au-delà, la génération HyDE est interrompue et la réponse utilise la première recherche seule
+PIPELINE_WORKERS = 4                                                            # PIPELINE_WORKERS : threads des étapes concurrentes du pipeline (cache, recherche, HyDE)
+
+# Expansion multi-requêtes (alternative à HyDE : reformulations courtes, fusionnées par RRF avec la requête originale)
+QUERY_EXPANSION_MODE = os.getenv("QUERY_EXPANSION_MODE", "hyde")                # QUERY_EXPANSION_MODE : "hyde" (document hypothétique) ou "multi_query" (reformulations + RRF)
+MULTI_QUERY_VARIANTS = 3                                                        # MULTI_QUERY_VARIANTS : nombre de reformulations demandées au LLM (en un seul appel)
+MULTI_QUERY_MAX_TOKENS = 96                                                     # MULTI_QUERY_MAX_TOKENS : budget de génération des reformulations (quelques lignes courtes)
+
+# Collections nommées (une table LanceDB par équipe)
+DEFAULT_COLLECTION = "default"                                                  # DEFAULT_COLLECTION : collection utilisée quand aucune n'est précisée (table historique vev_rag_data)
+# Écriture en lot dans LanceDB (évite les petits fragments Lance)
+WRITE_BATCH_ROWS = 2048                                                         # WRITE_BATCH_ROWS : nombre de chunks accumulés avant une écriture Arrow groupée
+WRITE_FLUSH_SECONDS = 5.0                                                       # WRITE_FLUSH_SECONDS : âge maximum (secondes) du tampon d'écriture avant flush
+# Moteur de la recherche vectorielle
+VECTOR_SEARCH_BACKEND = os.getenv("VECTOR_SEARCH_BACKEND", "lancedb")           # VECTOR_SEARCH_BACKEND : "lancedb" (index disque) ou "memory" (recherche exacte NumPy, petits/moyens corpus)
+MEMORY_INDEX_DTYPE = os.getenv("MEMORY_INDEX_DTYPE", "float32")                 # MEMORY_INDEX_DTYPE : "float32" ou "float16" (moitié de RAM) pour l'index en mémoire
+# Sharding de la base vectorielle (changer le nombre de shards impose une réindexation : le routage dépend de N)
+VECTOR_SHARDS = int(os.getenv("VECTOR_SHARDS", "1"))                            # VECTOR_SHARDS : nombre de shards par collection (1 = table unique historique)
+VECTOR_SHARD_URIS = [uri.strip() for uri in os.getenv("VECTOR_SHARD_URIS", "").split(",") if uri.strip()] # VECTOR_SHARD_URIS : emplacements des shards 1..N-1 (dossiers ou s3://...), défaut : data/lancedb/shards/shard_XX
+LANCEDB_STORAGE_OPTIONS = json.loads(os.getenv("LANCEDB_STORAGE_OPTIONS", "{}")) # LANCEDB_STORAGE_OPTIONS : options des shards distants (ex : {"endpoint": "http://localhost:9000", "allow_http": "true"} pour MinIO)
+# Lectures isolées par instantané (version LanceDB épinglée)
+SNAPSHOT_REFRESH_SECONDS = float(os.getenv("SNAPSHOT_REFRESH_SECONDS", "30"))   # SNAPSHOT_REFRESH_SECONDS : âge maximum d'un instantané de lecture avant de rattraper les écritures d'autres processus
+
+# Cache sémantique des réponses (table LanceDB bornée : TTL, éviction LRU, dédoublonnage, index vectoriel)
+SEMANTIC_CACHE_THRESHOLD = 0.90                                                 # SEMANTIC_CACHE_THRESHOLD : similarité cosinus minimale pour réutiliser une réponse
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "20000")) # SEMANTIC_CACHE_MAX_ENTRIES : au-delà, les entrées les moins récemment utilisées sont évincées
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(7 * 24 * 3600))) # SEMANTIC_CACHE_TTL_SECONDS : durée de vie d'une réponse (0 = illimitée)
+SEMANTIC_CACHE_DEDUP_THRESHOLD = 0.98                                           # SEMANTIC_CACHE_DEDUP_THRESHOLD : une question à ce niveau de similarité remplace l'entrée existante au lieu d'en ajouter une
+SEMANTIC_CACHE_INDEX_MIN_ENTRIES = 4096                                         # SEMANTIC_CACHE_INDEX_MIN_ENTRIES : taille à partir de laquelle un index vectoriel (IVF-HNSW) remplace le scan
+SEMANTIC_CACHE_MAINTENANCE_EVERY = 100                                          # SEMANTIC_CACHE_MAINTENANCE_EVERY : écritures entre deux maintenances (expiration, éviction, compaction)
+RETRIEVAL_CACHE_THRESHOLD = 0.85                                                # RETRIEVAL_CACHE_THRESHOLD : similarité cosinus minimale pour réutiliser les chunks reranqués d'une question voisine (plus souple que pour une réponse : le LLM répond à la nouvelle formulation)
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "512"))            # RETRIEVAL_CACHE_SIZE : requêtes dont le contexte reranqué est gardé en mémoire (0 = désactivé)
+SEMANTIC_CACHE_EXACT_ENTRIES = int(os.getenv("SEMANTIC_CACHE_EXACT_ENTRIES", "1024")) # SEMANTIC_CACHE_EXACT_ENTRIES : questions gardées dans le niveau exact en mémoire (LRU, 0 = désactivé), consulté avant l'embedding et LanceDB
+WARMUP_QUERY_FILES = [PROJECT_ROOT / p.strip() for p in os.getenv("WARMUP_QUERY_FILES", "").split(",") if p.strip()] # WARMUP_QUERY_FILES : questions (.txt / .jsonl) rejouées en arrière-plan au démarrage de app.py, seul moyen de remplir aussi les niveaux en mémoire (exact, résultats) | "" : désactivé
+WARMUP_QPS = float(os.getenv("WARMUP_QPS", "0.2"))                              # WARMUP_QPS : questions par seconde au plus pendant ce préchauffage (le trafic réel reste prioritaire)
 
 # Étape 6 — Créer les dossiers s'ils n'existent pas (Sécurité)
 for path in [RAW_DIR, PROCESSED_DIR, LANCEDB_DIR, LLM_DIR]:                     # for : boucle sur une liste | path : variable temporaire | in : dans | [...] : liste des chemins critiques
@@ -0,0 +1,52 @@
+# Objectif — Centraliser les métriques de performance du pipeline (compteurs et durées) sans dépendance externe
+
+# Étape 1 — Importer les dépendances
+import threading                                                                # import : charger le module standard | threading : verrou (Streamlit exécute plusieurs sessions en parallèle)
+from contextlib import contextmanager                                           # from : importer depuis contextlib | contextmanager : chronomètre utilisable avec "with"
+from time import perf_counter                                                   # from : importer depuis le module temps | perf_counter : chronomètre haute résolution
+from typing import Any, Dict                                                    # from : importer depuis le typage | typing : module types | Any, Dict : types génériques
+
+# Étape 2 — Définir le registre des métriques
+class MetricsRegistry:                                                          # class : définir une classe | MetricsRegistry : compteurs + observations (durées, tokens...)
+    """Registre en mémoire : `incr` pour compter un événement, `observe` pour une valeur (durée, nombre de tokens)."""
+
+    def __init__(self):                                                         # def : constructeur
+        self._lock = threading.Lock()                                           # self._lock : protège les dictionnaires
+        self._counters: Dict[str, float] = {}                                   # self._counters : nom -> total
+        self._observations: Dict[str, Dict[str, float]] = {}                    # self._observations : nom -> {count, total, max}
+
+    def incr(self, name: str, value: float = 1):                                # def : méthode | incr : incrémenter un compteur | name : nom pointé (ex : "hyde.skipped")
+        with self._lock:                                                        # with : section critique
+            self._counters[name] = self._counters.get(name, 0) + value          # mise à jour du compteur
+
+    def observe(self, name: str, value: float):                                 # def : méthode | observe : enregistrer une valeur | name : nom pointé (ex : "hyde.seconds")
+        with self._lock:                                                        # with : section critique
+            stats = self._observations.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0}) # stats : agrégats de la métrique
+            stats["count"] += 1                                                 # count : nombre d'observations
+            stats["total"] += value                                             # total : somme (coût cumulé)
+            stats["max"] = max(stats["max"], value)                             # max : pire cas
+
+    @contextmanager                                                             # @contextmanager : générateur -> gestionnaire de contexte
+    def timer(self, name: str):                                                 # def : méthode | timer : observer la durée d'un bloc (secondes)
+        start = perf_counter()                                                  # start : début
+        try:                                                                    # try : mesurer même si le bloc lève une erreur
+            yield                                                               # yield : exécuter le bloc
+        finally:                                                                # finally : toujours enregistrer
+            self.observe(name, perf_counter() - start)                          # observe : durée en secondes
+
+    def snapshot(self) -> Dict[str, Any]:                                       # def : méthode | snapshot : copie lisible des métriques | -> : retour | Dict
+        """Retourne les compteurs et, pour chaque observation, count / total / mean / max."""
+        with self._lock:                                                        # with : lecture cohérente
+            observations = {                                                    # observations : agrégats + moyenne
+                name: {**stats, "mean": stats["total"] / stats["count"] if stats["count"] else 0.0} # mean : coût moyen
+                for name, stats in self._observations.items()                   # for : chaque observation
+            }
+            return {"counters": dict(self._counters), "observations": observations} # return : copie indépendante du registre
+
+    def reset(self):                                                            # def : méthode | reset : remettre à zéro
+        with self._lock:                                                        # with : section critique
+            self._counters.clear()                                              # vider les compteurs
+            self._observations.clear()                                          # vider les observations
+
+# Étape 3 — Instancier le registre global (Singleton), partagé par tous les modules
+metrics = MetricsRegistry()                                                     # metrics : registre global du processus
@@ -2,11 +2,21 @@
 
 # Étape 1 — Importer les outils de typage et validation
 from __future__ import annotations                                              # from : importer depuis le futur | __future__ : module de compatibilité | import : commande | annotations : permet d'utiliser le type de la classe dans sa propre définition
+import hashlib                                                                  # import : charger le module standard | hashlib : empreinte stable des sources (identifiants déterministes)
 from typing import List, Optional, Dict, Any                                    # from : importer depuis le module de typage | typing : module standard | import : commande | List, Optional, Dict, Any : types génériques pour les annotations
 from uuid import uuid4                                                          # from : importer depuis le module uuid | uuid : module identifiants uniques | import : commande | uuid4 : fonction pour générer un ID aléatoire
 from datetime import datetime                                                   # from : importer depuis le module datetime | datetime : module gestion du temps | import : commande | datetime : classe date et heure
 from pydantic import BaseModel, Field                                           # from : importer depuis Pydantic | pydantic : librairie de validation | import : commande | BaseModel : classe mère des modèles | Field : fonction pour configurer les champs
 
+# Étape 1 bis — Identifiants déterministes (source + position) pour l'upsert et la suppression par source
+def source_hash(source_path: str) -> str:                                       # def : définir la fonction | source_hash : empreinte courte d'une source | -> : retour | str : 16 caractères hexadécimaux
+    """Empreinte stable (SHA-1 tronqué) d'un chemin ou d'une URL source."""
+    return hashlib.sha1(source_path.encode("utf-8")).hexdigest()[:16]           # return : les 16 premiers caractères du SHA-1
+
+def make_chunk_id(source_path: str, chunk_index: int) -> str:                   # def : définir la fonction | make_chunk_id : identifiant reproductible d'un chunk | -> : retour | str : identifiant
+    """Identifiant déterministe : le même document réindexé produit les mêmes ids (clé de merge_insert)."""
+    return f"{source_hash(source_path)}-{chunk_index:06d}"                      # return : "<hash source>-<index sur 6 chiffres>"
+
 # Étape 2 — Définir les métadonnées d'un document source
 class SourceMetadata(BaseModel):                                                # class : définir une classe | SourceMetadata : nom du schéma | (BaseModel) : hérite de Pydantic pour la validation
     """Informations sur l'origine du document (PDF, Web, etc.)"""
@@ -35,7 +45,8 @@ class Chunk(BaseModel):
             "source": self.metadata.source_path,                                # "source" : clé aplatie | self.metadata.source_path : chemin source
             "page": self.metadata.page_number or 0,                             # "page" : clé aplatie | ... or 0 : numéro page ou 0 si vide
             "title": self.metadata.title or "Unknown",                          # "title" : clé aplatie | ... : titre ou par défaut
-            "created_at": self.metadata.creation_date                           # "created_at" : clé date
+            "created_at": self.metadata.creation_date,                          # "created_at" : clé date
+            "chunk_index": self.chunk_index                                     # "chunk_index" : position dans le document (voisins d'un résultat)
         }                                                                       # } : fin dictionnaire
 
 # Étape 4 — Définir un résultat de recherche
@@ -0,0 +1,64 @@
+# Objectif — Mesurer la cascade du reranker : appels CrossEncoder économisés contre perte de qualité (nDCG@k par rapport au reranking complet)
+
+# Étape 1 — Importer les dépendances et les outils du projet
+import argparse                                                                 # import : charger le module standard | argparse : options de la ligne de commande
+import logging                                                                  # import : charger le module standard | logging : gestion des journaux
+from pathlib import Path                                                        # from : importer depuis un package | pathlib : lecture du corpus texte | Path : classe objet chemin
+from typing import Dict, List                                                   # from : importer depuis le typage | typing : module types | Dict, List : types génériques
+import numpy as np                                                              # import : charger le module de calcul | numpy : gains et moyennes
+from src.core.config import PROJECT_ROOT, RETRIEVAL_TOP_K, RERANK_TOP_K, RERANK_CASCADE_MARGIN, RERANK_CASCADE_GAP # from : importer les constantes | src.core.config : corpus par défaut, taille du pool, top-k final et réglages de la cascade
+from src.core.schemas import Chunk, SearchResult, SourceMetadata                # from : importer les schémas | src.core.schemas : candidats au format du pipeline
+from src.evaluation.bench_reranker import make_workload                         # from : importer la fonction | src.evaluation.bench_reranker : mêmes requêtes et candidats que le benchmark des moteurs
+from src.indexing.embedder import embedder                                      # from : importer l'embedder | src.indexing.embedder : vecteurs de l'étage cosinus
+from src.retrieval.reranker import Reranker, RerankScoreCache                   # from : importer le reranker | src.retrieval.reranker : reranking complet et cascade
+
+# Étape 2 — Configurer le logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s') # logging.basicConfig(...) : configuration
+logger = logging.getLogger(__name__)                                            # logger : objet enregistreur
+
+# Étape 3 — Qualité du classement
+def ndcg_at_k(ranked_ids: List[str], gains: Dict[str, float], k: int) -> float: # def : définir la fonction | ndcg_at_k : qualité d'un top-k | gains : pertinence de référence (scores du reranking complet) | -> : retour | float entre 0 et 1
+    """DCG du classement évalué divisé par le DCG du classement idéal (scores du reranking complet)."""
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))                              # discounts : 1 / log2(rang + 1)
+    dcg = sum(gains.get(doc_id, 0.0) * d for doc_id, d in zip(ranked_ids[:k], discounts)) # dcg : classement évalué
+    ideal = sum(g * d for g, d in zip(sorted(gains.values(), reverse=True)[:k], discounts)) # ideal : meilleur classement possible
+    return dcg / ideal if ideal > 0 else 1.0                                    # return : nDCG
+
+# Étape 4 — Comparaison
+def run_benchmark(corpus_path: Path, queries: int, pool: int, margins: List[float], gaps: List[float]): # def : définir la fonction | run_benchmark : grille marge x écart
+    """Le reranking complet sert de référence ; chaque réglage de la cascade est évalué en paires notées et en nDCG@k."""
+    workload = make_workload(corpus_path, queries, pool)                        # workload : paires (requête, chunk)
+    reranker = Reranker()                                                       # reranker : modèle du pipeline
+    metadata = SourceMetadata(source_type="bench", source_path=corpus_path.name) # metadata : source factice
+    cases = []                                                                  # cases : (requête, vecteur, candidats, gains de référence)
+    for pairs in workload:                                                      # for : chaque requête
+        query = pairs[0][0]                                                     # query : requête du lot
+        texts = [text for _, text in pairs]                                     # texts : candidats
+        vectors = embedder.embed_documents(texts)                               # vectors : vecteurs stockés (comme dans LanceDB)
+        results = [SearchResult(chunk=Chunk(id=f"c{i}", text=t, vector=v.tolist(), metadata=metadata, chunk_index=i), score=0.0, rank=i + 1) for i, (t, v) in enumerate(zip(texts, vectors))] # results : candidats du pipeline
+        full = reranker.predict(pairs)                                          # full : scores du reranking complet
+        gains = {r.chunk.id: float(max(s, 0.0)) for r, s in zip(results, full)} # gains : pertinence de référence (positive)
+        cases.append((query, embedder.embed_query(query), results, gains))      # cases.append : cas prêt
+    total_pairs = sum(len(c[2]) for c in cases)                                 # total_pairs : paires du reranking complet
+    logger.info(f"Workload: {queries} queries x {pool} candidates, full rerank = {total_pairs} pairs") # logger.info : paramètres
+
+    for margin in margins:                                                      # for : chaque largeur de bande
+        for gap in gaps:                                                        # for : chaque écart d'arrêt
+            scored, ndcgs = 0, []                                               # scored, ndcgs : paires notées et qualité par requête
+            for query, query_vector, results, gains in cases:                   # for : chaque requête
+                reranker.score_cache = RerankScoreCache()                       # cache vide : seules les paires de ce réglage comptent
+                scores = reranker.cascade_scores(query, results, query_vector, margin=margin, gap=gap) # scores : candidats notés par la cascade
+                scored += len(scores)                                           # scored : paires envoyées au CrossEncoder
+                ndcgs.append(ndcg_at_k(sorted(scores, key=scores.get, reverse=True), gains, RERANK_TOP_K)) # ndcgs.append : qualité du top-k
+            logger.info(f"margin={margin:.2f} gap={gap:.2f} | pairs scored={scored}/{total_pairs} ({1 - scored / total_pairs:.1%} saved) | nDCG@{RERANK_TOP_K}={np.mean(ndcgs):.4f}") # logger.info : économie contre qualité
+
+# Étape 5 — Point d'entrée
+if __name__ == "__main__":                                                      # if : condition d'exécution
+    parser = argparse.ArgumentParser(description="Benchmark cascade reranking: cross-encoder calls saved vs nDCG change") # parser : options
+    parser.add_argument("--corpus", type=Path, default=PROJECT_ROOT / "README.md", help="Text file split into paragraphs") # --corpus : texte source des chunks
+    parser.add_argument("--queries", type=int, default=50, help="Number of queries") # --queries : nombre de requêtes
+    parser.add_argument("--pool", type=int, default=RETRIEVAL_TOP_K * 2, help="Candidates per query") # --pool : taille du pool (plusieurs variantes / jambes)
+    parser.add_argument("--margins", type=float, nargs="+", default=[RERANK_CASCADE_MARGIN / 2, RERANK_CASCADE_MARGIN, RERANK_CASCADE_MARGIN * 2], help="Cosine band widths") # --margins : largeurs de bande testées
+    parser.add_argument("--gaps", type=float, nargs="+", default=[RERANK_CASCADE_GAP, float("inf")], help="Early-stop score gaps (inf = no early stop)") # --gaps : écarts d'arrêt testés
+    args = parser.parse_args()                                                  # args : options lues
+    run_benchmark(args.corpus, args.queries, args.pool, args.margins, args.gaps) # run_benchmark(...) : lancer la comparaison
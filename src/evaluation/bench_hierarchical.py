@@ -0,0 +1,78 @@
+# Objectif — Comparer la recherche à plat (tous les chunks) et la recherche hiérarchique (centroïdes des documents, puis chunks préfiltrés) : latence et rappel. Données synthétiques, aucun modèle IA chargé.
+
+# Étape 1 — Importer les dépendances et les outils du projet
+import argparse                                                                 # import : charger le module standard | argparse : options de la ligne de commande
+import logging                                                                  # import : charger le module standard | logging : gestion des journaux
+import tempfile                                                                 # import : charger le module standard | tempfile : base LanceDB jetable
+import numpy as np                                                              # import : charger le module de calcul | numpy : vecteurs synthétiques
+import pyarrow as pa                                                            # import : charger le module | pyarrow : construction de la table de test
+import lancedb as lancedb                                                       # import : charger la librairie | lancedb : moteur de référence
+from src.core.config import EMBEDDING_DIM, RETRIEVAL_TOP_K                      # from : importer les constantes | src.core.config : dimension et top-k du pipeline
+from src.evaluation.bench_vector_search import report, time_queries             # from : importer les mesures | src.evaluation.bench_vector_search : latences p50/p95
+from src.indexing.arrow_writer import CHUNK_SCHEMA                              # from : importer le schéma | src.indexing.arrow_writer : même schéma que vev_rag_data
+from src.indexing.doc_index import DocumentIndex                                # from : importer l'index | src.indexing.doc_index : premier niveau évalué
+
+# Étape 2 — Configurer le logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s') # logging.basicConfig(...) : configuration
+logger = logging.getLogger(__name__)                                            # logger : objet enregistreur
+
+# Étape 3 — Générer un corpus synthétique de documents thématiques
+def make_documents(docs: int, chunks_per_doc: int, dim: int, spread: float, seed: int = 0): # def : définir la fonction | make_documents : corpus et centroïdes | spread : dispersion des chunks autour du thème du document | -> : retour | (pa.Table, np.ndarray)
+    """Chaque document a un thème (vecteur aléatoire) ; ses chunks sont des variations bruitées de ce thème, normalisées comme FastEmbed."""
+    rng = np.random.default_rng(seed)                                           # rng : générateur reproductible
+    topics = rng.standard_normal((docs, dim)).astype(np.float32)                # topics : un thème par document
+    vectors = np.repeat(topics, chunks_per_doc, axis=0) + spread * rng.standard_normal((docs * chunks_per_doc, dim)).astype(np.float32) # vectors : chunks autour de leur thème
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)                   # vectors : normalisation
+    rows = docs * chunks_per_doc                                                # rows : nombre de chunks
+    table = pa.Table.from_arrays([                                              # table : table Arrow au schéma des chunks
+        pa.array([f"bench-{i:08d}" for i in range(rows)], pa.string()),         # id : identifiants
+        pa.array([f"chunk {i}" for i in range(rows)], pa.string()),             # text : contenus factices
+        pa.FixedSizeListArray.from_arrays(pa.array(vectors.ravel()), dim),      # vector : vecteurs float32
+        pa.array([f"doc-{i // chunks_per_doc}.pdf" for i in range(rows)], pa.string()), # source : document de chaque chunk
+        pa.array([0] * rows, pa.int32()),                                       # page : page factice
+        pa.array(["Bench"] * rows, pa.string()),                                # title : titre factice
+        pa.array(["2025-01-01"] * rows, pa.string()),                           # created_at : date factice
+        pa.array([i % chunks_per_doc for i in range(rows)], pa.int32()),        # chunk_index : position dans le document
+    ], schema=CHUNK_SCHEMA)                                                     # schema : schéma partagé
+    return table, vectors                                                       # return : table et matrice (requêtes tirées des chunks)
+
+# Étape 4 — Comparaison
+def run_benchmark(docs: int, chunks_per_doc: int, queries: int, top_k: int, top_docs_list, spread: float, dim: int = EMBEDDING_DIM): # def : définir la fonction | run_benchmark : à plat vs hiérarchique
+    """Mesure la latence de chaque mode et le rappel du top-k hiérarchique par rapport au top-k à plat (référence)."""
+    corpus, vectors = make_documents(docs, chunks_per_doc, dim, spread)         # corpus, vectors : table synthétique
+    rng = np.random.default_rng(1)                                              # rng : requêtes reproductibles
+    query_vectors = vectors[rng.integers(0, len(vectors), queries)] + 0.5 * spread * rng.standard_normal((queries, dim)).astype(np.float32) # query_vectors : proches d'un chunk existant
+
+    with tempfile.TemporaryDirectory() as tmp:                                  # with : base temporaire supprimée à la fin
+        db = lancedb.connect(tmp)                                               # db : base jetable
+        table = db.create_table("bench", data=corpus)                           # table : table des chunks
+        table.create_scalar_index("source")                                     # create_scalar_index : même index BTree que la table du projet (préfiltre par document)
+        doc_index = DocumentIndex(db, "bench", dim)                             # doc_index : table des centroïdes
+        doc_index.rebuild(table)                                                # rebuild : un centroïde par document
+        logger.info(f"Corpus: {docs} documents x {chunks_per_doc} chunks x {dim} dims, {queries} queries, top_k={top_k}") # logger.info : paramètres
+
+        def flat_search(q):                                                     # def : fonction locale | flat_search : tous les chunks
+            return table.search(q).limit(top_k).to_list()                       # return : top-k à plat
+        report("flat", time_queries(flat_search, query_vectors))                # report : latences de référence
+        reference = [{r["id"] for r in flat_search(q)} for q in query_vectors]  # reference : top-k exact à plat
+
+        for top_docs in top_docs_list:                                          # for : chaque taille de sélection
+            def hierarchical_search(q):                                         # def : fonction locale | hierarchical_search : documents puis chunks
+                sources = [row["source"] for row in doc_index.search(q, top_docs)] # sources : documents retenus
+                where = "source IN (" + ", ".join(f"'{s}'" for s in sources) + ")" # where : préfiltre des chunks
+                return table.search(q).where(where, prefilter=True).limit(top_k).to_list() # return : top-k restreint
+            report(f"hierarchical[M={top_docs}]", time_queries(hierarchical_search, query_vectors)) # report : latences hiérarchiques
+            recall = np.mean([len(reference[i] & {r["id"] for r in hierarchical_search(q)}) / top_k for i, q in enumerate(query_vectors)]) # recall : part du top-k à plat retrouvée
+            logger.info(f"{'':<22} searched={top_docs * chunks_per_doc / (docs * chunks_per_doc):.1%} of chunks | recall@{top_k} vs flat={recall:.3f}") # logger.info : espace de recherche et rappel
+
+# Étape 5 — Point d'entrée
+if __name__ == "__main__":                                                      # if : condition d'exécution
+    parser = argparse.ArgumentParser(description="Benchmark flat vs hierarchical (document centroids) vector search") # parser : options
+    parser.add_argument("--docs", type=int, default=2_000, help="Number of synthetic documents") # --docs : nombre de documents
+    parser.add_argument("--chunks-per-doc", type=int, default=50, help="Chunks per document") # --chunks-per-doc : longueur des documents
+    parser.add_argument("--queries", type=int, default=100, help="Number of timed queries") # --queries : nombre de requêtes mesurées
+    parser.add_argument("--top-k", type=int, default=RETRIEVAL_TOP_K * 2, help="Results per query") # --top-k : même profondeur que la jambe vectorielle du pipeline
+    parser.add_argument("--top-docs", type=int, nargs="+", default=[5, 20, 50], help="Documents kept by the first level") # --top-docs : valeurs de HIERARCHICAL_TOP_DOCS comparées
+    parser.add_argument("--spread", type=float, default=0.8, help="Noise around each document topic (higher = less separable documents)") # --spread : difficulté du corpus
+    args = parser.parse_args()                                                  # args : options lues
+    run_benchmark(args.docs, args.chunks_per_doc, args.queries, args.top_k, args.top_docs, args.spread) # run_benchmark(...) : lancer la comparaison
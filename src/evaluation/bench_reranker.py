@@ -0,0 +1,69 @@
+# Objectif — Comparer les moteurs du reranker (PyTorch, ONNX, ONNX int8) : débit en paires/seconde et accord des classements avec le modèle PyTorch actuel
+
+# Étape 1 — Importer les dépendances et les outils du projet
+import argparse                                                                 # import : charger le module standard | argparse : options de la ligne de commande
+import logging                                                                  # import : charger le module standard | logging : gestion des journaux
+from pathlib import Path                                                        # from : importer depuis un package | pathlib : lecture du corpus texte | Path : classe objet chemin
+from time import perf_counter                                                   # from : importer depuis le module temps | perf_counter : chronomètre haute résolution
+from typing import List, Tuple                                                  # from : importer depuis le typage | typing : module types | List, Tuple : types génériques
+import numpy as np                                                              # import : charger le module de calcul | numpy : scores, tris et accords
+from src.core.config import PROJECT_ROOT, RETRIEVAL_TOP_K, RERANK_TOP_K         # from : importer les constantes | src.core.config : racine du projet, taille du pool et top-k final
+from src.retrieval.reranker import RERANK_BACKENDS, Reranker                    # from : importer le reranker | src.retrieval.reranker : moteurs évalués
+
+# Étape 2 — Configurer le logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s') # logging.basicConfig(...) : configuration
+logger = logging.getLogger(__name__)                                            # logger : objet enregistreur
+
+# Étape 3 — Construire des requêtes et leurs candidats à partir d'un texte
+def make_workload(corpus_path: Path, queries: int, pool: int, seed: int = 0) -> List[List[Tuple[str, str]]]: # def : définir la fonction | make_workload : lots de paires (une liste par requête) | pool : candidats par requête | -> : retour
+    """Paragraphes du fichier = chunks ; requête = début d'un paragraphe ; candidats = ce paragraphe + d'autres tirés au hasard."""
+    paragraphs = [p.strip() for p in corpus_path.read_text(encoding="utf-8").split("\n\n") if len(p.strip()) > 80] # paragraphs : chunks du corpus
+    rng = np.random.default_rng(seed)                                           # rng : générateur reproductible
+    workload = []                                                               # workload : paires de chaque requête
+    for _ in range(queries):                                                    # for : chaque requête
+        target = int(rng.integers(len(paragraphs)))                             # target : paragraphe pertinent
+        query = " ".join(paragraphs[target].split()[:8])                        # query : huit premiers mots
+        others = rng.choice(len(paragraphs), size=min(pool - 1, len(paragraphs) - 1), replace=False) # others : candidats tirés au hasard
+        candidates = [paragraphs[target]] + [paragraphs[i] for i in others if i != target] # candidates : pool de la requête
+        workload.append([(query, text) for text in candidates[:pool]])          # workload.append : paires (requête, chunk)
+    return workload                                                             # return : lots de paires
+
+# Étape 4 — Mesurer un moteur
+def score_workload(reranker: Reranker, workload: List[List[Tuple[str, str]]]) -> Tuple[List[np.ndarray], float]: # def : définir la fonction | score_workload : scores et débit | -> : retour | (scores par requête, paires/s)
+    """Note chaque pool comme le pipeline (un appel par requête) et retourne les scores et le débit en paires/seconde."""
+    reranker.predict(workload[0])                                               # échauffement (allocation, graphe ONNX)
+    start = perf_counter()                                                      # start : début
+    scores = [reranker.predict(pairs) for pairs in workload]                    # scores : un tableau par requête
+    elapsed = perf_counter() - start                                            # elapsed : durée totale
+    return scores, sum(len(pairs) for pairs in workload) / elapsed              # return : scores et paires par seconde
+
+def top_k_overlap(reference: List[np.ndarray], candidate: List[np.ndarray], k: int) -> float: # def : définir la fonction | top_k_overlap : accord des classements | -> : retour | float entre 0 et 1
+    """Part moyenne des k premiers du moteur de référence retrouvés dans les k premiers du moteur évalué."""
+    return float(np.mean([len(set(np.argsort(-r)[:k]) & set(np.argsort(-c)[:k])) / k for r, c in zip(reference, candidate)])) # return : recouvrement moyen
+
+# Étape 5 — Comparaison
+def run_benchmark(corpus_path: Path, queries: int, pool: int, backends: List[str]): # def : définir la fonction | run_benchmark : comparer les moteurs
+    """PyTorch sert de référence ; chaque autre moteur est comparé en débit, en top-1 et en recouvrement du top-k final."""
+    workload = make_workload(corpus_path, queries, pool)                        # workload : paires de test
+    logger.info(f"Workload: {queries} queries x {pool} candidates from {corpus_path.name}") # logger.info : paramètres
+    reference = None                                                            # reference : scores du moteur PyTorch
+    for backend in ["torch"] + [b for b in backends if b != "torch"]:           # for : PyTorch d'abord (référence)
+        reranker = Reranker(backend=backend)                                    # reranker : moteur évalué
+        if reranker.model is None or reranker.backend != backend:               # if : moteur indisponible (repli PyTorch)
+            logger.warning(f"{backend:<10} unavailable, skipped")               # logger.warning : moteur ignoré
+            continue                                                            # continue : moteur suivant
+        scores, pairs_per_second = score_workload(reranker, workload)           # scores, pairs_per_second : résultats
+        if reference is None:                                                   # if : premier moteur mesuré
+            reference = scores                                                  # reference : scores de référence
+        top1 = np.mean([np.argmax(r) == np.argmax(s) for r, s in zip(reference, scores)]) # top1 : même meilleur candidat
+        logger.info(f"{backend:<10} {pairs_per_second:8.1f} pairs/s | top-1 agreement={top1:.3f} | top-{RERANK_TOP_K} overlap={top_k_overlap(reference, scores, RERANK_TOP_K):.3f}") # logger.info : débit et accord
+
+# Étape 6 — Point d'entrée
+if __name__ == "__main__":                                                      # if : condition d'exécution
+    parser = argparse.ArgumentParser(description="Benchmark reranker backends (PyTorch vs ONNX vs ONNX int8)") # parser : options
+    parser.add_argument("--corpus", type=Path, default=PROJECT_ROOT / "README.md", help="Text file split into paragraphs") # --corpus : texte source des chunks
+    parser.add_argument("--queries", type=int, default=50, help="Number of timed queries") # --queries : nombre de requêtes mesurées
+    parser.add_argument("--pool", type=int, default=RETRIEVAL_TOP_K, help="Candidates per query") # --pool : même taille que le pool du pipeline
+    parser.add_argument("--backends", nargs="+", default=list(RERANK_BACKENDS), choices=RERANK_BACKENDS, help="Backends to compare") # --backends : moteurs évalués
+    args = parser.parse_args()                                                  # args : options lues
+    run_benchmark(args.corpus, args.queries, args.pool, args.backends)          # run_benchmark(...) : lancer la comparaison
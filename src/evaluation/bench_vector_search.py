@@ -0,0 +1,82 @@
+# Objectif — Comparer la latence de la recherche vectorielle : table LanceDB (disque) vs index exact en mémoire (NumPy). Données synthétiques, aucun modèle IA chargé.
+
+# Étape 1 — Importer les dépendances et les outils du projet
+import argparse                                                                 # import : charger le module standard | argparse : options de la ligne de commande
+import logging                                                                  # import : charger le module standard | logging : gestion des journaux
+import tempfile                                                                 # import : charger le module standard | tempfile : base LanceDB jetable
+from time import perf_counter                                                   # from : importer depuis le module temps | perf_counter : chronomètre haute résolution
+import numpy as np                                                              # import : charger le module de calcul | numpy : vecteurs synthétiques et percentiles
+import pyarrow as pa                                                            # import : charger le module | pyarrow : construction de la table de test
+import lancedb as lancedb                                                       # import : charger la librairie | lancedb : moteur de référence
+from src.core.config import EMBEDDING_DIM, RETRIEVAL_TOP_K                      # from : importer les constantes | src.core.config : dimension et top-k du pipeline
+from src.indexing.arrow_writer import CHUNK_SCHEMA                              # from : importer le schéma | src.indexing.arrow_writer : même schéma que vev_rag_data
+from src.indexing.memory_index import InMemoryIndex                             # from : importer l'index | src.indexing.memory_index : moteur évalué
+
+# Étape 2 — Configurer le logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s') # logging.basicConfig(...) : configuration
+logger = logging.getLogger(__name__)                                            # logger : objet enregistreur
+
+# Étape 3 — Générer un corpus synthétique au schéma des chunks
+def make_corpus(rows: int, dim: int, seed: int = 0) -> pa.Table:                # def : définir la fonction | make_corpus : table Arrow de test | rows : nombre de chunks | dim : dimension | -> : retour | pa.Table
+    """Crée `rows` chunks aléatoires (vecteurs normalisés) au schéma CHUNK_SCHEMA."""
+    rng = np.random.default_rng(seed)                                           # rng : générateur reproductible
+    vectors = rng.standard_normal((rows, dim)).astype(np.float32)               # vectors : vecteurs aléatoires
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)                   # vectors : normalisation (comme FastEmbed)
+    return pa.Table.from_arrays([                                               # return : table Arrow
+        pa.array([f"bench-{i:08d}" for i in range(rows)], pa.string()),         # id : identifiants
+        pa.array([f"chunk {i}" for i in range(rows)], pa.string()),             # text : contenus factices
+        pa.FixedSizeListArray.from_arrays(pa.array(vectors.ravel()), dim),      # vector : vecteurs float32
+        pa.array([f"doc-{i // 50}.pdf" for i in range(rows)], pa.string()),     # source : 50 chunks par document
+        pa.array([0] * rows, pa.int32()),                                       # page : page factice
+        pa.array(["Bench"] * rows, pa.string()),                                # title : titre factice
+        pa.array(["2025-01-01"] * rows, pa.string()),                           # created_at : date factice
+        pa.array([i % 50 for i in range(rows)], pa.int32()),                    # chunk_index : position dans le document factice
+    ], schema=CHUNK_SCHEMA)                                                     # schema : schéma partagé
+
+# Étape 4 — Mesurer une fonction de recherche
+def time_queries(search_fn, queries: np.ndarray) -> np.ndarray:                 # def : définir la fonction | time_queries : latence par requête | search_fn : fonction à mesurer | -> : retour | np.ndarray : latences en ms
+    """Exécute chaque requête une fois et retourne les latences en millisecondes."""
+    search_fn(queries[0])                                                       # échauffement (caches, ouverture des fichiers)
+    latencies = []                                                              # latencies : mesures
+    for query in queries:                                                       # for : chaque requête
+        start = perf_counter()                                                  # start : début
+        search_fn(query)                                                        # recherche
+        latencies.append((perf_counter() - start) * 1000)                       # latencies.append : durée en ms
+    return np.array(latencies)                                                  # return : tableau des latences
+
+def report(name: str, latencies: np.ndarray):                                   # def : définir la fonction | report : afficher p50/p95/moyenne
+    logger.info(f"{name:<22} p50={np.percentile(latencies, 50):7.2f} ms | p95={np.percentile(latencies, 95):7.2f} ms | mean={latencies.mean():7.2f} ms") # logger.info : ligne de résultat
+
+# Étape 5 — Comparaison
+def run_benchmark(rows: int, queries: int, top_k: int, dim: int = EMBEDDING_DIM): # def : définir la fonction | run_benchmark : comparer les moteurs
+    """Compare LanceDB (scan sans index ANN, comme la table du projet) et l'index en mémoire float32 / float16, latence et recouvrement des top-k."""
+    corpus = make_corpus(rows, dim)                                             # corpus : table Arrow synthétique
+    query_vectors = np.random.default_rng(1).standard_normal((queries, dim)).astype(np.float32) # query_vectors : requêtes aléatoires
+
+    with tempfile.TemporaryDirectory() as tmp:                                  # with : base temporaire supprimée à la fin
+        table = lancedb.connect(tmp).create_table("bench", data=corpus)         # table : table LanceDB de référence
+        logger.info(f"Corpus: {rows} chunks x {dim} dims, {queries} queries, top_k={top_k}") # logger.info : paramètres
+
+        lance_ids = []                                                          # lance_ids : top-k LanceDB (référence du recouvrement)
+        def lance_search(q):                                                    # def : fonction locale | lance_search : recherche LanceDB
+            return table.search(q).limit(top_k).to_list()                       # return : top-k LanceDB
+        report("lancedb", time_queries(lance_search, query_vectors))            # report : latences LanceDB
+        for q in query_vectors:                                                 # for : collecter les résultats de référence
+            lance_ids.append({r["id"] for r in lance_search(q)})                # lance_ids.append : ids du top-k
+
+        for dtype in ("float32", "float16"):                                    # for : chaque précision de stockage
+            start = perf_counter()                                              # start : début du chargement
+            index = InMemoryIndex.from_table(table, dim, dtype=dtype)           # index : chargement depuis la table
+            load_ms = (perf_counter() - start) * 1000                           # load_ms : coût du chargement initial
+            report(f"memory[{dtype}]", time_queries(lambda q: index.search(q, top_k), query_vectors)) # report : latences de l'index en mémoire
+            overlap = np.mean([len(lance_ids[i] & {r["id"] for r in index.search(q, top_k)}) / top_k for i, q in enumerate(query_vectors)]) # overlap : recouvrement moyen des top-k
+            logger.info(f"{'':<22} load={load_ms:.0f} ms | matrix={index.nbytes / 1e6:.1f} MB | top-k overlap with lancedb={overlap:.3f}") # logger.info : coût mémoire et exactitude
+
+# Étape 6 — Point d'entrée
+if __name__ == "__main__":                                                      # if : condition d'exécution
+    parser = argparse.ArgumentParser(description="Benchmark LanceDB vs in-memory exact vector search") # parser : options
+    parser.add_argument("--rows", type=int, default=50_000, help="Number of synthetic chunks") # --rows : taille du corpus
+    parser.add_argument("--queries", type=int, default=200, help="Number of timed queries") # --queries : nombre de requêtes mesurées
+    parser.add_argument("--top-k", type=int, default=RETRIEVAL_TOP_K * 2, help="Results per query") # --top-k : même profondeur que la jambe vectorielle du pipeline
+    args = parser.parse_args()                                                  # args : options lues
+    run_benchmark(args.rows, args.queries, args.top_k)                          # run_benchmark(...) : lancer la comparaison
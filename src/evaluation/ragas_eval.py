@@ -85,7 +85,7 @@ if __name__ == "__main__":
     try:                                                                        # try : bloc de sécurité
         agent = VEVAgent()                                                      # agent : initialisation de l'agent
         
-        if agent.vector_store.table.count_rows() == 0:                          # if : vérifier si la base est vide
+        if agent.vector_store.count_rows() == 0:                                # if : vérifier si la base est vide (tous shards)
             logger.error("Database is empty. Please run the ingestion pipeline first via app.py or main.py.") # logger.error : message d'erreur critique
         else:                                                                   # else : si la base n'est pas vide
             run_evaluation(agent, EXAMPLE_TEST_SET)                             # run_evaluation(...) : lancer l'évaluation
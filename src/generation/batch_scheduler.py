@@ -0,0 +1,217 @@
+# Objectif — Décodage par lots continu : plusieurs générations partagent un seul contexte llama.cpp (un identifiant de séquence chacune), les nouvelles requêtes rejoignent le lot entre deux pas de décodage
+
+# Étape 1 — Importer les dépendances
+import codecs                                                                   # import : charger le module standard | codecs : décodage UTF-8 incrémental (caractères coupés entre deux tokens)
+import logging                                                                  # import : charger le module standard | logging : gestion des journaux
+import queue                                                                    # import : charger le module standard | queue : requêtes en attente et morceaux produits
+import threading                                                                # import : charger le module standard | threading : thread de l'ordonnanceur et annulation
+from time import perf_counter                                                   # from : importer depuis le module temps | perf_counter : délai avant le premier token et durée des pas
+from typing import Dict, Iterator, List, Optional                               # from : importer depuis le typage | typing : module types | Dict, Iterator, List, Optional : types génériques
+import llama_cpp                                                                # import : charger l'API C | llama_cpp : paramètres de contexte, fin de génération, graine
+from llama_cpp import Llama                                                     # from : importer le moteur LLM | Llama : modèle chargé (poids et tokenizer partagés)
+from llama_cpp._internals import LlamaBatch, LlamaContext, LlamaSampler         # from : importer les enveloppes bas niveau | LlamaBatch, LlamaContext, LlamaSampler : lot multi-séquences, second contexte, échantillonneur par séquence
+from src.core.config import LLM_CONTEXT_WINDOW                                  # from : importer les constantes | src.core.config : fenêtre de chaque séquence
+from src.core.metrics import metrics                                            # from : importer le registre | src.core.metrics : taille des lots, durée des pas, tokens
+
+# Étape 2 — Configurer le logging
+logger = logging.getLogger(__name__)                                            # logger : objet enregistreur
+
+# Étape 3 — État d'une génération en cours
+class _Sequence:                                                                # class : définir une classe privée | _Sequence : une requête et sa place dans le lot
+    def __init__(self, tokens: List[int], max_tokens: int, temperature: float, metric_prefix: str, stop_event: Optional[threading.Event], system: bool): # def : constructeur | tokens : prompt complet (préfixe système compris)
+        self.tokens = tokens                                                    # self.tokens : prompt tokenisé
+        self.max_tokens = max_tokens                                            # self.max_tokens : limite de la réponse
+        self.temperature = temperature                                          # self.temperature : créativité
+        self.metric_prefix = metric_prefix                                      # self.metric_prefix : préfixe des métriques (ex : "hyde")
+        self.stop_event = stop_event                                            # self.stop_event : arrêt demandé par l'appelant (échéance HyDE)
+        self.abandoned = threading.Event()                                      # self.abandoned : le consommateur a arrêté de lire
+        self.system = system                                                    # self.system : commence par le bloc système (copié depuis la séquence de préfixe)
+        self.out: "queue.Queue" = queue.Queue()                                 # self.out : morceaux de texte (None = fin, exception = échec)
+        self.seq_id = -1                                                        # self.seq_id : identifiant de séquence attribué à l'admission
+        self.n_past = 0                                                         # self.n_past : tokens déjà dans le cache KV de la séquence
+        self.pending: List[int] = []                                            # self.pending : tokens du prompt restant à évaluer (prefill par morceaux)
+        self.last_token = -1                                                    # self.last_token : dernier token échantillonné (entrée du pas suivant)
+        self.generated = 0                                                      # self.generated : tokens produits
+        self.started = perf_counter()                                           # self.started : arrivée de la requête
+        self.sampler: Optional[LlamaSampler] = None                             # self.sampler : échantillonneur propre à la séquence
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")  # self.decoder : octets des tokens -> texte
+
+    def cancelled(self) -> bool:                                                # def : méthode | cancelled : arrêt demandé | -> : retour | bool
+        return self.abandoned.is_set() or (self.stop_event is not None and self.stop_event.is_set()) # return : échéance dépassée ou flux abandonné
+
+# Étape 4 — Définir l'ordonnanceur
+class BatchScheduler:                                                           # class : définir une classe | BatchScheduler : N générations simultanées sur une seule copie du modèle
+    """Un thread décode un lot contenant un token par séquence active (ou un morceau de prompt) ; les séquences terminées libèrent leur place dès le pas suivant."""
+
+    def __init__(self, llama: Llama, n_seq: int, prefix_tokens: List[int], n_ctx: int = LLM_CONTEXT_WINDOW): # def : constructeur | llama : modèle chargé | n_seq : séquences simultanées | prefix_tokens : bloc système commun | n_ctx : fenêtre par séquence
+        self.llama = llama                                                      # self.llama : poids et tokenizer (le contexte de Llama n'est pas utilisé ici)
+        self.n_seq = n_seq                                                      # self.n_seq : places dans le lot
+        self.n_ctx = n_ctx                                                      # self.n_ctx : fenêtre par séquence
+        self.n_batch = llama.n_batch                                            # self.n_batch : tokens au plus par pas (prefill découpé en morceaux)
+        self.prefix_tokens = list(prefix_tokens)                                # self.prefix_tokens : bloc système gardé dans la séquence n_seq
+        self.prefix_seq = n_seq                                                 # self.prefix_seq : séquence réservée au bloc système (copiée dans chaque réponse RAG)
+        self._pending: "queue.Queue[_Sequence]" = queue.Queue()                 # self._pending : requêtes en attente d'une place
+        self._start_lock = threading.Lock()                                     # self._start_lock : démarrage unique du thread
+        self._thread: Optional[threading.Thread] = None                         # self._thread : thread de décodage (démarré à la première requête)
+        self._ctx: Optional[LlamaContext] = None                                # self._ctx : contexte multi-séquences
+        self._batch: Optional[LlamaBatch] = None                                # self._batch : lot réutilisé à chaque pas
+
+    def _ensure_started(self):                                                  # def : méthode privée | _ensure_started : démarrer le thread depuis le premier appelant
+        """Démarré depuis un thread du pool : le thread de décodage (et ceux de llama.cpp) héritent de sa tranche de cœurs."""
+        with self._start_lock:                                                  # with : un seul démarrage
+            if self._thread is None:                                            # if : pas encore démarré
+                self._thread = threading.Thread(target=self._run, name="vev-llm-batch", daemon=True) # self._thread : boucle de décodage
+                self._thread.start()                                            # start : lancement
+
+    # Étape 4.1 — Contexte multi-séquences sur les poids déjà chargés
+    def _open_context(self):                                                    # def : méthode privée | _open_context : second contexte llama.cpp (cache KV partagé entre les séquences)
+        params = llama_cpp.llama_context_params.from_buffer_copy(self.llama.context_params) # params : mêmes threads et lots que le contexte de Llama
+        params.n_seq_max = self.n_seq + 1                                       # n_seq_max : séquences des réponses + séquence du bloc système
+        params.n_ctx = self.n_ctx * self.n_seq + len(self.prefix_tokens)        # n_ctx : une fenêtre par séquence, bloc système stocké une fois
+        params.kv_unified = True                                                # kv_unified : cache KV unique (le bloc système copié n'est pas dupliqué)
+        self._ctx = LlamaContext(model=self.llama._model, params=params, verbose=False) # self._ctx : contexte partageant les poids du modèle
+        self._batch = LlamaBatch(n_tokens=self.n_batch, embd=0, n_seq_max=1, verbose=False) # self._batch : un identifiant de séquence par token
+        for start in range(0, len(self.prefix_tokens), self.n_batch):           # for : bloc système par morceaux
+            chunk = self.prefix_tokens[start:start + self.n_batch]              # chunk : morceau du bloc système
+            self._batch.reset()                                                 # reset : lot vide
+            for i, token in enumerate(chunk):                                   # for : chaque token
+                self._add(token, start + i, self.prefix_seq, False)             # _add : aucun logit nécessaire
+            self._ctx.decode(self._batch)                                       # decode : prefill du bloc système, une seule fois
+        metrics.observe("llm.prefix_prefill_tokens", len(self.prefix_tokens))   # metrics.observe : coût payé une fois
+        logger.info(f"Batch scheduler ready: {self.n_seq} sequences x {self.n_ctx} tokens, {len(self.prefix_tokens)} system prompt tokens shared.") # logger.info : configuration
+
+    def _add(self, token: int, pos: int, seq_id: int, logits: bool):            # def : méthode privée | _add : ajouter un token au lot
+        batch, j = self._batch.batch, self._batch.batch.n_tokens                # batch : structure llama_batch | j : position dans le lot
+        batch.token[j] = token                                                  # token : identifiant du token
+        batch.pos[j] = pos                                                      # pos : position dans sa séquence
+        batch.n_seq_id[j] = 1                                                   # n_seq_id : une seule séquence
+        batch.seq_id[j][0] = seq_id                                             # seq_id : séquence du token
+        batch.logits[j] = logits                                                # logits : sortie calculée seulement pour le dernier token de chaque séquence
+        batch.n_tokens = j + 1                                                  # n_tokens : taille du lot
+
+    # Étape 4.2 — Admission et fin d'une séquence
+    def _admit(self, seq: _Sequence, seq_id: int):                              # def : méthode privée | _admit : donner une place à une requête
+        seq.seq_id = seq_id                                                     # seq_id : place attribuée
+        reused = len(self.prefix_tokens) if seq.system and seq.tokens[:len(self.prefix_tokens)] == self.prefix_tokens else 0 # reused : bloc système déjà calculé
+        if reused:                                                              # if : réponse RAG
+            self._ctx.kv_cache_seq_cp(self.prefix_seq, seq_id, 0, reused)       # kv_cache_seq_cp : le bloc système est partagé, pas recalculé
+        if seq.system:                                                          # if : réponse RAG
+            metrics.observe("llm.prefix_reused_tokens", reused)                 # metrics.observe : tokens du préfixe non recalculés
+        seq.n_past, seq.pending = reused, seq.tokens[reused:]                   # n_past, pending : reste du prompt à évaluer
+        seq.sampler = LlamaSampler()                                            # sampler : mêmes réglages que create_chat_completion
+        if seq.temperature <= 0:                                                # if : génération déterministe
+            seq.sampler.add_greedy()                                            # add_greedy : token le plus probable
+        else:                                                                   # else : échantillonnage
+            seq.sampler.add_top_k(40)                                           # add_top_k : 40 candidats
+            seq.sampler.add_top_p(0.95)                                         # add_top_p : masse cumulée 0.95
+            seq.sampler.add_min_p(0.05)                                         # add_min_p : probabilité relative minimale
+            seq.sampler.add_temp(seq.temperature)                               # add_temp : température
+            seq.sampler.add_dist(llama_cpp.LLAMA_DEFAULT_SEED)                  # add_dist : tirage (graine aléatoire)
+        metrics.observe(f"{seq.metric_prefix}.prompt_tokens", len(seq.tokens))  # metrics.observe : coût en tokens du prompt
+
+    def _finish(self, seq: _Sequence, error: Optional[Exception] = None):       # def : méthode privée | _finish : libérer la place d'une séquence | error : relevée par stream() après les morceaux déjà rendus
+        self._ctx.kv_cache_seq_rm(seq.seq_id, -1, -1)                           # kv_cache_seq_rm : vider le cache KV de la séquence
+        if seq.sampler is not None:                                             # if : échantillonneur créé
+            seq.sampler.close()                                                 # close : libérer l'échantillonneur
+        tail = seq.decoder.decode(b"", final=True)                              # tail : octets restants
+        if tail:                                                                # if : texte à rendre
+            seq.out.put(tail)                                                   # put : dernier morceau
+        seq.out.put(error)                                                      # put : marqueur de fin (None) ou erreur
+        metrics.observe(f"{seq.metric_prefix}.completion_tokens", seq.generated) # metrics.observe : tokens générés
+        if seq.cancelled():                                                     # if : arrêtée avant la fin
+            metrics.incr(f"{seq.metric_prefix}.interrupted")                    # metrics.incr : génération abandonnée
+
+    # Étape 4.3 — Boucle de décodage
+    def _run(self):                                                             # def : méthode privée | _run : un pas = un appel llama_decode pour toutes les séquences actives
+        try:                                                                    # try : contexte impossible à créer (mémoire)
+            self._open_context()                                                # _open_context : contexte et bloc système
+        except Exception as e:                                                  # except : toutes les requêtes échouent
+            logger.error(f"Batch scheduler failed to start: {e}")               # logger.error : afficher l'erreur
+            while True:                                                         # while : répondre aux requêtes en attente
+                self._pending.get().out.put(RuntimeError(f"Batch scheduler failed to start: {e}")) # put : échec relevé par stream() (jamais une réponse vide mise en cache)
+        active: Dict[int, _Sequence] = {}                                       # active : séquences du lot par identifiant
+        free = list(range(self.n_seq))                                          # free : places libres
+        while True:                                                             # while : boucle de l'ordonnanceur
+            if not active:                                                      # if : rien à décoder
+                seq = self._pending.get()                                       # get : attendre une requête (bloquant)
+                self._admit(seq, free.pop())                                    # _admit : première séquence
+                active[seq.seq_id] = seq                                        # active : séquence ajoutée
+            while free and not self._pending.empty():                           # while : places libres et requêtes en attente
+                seq = self._pending.get_nowait()                                # seq : rejoint le lot en cours
+                self._admit(seq, free.pop())                                    # _admit : place attribuée
+                active[seq.seq_id] = seq                                        # active : séquence ajoutée
+            for seq_id, seq in list(active.items()):                            # for : séquences annulées depuis le dernier pas
+                if seq.cancelled():                                             # if : échéance dépassée ou flux abandonné
+                    self._finish(seq)                                           # _finish : place libérée
+                    del active[seq_id]                                          # del : retrait du lot
+                    free.append(seq_id)                                         # free : place disponible
+            if not active:                                                      # if : toutes annulées
+                continue                                                        # continue : attendre la prochaine requête
+
+            # Construire le lot : un token par séquence en génération, un morceau de prompt pour les autres
+            self._batch.reset()                                                 # reset : lot vide
+            outputs: Dict[int, int] = {}                                        # outputs : séquence -> index de ses logits dans le lot
+            for seq in active.values():                                         # for : chaque séquence
+                room = self.n_batch - self._batch.batch.n_tokens                # room : place restante dans le lot
+                if room <= 0:                                                   # if : lot plein (prefills longs)
+                    break                                                       # break : les autres séquences attendent le pas suivant
+                if seq.pending:                                                 # if : prompt pas encore évalué
+                    chunk, seq.pending = seq.pending[:room], seq.pending[room:] # chunk : morceau du prompt
+                    for i, token in enumerate(chunk):                           # for : chaque token
+                        self._add(token, seq.n_past + i, seq.seq_id, not seq.pending and i == len(chunk) - 1) # _add : logits sur le dernier token du prompt
+                    seq.n_past += len(chunk)                                    # n_past : tokens évalués
+                    if not seq.pending:                                         # if : prompt entièrement évalué
+                        outputs[seq.seq_id] = self._batch.batch.n_tokens - 1    # outputs : premier token à échantillonner
+                else:                                                           # else : génération en cours
+                    self._add(seq.last_token, seq.n_past, seq.seq_id, True)     # _add : dernier token produit
+                    seq.n_past += 1                                             # n_past : un token de plus
+                    outputs[seq.seq_id] = self._batch.batch.n_tokens - 1        # outputs : token suivant à échantillonner
+            step_started = perf_counter()                                       # step_started : début du pas
+            try:                                                                # try : cache KV plein
+                self._ctx.decode(self._batch)                                   # decode : un passage du modèle pour tout le lot
+            except RuntimeError as e:                                           # except : échec du pas
+                logger.error(f"Batched decode failed: {e}")                     # logger.error : afficher l'erreur
+                for seq_id, seq in list(active.items()):                        # for : toutes les séquences du lot
+                    self._finish(seq, RuntimeError(f"Batched decode failed: {e}")) # _finish : erreur transmise au flux
+                    free.append(seq_id)                                         # free : place disponible
+                active.clear()                                                  # clear : lot vidé
+                continue                                                        # continue : requêtes suivantes
+            metrics.observe("llm_batch.step_seconds", perf_counter() - step_started) # metrics.observe : durée d'un pas
+            metrics.observe("llm_batch.sequences", len(outputs))                # metrics.observe : tokens générés par pas (débit = sequences / step_seconds)
+
+            # Échantillonner un token par séquence
+            for seq_id, index in outputs.items():                               # for : séquences avec des logits
+                seq = active[seq_id]                                            # seq : séquence concernée
+                token = seq.sampler.sample(self._ctx, index)                    # token : échantillonné (et accepté) depuis les logits de la séquence
+                done = llama_cpp.llama_vocab_is_eog(self.llama._model.vocab, token) or seq.generated >= seq.max_tokens or seq.n_past >= self.n_ctx # done : fin de génération, limite de tokens ou fenêtre pleine
+                if not done:                                                    # if : token de texte
+                    if seq.generated == 0:                                      # if : premier token
+                        metrics.observe(f"{seq.metric_prefix}.first_token_seconds", perf_counter() - seq.started) # metrics.observe : latence perçue (attente comprise)
+                    seq.generated += 1                                          # generated : un de plus
+                    seq.last_token = token                                      # last_token : entrée du pas suivant
+                    piece = seq.decoder.decode(self.llama.detokenize([token]))  # piece : texte du token (UTF-8 complété au besoin)
+                    if piece:                                                   # if : caractères complets
+                        seq.out.put(piece)                                      # put : rendu immédiat
+                else:                                                           # else : séquence terminée
+                    self._finish(seq)                                           # _finish : place libérée
+                    del active[seq_id]                                          # del : retrait du lot
+                    free.append(seq_id)                                         # free : place disponible
+
+    # Étape 4.4 — Interface appelée par LLMEngine
+    def stream(self, tokens: List[int], max_tokens: int, temperature: float = 0.6, metric_prefix: str = "llm", # def : méthode | stream : morceaux de texte d'une génération | tokens : prompt tokenisé
+               stop_event: Optional[threading.Event] = None, system: bool = False) -> Iterator[str]: # stop_event : arrêt demandé par l'appelant | system : le prompt commence par le bloc système | -> : retour | Iterator[str]
+        if len(tokens) >= self.n_ctx:                                           # if : prompt plus long que la fenêtre d'une séquence
+            raise ValueError(f"Prompt of {len(tokens)} tokens does not fit the {self.n_ctx}-token sequence window.") # raise : LLMEngine en fait un LLMGenerationError
+        seq = _Sequence(tokens, max_tokens, temperature, metric_prefix, stop_event, system) # seq : nouvelle génération
+        self._ensure_started()                                                  # _ensure_started : thread de décodage
+        self._pending.put(seq)                                                  # put : rejoint le lot au prochain pas
+        try:                                                                    # try : abandon du flux par le consommateur
+            while True:                                                         # while : relayer jusqu'au marqueur de fin
+                piece = seq.out.get()                                           # piece : morceau suivant
+                if piece is None:                                               # if : fin de la génération
+                    break                                                       # break : sortie
+                if isinstance(piece, Exception):                                # if : génération en échec
+                    raise piece                                                 # raise : relevée chez l'appelant
+                yield piece                                                     # yield : rendu immédiat
+        finally:                                                                # finally : flux terminé ou abandonné
+            seq.abandoned.set()                                                 # abandoned : la place est libérée au prochain pas si la séquence tourne encore
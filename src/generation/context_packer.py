@@ -0,0 +1,83 @@
+# Objectif — Construire le contexte du prompt final dans un budget de tokens : chunks par pertinence, phrases les plus proches de la question quand un chunk déborde
+
+# Étape 1 — Importer les dépendances
+import logging                                                                  # import : charger le module standard | logging : gestion des journaux
+import re                                                                       # import : charger le module standard | re : découpage en phrases et en mots
+import threading                                                                # import : charger le module standard | threading : verrou du cache de comptage
+from collections import OrderedDict                                             # from : importer depuis collections | OrderedDict : cache LRU des comptes de tokens
+from typing import Callable, List, Sequence, Tuple                              # from : importer depuis le typage | typing : module types | Callable, List, Sequence, Tuple : types génériques
+from src.core.config import CONTEXT_TOKEN_BUDGET, CONTEXT_MIN_CHUNK_TOKENS      # from : importer les constantes | src.core.config : budget du contexte et plus petit extrait utile
+from src.core.metrics import metrics                                            # from : importer le registre | src.core.metrics : tokens envoyés, chunks coupés ou écartés
+from src.core.schemas import SearchResult                                       # from : importer le schéma | src.core.schemas : chunks classés par le Reranker
+
+# Étape 2 — Configurer le logging
+logger = logging.getLogger(__name__)                                            # logger : objet enregistreur | = : assignation | logging.getLogger(__name__) : récupérer le logger actuel
+
+CHAT_TEMPLATE_TOKENS = 32                                                       # CHAT_TEMPLATE_TOKENS : marge pour les balises ChatML ajoutées autour du prompt (<|im_start|>user...)
+CONTEXT_SEPARATOR = "\n---\n"                                                   # CONTEXT_SEPARATOR : séparateur entre deux chunks du contexte
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?;:])\s+|\n+")                             # SENTENCE_SPLIT : fin de phrase ou saut de ligne
+WORD = re.compile(r"\w{3,}")                                                    # WORD : mots d'au moins trois lettres (ignore "le", "de", "à"...)
+
+# Étape 3 — Définir le packer
+class ContextPacker:                                                            # class : définir une classe | ContextPacker : contexte borné en tokens
+    """Remplit un budget de tokens avec les chunks du plus au moins pertinent ; un chunk trop long est réduit à ses phrases les plus proches de la question."""
+
+    def __init__(self, count_tokens: Callable[[str], int], cache_size: int = 4096): # def : constructeur | count_tokens : tokenizer du GGUF chargé (LLMEngine.count_tokens) | cache_size : comptes gardés en mémoire
+        self.count_tokens = count_tokens                                        # self.count_tokens : fonction de comptage
+        self.cache_size = cache_size                                            # self.cache_size : capacité du cache LRU
+        self._counts: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()       # self._counts : id du chunk -> (texte, nombre de tokens)
+        self._lock = threading.Lock()                                           # self._lock : protège le cache (sessions Streamlit parallèles)
+
+    # Étape 3.1 — Compter les tokens d'un chunk (une fois par chunk)
+    def chunk_tokens(self, result: SearchResult) -> int:                        # def : méthode | chunk_tokens : taille d'un chunk en tokens | -> : retour | int
+        """Relit le compte du cache ; recompte si le texte du chunk a changé (réindexation)."""
+        key, text = result.chunk.id, result.chunk.text                          # key, text : identifiant et contenu
+        with self._lock:                                                        # with : section critique
+            cached = self._counts.get(key)                                      # cached : (texte, compte) ou None
+            if cached and cached[0] == text:                                    # if : même texte déjà compté
+                self._counts.move_to_end(key)                                   # move_to_end : entrée la plus récente (LRU)
+                return cached[1]                                                # return : compte en cache
+        count = self.count_tokens(text)                                         # count : tokenisation (hors verrou)
+        with self._lock:                                                        # with : section critique
+            self._counts[key] = (text, count)                                   # mise en cache
+            if len(self._counts) > self.cache_size:                             # if : cache plein
+                self._counts.popitem(last=False)                                # popitem(last=False) : retirer l'entrée la plus ancienne
+        return count                                                            # return : nombre de tokens
+
+    # Étape 3.2 — Réduire un chunk à ses phrases les plus pertinentes
+    def trim(self, query: str, text: str, budget: int) -> str:                  # def : méthode | trim : extrait du chunk dans le budget | -> : retour | str : vide si rien ne tient
+        """Classe les phrases par mots communs avec la question, garde les meilleures qui tiennent, puis les remet dans l'ordre du texte."""
+        query_words = {w.casefold() for w in WORD.findall(query)}               # query_words : vocabulaire de la question
+        sentences = [s.strip() for s in SENTENCE_SPLIT.split(text) if s.strip()] # sentences : phrases du chunk
+        overlap = [len(query_words & {w.casefold() for w in WORD.findall(s)}) for s in sentences] # overlap : mots de la question présents dans chaque phrase
+        kept, used = [], 0                                                      # kept : indices gardés | used : tokens consommés
+        for i in sorted(range(len(sentences)), key=lambda i: (-overlap[i], i)): # for : phrases de la plus à la moins pertinente (ordre du texte en cas d'égalité)
+            cost = self.count_tokens(sentences[i]) + 1                          # cost : tokens de la phrase + espace de jonction
+            if used + cost <= budget:                                           # if : la phrase tient encore
+                kept.append(i)                                                  # kept.append : phrase retenue
+                used += cost                                                    # used : budget consommé
+        return " ".join(sentences[i] for i in sorted(kept))                     # return : phrases dans l'ordre d'origine
+
+    # Étape 3.3 — Construire le contexte
+    def pack(self, query: str, results: Sequence[SearchResult], budget: int = CONTEXT_TOKEN_BUDGET) -> List[str]: # def : méthode | pack : textes du contexte | results : chunks classés par pertinence | budget : tokens disponibles | -> : retour | List[str]
+        """Ajoute les chunks entiers tant qu'ils tiennent ; le premier qui déborde est réduit, les suivants ne reçoivent que le reste du budget."""
+        separator_tokens = self.count_tokens(CONTEXT_SEPARATOR)                 # separator_tokens : coût d'un séparateur
+        texts, remaining, trimmed = [], budget, 0                               # texts : contexte | remaining : tokens restants | trimmed : chunks coupés
+        for result in results:                                                  # for : du plus au moins pertinent
+            cost = self.chunk_tokens(result) + (separator_tokens if texts else 0) # cost : chunk + séparateur
+            if cost <= remaining:                                               # if : le chunk tient en entier
+                texts.append(result.chunk.text)                                 # texts.append : chunk complet
+                remaining -= cost                                               # remaining : budget restant
+                continue                                                        # continue : chunk suivant
+            if remaining < CONTEXT_MIN_CHUNK_TOKENS:                            # if : plus de place pour un extrait utile
+                break                                                           # break : contexte plein
+            excerpt = self.trim(query, result.chunk.text, remaining - separator_tokens) # excerpt : phrases les plus pertinentes du chunk
+            if excerpt:                                                         # if : au moins une phrase tient
+                texts.append(excerpt)                                           # texts.append : extrait
+                remaining -= self.count_tokens(excerpt) + (separator_tokens if len(texts) > 1 else 0) # remaining : budget restant
+                trimmed += 1                                                    # trimmed : un chunk coupé de plus
+        metrics.observe("context.tokens", budget - remaining)                   # metrics.observe : tokens de contexte envoyés au prefill
+        metrics.incr("context.trimmed_chunks", trimmed)                         # metrics.incr : chunks réduits
+        metrics.incr("context.dropped_chunks", len(results) - len(texts))       # metrics.incr : chunks écartés
+        logger.info(f"Context packed: {len(texts)}/{len(results)} chunks ({trimmed} trimmed), {budget - remaining}/{budget} tokens") # logger.info : bilan
+        return texts                                                            # return : textes à joindre avec CONTEXT_SEPARATOR
@@ -1,69 +1,245 @@
-# Objectif — Implémenter le moteur LLM local pour la génération de texte (réponse finale et HyDE) en utilisant llama-cpp-python (GGUF)
+# Objectif — Implémenter le moteur LLM local pour la génération de texte (réponse finale et HyDE) en utilisant llama-cpp-python (GGUF), avec réutilisation de l'état KV du prompt système et décodage spéculatif optionnel
 
 # Étape 1 — Importer les dépendances
-import os
+import hashlib                                                                  # import : charger le module standard | hashlib : nom du fichier d'état KV (modèle + prompt système + fenêtre)
 import logging                                                                  # import : charger le module standard | logging : gestion des journaux
+import os                                                                       # import : charger le module standard | os : identifiant du processus (fichier temporaire de l'état KV)
+import pickle                                                                   # import : charger le module standard | pickle : état KV du prompt système sur disque
+import threading                                                                # import : charger le module standard | threading : verrou du modèle et arrêt d'une génération
 from pathlib import Path                                                        # from : importer depuis un package | pathlib : gestion moderne des chemins | Path : classe objet chemin
-from typing import Optional                                                     # from : importer depuis le typage | typing : module types | Optional : type pour gérer l'absence de valeur
-from llama_cpp import Llama                                                     # from : importer le moteur LLM | llama_cpp : librairie d'inférence GGUF | Llama : classe principale du modèle
-from src.core.config import LLM_DIR, LLM_MODEL_FILE, LLM_CONTEXT_WINDOW, LLM_MAX_TOKENS # from : importer les constantes | src.core.config : notre configuration | LLM_DIR, ... : chemins et tailles
+from time import perf_counter                                                   # from : importer depuis le module temps | perf_counter : délai avant le premier token
+from typing import Dict, Iterator, List, Optional                               # from : importer depuis le typage | typing : module types | Dict, List : messages du chat | Iterator : flux de tokens | Optional : type pour gérer l'absence de valeur
+import llama_cpp                                                                # import : charger la librairie | llama_cpp : version (clé de l'état KV persisté)
+from llama_cpp import Llama, LlamaState                                         # from : importer le moteur LLM | llama_cpp : librairie d'inférence GGUF | Llama : classe principale du modèle | LlamaState : état KV sauvegardé
+from src.core.config import LLM_DIR, LLM_MODEL_FILE, LLM_CONTEXT_WINDOW, LLM_MAX_TOKENS, LLM_PREFIX_CACHE, LLM_PREFIX_CACHE_DIR, LLM_THREADS, LLM_THREADS_BATCH, LLM_BATCH_SEQUENCES, LLM_DRAFT # from : importer les constantes | src.core.config : notre configuration | LLM_DIR, ... : chemins et tailles | LLM_PREFIX_CACHE* : état KV du prompt système | LLM_THREADS* : threads par instance | LLM_BATCH_SEQUENCES : décodage par lots | LLM_DRAFT : décodage spéculatif
+from src.generation.speculative import make_draft_model                         # from : importer le brouillon | src.generation.speculative : décodage spéculatif (LLM_DRAFT)
+from src.generation.batch_scheduler import BatchScheduler                       # from : importer l'ordonnanceur | src.generation.batch_scheduler : plusieurs générations dans un même contexte
+from src.generation.system_prompts import LLM_SYSTEM_PROMPT                     # from : importer le prompt | src.generation.system_prompts : rôle de l'agent (préfixe commun des réponses)
+from src.core.metrics import metrics                                            # from : importer le registre | src.core.metrics : tokens consommés par génération
 
 # Étape 2 — Configurer le logging
 logger = logging.getLogger(__name__)                                            # logger : objet enregistreur | = : assignation | logging.getLogger(__name__) : récupérer le logger actuel
 
+MODEL_UNAVAILABLE_MESSAGE = "Error: LLM model not available."                   # MODEL_UNAVAILABLE_MESSAGE : réponse quand le fichier GGUF n'a pas pu être chargé
+GENERATION_FAILED_MESSAGE = "Error: Generation failed due to internal LLM error (possibly out of context memory)." # GENERATION_FAILED_MESSAGE : réponse quand llama.cpp échoue
+
+class LLMGenerationError(RuntimeError):                                         # class : définir une exception | LLMGenerationError : génération impossible
+    """Modèle absent, erreur llama.cpp ou file du pool pleine ; str(e) est le message montré à l'utilisateur (jamais mis en cache)."""
+
 # Étape 3 — Définir la classe du Moteur LLM
 class LLMEngine:                                                                # class : définir une classe | LLMEngine : outil pour interagir avec le modèle
     
     # Étape 3.1 — Constructeur (Chargement du modèle)
-    def __init__(self):                                                         # def : constructeur | self : instance de la classe
+    def __init__(self, system_prompt: str = LLM_SYSTEM_PROMPT, n_threads: int = LLM_THREADS, n_threads_batch: int = LLM_THREADS_BATCH): # def : constructeur | self : instance de la classe | system_prompt : message système des réponses RAG | n_threads, n_threads_batch : threads du décodage et du prefill (tranche de cœurs de l'instance)
         model_path = LLM_DIR / LLM_MODEL_FILE                                   # model_path : chemin complet du fichier GGUF | LLM_DIR : dossier | / : concaténation | LLM_MODEL_FILE : nom du fichier
         
         if not model_path.exists():                                             # if : si le fichier GGUF n'est pas dans le dossier
             logger.error(f"LLM model file not found at: {model_path}")          # logger.error : message critique
             raise FileNotFoundError("GGUF model file not found. Please download Qwen 2.5 3B GGUF into models/llm/ directory.") # raise : lever erreur | FileNotFoundError : le fichier est manquant
         
+        self._lock = threading.Lock()                                           # self._lock : le contexte llama.cpp ne supporte pas deux générations simultanées
+        self.system_prompt = system_prompt                                      # self.system_prompt : préfixe identique de toutes les réponses RAG
+        self._prefix_tokens: List[int] = []                                     # self._prefix_tokens : tokens du bloc système (ChatML)
+        self._prefix_state: Optional[LlamaState] = None                         # self._prefix_state : état KV après le bloc système (None = pas de réutilisation)
         logger.info(f"Loading LLM from {model_path}...")                        # logger.info : afficher le modèle en cours de chargement
+        draft_model = make_draft_model() if LLM_BATCH_SEQUENCES == 1 else None  # draft_model : brouillon du décodage spéculatif (None = désactivé)
+        if LLM_DRAFT and LLM_BATCH_SEQUENCES > 1:                               # if : l'ordonnanceur par lots n'utilise pas Llama.generate
+            logger.warning("Speculative decoding (LLM_DRAFT) is ignored when LLM_BATCH_SEQUENCES > 1.") # logger.warning : configuration incompatible
         try:                                                                    # try : tenter d'exécuter le bloc suivant
-            # Llama.cpp est optimisé pour utiliser tous les cœurs CPU disponibles
+            # Llama.cpp répartit chaque génération sur n_threads cœurs ; avec plusieurs instances (LLMPool), chacune a sa tranche
             self.model = Llama(                                                 # self.model : instance du modèle chargé
                 model_path=str(model_path),                                     # model_path : chemin du fichier GGUF
                 n_ctx=LLM_CONTEXT_WINDOW,                                       # n_ctx : taille max de la fenêtre de contexte (mémoire)
-                n_threads=os.cpu_count(),                                       # n_threads : utiliser tous les cœurs CPU disponibles
+                n_threads=n_threads,                                            # n_threads : threads du décodage token par token (tous les cœurs si une seule instance)
+                n_threads_batch=n_threads_batch,                                # n_threads_batch : threads de l'évaluation du prompt par lots (prefill)
+                draft_model=draft_model,                                        # draft_model : tokens proposés puis vérifiés en un passage (garde les logits de toute la fenêtre : n_ctx x vocabulaire en float32)
                 verbose=False                                                   # verbose : désactiver les messages d'inférence bruyants
             )
-            logger.info(f"LLM Qwen loaded successfully. Context size: {LLM_CONTEXT_WINDOW}") # logger.info : confirmation de chargement réussi
+            logger.info(f"LLM Qwen loaded successfully. Context size: {LLM_CONTEXT_WINDOW}, threads: {n_threads} (batch: {n_threads_batch})") # logger.info : confirmation de chargement réussi
         except Exception as e:                                                  # except : si une erreur survient
             logger.error(f"Failed to load Llama-cpp model: {e}")                # logger.error : afficher l'erreur
             self.model = None                                                   # self.model : mettre à None si échec
+        if self.model and getattr(draft_model, "model", None) is not None and draft_model.model.n_vocab() != self.model.n_vocab(): # if : petit modèle d'un autre tokenizer
+            logger.warning("Draft model vocabulary differs from the target model, speculative decoding disabled.") # logger.warning : brouillon inutilisable
+            self.model.draft_model = None                                       # draft_model : génération classique
+        self.scheduler: Optional[BatchScheduler] = None                         # self.scheduler : décodage par lots (None = une génération à la fois sous verrou)
+        if self.model:                                                          # if : modèle chargé
+            self._prefix_tokens = self._chatml("system", self.system_prompt)    # _prefix_tokens : même début que le prompt formaté par create_chat_completion
+            if LLM_BATCH_SEQUENCES > 1:                                         # if : plusieurs générations par contexte
+                self.scheduler = BatchScheduler(self.model, LLM_BATCH_SEQUENCES, self._prefix_tokens) # self.scheduler : le bloc système y est gardé dans une séquence dédiée
+            elif LLM_PREFIX_CACHE:                                              # elif : réutilisation activée
+                self.warm_prefix()                                              # warm_prefix : état KV du prompt système (disque, sinon un prefill au démarrage)
+        self.concurrency = LLM_BATCH_SEQUENCES if self.scheduler else 1         # self.concurrency : générations simultanées acceptées (threads du pool pour cette instance)
+
+    # Étape 3.1 ter — État KV du prompt système (préfixe commun de toutes les réponses RAG)
+    def _prefix_path(self) -> Path:                                             # def : méthode privée | _prefix_path : fichier d'état de ce modèle, de ce prompt et de cette fenêtre | -> : retour | Path
+        key = hashlib.sha1(f"{LLM_MODEL_FILE}|{LLM_CONTEXT_WINDOW}|{self.model.n_batch}|{llama_cpp.__version__}|{self.system_prompt}".encode("utf-8")).hexdigest()[:16] # key : un autre prompt, modèle, n_batch ou llama.cpp ne relit jamais cet état
+        return LLM_PREFIX_CACHE_DIR / f"{Path(LLM_MODEL_FILE).stem}-{key}.state" # return : chemin du fichier
+
+    def warm_prefix(self):                                                      # def : méthode | warm_prefix : calculer (ou relire) l'état KV du bloc système
+        """Le bloc système est tokenisé comme le template ChatML de Qwen ; son état KV est gardé en RAM et sur disque pour survivre aux redémarrages."""
+        path = self._prefix_path()                                              # path : état persisté
+        try:                                                                    # try : un fichier corrompu ou d'une autre version de llama.cpp est recalculé
+            if path.exists():                                                   # if : état déjà calculé par un démarrage précédent
+                with open(path, "rb") as f:                                     # with : lecture binaire
+                    state = pickle.load(f)                                      # state : état relu sans prefill
+                if state.input_ids[:state.n_tokens].tolist() != self._prefix_tokens: # if : tokens différents du bloc système (tokenizer modifié)
+                    raise ValueError("tokens do not match the system prompt")   # raise : état inutilisable
+                with self._lock:                                                # with : le contexte llama.cpp est partagé
+                    self.model.load_state(state)                                # load_state : validation réelle (taille d'état refusée par llama.cpp -> RuntimeError)
+                self._prefix_state = state                                      # _prefix_state : état accepté par le contexte
+                logger.info(f"Loaded system prompt KV state ({len(self._prefix_tokens)} tokens) from {path}") # logger.info : suivi
+                return                                                          # return : rien à calculer
+        except Exception as e:                                                  # except : état illisible ou refusé
+            logger.warning(f"Discarding unusable KV state {path}: {e}")         # logger.warning : fichier supprimé puis état recalculé
+            path.unlink(missing_ok=True)                                        # unlink : ne plus le relire aux prochains démarrages
+        with self._lock:                                                        # with : le prefill utilise le contexte llama.cpp
+            self.model.reset()                                                  # reset : contexte vide
+            self.model.eval(self._prefix_tokens)                                # eval : prefill du bloc système, une seule fois
+            state = self.model.save_state()                                     # state : état KV + logits
+        self._prefix_state = LlamaState(input_ids=state.input_ids, scores=state.scores[-1:].copy(), n_tokens=state.n_tokens, # _prefix_state : seule la dernière ligne de logits est gardée (load_state la diffuse sur les lignes du préfixe, réécrites par l'évaluation de la suite du prompt)
+                                        llama_state=state.llama_state, llama_state_size=state.llama_state_size, seed=state.seed) # état KV du bloc système inchangé
+        metrics.observe("llm.prefix_prefill_tokens", len(self._prefix_tokens))  # metrics.observe : coût payé une fois par modèle / prompt
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}-{threading.get_ident()}.tmp") # tmp_path : fichier temporaire propre à ce moteur (un fichier tronqué ne porte jamais le nom final)
+        try:                                                                    # try : disque plein ou en lecture seule -> état gardé en RAM seulement
+            LLM_PREFIX_CACHE_DIR.mkdir(parents=True, exist_ok=True)             # mkdir : créer le dossier si nécessaire
+            with open(tmp_path, "wb") as f:                                     # with : écriture binaire
+                pickle.dump(self._prefix_state, f, protocol=pickle.HIGHEST_PROTOCOL) # pickle.dump : état persisté
+            tmp_path.replace(path)                                              # replace : publication atomique
+            logger.info(f"Saved system prompt KV state ({len(self._prefix_tokens)} tokens) to {path}") # logger.info : suivi
+        except OSError as e:                                                    # except : écriture impossible
+            logger.warning(f"Could not persist KV state to {path}: {e}")        # logger.warning : avertissement
+            tmp_path.unlink(missing_ok=True)                                    # unlink : pas de fichier partiel laissé sur le disque
+
+    def _restore_prefix(self):                                                  # def : méthode privée | _restore_prefix : remettre le bloc système dans le contexte avant une réponse RAG (verrou tenu)
+        """llama.cpp saute déjà les tokens communs avec le dernier prompt évalué ; après une génération HyDE, l'état du bloc système est rechargé au lieu d'être recalculé."""
+        if self._prefix_state is None:                                          # if : réutilisation désactivée ou état indisponible
+            metrics.observe("llm.prefix_reused_tokens", 0)                      # metrics.observe : tout le prompt est évalué
+            return                                                              # return : rien à restaurer
+        prefix_len = len(self._prefix_tokens)                                   # prefix_len : taille du bloc système
+        live = self.model.input_ids[:self.model.n_tokens].tolist()              # live : tokens actuellement dans le cache KV
+        if Llama.longest_token_prefix(live, self._prefix_tokens) < prefix_len:  # if : le contexte courant ne commence pas par le bloc système (HyDE, multi-requêtes, démarrage)
+            self.model.load_state(self._prefix_state)                           # load_state : copie mémoire de l'état au lieu d'un prefill
+            metrics.incr("llm.prefix_restored")                                 # metrics.incr : état rechargé
+        metrics.observe("llm.prefix_reused_tokens", prefix_len)                 # metrics.observe : tokens du préfixe non recalculés
+
+    def _chatml(self, role: str, content: str) -> List[int]:                    # def : méthode privée | _chatml : tokens d'un message au format ChatML de Qwen | -> : retour | List[int]
+        return self.model.tokenize(f"<|im_start|>{role}\n{content}<|im_end|>\n".encode("utf-8"), add_bos=False, special=True) # return : balises spéciales comprises
+
+    def _chat_tokens(self, prompt: str, system: bool) -> List[int]:             # def : méthode privée | _chat_tokens : prompt complet pour l'ordonnanceur (create_chat_completion n'est pas utilisé) | -> : retour | List[int]
+        prefix = self._prefix_tokens if system else []                          # prefix : bloc système commun en tête
+        return prefix + self._chatml("user", prompt) + self.model.tokenize(b"<|im_start|>assistant\n", add_bos=False, special=True) # return : question puis début de la réponse
+
+    def _messages(self, prompt: str, system: bool) -> List[Dict[str, str]]:     # def : méthode privée | _messages : messages ChatML | system : réponse RAG (préfixe système) ou tâche auxiliaire (HyDE) | -> : retour | List[Dict]
+        messages = [{"role": "system", "content": self.system_prompt}] if system else [] # messages : bloc système commun en tête
+        return messages + [{"role": "user", "content": prompt}]                 # return : question et contexte en message utilisateur
+
+    # Étape 3.1 bis — Compter les tokens avec le tokenizer du GGUF
+    def count_tokens(self, text: str) -> int:                                   # def : méthode | count_tokens : taille exacte d'un texte pour ce modèle | -> : retour | int
+        """Tokenise sans BOS ni tokens spéciaux (le vocabulaire seul, sans le contexte : pas besoin du verrou de génération)."""
+        if not self.model:                                                      # if : modèle indisponible
+            return len(text) // 4 + 1                                           # return : estimation (environ 4 caractères par token)
+        return len(self.model.tokenize(text.encode("utf-8"), add_bos=False, special=False)) # return : nombre de tokens réels
 
     # Étape 3.2 — Méthode de génération
-    def generate(self, prompt: str, max_tokens: Optional[int] = None, temperature: float = 0.6) -> str: # def : définir la méthode | generate : fonction principale de génération | max_tokens : limite de la réponse | temperature : créativité
+    def generate(self, prompt: str, max_tokens: Optional[int] = None, temperature: float = 0.6, metric_prefix: str = "llm", # def : définir la méthode | generate : fonction principale de génération | max_tokens : limite de la réponse | temperature : créativité | metric_prefix : préfixe des métriques de tokens (ex : "hyde")
+                 stop_event: Optional[threading.Event] = None, system: bool = False) -> str: # stop_event : événement d'arrêt (génération interruptible) | system : précéder du prompt système (réponses RAG)
         """Génère une réponse textuelle en utilisant le modèle chargé."""
         if not self.model:                                                      # if : si le modèle n'a pas pu être chargé
             logger.error("LLM engine is inactive.")                             # logger.error : prévenir l'utilisateur
-            return "Error: LLM model not available."                            # return : renvoyer un message d'erreur
+            raise LLMGenerationError(MODEL_UNAVAILABLE_MESSAGE)                 # raise : l'appelant affiche le message sans le mettre en cache
 
         max_tokens = max_tokens or LLM_MAX_TOKENS                               # max_tokens : utiliser la valeur passée OU la valeur par défaut du config.py
+        if self.scheduler:                                                      # if : décodage par lots
+            try:                                                                # try : séquence refusée ou pas de décodage en échec
+                return "".join(self.scheduler.stream(self._chat_tokens(prompt, system), max_tokens, temperature, metric_prefix, stop_event, system)) # return : texte produit, en lot avec les autres générations
+            except Exception as e:                                              # except : erreur relevée par l'ordonnanceur
+                logger.error(f"LLM Generation failed: {e}")                     # logger.error : afficher l'erreur
+                raise LLMGenerationError(GENERATION_FAILED_MESSAGE) from e      # raise : même signal que la génération directe
         
         # Le format ChatML est le format optimal pour Qwen (prompt système/utilisateur)
-        messages = [                                                            # messages : liste formatée pour le modèle
-            {"role": "user", "content": prompt}                                 # "role": "user" : le rôle de l'utilisateur | "content": prompt : le texte à traiter
-        ]                                                                       # ] : fin de la liste messages
+        messages = self._messages(prompt, system)                               # messages : liste formatée pour le modèle (bloc système commun en tête si system)
 
         try:                                                                    # try : tenter l'inférence
-            response = self.model.create_chat_completion(                       # response : résultat de l'inférence
-                messages=messages,                                              # messages=messages : la requête formatée
-                max_tokens=max_tokens,                                          # max_tokens : limite de la réponse
-                temperature=temperature,                                        # temperature : niveau de créativité (0.0=déterministe, 1.0=créatif)
-                stream=False                                                    # stream=False : attendre la réponse complète (pas de streaming)
-            )
+            with self._lock:                                                    # with : un seul appel à la fois sur le contexte llama.cpp (non thread-safe)
+                if system:                                                      # if : réponse RAG
+                    self._restore_prefix()                                      # _restore_prefix : bloc système déjà dans le cache KV
+                if stop_event is not None:                                      # if : génération interruptible (HyDE avec échéance)
+                    return self._generate_interruptible(messages, max_tokens, temperature, stop_event, metric_prefix) # return : texte produit jusqu'à l'arrêt
+                started = perf_counter()                                        # started : début de la génération (débit en tokens/s)
+                response = self.model.create_chat_completion(                   # response : résultat de l'inférence
+                    messages=messages,                                          # messages=messages : la requête formatée
+                    max_tokens=max_tokens,                                      # max_tokens : limite de la réponse
+                    temperature=temperature,                                    # temperature : niveau de créativité (0.0=déterministe, 1.0=créatif)
+                    stream=False                                                # stream=False : attendre la réponse complète (pas de streaming)
+                )
             # Extrait le texte généré par le LLM
             generated_text = response['choices'][0]['message']['content']       # generated_text : extraction du contenu de la réponse
+            usage = response.get('usage') or {}                                 # usage : tokens consommés (fournis par llama.cpp)
+            metrics.observe(f"{metric_prefix}.prompt_tokens", usage.get('prompt_tokens', 0)) # metrics.observe : coût en tokens du prompt
+            metrics.observe(f"{metric_prefix}.completion_tokens", usage.get('completion_tokens', 0)) # metrics.observe : coût en tokens générés
+            metrics.observe(f"{metric_prefix}.tokens_per_second", usage.get('completion_tokens', 0) / max(perf_counter() - started, 1e-9)) # metrics.observe : débit de génération, prefill compris (gain du décodage spéculatif)
             return generated_text                                               # return : renvoyer le texte propre
 
         except Exception as e:                                                  # except : si l'inférence échoue (souvent OOM, Out Of Memory)
             logger.error(f"LLM Generation failed: {e}")                         # logger.error : afficher l'erreur
-            return "Error: Generation failed due to internal LLM error (possibly out of context memory)." # return : renvoyer un message d'erreur explicite
+            raise LLMGenerationError(GENERATION_FAILED_MESSAGE) from e          # raise : échec signalé à l'appelant (message à afficher, réponse à ne pas mettre en cache)
+
+    # Étape 3.2 bis — Génération en streaming (réponse affichée au fil du décodage)
+    def generate_stream(self, prompt: str, max_tokens: Optional[int] = None, temperature: float = 0.6, metric_prefix: str = "llm", system: bool = False) -> Iterator[str]: # def : méthode | generate_stream : morceaux de texte dès leur décodage | -> : retour | Iterator[str]
+        """Même génération que `generate`, mais chaque morceau est produit dès qu'il est décodé (le verrou est tenu jusqu'à la fin ou l'abandon du flux)."""
+        if not self.model:                                                      # if : si le modèle n'a pas pu être chargé
+            logger.error("LLM engine is inactive.")                             # logger.error : prévenir l'utilisateur
+            raise LLMGenerationError(MODEL_UNAVAILABLE_MESSAGE)                 # raise : relevée à la première itération du flux
+
+        if self.scheduler:                                                      # if : décodage par lots
+            try:                                                                # try : séquence refusée ou pas de décodage en échec
+                yield from self.scheduler.stream(self._chat_tokens(prompt, system), max_tokens or LLM_MAX_TOKENS, temperature, metric_prefix, system=system) # yield from : morceaux relayés par l'ordonnanceur
+            except Exception as e:                                              # except : erreur relevée par l'ordonnanceur (éventuellement après des morceaux déjà rendus)
+                logger.error(f"LLM Generation failed: {e}")                     # logger.error : afficher l'erreur
+                raise LLMGenerationError(GENERATION_FAILED_MESSAGE) from e      # raise : même signal que la génération directe
+            return                                                              # return : fin du flux
+
+        messages = self._messages(prompt, system)                               # messages : même format ChatML que generate
+        started, tokens = perf_counter(), 0                                     # started : début de la génération | tokens : morceaux non vides reçus
+        try:                                                                    # try : tenter l'inférence
+            with self._lock:                                                    # with : un seul appel à la fois sur le contexte llama.cpp (non thread-safe)
+                if system:                                                      # if : réponse RAG
+                    self._restore_prefix()                                      # _restore_prefix : bloc système déjà dans le cache KV
+                stream = self.model.create_chat_completion(messages=messages, max_tokens=max_tokens or LLM_MAX_TOKENS, temperature=temperature, stream=True) # stream : générateur de morceaux
+                try:                                                            # try : toujours fermer le flux (consommateur qui s'arrête en route)
+                    for chunk in stream:                                        # for : chaque token reçu
+                        piece = chunk['choices'][0]['delta'].get('content') or '' # piece : texte du token (vide pour le rôle et la fin)
+                        if piece:                                               # if : token de texte
+                            if tokens == 0:                                     # if : premier token
+                                metrics.observe(f"{metric_prefix}.first_token_seconds", perf_counter() - started) # metrics.observe : latence perçue par l'utilisateur
+                            tokens += 1                                         # tokens : un de plus
+                            yield piece                                         # yield : rendu immédiat
+                finally:                                                        # finally : libérer le générateur llama.cpp
+                    stream.close()                                              # close : arrête la boucle de décodage
+        except Exception as e:                                                  # except : si l'inférence échoue (souvent OOM, Out Of Memory)
+            logger.error(f"LLM Generation failed: {e}")                         # logger.error : afficher l'erreur
+            raise LLMGenerationError(GENERATION_FAILED_MESSAGE) from e          # raise : échec signalé à l'appelant (après les morceaux déjà rendus)
+        finally:                                                                # finally : métriques même si le flux est abandonné
+            metrics.observe(f"{metric_prefix}.completion_tokens", tokens)       # metrics.observe : un morceau de flux non vide = un token
+            metrics.observe(f"{metric_prefix}.stream_seconds", perf_counter() - started) # metrics.observe : durée totale du flux
+            metrics.observe(f"{metric_prefix}.tokens_per_second", tokens / max(perf_counter() - started, 1e-9)) # metrics.observe : débit de génération, prefill compris (gain du décodage spéculatif)
+
+    # Étape 3.3 — Génération interruptible (streaming interne, arrêt dès que l'événement est levé)
+    def _generate_interruptible(self, messages, max_tokens: int, temperature: float, stop_event: threading.Event, metric_prefix: str) -> str: # def : méthode privée | _generate_interruptible : générer jusqu'à la fin ou l'arrêt | -> : retour | str : texte produit
+        """Génère token par token et s'arrête dès que `stop_event` est levé (libère le modèle pour la réponse finale)."""
+        pieces = []                                                             # pieces : morceaux de texte reçus
+        stream = self.model.create_chat_completion(messages=messages, max_tokens=max_tokens, temperature=temperature, stream=True) # stream : générateur de morceaux
+        try:                                                                    # try : toujours fermer le flux
+            for chunk in stream:                                                # for : chaque token reçu
+                if stop_event.is_set():                                         # if : échéance dépassée côté appelant
+                    metrics.incr(f"{metric_prefix}.interrupted")                # metrics.incr : génération abandonnée
+                    break                                                       # break : arrêter de décoder
+                pieces.append(chunk['choices'][0]['delta'].get('content') or '') # pieces.append : texte du token
+        finally:                                                                # finally : libérer le générateur llama.cpp
+            stream.close()                                                      # close : arrête la boucle de décodage
+        metrics.observe(f"{metric_prefix}.completion_tokens", sum(1 for piece in pieces if piece)) # metrics.observe : un morceau de flux non vide = un token
+        return "".join(pieces)                                                  # return : texte produit
 
 # Étape 4 — Instancier le moteur (Singleton) - On le charge une fois au démarrage du programme
 try:                                                                            # try : essayer de charger le modèle
@@ -0,0 +1,137 @@
+# Objectif — Pool de moteurs LLM : N instances du modèle, chacune servie par un thread épinglé sur sa tranche de cœurs, alimentées par une file d'attente bornée (débit prévisible quand plusieurs sessions génèrent en même temps)
+
+# Étape 1 — Importer les dépendances
+import logging                                                                  # import : charger le module standard | logging : gestion des journaux
+import os                                                                       # import : charger le module standard | os : cœurs disponibles et affinité CPU
+import queue                                                                    # import : charger le module standard | queue : file d'attente bornée des générations
+import threading                                                                # import : charger le module standard | threading : threads des instances et arrêt d'un flux
+from concurrent.futures import Future                                           # from : importer depuis concurrent.futures | Future : résultat d'une génération en file
+from time import perf_counter                                                   # from : importer depuis le module temps | perf_counter : temps d'attente dans la file
+from typing import Callable, Iterator, List, Optional, Sequence                 # from : importer depuis le typage | typing : module types | Callable, Iterator, List, Optional, Sequence : types génériques
+from src.core.config import LLM_QUEUE_SIZE, LLM_QUEUE_TIMEOUT, LLM_THREADS, LLM_WORKERS # from : importer les constantes | src.core.config : taille du pool, threads par instance et file d'attente
+from src.core.metrics import metrics                                            # from : importer le registre | src.core.metrics : profondeur de file, attente et refus
+from src.generation.llm_engine import LLMEngine, LLMGenerationError, llm_engine # from : importer le moteur | src.generation.llm_engine : classe, erreur de génération et première instance (déjà chargée)
+
+# Étape 2 — Configurer le logging
+logger = logging.getLogger(__name__)                                            # logger : objet enregistreur
+
+QUEUE_FULL_MESSAGE = "Error: LLM is overloaded, please retry in a moment."      # QUEUE_FULL_MESSAGE : réponse quand la file reste pleine au-delà de LLM_QUEUE_TIMEOUT
+
+class LLMOverloadedError(LLMGenerationError):                                   # class : définir une exception | LLMOverloadedError : génération refusée (file pleine)
+    """La file est restée pleine au-delà de LLM_QUEUE_TIMEOUT ; str(e) vaut QUEUE_FULL_MESSAGE."""
+
+# Étape 3 — Répartir les cœurs entre les instances
+def core_slices(workers: int, threads: int) -> List[List[int]]:                 # def : définir la fonction | core_slices : cœurs réservés à chaque instance | -> : retour | une liste de cœurs par instance ([] = pas d'épinglage)
+    """Tranches consécutives de `threads` cœurs parmi ceux autorisés pour le processus ; si elles ne tiennent pas toutes, aucune instance n'est épinglée."""
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1)) # cores : cœurs utilisables (cgroups / taskset respectés)
+    if workers * threads > len(cores):                                          # if : tranches plus grandes que la machine
+        return [[] for _ in range(workers)]                                     # return : le système répartit les threads
+    return [cores[i * threads:(i + 1) * threads] for i in range(workers)]       # return : une tranche disjointe par instance
+
+def pin_current_thread(cores: Sequence[int]):                                   # def : définir la fonction | pin_current_thread : épingler le thread appelant
+    """Sous Linux l'affinité est propre au thread ; les threads de calcul que llama.cpp crée depuis ce thread en héritent."""
+    if not cores or not hasattr(os, "sched_setaffinity"):                       # if : pas de tranche ou système non POSIX
+        return                                                                  # return : rien à faire
+    try:                                                                        # try : affinité refusée (conteneur restreint)
+        os.sched_setaffinity(0, cores)                                          # sched_setaffinity : 0 = thread courant
+    except OSError as e:                                                        # except : échec sans conséquence
+        logger.warning(f"Could not pin LLM worker to cores {list(cores)}: {e}") # logger.warning : avertissement
+
+# Étape 4 — Définir le pool
+class LLMPool:                                                                  # class : définir une classe | LLMPool : même interface que LLMEngine (generate, generate_stream, count_tokens)
+    """Chaque instance a sa tranche de cœurs et un thread par génération simultanée (un seul sans décodage par lots) ; une génération prend la première place libre."""
+
+    def __init__(self, engines: Sequence[LLMEngine], cores: Optional[Sequence[Sequence[int]]] = None, # def : constructeur | engines : instances chargées | cores : tranche de cœurs de chaque instance
+                 queue_size: int = LLM_QUEUE_SIZE, queue_timeout: float = LLM_QUEUE_TIMEOUT): # queue_size : générations en attente au plus | queue_timeout : attente d'une place avant refus
+        self.engines = list(engines)                                            # self.engines : instances du modèle
+        self.queue_timeout = queue_timeout                                      # self.queue_timeout : secondes
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)            # self._queue : (date d'entrée, tâche, Future) en attente d'une instance
+        cores = cores or [[] for _ in self.engines]                             # cores : pas d'épinglage par défaut
+        self._workers = [threading.Thread(target=self._work, args=(engine, slice_), name=f"vev-llm-{i}-{j}", daemon=True) # self._workers : un thread par génération simultanée de chaque instance
+                         for i, (engine, slice_) in enumerate(zip(self.engines, cores)) # un groupe par couple (instance, tranche)
+                         for j in range(getattr(engine, "concurrency", 1))]     # concurrency : 1, ou LLM_BATCH_SEQUENCES si l'instance décode par lots
+        for worker in self._workers:                                            # for : chaque thread
+            worker.start()                                                      # start : prêt à servir la file
+
+    @classmethod                                                                # @classmethod : constructeur alternatif
+    def create(cls, workers: int = LLM_WORKERS, threads: int = LLM_THREADS, first: Optional[LLMEngine] = None) -> "LLMPool": # def : méthode de classe | create : charger les instances manquantes | first : instance déjà chargée (réutilisée) | -> : retour | LLMPool
+        engines = [first] if first is not None else []                          # engines : instances disponibles
+        while len(engines) < workers:                                           # while : instances à charger
+            engine = LLMEngine()                                                # engine : nouvelle instance (état KV du prompt système relu sur disque)
+            if engine.model is None:                                            # if : chargement échoué (mémoire insuffisante)
+                logger.warning(f"LLM pool: only {len(engines)}/{workers} instances could be loaded.") # logger.warning : pool réduit
+                break                                                           # break : garder les instances chargées
+            engines.append(engine)                                              # engines.append : instance prête
+        logger.info(f"LLM pool ready: {len(engines)} instance(s) x {threads} threads.") # logger.info : configuration effective
+        return cls(engines, core_slices(len(engines), threads))                 # return : pool démarré
+
+    # Étape 4.1 — Boucle d'une instance
+    def _work(self, engine: LLMEngine, cores: Sequence[int]):                   # def : méthode privée | _work : sert la file jusqu'à l'arrêt du processus
+        pin_current_thread(cores)                                               # pin_current_thread : tranche de cœurs de l'instance
+        while True:                                                             # while : boucle du thread
+            enqueued_at, task, future = self._queue.get()                       # get : attendre une génération
+            metrics.observe("llm_pool.wait_seconds", perf_counter() - enqueued_at) # metrics.observe : temps passé dans la file
+            if future.set_running_or_notify_cancel():                           # if : pas annulée pendant l'attente (flux abandonné)
+                try:                                                            # try : l'erreur est transmise à l'appelant
+                    future.set_result(task(engine))                             # set_result : génération sur cette instance
+                except BaseException as e:                                      # except : toute erreur
+                    future.set_exception(e)                                     # set_exception : relevée par future.result()
+            self._queue.task_done()                                             # task_done : tâche traitée
+
+    def _submit(self, task: Callable[[LLMEngine], object]) -> Future:           # def : méthode privée | _submit : mettre une tâche en file | -> : retour | Future (LLMOverloadedError si la file reste pleine)tée pleine
+        future: Future = Future()                                               # future : résultat à venir
+        try:                                                                    # try : file pleine
+            self._queue.put((perf_counter(), task, future), timeout=self.queue_timeout) # put : attend une place au plus queue_timeout secondes
+        except queue.Full:                                                      # except : surcharge
+            metrics.incr("llm_pool.rejected")                                   # metrics.incr : génération refusée
+            logger.warning(f"LLM queue full for {self.queue_timeout}s, request rejected.") # logger.warning : surcharge
+            raise LLMOverloadedError(QUEUE_FULL_MESSAGE) from None              # raise : refus signalé à l'appelant (réponse à ne pas mettre en cache)
+        metrics.observe("llm_pool.queue_depth", self._queue.qsize())            # metrics.observe : générations en attente (dont celle-ci)
+        return future                                                           # return : résultat à attendre
+
+    # Étape 4.2 — Interface de LLMEngine
+    def count_tokens(self, text: str) -> int:                                   # def : méthode | count_tokens : tokenizer partagé (sans passer par la file)
+        return self.engines[0].count_tokens(text)                               # return : même vocabulaire pour toutes les instances
+
+    def generate(self, prompt: str, max_tokens: Optional[int] = None, temperature: float = 0.6, metric_prefix: str = "llm", # def : méthode | generate : comme LLMEngine.generate, sur la première instance libre
+                 stop_event: Optional[threading.Event] = None, system: bool = False) -> str: # stop_event : échéance (HyDE) | system : réponse RAG
+        def task(engine: LLMEngine) -> str:                                     # def : fonction locale | task : génération sur l'instance attribuée
+            if stop_event is not None and stop_event.is_set():                  # if : échéance dépassée pendant l'attente dans la file
+                metrics.incr(f"{metric_prefix}.interrupted")                    # metrics.incr : génération abandonnée
+                return ""                                                       # return : rien à générer
+            return engine.generate(prompt, max_tokens=max_tokens, temperature=temperature, metric_prefix=metric_prefix, stop_event=stop_event, system=system) # return : texte généré
+        return self._submit(task).result()                                      # return : texte généré (erreurs du moteur relevées ici)
+
+    def generate_stream(self, prompt: str, max_tokens: Optional[int] = None, temperature: float = 0.6, metric_prefix: str = "llm", system: bool = False) -> Iterator[str]: # def : méthode | generate_stream : comme LLMEngine.generate_stream, morceaux relayés depuis le thread de l'instance | -> : retour | Iterator[str]
+        pieces: "queue.Queue" = queue.Queue()                                   # pieces : morceaux décodés (None = fin du flux)
+        abandoned = threading.Event()                                           # abandoned : le consommateur a arrêté de lire
+
+        def task(engine: LLMEngine):                                            # def : fonction locale | task : décoder et relayer
+            stream = engine.generate_stream(prompt, max_tokens=max_tokens, temperature=temperature, metric_prefix=metric_prefix, system=system) # stream : flux de l'instance
+            try:                                                                # try : toujours fermer le flux et signaler la fin
+                for piece in stream:                                            # for : chaque morceau
+                    if abandoned.is_set():                                      # if : plus personne ne lit
+                        break                                                   # break : libérer l'instance
+                    pieces.put(piece)                                           # put : relais vers le consommateur
+            finally:                                                            # finally : fin du flux
+                stream.close()                                                  # close : libère le verrou de l'instance
+                pieces.put(None)                                                # put : marqueur de fin
+
+        future = self._submit(task)                                             # future : génération en file (LLMOverloadedError à la première itération si la file reste pleine)
+        try:                                                                    # try : abandon du flux par le consommateur (GeneratorExit)
+            while True:                                                         # while : relayer jusqu'au marqueur de fin
+                piece = pieces.get()                                            # piece : morceau suivant
+                if piece is None:                                               # if : fin du flux
+                    break                                                       # break : sortie
+                yield piece                                                     # yield : rendu immédiat
+            future.result()                                                     # result : relève une éventuelle erreur du thread
+        finally:                                                                # finally : flux terminé ou abandonné
+            abandoned.set()                                                     # abandoned : arrêter le décodage
+            future.cancel()                                                     # cancel : retirer la génération si elle attend encore dans la file
+
+# Étape 5 — Instancier le pool (Singleton) à partir du moteur déjà chargé
+try:                                                                            # try : essayer de charger les instances supplémentaires
+    llm_pool = LLMPool.create(first=llm_engine) if llm_engine is not None else None # llm_pool : pool global (None si le modèle est absent)
+except Exception as e:                                                          # except : si une erreur survient pendant le chargement
+    logger.error(f"Failed to start LLM pool: {e}")                              # logger.error : afficher l'erreur
+    llm_pool = None                                                             # llm_pool : mettre à None
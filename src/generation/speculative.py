@@ -0,0 +1,94 @@
+# Objectif — Modèles brouillons du décodage spéculatif : le brouillon propose quelques tokens, le modèle cible les vérifie en un seul passage (Llama.generate) ; taux d'acceptation mesuré à chaque pas
+
+# Étape 1 — Importer les dépendances
+import abc                                                                      # import : charger le module standard | abc : méthode abstraite des brouillons
+import logging                                                                  # import : charger le module standard | logging : gestion des journaux
+from typing import Any, Optional                                                # from : importer depuis le typage | typing : module types | Any, Optional : types génériques
+import numpy as np                                                              # import : charger le module de calcul | numpy : tokens sous forme de tableaux
+import llama_cpp                                                                # import : charger l'API C | llama_cpp : fin de génération du brouillon
+from llama_cpp import Llama                                                     # from : importer le moteur LLM | Llama : petit modèle brouillon
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding # from : importer l'interface | llama_speculative : brouillons acceptés par Llama(draft_model=...)
+from src.core.config import LLM_DIR, LLM_MODEL_FILE, LLM_CONTEXT_WINDOW, LLM_THREADS, LLM_THREADS_BATCH, LLM_DRAFT, LLM_DRAFT_TOKENS, LLM_DRAFT_NGRAM # from : importer les constantes | src.core.config : choix et réglages du brouillon
+from src.core.metrics import metrics                                            # from : importer le registre | src.core.metrics : tokens proposés / acceptés
+
+# Étape 2 — Configurer le logging
+logger = logging.getLogger(__name__)                                            # logger : objet enregistreur
+
+# Étape 3 — Mesurer l'acceptation des brouillons
+class TrackedDraft(LlamaDraftModel):                                            # class : définir une classe | TrackedDraft : brouillon dont les propositions sont comparées aux tokens retenus
+    """Llama.generate rappelle le brouillon avec la suite acceptée : les tokens ajoutés depuis l'appel précédent disent combien de tokens proposés ont été gardés."""
+
+    def __init__(self, num_pred_tokens: int = LLM_DRAFT_TOKENS):                # def : constructeur | num_pred_tokens : tokens proposés par pas
+        self.num_pred_tokens = num_pred_tokens                                  # self.num_pred_tokens : taille du brouillon
+        self._history = np.array([], dtype=np.intc)                             # self._history : tokens vus à l'appel précédent
+        self._proposal = np.array([], dtype=np.intc)                            # self._proposal : dernier brouillon proposé
+
+    @abc.abstractmethod                                                         # @abc.abstractmethod : à définir par chaque brouillon (LlamaDraftModel est un abc.ABC)
+    def propose(self, input_ids: np.ndarray) -> np.ndarray:                     # def : méthode | propose : tokens proposés après input_ids | -> : retour | np.ndarray
+        """Tokens proposés après input_ids (tableau vide : pas de brouillon à ce pas)."""
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs: Any) -> np.ndarray:  # def : méthode spéciale | __call__ : appelée par Llama.generate à chaque pas | -> : retour | tokens proposés
+        seen = len(self._history)                                               # seen : longueur de la suite au pas précédent
+        if len(self._proposal) and len(input_ids) > seen and np.array_equal(input_ids[:seen], self._history): # if : même génération, brouillon précédent vérifié
+            added = input_ids[seen:seen + len(self._proposal)]                  # added : tokens retenus à la place du brouillon
+            accepted = int(np.argmin(np.append(added == self._proposal[:len(added)], False))) # accepted : tokens du brouillon gardés avant le premier désaccord
+            metrics.observe("llm.draft_accepted_tokens", accepted)              # metrics.observe : total accepté / total proposé = taux d'acceptation global
+            metrics.observe("llm.draft_acceptance", accepted / len(self._proposal)) # metrics.observe : taux d'acceptation par pas
+        self._history = np.array(input_ids, dtype=np.intc)                      # _history : copie (input_ids est une vue sur le tampon du modèle)
+        self._proposal = np.asarray(self.propose(self._history), dtype=np.intc) # _proposal : nouveau brouillon
+        if len(self._proposal):                                                 # if : brouillon non vide
+            metrics.observe("llm.draft_proposed_tokens", len(self._proposal))   # metrics.observe : tokens proposés
+        return self._proposal                                                   # return : tokens à vérifier par le modèle cible
+
+# Étape 4 — Brouillon sans modèle : recopier la suite d'un n-gramme déjà présent dans le prompt
+class PromptLookupDraft(TrackedDraft):                                          # class : définir une classe | PromptLookupDraft : les réponses RAG recopient de longs passages du contexte
+    def __init__(self, max_ngram_size: int = LLM_DRAFT_NGRAM, num_pred_tokens: int = LLM_DRAFT_TOKENS): # def : constructeur | max_ngram_size : n-gramme recherché
+        super().__init__(num_pred_tokens)                                       # super().__init__ : suivi de l'acceptation
+        self.max_ngram_size = max_ngram_size                                    # self.max_ngram_size : longueur max de la fin de séquence recherchée
+
+    def propose(self, input_ids: np.ndarray) -> np.ndarray:                     # def : méthode | propose : suite de la première occurrence des derniers tokens
+        return LlamaPromptLookupDecoding.find_candidate_pred_tokens(input_ids=input_ids, max_ngram_size=self.max_ngram_size, num_pred_tokens=self.num_pred_tokens) # return : brouillon (vide si aucun n-gramme ne se répète)
+
+# Étape 5 — Brouillon par un petit modèle du même tokenizer (Qwen3-0.6B pour Qwen3-4B)
+class ModelDraft(TrackedDraft):                                                 # class : définir une classe | ModelDraft : décodage glouton du petit modèle
+    def __init__(self, model: Llama, num_pred_tokens: int = LLM_DRAFT_TOKENS):  # def : constructeur | model : petit modèle chargé
+        super().__init__(num_pred_tokens)                                       # super().__init__ : suivi de l'acceptation
+        self.model = model                                                      # self.model : brouillon (son cache KV suit la génération du modèle cible)
+
+    def propose(self, input_ids: np.ndarray) -> np.ndarray:                     # def : méthode | propose : num_pred_tokens tokens gloutons du petit modèle
+        model, ids = self.model, input_ids.tolist()                             # model : brouillon | ids : suite acceptée
+        if len(ids) + self.num_pred_tokens > model.n_ctx():                     # if : fenêtre du brouillon pleine
+            return np.array([], dtype=np.intc)                                  # return : pas de brouillon (le modèle cible continue seul)
+        common = Llama.longest_token_prefix(model.input_ids[:model.n_tokens].tolist(), ids) # common : tokens déjà dans le cache KV du brouillon
+        model.n_tokens = min(common, len(ids) - 1)                              # n_tokens : le dernier token est réévalué pour obtenir ses logits
+        model.eval(ids[model.n_tokens:])                                        # eval : seulement les tokens nouveaux (eval retire le reste du cache KV)
+        draft = []                                                              # draft : tokens proposés
+        while True:                                                             # while : un token glouton à la fois
+            logits = np.ctypeslib.as_array(model._ctx.get_logits_ith(-1), shape=(model.n_vocab(),)) # logits : sortie du dernier token évalué
+            token = int(np.argmax(logits))                                      # token : le plus probable
+            if llama_cpp.llama_vocab_is_eog(model._model.vocab, token):         # if : fin de réponse prévue
+                break                                                           # break : le modèle cible décidera
+            draft.append(token)                                                 # draft.append : token proposé
+            if len(draft) >= self.num_pred_tokens:                              # if : brouillon complet
+                break                                                           # break : inutile d'évaluer le dernier token
+            model.eval([token])                                                 # eval : avancer le brouillon
+        return np.array(draft, dtype=np.intc)                                   # return : brouillon
+
+# Étape 6 — Choisir le brouillon selon la configuration
+def make_draft_model(spec: str = LLM_DRAFT) -> Optional[TrackedDraft]:          # def : définir la fonction | make_draft_model : brouillon de LLM_DRAFT | -> : retour | None si désactivé ou indisponible
+    if not spec:                                                                # if : décodage spéculatif désactivé
+        return None                                                             # return : génération classique
+    if spec == "prompt_lookup":                                                 # if : brouillon sans modèle
+        logger.info(f"Speculative decoding: prompt lookup (ngram<={LLM_DRAFT_NGRAM}, {LLM_DRAFT_TOKENS} tokens per step).") # logger.info : configuration
+        return PromptLookupDraft()                                              # return : brouillon gratuit
+    path = LLM_DIR / spec                                                       # path : GGUF du petit modèle
+    if spec == LLM_MODEL_FILE or not path.exists():                             # if : même modèle que la cible ou fichier absent
+        logger.warning(f"Speculative decoding disabled: draft model {path} is missing or is the target model.") # logger.warning : génération classique
+        return None                                                             # return : pas de brouillon
+    try:                                                                        # try : chargement du petit modèle
+        model = Llama(model_path=str(path), n_ctx=LLM_CONTEXT_WINDOW, n_threads=LLM_THREADS, n_threads_batch=LLM_THREADS_BATCH, verbose=False) # model : brouillon (même fenêtre que la cible)
+    except Exception as e:                                                      # except : chargement impossible (mémoire)
+        logger.error(f"Failed to load draft model {path}: {e}")                 # logger.error : afficher l'erreur
+        return None                                                             # return : génération classique
+    logger.info(f"Speculative decoding: draft model {spec} ({LLM_DRAFT_TOKENS} tokens per step).") # logger.info : configuration
+    return ModelDraft(model)                                                    # return : brouillon par petit modèle
@@ -15,8 +15,8 @@ HYDE_GENERATION_PROMPT = (
 )
 
 # Étape 3 — Définir le prompt pour la recherche de faits (Format RAG final) - Ce prompt est utilisé par le main.py pour la génération finale (après l'étape de Reranking).
-RAG_FINAL_TEMPLATE = (                                                                                                                            # RAG_FINAL_TEMPLATE : template de prompt final pour la réponse
-    "{system_prompt}\n\n"                                                                                                                         # {system_prompt} : variable pour injecter le rôle de l'agent (Phase 1)
+# Le rôle de l'agent (LLM_SYSTEM_PROMPT) n'est plus dans ce template : il est envoyé en message système, préfixe identique d'une question à l'autre dont l'état KV est réutilisé par LLMEngine.
+RAG_FINAL_TEMPLATE = (                                                                                                                            # RAG_FINAL_TEMPLATE : template de prompt final pour la réponse (message utilisateur)
     "Contexte:\n"                                                                                                                                 # "Contexte:" : marqueur pour le début du contexte fourni
     "===\n{context}\n===\n"                                                                                                                       # "{context}" : variable pour injecter les chunks rerankés (Phase 3)
     "Question: {query}\n"                                                                                                                         # "Question:" : variable pour la question originale de l'utilisateur
@@ -0,0 +1,146 @@
+# Objectif — Écrire les chunks dans LanceDB par gros lots Arrow (RecordBatch) pour éviter une multitude de petits fragments Lance
+
+# Étape 1 — Importer les dépendances
+import logging                                                                  # import : charger le module standard | logging : gestion des journaux
+import threading                                                                # import : charger le module standard | threading : verrou pour les écritures concurrentes (Streamlit)
+from time import monotonic                                                      # from : importer depuis le module temps | monotonic : horloge monotone pour le seuil de temps
+from typing import Callable, List, Optional, Sequence, Set                      # from : importer depuis le typage | typing : module types | Callable, List, Optional, Sequence, Set : types génériques
+import numpy as np                                                              # import : charger le module de calcul | numpy : matrice des vecteurs (sans passer par des listes Python)
+import pyarrow as pa                                                            # import : charger le module | pyarrow : format de données en colonnes (requis par LanceDB) | as pa : alias
+from src.core.config import EMBEDDING_DIM, WRITE_BATCH_ROWS, WRITE_FLUSH_SECONDS # from : importer les constantes | src.core.config : configuration | EMBEDDING_DIM, WRITE_BATCH_ROWS, WRITE_FLUSH_SECONDS : dimension et seuils de flush
+from src.core.schemas import Chunk                                              # from : importer définitions | src.core.schemas : nos objets Pydantic
+
+# Étape 2 — Configurer le logging
+logger = logging.getLogger(__name__)                                            # logger : objet enregistreur | = : assignation | logging.getLogger(__name__) : récupérer le logger actuel
+
+# Étape 3 — Définir le schéma Arrow unique de la table des chunks (partagé par la création de table et l'écriture)
+CHUNK_SCHEMA = pa.schema([                                                      # CHUNK_SCHEMA : définition des colonnes | pa.schema(...) : fonction pyarrow
+    pa.field("id", pa.string()),                                                # pa.field : colonne ID (chaîne)
+    pa.field("text", pa.string()),                                              # pa.field : colonne TEXTE (chaîne)
+    pa.field("vector", pa.list_(pa.float32(), EMBEDDING_DIM)),                  # pa.field : colonne VECTEUR (liste de taille fixe de float32, taille EMBEDDING_DIM)
+    pa.field("source", pa.string()),                                            # pa.field : colonne SOURCE (chaîne)
+    pa.field("page", pa.int32()),                                               # pa.field : colonne PAGE (entier)
+    pa.field("title", pa.string()),                                             # pa.field : colonne TITRE (chaîne)
+    pa.field("created_at", pa.string()),                                        # pa.field : colonne DATE (chaîne)
+    pa.field("chunk_index", pa.int32()),                                        # pa.field : colonne POSITION du chunk dans son document (voisins d'un résultat)
+])                                                                              # ]) : fin du schéma
+
+# Étape 4 — Fonction de conversion Chunks -> RecordBatch (sans aller-retour par des listes Python pour les vecteurs)
+def chunks_to_record_batch(chunks: Sequence[Chunk], vectors: np.ndarray) -> pa.RecordBatch: # def : définir la fonction | chunks : objets Chunk | vectors : matrice (n, EMBEDDING_DIM) | -> : retour | pa.RecordBatch : lot Arrow
+    """Construit un RecordBatch Arrow à partir des chunks et de leur matrice de vecteurs."""
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)                    # matrix : matrice float32 contiguë en mémoire (copie évitée si déjà au bon format)
+    if matrix.shape != (len(chunks), EMBEDDING_DIM):                            # if : vérifier la cohérence des dimensions
+        raise ValueError(f"Vector matrix shape {matrix.shape} does not match ({len(chunks)}, {EMBEDDING_DIM})") # raise : erreur explicite plutôt qu'une table corrompue
+
+    # La colonne vecteur est construite directement depuis le buffer numpy (zéro conversion .tolist())
+    vector_column = pa.FixedSizeListArray.from_arrays(pa.array(matrix.ravel()), EMBEDDING_DIM) # vector_column : colonne liste de taille fixe | .ravel() : vue 1D du buffer | EMBEDDING_DIM : taille de chaque liste
+
+    return pa.RecordBatch.from_arrays([                                         # return : renvoyer le lot Arrow
+        pa.array([chunk.id for chunk in chunks], pa.string()),                  # id : identifiants
+        pa.array([chunk.text for chunk in chunks], pa.string()),                # text : contenus
+        vector_column,                                                          # vector : vecteurs float32
+        pa.array([chunk.metadata.source_path for chunk in chunks], pa.string()), # source : chemin source aplati
+        pa.array([chunk.metadata.page_number or 0 for chunk in chunks], pa.int32()), # page : numéro de page ou 0
+        pa.array([chunk.metadata.title or "Unknown" for chunk in chunks], pa.string()), # title : titre ou valeur par défaut
+        pa.array([chunk.metadata.creation_date for chunk in chunks], pa.string()), # created_at : date
+        pa.array([chunk.chunk_index for chunk in chunks], pa.int32()),          # chunk_index : position dans le document
+    ], schema=CHUNK_SCHEMA)                                                     # schema : schéma partagé de la table
+
+# Étape 5 — Définir l'écrivain tamponné
+class ArrowBatchWriter:                                                         # class : définir une classe | ArrowBatchWriter : accumule des RecordBatch et les écrit en une seule fois
+    """Tampon d'écriture LanceDB : un seul `table.add` par lot, déclenché par un seuil de taille (à l'ajout) ou de temps (minuterie, même sans nouvel ajout)."""
+
+    # Étape 5.1 — Constructeur
+    def __init__(self, table, flush_rows: int = WRITE_BATCH_ROWS, flush_seconds: float = WRITE_FLUSH_SECONDS, # def : constructeur | table : table LanceDB cible | flush_rows : seuil de lignes | flush_seconds : seuil de temps
+                 on_flush: Optional[Callable[[pa.Table], None]] = None):        # on_flush : rappel après chaque écriture réussie (miroir en mémoire...)
+        self.table = table                                                      # self.table : table de destination
+        self.flush_rows = flush_rows                                            # self.flush_rows : nombre de lignes déclenchant l'écriture
+        self.flush_seconds = flush_seconds                                      # self.flush_seconds : âge maximum du tampon avant écriture
+        self.on_flush = on_flush                                                # self.on_flush : rappel optionnel recevant la table Arrow écrite
+        self._batches: List[pa.RecordBatch] = []                                # self._batches : lots en attente d'écriture
+        self._pending_rows = 0                                                  # self._pending_rows : nombre de lignes en attente
+        self._first_pending_at: Optional[float] = None                          # self._first_pending_at : instant du premier lot en attente
+        self._pending_sources: Set[str] = set()                                 # self._pending_sources : sources présentes dans le tampon (évite les doublons avant flush)
+        self._lock = threading.Lock()                                           # self._lock : protège le tampon contre les ingestions simultanées
+        self._timer: Optional[threading.Timer] = None                           # self._timer : minuterie du seuil de temps (armée par le premier lot du tampon)
+        self._closed = False                                                    # self._closed : écrivain fermé (table supprimée)
+
+    @property                                                                   # @property : accès en lecture seule
+    def pending_rows(self) -> int:                                              # def : propriété | pending_rows : lignes non encore écrites
+        return self._pending_rows                                               # return : renvoyer le compteur
+
+    @property                                                                   # @property : accès en lecture seule
+    def pending_sources(self) -> Set[str]:                                      # def : propriété | pending_sources : sources non encore écrites
+        return set(self._pending_sources)                                       # return : copie de l'ensemble
+
+    # Étape 5.2 — Ajouter des chunks au tampon
+    def add(self, chunks: Sequence[Chunk], vectors: np.ndarray) -> bool:        # def : méthode | add : ajouter un lot | -> : retour | bool : True si un flush a eu lieu
+        """Ajoute des chunks au tampon et écrit si un seuil est atteint."""
+        if not chunks:                                                          # if : rien à ajouter
+            return False                                                        # return : aucun flush
+        batch = chunks_to_record_batch(chunks, vectors)                         # batch : conversion en RecordBatch Arrow
+        with self._lock:                                                        # with : section critique
+            if self._closed:                                                    # if : table supprimée
+                raise RuntimeError("ArrowBatchWriter is closed")                # raise : plus aucune écriture possible
+            self._batches.append(batch)                                         # self._batches.append(...) : mise en tampon
+            self._pending_rows += batch.num_rows                                # self._pending_rows : mise à jour du compteur
+            self._pending_sources.update(chunk.metadata.source_path for chunk in chunks) # self._pending_sources : mémoriser les sources en attente
+            if self._first_pending_at is None:                                  # if : premier lot du tampon
+                self._first_pending_at = monotonic()                            # self._first_pending_at : démarrer le chrono
+                self._arm_timer()                                               # _arm_timer : flush au bout de flush_seconds même si plus rien n'est ajouté
+        return self.flush_if_due()                                              # return : écrire si un seuil est atteint
+
+    def _arm_timer(self):                                                       # def : méthode privée | _arm_timer : démarrer la minuterie du seuil de temps (verrou tenu)
+        self._timer = threading.Timer(self.flush_seconds, self._on_timer)       # self._timer : appel unique après flush_seconds
+        self._timer.daemon = True                                               # daemon : n'empêche pas l'arrêt du processus
+        self._timer.start()                                                     # start : lancement
+
+    def _on_timer(self):                                                        # def : méthode privée | _on_timer : flush du tampon devenu trop ancien (thread de la minuterie)
+        try:                                                                    # try : une erreur d'écriture ne doit pas tuer la minuterie en silence
+            self.flush_if_due()                                                 # flush_if_due : écrit si le tampon a atteint flush_seconds (sinon, un flush par taille a déjà réarmé une minuterie)
+        except Exception as e:                                                  # except : écriture échouée (les lots restent dans le tampon)
+            logger.error(f"Timed flush failed: {e}")                            # logger.error : afficher l'erreur
+            with self._lock:                                                    # with : section critique
+                if self._batches:                                               # if : lots toujours en attente
+                    self._arm_timer()                                           # _arm_timer : nouvelle tentative au prochain délai
+
+    # Étape 5.3 — Vérifier les seuils
+    def flush_if_due(self) -> bool:                                             # def : méthode | flush_if_due : écrire seulement si nécessaire
+        """Écrit le tampon si le seuil de lignes ou de temps est dépassé."""
+        with self._lock:                                                        # with : lecture cohérente de l'état
+            if not self._batches:                                               # if : tampon vide
+                return False                                                    # return : rien à faire
+            too_big = self._pending_rows >= self.flush_rows                     # too_big : seuil de taille atteint
+            too_old = (monotonic() - self._first_pending_at) >= self.flush_seconds # too_old : seuil de temps atteint
+        if too_big or too_old:                                                  # if : un des seuils est dépassé
+            return self.flush() > 0                                             # return : écrire et confirmer
+        return False                                                            # return : pas encore
+
+    # Étape 5.4 — Écrire le tampon
+    def flush(self) -> int:                                                     # def : méthode | flush : écriture forcée | -> : retour | int : nombre de lignes écrites
+        """Écrit tous les lots en attente en un seul `table.add` (un seul fragment Lance)."""
+        with self._lock:                                                        # with : section critique (le tampon est vidé atomiquement)
+            if not self._batches:                                               # if : tampon vide
+                return 0                                                        # return : rien écrit
+            data = pa.Table.from_batches(self._batches, schema=CHUNK_SCHEMA)    # data : fusion des lots en une table Arrow (sans copie des buffers)
+            self.table.add(data)                                                # self.table.add(...) : une seule insertion LanceDB
+            if self.on_flush is not None:                                       # if : un miroir doit suivre la table
+                self.on_flush(data)                                             # self.on_flush(...) : mêmes lignes que celles écrites dans LanceDB
+            rows = self._pending_rows                                           # rows : nombre de lignes écrites
+            self._batches = []                                                  # self._batches : reset du tampon
+            self._pending_rows = 0                                              # self._pending_rows : reset du compteur
+            self._pending_sources = set()                                       # self._pending_sources : reset des sources en attente
+            self._first_pending_at = None                                       # self._first_pending_at : reset du chrono
+        logger.info(f"Flushed {rows} chunks to LanceDB in one Arrow write.")    # logger.info : confirmation de l'écriture
+        return rows                                                             # return : nombre de lignes écrites
+
+    # Étape 5.5 — Fermer l'écrivain (table supprimée)
+    def close(self) -> int:                                                     # def : méthode | close : abandonner le tampon et arrêter la minuterie | -> : retour | int : lignes abandonnées
+        """Sans écrire : la table va disparaître, la minuterie ne doit plus réessayer `table.add`."""
+        with self._lock:                                                        # with : section critique
+            self._closed = True                                                 # self._closed : add() refusé désormais
+            if self._timer is not None:                                         # if : minuterie armée
+                self._timer.cancel()                                            # cancel : plus de flush différé
+            dropped = self._pending_rows                                        # dropped : lignes jamais écrites
+            self._batches, self._pending_rows, self._pending_sources, self._first_pending_at = [], 0, set(), None # reset du tampon
+        return dropped                                                          # return : lignes abandonnées
@@ -3,7 +3,7 @@
 # Étape 1 — Importer les dépendances
 import numpy as np                                                              # import : charger module calcul | numpy : gestion des tableaux et distances mathématiques
 from typing import List, Dict, Any                                              # from : importer typage | typing : types standards
-from src.core.schemas import Chunk, SourceMetadata                              # from : importer définitions | src.core.schemas : nos objets Pydantic
+from src.core.schemas import Chunk, SourceMetadata, make_chunk_id               # from : importer définitions | src.core.schemas : nos objets Pydantic | make_chunk_id : identifiant déterministe (source + index)
 from src.indexing.embedder import FastEmbedder                                  # from : importer notre embedder | src.indexing.embedder : (on va le créer juste après, ne vous inquiétez pas si VS Code souligne en rouge pour l'instant)
 from src.ingestion.cleaner import split_into_sentences                          # from : importer notre nettoyeur | src.ingestion.cleaner : pour avoir des phrases propres
 
@@ -51,6 +51,7 @@ class SemanticChunker:
                 
                 # On crée l'objet Chunk
                 new_chunk = Chunk(                                              # new_chunk : instance Pydantic
+                    id=make_chunk_id(metadata.source_path, len(chunks)),        # id : identifiant déterministe (réindexation = mêmes ids)
                     text=chunk_text,                                            # text : contenu
                     metadata=metadata,                                          # metadata : source originale
                     chunk_index=len(chunks)                                     # chunk_index : numéro (0, 1, 2...)
@@ -67,6 +68,7 @@ class SemanticChunker:
         if current_chunk_sentences:                                             # if : s'il reste des phrases
             chunk_text = " ".join(current_chunk_sentences)                      # chunk_text : fusion
             new_chunk = Chunk(                                                  # new_chunk : création dernier chunk
+                id=make_chunk_id(metadata.source_path, len(chunks)),            # id : identifiant déterministe
                 text=chunk_text,                                                # text : contenu
                 metadata=metadata,                                              # metadata : source
                 chunk_index=len(chunks)                                         # chunk_index : numéro final
@@ -0,0 +1,110 @@
+# Objectif — Gérer plusieurs collections nommées (une table LanceDB par équipe) et leur registre (modèle d'embedding, date de création)
+
+# Étape 1 — Importer les dépendances
+import logging                                                                  # import : charger le module standard | logging : gestion des journaux
+import re                                                                       # import : charger le module standard | re : validation des noms de collection
+from datetime import datetime                                                   # from : importer depuis le module datetime | datetime : date de création
+from typing import Dict, List, Optional                                         # from : importer depuis le typage | typing : module types | Dict, List, Optional : types génériques
+import pyarrow as pa                                                            # import : charger le module | pyarrow : schéma de la table registre | as pa : alias
+from src.core.config import DEFAULT_COLLECTION                                  # from : importer la constante | src.core.config : configuration | DEFAULT_COLLECTION : collection historique
+
+# Étape 2 — Configurer le logging et les constantes
+logger = logging.getLogger(__name__)                                            # logger : objet enregistreur | = : assignation | logging.getLogger(__name__) : récupérer le logger actuel
+REGISTRY_TABLE_NAME = "vev_collections"                                         # REGISTRY_TABLE_NAME : table LanceDB qui décrit les collections
+DEFAULT_TABLE_NAME = "vev_rag_data"                                             # DEFAULT_TABLE_NAME : table historique (collection par défaut, rétrocompatible)
+COLLECTION_NAME_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")             # COLLECTION_NAME_PATTERN : minuscules, chiffres, '_' et '-' (nom de table sûr)
+
+REGISTRY_SCHEMA = pa.schema([                                                   # REGISTRY_SCHEMA : colonnes du registre | pa.schema(...) : fonction pyarrow
+    pa.field("name", pa.string()),                                              # pa.field : nom de la collection
+    pa.field("table_name", pa.string()),                                        # pa.field : table LanceDB associée
+    pa.field("embedding_model", pa.string()),                                   # pa.field : modèle d'embedding utilisé pour indexer
+    pa.field("embedding_dim", pa.int32()),                                      # pa.field : dimension des vecteurs
+    pa.field("created_at", pa.string()),                                        # pa.field : date de création
+    pa.field("corpus_version", pa.int64()),                                     # pa.field : incrémentée à chaque ajout / réindexation / suppression de documents (invalidation des caches)
+])                                                                              # ]) : fin du schéma
+
+# Étape 3 — Fonctions de nommage
+def validate_collection_name(name: str) -> str:                                 # def : définir la fonction | validate_collection_name : vérifier un nom | -> : retour | str : nom normalisé
+    """Normalise (minuscules, espaces -> '_') et valide un nom de collection."""
+    normalized = name.strip().lower().replace(" ", "_")                         # normalized : nom normalisé
+    if not COLLECTION_NAME_PATTERN.match(normalized):                           # if : nom invalide
+        raise ValueError(f"Invalid collection name: {name!r} (allowed: a-z, 0-9, '_', '-', max 64 chars)") # raise : erreur explicite
+    return normalized                                                           # return : nom prêt à l'emploi
+
+def collection_table_name(name: str) -> str:                                    # def : définir la fonction | collection_table_name : nom de table d'une collection | -> : retour | str
+    """Retourne la table LanceDB d'une collection (la collection par défaut garde la table historique)."""
+    name = validate_collection_name(name)                                       # name : nom validé
+    return DEFAULT_TABLE_NAME if name == DEFAULT_COLLECTION else f"vev_rag_{name}" # return : table historique ou table dédiée
+
+# Étape 4 — Définir le registre des collections
+class CollectionRegistry:                                                       # class : définir une classe | CollectionRegistry : catalogue des collections d'une base LanceDB
+    """Registre des collections : une ligne par collection avec son modèle d'embedding."""
+
+    # Étape 4.1 — Constructeur
+    def __init__(self, db):                                                     # def : constructeur | db : connexion LanceDB
+        self.db = db                                                            # self.db : connexion à la base
+        if REGISTRY_TABLE_NAME in self.db.table_names():                        # if : registre existant
+            self.table = self.db.open_table(REGISTRY_TABLE_NAME)                # self.table : ouvrir le registre
+            if "corpus_version" not in self.table.schema.names:                 # if : registre d'avant les versions de corpus
+                self.table.add_columns({"corpus_version": "CAST(0 AS BIGINT)"}) # add_columns : version 0 pour les collections existantes
+        else:                                                                   # else : premier démarrage
+            self.table = self.db.create_table(REGISTRY_TABLE_NAME, schema=REGISTRY_SCHEMA) # self.table : créer le registre vide
+
+    # Étape 4.2 — Lire une collection
+    def get(self, name: str) -> Optional[Dict]:                                 # def : méthode | get : enregistrement d'une collection | -> : retour | Optional[Dict] : ligne ou None
+        """Retourne l'enregistrement de la collection, ou None si elle n'est pas déclarée."""
+        name = validate_collection_name(name)                                   # name : nom validé (sûr dans un filtre SQL)
+        self.table.checkout_latest()                                            # checkout_latest : voir les collections déclarées par les autres connexions
+        rows = self.table.search().where(f"name = '{name}'").limit(1).to_list() # rows : recherche par nom
+        return rows[0] if rows else None                                        # return : ligne ou None
+
+    def names(self) -> List[str]:                                               # def : méthode | names : noms des collections | -> : retour | List[str]
+        """Retourne les noms des collections déclarées (la collection par défaut est toujours présente)."""
+        self.table.checkout_latest()                                            # checkout_latest : voir les collections déclarées par les autres connexions
+        rows = self.table.search().select(["name"]).limit(None).to_arrow()      # rows : seule la colonne 'name' est lue
+        return sorted(set(rows.column("name").to_pylist()) | {DEFAULT_COLLECTION}) # return : noms triés
+
+    # Étape 4.3 — Déclarer une collection (ou vérifier sa cohérence)
+    def ensure(self, name: str, embedding_model: str, embedding_dim: int) -> Dict: # def : méthode | ensure : déclarer si absente | -> : retour | Dict : enregistrement
+        """Déclare la collection si besoin et vérifie qu'elle est interrogée avec son propre modèle d'embedding."""
+        name = validate_collection_name(name)                                   # name : nom validé
+        record = self.get(name)                                                 # record : enregistrement existant
+        if record is None:                                                      # if : nouvelle collection
+            record = {                                                          # record : nouvel enregistrement
+                "name": name,                                                   # "name" : nom
+                "table_name": collection_table_name(name),                      # "table_name" : table LanceDB
+                "embedding_model": embedding_model,                             # "embedding_model" : modèle d'embedding
+                "embedding_dim": embedding_dim,                                 # "embedding_dim" : dimension
+                "created_at": datetime.now().isoformat(),                       # "created_at" : date de création
+                "corpus_version": 0,                                            # "corpus_version" : aucun document indexé
+            }
+            self.table.add([record])                                            # self.table.add(...) : insertion dans le registre
+            logger.info(f"Registered collection '{name}' ({record['table_name']}, {embedding_model})") # logger.info : confirmation
+        elif record["embedding_model"] != embedding_model or record["embedding_dim"] != embedding_dim: # elif : modèle différent -> vecteurs incompatibles
+            raise ValueError(                                                   # raise : refuser plutôt que mélanger des espaces vectoriels
+                f"Collection '{name}' was indexed with {record['embedding_model']} ({record['embedding_dim']}d), " # message : modèle enregistré
+                f"not {embedding_model} ({embedding_dim}d). Re-index it or drop it first." # message : modèle courant
+            )
+        return record                                                           # return : enregistrement de la collection
+
+    # Étape 4.3 bis — Version du corpus (clé d'invalidation des caches de réponses et de résultats)
+    def corpus_version(self, name: str) -> int:                                 # def : méthode | corpus_version : version courante | -> : retour | int
+        """Version du contenu de la collection (0 si elle n'est pas déclarée)."""
+        record = self.get(name)                                                 # record : enregistrement (relu : les autres processus peuvent indexer)
+        return int(record.get("corpus_version") or 0) if record else 0          # return : version ou 0
+
+    def bump_corpus_version(self, name: str):                                   # def : méthode | bump_corpus_version : le contenu de la collection a changé
+        name = validate_collection_name(name)                                   # name : nom validé (sûr dans un filtre SQL)
+        self.table.checkout_latest()                                            # checkout_latest : partir de la dernière version (un autre handle a pu écrire)
+        self.table.update(where=f"name = '{name}'", values_sql={"corpus_version": "corpus_version + 1"}) # update : incrément atomique côté LanceDB
+
+    # Étape 4.4 — Supprimer une collection
+    def drop(self, name: str):                                                  # def : méthode | drop : supprimer table + enregistrement
+        """Supprime la table de la collection et son enregistrement (les autres collections ne sont pas touchées)."""
+        name = validate_collection_name(name)                                   # name : nom validé
+        table_name = collection_table_name(name)                                # table_name : table à supprimer
+        if table_name in self.db.table_names():                                 # if : la table existe
+            self.db.drop_table(table_name)                                      # self.db.drop_table(...) : suppression de la table LanceDB
+        self.table.checkout_latest()                                            # checkout_latest : sinon la suppression part d'une version périmée
+        self.table.delete(f"name = '{name}'")                                   # self.table.delete(...) : retirer l'enregistrement
+        logger.info(f"Dropped collection '{name}' ({table_name})")              # logger.info : confirmation
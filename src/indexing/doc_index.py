@@ -0,0 +1,85 @@
+# Objectif — Index de premier niveau de la recherche hiérarchique : un vecteur par document (moyenne normalisée de ses chunks), persisté dans LanceDB et servi en mémoire
+
+# Étape 1 — Importer les dépendances
+import logging                                                                  # import : charger le module standard | logging : gestion des journaux
+from typing import Dict, List, Sequence, Tuple                                  # from : importer depuis le typage | typing : module types | Dict, List, Sequence, Tuple : types génériques
+import numpy as np                                                              # import : charger le module de calcul | numpy : moyennes des vecteurs par document
+import pyarrow as pa                                                            # import : charger le module | pyarrow : lignes de la table des documents
+from src.indexing.collection_registry import collection_table_name              # from : importer le nommage | src.indexing.collection_registry : table des chunks de la collection
+from src.indexing.memory_index import InMemoryIndex                             # from : importer l'index | src.indexing.memory_index : recherche exacte des documents (quelques milliers de vecteurs)
+
+# Étape 2 — Configurer le logging
+logger = logging.getLogger(__name__)                                            # logger : objet enregistreur | = : assignation | logging.getLogger(__name__) : récupérer le logger actuel
+
+# Étape 3 — Nommage et schéma de la table des documents
+def document_table_name(collection: str) -> str:                                # def : définir la fonction | document_table_name : table des vecteurs documents d'une collection | -> : retour | str
+    """"vev_rag_<x>" -> "vev_docs_<x>" : préfixe distinct, aucune collection ne peut porter ce nom."""
+    return "vev_docs_" + collection_table_name(collection)[len("vev_rag_"):]    # return : table dédiée (vev_docs_data pour la collection par défaut)
+
+def document_schema(dim: int) -> pa.Schema:                                     # def : définir la fonction | document_schema : colonnes de la table des documents | -> : retour | pa.Schema
+    return pa.schema([                                                          # return : schéma Arrow
+        pa.field("id", pa.string()),                                            # pa.field : clé de la ligne (= source, pour merge_insert et InMemoryIndex)
+        pa.field("source", pa.string()),                                        # pa.field : chemin du document (préfiltre des chunks)
+        pa.field("vector", pa.list_(pa.float32(), dim)),                        # pa.field : moyenne normalisée des vecteurs de ses chunks
+        pa.field("chunk_count", pa.int32()),                                    # pa.field : nombre de chunks moyennés
+    ])                                                                          # ]) : fin du schéma
+
+# Étape 4 — Moyenne des vecteurs par document
+def mean_document_vectors(sources: Sequence[str], vectors: np.ndarray) -> Tuple[List[str], np.ndarray, np.ndarray]: # def : définir la fonction | mean_document_vectors : centroïde de chaque source | -> : retour | (sources, vecteurs, nombres de chunks)
+    """Regroupe les lignes par source et retourne le centroïde normalisé de chacune (np.add.at, sans boucle Python sur les chunks)."""
+    unique, inverse = np.unique(np.asarray(sources, dtype=object), return_inverse=True) # unique : sources distinctes | inverse : groupe de chaque ligne
+    sums = np.zeros((len(unique), vectors.shape[1]), dtype=np.float32)          # sums : somme des vecteurs de chaque source
+    np.add.at(sums, inverse, vectors)                                           # add.at : accumulation groupée
+    norms = np.linalg.norm(sums, axis=1, keepdims=True)                         # norms : la moyenne normalisée ne dépend que de la direction de la somme
+    return list(unique), sums / np.maximum(norms, 1e-12), np.bincount(inverse, minlength=len(unique)) # return : sources, centroïdes, tailles
+
+# Étape 5 — Définir l'index des documents d'un shard
+class DocumentIndex:                                                            # class : définir une classe | DocumentIndex : un vecteur par document, table LanceDB + miroir NumPy
+    """Vecteurs documents d'une collection dans un shard : mis à jour à chaque écriture de chunks, interrogés avant la recherche des chunks."""
+
+    def __init__(self, db, collection: str, dim: int):                          # def : constructeur | db : connexion LanceDB du shard | collection : nom de la collection | dim : dimension des vecteurs
+        self.dim = dim                                                          # self.dim : dimension attendue
+        self.table_name = document_table_name(collection)                       # self.table_name : table des documents
+        if self.table_name in db.table_names():                                 # if : table existante
+            self.table = db.open_table(self.table_name)                         # self.table : ouvrir la table
+        else:                                                                   # else : premier démarrage
+            self.table = db.create_table(self.table_name, schema=document_schema(dim)) # self.table : créer la table vide
+        self.index = InMemoryIndex.from_table(self.table, dim)                  # self.index : miroir en mémoire (un GEMV sur quelques milliers de lignes)
+
+    def __len__(self) -> int:                                                   # def : méthode spéciale | __len__ : nombre de documents indexés
+        return len(self.index)                                                  # return : taille du miroir
+
+    # Étape 5.1 — Mises à jour
+    def _to_arrow(self, data) -> pa.Table:                                      # def : méthode privée | _to_arrow : chunks Arrow -> lignes documents | -> : retour | pa.Table
+        vectors = np.asarray(data.column("vector").combine_chunks().values, dtype=np.float32).reshape(-1, self.dim) # vectors : matrice (n, dim) lue depuis le buffer Arrow
+        sources, means, counts = mean_document_vectors(data.column("source").to_pylist(), vectors) # sources, means, counts : un centroïde par document
+        return pa.Table.from_arrays([                                           # return : table au schéma des documents
+            pa.array(sources, pa.string()),                                     # id : source
+            pa.array(sources, pa.string()),                                     # source : chemin du document
+            pa.FixedSizeListArray.from_arrays(pa.array(means.astype(np.float32).ravel()), self.dim), # vector : centroïdes float32
+            pa.array(counts, pa.int32()),                                       # chunk_count : taille de chaque document
+        ], schema=document_schema(self.dim))                                    # schema : schéma de la table
+
+    def add_arrow(self, data):                                                  # def : méthode | add_arrow : (re)calculer les documents d'un lot de chunks
+        """Remplace le vecteur des documents du lot (chaque écriture contient des documents complets : ingestion ou upsert par source)."""
+        if isinstance(data, pa.RecordBatch):                                    # if : un RecordBatch seul (upsert d'un document)
+            data = pa.Table.from_batches([data])                                # data : conversion en table (sans copie)
+        if data.num_rows == 0:                                                  # if : rien à indexer
+            return                                                              # return : sortir
+        rows = self._to_arrow(data)                                             # rows : une ligne par document
+        self.table.merge_insert("id").when_matched_update_all().when_not_matched_insert_all().execute(rows) # merge_insert : une transaction pour tous les documents du lot
+        self.index.add_arrow(rows)                                              # add_arrow : miroir synchronisé
+
+    def remove_source(self, source: str):                                       # def : méthode | remove_source : oublier un document supprimé
+        self.table.delete("id = '" + source.replace("'", "''") + "'")           # delete : ligne du document (apostrophes doublées)
+        self.index.remove_ids([source])                                         # remove_ids : miroir synchronisé
+
+    def rebuild(self, chunk_table):                                             # def : méthode | rebuild : calculer tous les documents depuis la table des chunks
+        """Remplit l'index d'une collection indexée avant la recherche hiérarchique (lecture des seules colonnes source et vector)."""
+        data = chunk_table.search().select(["source", "vector"]).limit(None).to_arrow() # data : colonnes utiles seulement
+        self.add_arrow(data)                                                    # add_arrow : un centroïde par document, table et miroir
+        logger.info(f"Document index {self.table_name} built: {len(self)} documents") # logger.info : confirmation
+
+    # Étape 5.2 — Premier niveau de la recherche
+    def search(self, query_vector: np.ndarray, top_docs: int) -> List[Dict]:    # def : méthode | search : documents les plus proches | top_docs : nombre de documents | -> : retour | List[Dict] : lignes avec 'source' et '_distance'
+        return self.index.search(query_vector, top_docs)                        # return : top documents au format LanceDB
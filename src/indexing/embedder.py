@@ -40,6 +40,12 @@ class FastEmbedder:
         embeddings = list(self.model.embed([query]))                            # embeddings : résultat de l'encodage converti en liste | list(...) : ✅ Fix générateur FastEmbed | self.model.embed(...) : méthode d'encodage fastembed | [query] : doit être une liste (fastembed travaille par lot)
         return embeddings[0].astype(np.float32)                                 # return : renvoyer le premier (et unique) vecteur | .astype(np.float32) : assurer le bon format (float32 est le standard pour les DB vectorielles)
 
+    # Étape 3.3 bis — Méthode pour encoder plusieurs requêtes en un seul lot
+    def embed_queries(self, queries: Sequence[str]) -> np.ndarray:              # def : définir la méthode | embed_queries : encoder les variantes d'une question | -> : retour type | np.ndarray : matrice (n, dim)
+        """Encode plusieurs requêtes (variantes d'une même question) en un seul appel au modèle."""
+        embeddings = list(self.model.embed(list(queries)))                      # embeddings : un seul lot FastEmbed au lieu de n appels
+        return np.vstack(embeddings).astype(np.float32)                         # return : matrice float32, une ligne par requête
+
     # Étape 3.4 — Méthode pour encoder les documents (chunks)
     def embed_documents(self, documents: Sequence[str]) -> List[np.ndarray]:    # def : définir la méthode | embed_documents : pour encoder une liste de documents (chunks) | -> : retour type | List[np.ndarray] : liste de tableaux numpy
         """Encode une liste de documents (chunks)."""
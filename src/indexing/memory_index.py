@@ -0,0 +1,164 @@
+# Objectif — Index vectoriel exact en mémoire (NumPy) : miroir de la table LanceDB pour les petits et moyens corpus (un produit matrice-vecteur + argpartition par requête)
+
+# Étape 1 — Importer les dépendances
+import logging                                                                  # import : charger le module standard | logging : gestion des journaux
+import threading                                                                # import : charger le module standard | threading : verrou (ingestion et recherche simultanées)
+from typing import Any, Dict, Iterable, List, Optional, Sequence                # from : importer depuis le typage | typing : module types | Any, Dict, Iterable, List, Optional, Sequence : types génériques
+import numpy as np                                                              # import : charger le module de calcul | numpy : matrice des vecteurs normalisés
+import pyarrow as pa                                                            # import : charger le module | pyarrow : lecture colonnaire de la table LanceDB | as pa : alias
+
+# Étape 2 — Configurer le logging et les constantes
+logger = logging.getLogger(__name__)                                            # logger : objet enregistreur | = : assignation | logging.getLogger(__name__) : récupérer le logger actuel
+PAYLOAD_COLUMNS = ("text", "source", "page", "title", "created_at", "chunk_index") # PAYLOAD_COLUMNS : colonnes renvoyées avec chaque résultat (mêmes clés que LanceDB)
+FLOAT16_BLOCK_ROWS = 4096                                                       # FLOAT16_BLOCK_ROWS : taille des blocs convertis en float32 pour le produit scalaire (numpy n'a pas de BLAS float16 ; 4096 lignes restent en cache L2)
+
+# Étape 3 — Définir l'index en mémoire
+class InMemoryIndex:                                                            # class : définir une classe | InMemoryIndex : recherche exacte par force brute en RAM
+    """Matrice de vecteurs normalisés + table d'ids, synchronisée avec la table LanceDB (ajouts, upserts, suppressions)."""
+
+    # Étape 3.1 — Constructeur
+    def __init__(self, dim: int, dtype: str = "float32", initial_capacity: int = 1024): # def : constructeur | dim : dimension des vecteurs | dtype : "float32" ou "float16" (moitié de RAM) | initial_capacity : lignes pré-allouées
+        self.dim = dim                                                          # self.dim : dimension des vecteurs
+        self.dtype = np.dtype(dtype)                                            # self.dtype : type de stockage de la matrice
+        self._matrix = np.zeros((initial_capacity, dim), dtype=self.dtype)      # self._matrix : vecteurs normalisés (seules les self._size premières lignes sont valides)
+        self._size = 0                                                          # self._size : nombre de lignes valides
+        self._ids: List[str] = []                                               # self._ids : id du chunk de chaque ligne
+        self._payloads: List[Dict[str, Any]] = []                               # self._payloads : métadonnées de chaque ligne
+        self._row_of: Dict[str, int] = {}                                       # self._row_of : id -> ligne
+        self._ids_by_source: Dict[str, set] = {}                                # self._ids_by_source : source -> ids (suppression par document)
+        self._lock = threading.RLock()                                          # self._lock : protège la matrice pendant les mutations
+
+    def __len__(self) -> int:                                                   # def : méthode spéciale | __len__ : nombre de vecteurs indexés
+        return self._size                                                       # return : taille courante
+
+    # Étape 3.2 — Construction depuis une table LanceDB
+    @classmethod                                                                # @classmethod : constructeur alternatif
+    def from_table(cls, table, dim: int, dtype: str = "float32") -> "InMemoryIndex": # def : méthode de classe | from_table : charger toute la table | -> : retour | InMemoryIndex
+        """Charge toute la table LanceDB (lecture colonnaire Arrow) dans un nouvel index."""
+        data = table.to_arrow()                                                 # data : table Arrow complète (un seul scan)
+        index = cls(dim, dtype=dtype, initial_capacity=max(data.num_rows, 1024)) # index : capacité ajustée au corpus
+        index.add_arrow(data)                                                   # index.add_arrow(...) : remplissage vectorisé
+        logger.info(f"In-memory index loaded: {len(index)} vectors ({index.dtype.name}, {index.nbytes / 1e6:.1f} MB)") # logger.info : taille de l'index
+        return index                                                            # return : index prêt
+
+    @property                                                                   # @property : accès en lecture seule
+    def nbytes(self) -> int:                                                    # def : propriété | nbytes : mémoire occupée par la matrice
+        return self._matrix.nbytes                                              # return : octets alloués
+
+    # Étape 3.3 — Ajouts / upserts
+    def add_arrow(self, data):                                                  # def : méthode | add_arrow : ajouter les lignes d'une table / d'un RecordBatch Arrow (flush LanceDB, upsert)
+        """Ajoute ou remplace (par id) les lignes d'une table Arrow au schéma des chunks."""
+        if isinstance(data, pa.RecordBatch):                                    # if : un RecordBatch seul (upsert d'un document)
+            data = pa.Table.from_batches([data])                                # data : conversion en table (sans copie)
+        if data.num_rows == 0:                                                  # if : rien à ajouter
+            return                                                              # return : sortir
+        vectors = np.asarray(data.column("vector").combine_chunks().values, dtype=np.float32).reshape(-1, self.dim) # vectors : matrice (n, dim) lue depuis le buffer Arrow (sans listes Python)
+        columns = {name: data.column(name).to_pylist() for name in PAYLOAD_COLUMNS if name in data.column_names} # columns : métadonnées colonne par colonne
+        payloads = [{name: values[i] for name, values in columns.items()} for i in range(data.num_rows)] # payloads : une entrée par ligne
+        self.add(data.column("id").to_pylist(), vectors, payloads)              # self.add(...) : insertion
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray, payloads: Sequence[Dict[str, Any]]): # def : méthode | add : ajouter ou remplacer des vecteurs
+        """Ajoute des vecteurs (normalisés ici) ; un id déjà présent est remplacé sur place."""
+        vectors = np.asarray(vectors, dtype=np.float32)                         # vectors : matrice float32
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)                  # norms : normes L2 de chaque ligne
+        vectors = vectors / np.maximum(norms, 1e-12)                            # vectors : normalisation (produit scalaire = cosinus)
+        with self._lock:                                                        # with : section critique
+            self._reserve(self._size + len(ids))                                # self._reserve(...) : agrandir la matrice si besoin
+            for i, chunk_id in enumerate(ids):                                  # for : chaque vecteur
+                row = self._row_of.get(chunk_id)                                # row : ligne existante pour cet id (upsert)
+                if row is None:                                                 # if : nouvel id
+                    row = self._size                                            # row : première ligne libre
+                    self._size += 1                                             # self._size : une ligne de plus
+                    self._ids.append(chunk_id)                                  # self._ids.append : id de la ligne
+                    self._payloads.append(payloads[i])                          # self._payloads.append : métadonnées de la ligne
+                    self._row_of[chunk_id] = row                                # self._row_of : id -> ligne
+                else:                                                           # else : id existant -> remplacement
+                    self._forget_source(chunk_id, self._payloads[row].get("source")) # self._forget_source : l'ancienne source peut différer
+                    self._payloads[row] = payloads[i]                           # self._payloads[row] : nouvelles métadonnées
+                self._matrix[row] = vectors[i]                                  # self._matrix[row] : copie du vecteur (converti au dtype de stockage)
+                self._ids_by_source.setdefault(payloads[i].get("source"), set()).add(chunk_id) # self._ids_by_source : mémoriser la source
+
+    def _reserve(self, capacity: int):                                          # def : méthode privée | _reserve : capacité minimale de la matrice
+        """Agrandit la matrice (x2) pour amortir le coût des ajouts."""
+        if capacity <= self._matrix.shape[0]:                                   # if : capacité suffisante
+            return                                                              # return : rien à faire
+        new_matrix = np.zeros((max(capacity, 2 * self._matrix.shape[0]), self.dim), dtype=self.dtype) # new_matrix : matrice agrandie
+        new_matrix[:self._size] = self._matrix[:self._size]                     # new_matrix[...] : recopie des lignes valides
+        self._matrix = new_matrix                                               # self._matrix : remplacement
+
+    # Étape 3.4 — Suppressions
+    def remove_ids(self, ids: Iterable[str]) -> int:                            # def : méthode | remove_ids : retirer des vecteurs par id | -> : retour | int : nombre retiré
+        """Retire des ids (la dernière ligne prend la place libérée : O(1) par suppression)."""
+        removed = 0                                                             # removed : compteur
+        with self._lock:                                                        # with : section critique
+            for chunk_id in list(ids):                                          # for : chaque id à retirer
+                row = self._row_of.pop(chunk_id, None)                          # row : ligne de l'id (None si absent)
+                if row is None:                                                 # if : id inconnu
+                    continue                                                    # continue : ignorer
+                self._forget_source(chunk_id, self._payloads[row].get("source")) # self._forget_source : retirer de l'index par source
+                last = self._size - 1                                           # last : dernière ligne valide
+                if row != last:                                                 # if : la ligne n'est pas la dernière -> on y déplace la dernière
+                    self._matrix[row] = self._matrix[last]                      # déplacement du vecteur
+                    self._ids[row] = self._ids[last]                            # déplacement de l'id
+                    self._payloads[row] = self._payloads[last]                  # déplacement des métadonnées
+                    self._row_of[self._ids[row]] = row                          # mise à jour de la position
+                self._ids.pop()                                                 # retirer la dernière entrée
+                self._payloads.pop()                                            # retirer la dernière entrée
+                self._size -= 1                                                 # une ligne de moins
+                removed += 1                                                    # compteur
+        return removed                                                          # return : nombre de vecteurs retirés
+
+    def remove_source(self, source: str) -> int:                                # def : méthode | remove_source : retirer tous les vecteurs d'un document | -> : retour | int
+        """Retire tous les vecteurs d'une source."""
+        with self._lock:                                                        # with : section critique
+            ids = list(self._ids_by_source.get(source, ()))                     # ids : ids de la source
+        return self.remove_ids(ids)                                             # return : nombre retiré
+
+    def _forget_source(self, chunk_id: str, source: Optional[str]):             # def : méthode privée | _forget_source : retirer un id de l'index par source
+        ids = self._ids_by_source.get(source)                                   # ids : ensemble de la source
+        if ids is not None:                                                     # if : source connue
+            ids.discard(chunk_id)                                               # discard : retirer l'id
+            if not ids:                                                         # if : plus aucun chunk pour cette source
+                del self._ids_by_source[source]                                 # del : oublier la source
+
+    # Étape 3.5 — Recherche exacte
+    def _scores(self, query: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray: # def : méthode privée | _scores : cosinus de la requête avec les lignes | -> : retour | np.ndarray
+        """Produit matrice-vecteur (GEMV) ; par blocs convertis en float32 si la matrice est en float16."""
+        matrix = self._matrix[:self._size] if rows is None else self._matrix[rows] # matrix : lignes candidates (vue, ou copie si filtrées)
+        if matrix.dtype == np.float32:                                          # if : stockage float32 -> BLAS direct
+            return matrix @ query                                               # return : un seul GEMV
+        return np.concatenate([                                                 # return : GEMV par blocs float16 -> float32
+            matrix[start:start + FLOAT16_BLOCK_ROWS].astype(np.float32) @ query # bloc converti puis multiplié
+            for start in range(0, matrix.shape[0], FLOAT16_BLOCK_ROWS)          # for : chaque bloc
+        ]) if matrix.shape[0] else np.zeros(0, dtype=np.float32)                # cas vide
+
+    def search(self, query_vector: np.ndarray, top_k: int, sources: Optional[Sequence[str]] = None, # def : méthode | search : top-k exact | query_vector : vecteur requête | top_k : nombre de résultats | sources : filtre par documents
+               text_contains: Optional[str] = None) -> List[Dict[str, Any]]:    # text_contains : filtre sous-chaîne (équivalent du LIKE '%...%') | -> : retour | List[Dict] : lignes au format LanceDB
+        """Retourne les top-k lignes au format des résultats LanceDB (dont '_distance' = distance L2² entre vecteurs normalisés)."""
+        query = np.asarray(query_vector, dtype=np.float32)                      # query : vecteur float32
+        query = query / max(float(np.linalg.norm(query)), 1e-12)                # query : normalisation
+        with self._lock:                                                        # with : lecture cohérente pendant une ingestion
+            if self._size == 0 or top_k <= 0:                                   # if : index vide
+                return []                                                       # return : aucun résultat
+            rows = None                                                         # rows : None = toutes les lignes
+            if sources is not None:                                             # if : filtre par documents (recherche hiérarchique, préfiltre)
+                wanted = set().union(*(self._ids_by_source.get(s, ()) for s in sources)) if sources else set() # wanted : ids des sources demandées
+                rows = np.fromiter((self._row_of[i] for i in wanted), dtype=np.int64, count=len(wanted)) # rows : lignes candidates
+            if text_contains is not None:                                       # if : filtre texte (jambe "FTS" de la recherche hybride)
+                candidates = range(self._size) if rows is None else rows        # candidates : lignes déjà filtrées ou toutes
+                rows = np.array([r for r in candidates if text_contains in (self._payloads[r].get("text") or "")], dtype=np.int64) # rows : lignes dont le texte contient la sous-chaîne
+            if rows is not None and rows.size == 0:                             # if : aucun candidat après filtrage
+                return []                                                       # return : aucun résultat
+            scores = self._scores(query, rows)                                  # scores : cosinus de chaque candidat
+            k = min(top_k, scores.shape[0])                                     # k : ne pas dépasser le nombre de candidats
+            top = np.argpartition(-scores, k - 1)[:k]                           # top : k meilleurs en O(n) (non triés)
+            top = top[np.argsort(-scores[top])]                                 # top : tri des k meilleurs seulement
+            results = []                                                        # results : lignes de sortie
+            for position in top:                                                # for : chaque meilleur candidat
+                row = int(position if rows is None else rows[position])         # row : ligne réelle dans la matrice
+                result = dict(self._payloads[row])                              # result : copie des métadonnées
+                result["id"] = self._ids[row]                                   # "id" : identifiant du chunk
+                result["vector"] = self._matrix[row].astype(np.float32).tolist() # "vector" : vecteur normalisé (k petites conversions seulement)
+                result["_distance"] = float(2.0 - 2.0 * scores[position])       # "_distance" : même échelle que la distance L2 de LanceDB
+                results.append(result)                                          # results.append : ajout
+            return results                                                      # return : top-k au format LanceDB
@@ -0,0 +1,89 @@
+# Objectif — Répartir une collection sur N shards LanceDB (un par dossier local ou par URI objet type S3) : routage par hash de la source, fusion des top-k
+
+# Étape 1 — Importer les dépendances
+import logging                                                                  # import : charger le module standard | logging : gestion des journaux
+import heapq                                                                    # import : charger le module standard | heapq : fusion des listes triées de chaque shard
+import threading                                                                # import : charger le module standard | threading : rafraîchissement de l'instantané en arrière-plan
+from itertools import islice                                                    # from : importer depuis itertools | islice : ne garder que les k premiers de la fusion
+from time import monotonic                                                      # from : importer depuis le module temps | monotonic : âge de l'instantané
+from typing import Callable, Dict, List, Optional, Sequence                     # from : importer depuis le typage | typing : module types | Callable, Dict, List, Optional, Sequence : types génériques
+from src.core.config import LANCEDB_DIR, VECTOR_SHARD_URIS                      # from : importer les constantes | src.core.config : dossier LanceDB et URIs des shards
+from src.core.schemas import source_hash                                        # from : importer le hash | src.core.schemas : même hash que les ids de chunks
+from src.indexing.arrow_writer import ArrowBatchWriter                          # from : importer l'écrivain | src.indexing.arrow_writer : tampon d'écriture du shard
+
+# Étape 1 bis — Configurer le logging
+logger = logging.getLogger(__name__)                                            # logger : objet enregistreur | = : assignation | logging.getLogger(__name__) : récupérer le logger actuel
+
+# Étape 2 — Emplacement et routage des shards
+def shard_uri(shard_id: int) -> str:                                            # def : définir la fonction | shard_uri : emplacement d'un shard | -> : retour | str : dossier local ou URI
+    """Shard 0 = base historique (LANCEDB_DIR) ; shards suivants = VECTOR_SHARD_URIS, sinon LANCEDB_DIR/shards/shard_XX."""
+    if shard_id == 0:                                                           # if : premier shard
+        return str(LANCEDB_DIR)                                                 # return : base historique (registre des collections compris)
+    if shard_id <= len(VECTOR_SHARD_URIS):                                      # if : URI configurée (autre disque, stockage objet compatible S3)
+        return VECTOR_SHARD_URIS[shard_id - 1]                                  # return : URI explicite
+    return str(LANCEDB_DIR / "shards" / f"shard_{shard_id:02d}")                # return : sous-dossier local par défaut
+
+def shard_for_source(source: str, num_shards: int) -> int:                      # def : définir la fonction | shard_for_source : shard d'un document | -> : retour | int : numéro de shard
+    """Un document entier vit dans un seul shard (upsert et suppression restent locaux)."""
+    if num_shards <= 1:                                                         # if : pas de sharding
+        return 0                                                                # return : shard unique
+    return int(source_hash(source), 16) % num_shards                            # return : hash stable de la source modulo N
+
+# Étape 3 — Fusion des résultats
+def merge_top_k(results_per_shard: Sequence[List[Dict]], limit: int) -> List[Dict]: # def : définir la fonction | merge_top_k : top-k global | results_per_shard : listes triées par '_distance' croissante | -> : retour | List[Dict]
+    """Fusionne les top-k (déjà triés) de chaque shard avec un tas : O(k log N)."""
+    if len(results_per_shard) == 1:                                             # if : un seul shard
+        return list(results_per_shard[0][:limit])                               # return : rien à fusionner
+    merged = heapq.merge(*results_per_shard, key=lambda row: row.get("_distance", 0.0)) # merged : itérateur fusionné paresseux
+    return list(islice(merged, limit))                                          # return : k meilleurs tous shards confondus
+
+# Étape 4 — Un shard ouvert
+class Shard:                                                                    # class : définir une classe | Shard : table d'une collection dans une base LanceDB
+    """Connexion, table d'écriture, instantané de lecture épinglé, tampon d'écriture, index en mémoire (optionnel) et index des documents d'un shard."""
+
+    def __init__(self, shard_id: int, uri: str, db, table, memory_index: Optional[object] = None, doc_index: Optional[object] = None, # def : constructeur | shard_id : numéro | uri : emplacement | db : connexion | table : table LanceDB (écriture) | memory_index : InMemoryIndex ou None | doc_index : DocumentIndex ou None
+                 on_write: Optional[Callable[[], None]] = None, on_refresh: Optional[Callable[[], None]] = None): # on_write : appelé après chaque écriture du tampon | on_refresh : appelé quand l'instantané change de version
+        self.shard_id = shard_id                                                # self.shard_id : numéro du shard
+        self.uri = uri                                                          # self.uri : emplacement (journaux, diagnostic)
+        self.db = db                                                            # self.db : connexion LanceDB
+        self.table = table                                                      # self.table : handle d'écriture de la table (ingestion, upsert, suppression)
+        self.memory_index = memory_index                                        # self.memory_index : miroir NumPy (moteur "memory")
+        self.doc_index = doc_index                                              # self.doc_index : un vecteur par document (premier niveau de la recherche hiérarchique)
+        self.on_write = on_write                                                # self.on_write : rappel d'écriture (version du corpus)
+        self.on_refresh = on_refresh                                            # self.on_refresh : rappel de nouvelle version (écritures des autres processus comprises)
+        self.writer = ArrowBatchWriter(table, on_flush=self._on_flush)          # self.writer : tampon d'écriture Arrow du shard | on_flush : miroir + nouvel instantané après chaque écriture
+        self.read_table = None                                                  # self.read_table : handle de lecture épinglé sur une version (jamais modifié en place)
+        self.read_version = None                                                # self.read_version : version LanceDB visible par les recherches
+        self.row_count = 0                                                      # self.row_count : nombre de lignes de l'instantané (évite un count_rows à chaque rerun Streamlit)
+        self._refreshed_at = 0.0                                                # self._refreshed_at : instant du dernier rafraîchissement
+        self._refresh_lock = threading.Lock()                                   # self._refresh_lock : un seul rafraîchissement à la fois
+        self.refresh()                                                          # self.refresh() : premier instantané
+
+    # Étape 4.1 — Instantané de lecture
+    def refresh(self):                                                          # def : méthode | refresh : épingler la dernière version validée
+        """Ouvre un nouveau handle épinglé sur la dernière version et le publie d'un bloc (les recherches en cours gardent l'ancien)."""
+        with self._refresh_lock:                                                # with : éviter deux ouvertures simultanées
+            handle = self.db.open_table(self.table.name)                        # handle : nouveau handle (dernière version validée, écritures des autres processus comprises)
+            handle.checkout(handle.version)                                     # checkout : épingler la version (lecture seule, ne bouge plus)
+            row_count = handle.count_rows()                                     # row_count : comptage une fois par version
+            changed = self.read_version is not None and handle.version != self.read_version # changed : nouvelle version (pas au premier instantané)
+            self.read_table, self.read_version, self.row_count = handle, handle.version, row_count # publication de l'instantané
+            self._refreshed_at = monotonic()                                    # self._refreshed_at : horodatage
+        logger.debug(f"Shard {self.shard_id} pinned to version {self.read_version} ({row_count} rows)") # logger.debug : suivi
+        if changed and self.on_refresh is not None:                             # if : contenu modifié depuis l'instantané précédent
+            self.on_refresh()                                                   # on_refresh : relire la version du corpus
+
+    def refresh_if_stale(self, max_age: float):                                 # def : méthode | refresh_if_stale : rattraper les écritures d'autres processus | max_age : âge maximum (secondes) de l'instantané
+        """Rafraîchit l'instantané en arrière-plan s'il est trop ancien (la recherche courante n'attend pas)."""
+        if monotonic() - self._refreshed_at < max_age or self._refresh_lock.locked(): # if : instantané récent ou rafraîchissement en cours
+            return                                                              # return : rien à faire
+        threading.Thread(target=self.refresh, daemon=True, name=f"vev-refresh-{self.shard_id}").start() # Thread : rafraîchissement hors du chemin de la requête
+
+    def _on_flush(self, data):                                                  # def : méthode privée | _on_flush : rappel après une écriture du tampon
+        if self.memory_index is not None:                                       # if : moteur en mémoire
+            self.memory_index.add_arrow(data)                                   # add_arrow : mêmes lignes que celles écrites dans LanceDB
+        if self.doc_index is not None:                                          # if : index des documents
+            self.doc_index.add_arrow(data)                                      # add_arrow : centroïdes des documents écrits
+        self.refresh()                                                          # self.refresh() : les recherches voient le lot entier d'un coup
+        if self.on_write is not None:                                           # if : rappel d'écriture fourni
+            self.on_write()                                                     # on_write : version du corpus incrémentée une fois le lot écrit et publié
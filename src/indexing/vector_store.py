@@ -2,164 +2,478 @@
 
 # Étape 1 — Importer les dépendances
 import logging                                                                  # import : charger le module standard | logging : gestion des journaux
-from typing import List, Optional                                               # from : importer depuis le typage | typing : module types | List, Optional : types génériques
+from concurrent.futures import Future, ThreadPoolExecutor                       # from : importer depuis concurrent.futures | ThreadPoolExecutor : recherche parallèle sur les shards et construction d'index en arrière-plan | Future : résultat différé
+from typing import Dict, List, Optional, Tuple                                  # from : importer depuis le typage | typing : module types | Dict, List, Optional, Tuple : types génériques
+import numpy as np                                                              # import : charger le module de calcul | numpy : matrice des vecteurs à écrire
+import pyarrow as pa                                                            # import : charger le module | pyarrow : colonne ajoutée lors de la migration du schéma
 import lancedb as lancedb                                                       # import : charger la librairie | lancedb : base de données vectorielle ultra-rapide | as lancedb : alias local
-import pyarrow as pa                                                            # import : charger le module | pyarrow : format de données en colonnes (requis par LanceDB) | as pa : alias
-from src.core.config import LANCEDB_DIR, EMBEDDING_DIM, LLM_CONTEXT_WINDOW      # from : importer les constantes | src.core.config : notre fichier de configuration | LANCEDB_DIR, EMBEDDING_DIM, LLM_CONTEXT_WINDOW : chemins et tailles
+from src.core.config import EMBEDDING_DIM, DEFAULT_COLLECTION, VECTOR_SEARCH_BACKEND, MEMORY_INDEX_DTYPE, VECTOR_SHARDS, LANCEDB_STORAGE_OPTIONS, SNAPSHOT_REFRESH_SECONDS, HIERARCHICAL_TOP_DOCS # from : importer les constantes | src.core.config : notre fichier de configuration | EMBEDDING_DIM, DEFAULT_COLLECTION : taille et collection par défaut | VECTOR_SEARCH_BACKEND, MEMORY_INDEX_DTYPE : moteur de recherche vectorielle | VECTOR_SHARDS, LANCEDB_STORAGE_OPTIONS : sharding | SNAPSHOT_REFRESH_SECONDS : âge maximum des instantanés de lecture
+from src.core.metrics import metrics                                            # from : importer le registre | src.core.metrics : nombre de voisins ajoutés
 from src.core.schemas import Chunk, SearchResult, SourceMetadata                                # from : importer définitions | src.core.schemas : nos objets Pydantic
+from src.indexing.arrow_writer import ArrowBatchWriter, CHUNK_SCHEMA, chunks_to_record_batch # from : importer l'écrivain Arrow | src.indexing.arrow_writer : écriture groupée en RecordBatch | CHUNK_SCHEMA : schéma de la table | chunks_to_record_batch : conversion pour l'upsert
+from src.indexing.collection_registry import CollectionRegistry, DEFAULT_TABLE_NAME, collection_table_name, validate_collection_name # from : importer le registre | src.indexing.collection_registry : collections nommées
+from src.indexing.doc_index import DocumentIndex, document_table_name           # from : importer l'index des documents | src.indexing.doc_index : premier niveau de la recherche hiérarchique
+from src.indexing.memory_index import InMemoryIndex                             # from : importer l'index | src.indexing.memory_index : recherche exacte en mémoire (NumPy)
+from src.indexing.shards import Shard, merge_top_k, shard_for_source, shard_uri # from : importer le sharding | src.indexing.shards : emplacement, routage par source et fusion des top-k
+from src.retrieval.fusion import reciprocal_rank_fusion                         # from : importer la fusion | src.retrieval.fusion : Reciprocal Rank Fusion vectorisée
 from src.indexing.embedder import FastEmbedder                                  # from : importer l'embedder | src.indexing.embedder : outil d'encodage FastEmbed
 from src.ingestion.cleaner import clean_text_basic                              # from : importer le nettoyeur | src.ingestion.cleaner : pour nettoyer la requête utilisateur
 
 # Étape 2 — Configurer le logging
 logger = logging.getLogger(__name__)                                            # logger : objet enregistreur | = : assignation | logging.getLogger(__name__) : récupérer le logger actuel
 
+# Étape 2 bis — Position d'un chunk d'après son identifiant déterministe
+def _chunk_index_from_id(chunk_id: str) -> int:                                 # def : fonction privée | _chunk_index_from_id : suffixe de l'id | -> : retour | int : position (0 si l'id n'est pas déterministe)
+    """"<hash source>-<index sur 6 chiffres>" -> index ; les ids aléatoires (uuid) donnent 0."""
+    prefix, _, suffix = chunk_id.rpartition("-")                                # rpartition : séparer le dernier segment
+    return int(suffix) if len(prefix) == 16 and suffix.isdigit() else 0         # return : index lu, ou 0
+
+# Étape 2 ter — Échapper une valeur texte pour les filtres SQL de LanceDB
+def _sql_quote(value: str) -> str:                                              # def : fonction privée | _sql_quote : littéral SQL sûr | -> : retour | str : valeur entre apostrophes
+    """Retourne la valeur entre apostrophes, apostrophes internes doublées (ex : noms de fichiers avec ')."""
+    return "'" + value.replace("'", "''") + "'"                                 # return : 'valeur' échappée
+
+def _sources_filter(sources: List[str]) -> str:                                 # def : fonction privée | _sources_filter : filtre SQL sur une liste de documents | -> : retour | str
+    return f"source IN ({', '.join(_sql_quote(source) for source in sources)})" # return : source IN ('a', 'b', ...)
+
 # Étape 3 — Définir la classe de gestion LanceDB
 class VectorStore:                                                              # class : définir une classe | VectorStore : outil de gestion de la base de données
-    TABLE_NAME = "vev_rag_data"                                                 # TABLE_NAME : nom de la table LanceDB
+    SEARCH_BACKENDS = ("lancedb", "memory")                                     # SEARCH_BACKENDS : moteurs de recherche vectorielle disponibles
+    TABLE_NAME = DEFAULT_TABLE_NAME                                             # TABLE_NAME : nom de la table LanceDB de la collection par défaut
 
     # Étape 3.1 — Constructeur (Connexion)
-    def __init__(self, embedder: FastEmbedder):                                 # def : constructeur | self : instance | embedder : objet FastEmbedder (pour la recherche)
+    def __init__(self, embedder: FastEmbedder, collection: str = DEFAULT_COLLECTION, backend: Optional[str] = None, # def : constructeur | self : instance | embedder : objet FastEmbedder (pour la recherche) | collection : collection nommée (une table par équipe) | backend : moteur de recherche (défaut : VECTOR_SEARCH_BACKEND)
+                 num_shards: Optional[int] = None):                             # num_shards : nombre de shards (défaut : VECTOR_SHARDS)
         self.embedder = embedder                                                # self.embedder : stocker l'outil d'encodage
-        self.db = lancedb.connect(str(LANCEDB_DIR))                             # self.db : objet connexion à la base | lancedb.connect(...) : connexion au dossier lancedb
-        self.table = self._get_or_create_table()                                # self.table : la table de travail | self._get_or_create_table() : appel à la méthode de vérification
+        self.collection = validate_collection_name(collection)                  # self.collection : nom de la collection
+        self.table_name = collection_table_name(self.collection)                # self.table_name : table LanceDB dédiée à la collection
+        self.backend = backend or VECTOR_SEARCH_BACKEND                         # self.backend : "lancedb" ou "memory"
+        if self.backend not in self.SEARCH_BACKENDS:                            # if : moteur inconnu
+            raise ValueError(f"Unknown vector search backend: {self.backend!r} (expected one of {self.SEARCH_BACKENDS})") # raise : erreur de configuration explicite
+        self.num_shards = num_shards or VECTOR_SHARDS                           # self.num_shards : nombre de shards de la collection
+        if self.num_shards < 1:                                                 # if : valeur impossible
+            raise ValueError(f"num_shards must be >= 1, got {self.num_shards}") # raise : erreur de configuration explicite
+        self._index_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vev-index") # self._index_pool : constructions d'index en arrière-plan (une à la fois)
+        self._search_pool = (ThreadPoolExecutor(max_workers=self.num_shards, thread_name_prefix="vev-shard") # self._search_pool : un thread par shard pour la recherche parallèle
+                             if self.num_shards > 1 else None)                  # None : pas de pool avec un shard unique
+
+        # Le shard 0 est la base historique : il porte aussi le registre des collections
+        self.db = self._connect(0)                                              # self.db : connexion à la base du shard 0
+        self.registry = CollectionRegistry(self.db)                             # self.registry : registre des collections
+        self.registry.ensure(self.collection, embedder.model_name, embedder.dimension) # ensure(...) : déclarer la collection et vérifier son modèle d'embedding
+        self._corpus_version = self.registry.corpus_version(self.collection)    # self._corpus_version : version en mémoire (relue à chaque nouvel instantané, pas à chaque question)
+        self.shards = [self._open_shard(i, self.db if i == 0 else None) for i in range(self.num_shards)] # self.shards : shards ouverts (tables créées si besoin)
+        self.table = self.shards[0].table                                       # self.table : table du shard 0 (la table de la collection quand num_shards = 1)
+        self.memory_index = self.shards[0].memory_index                         # self.memory_index : miroir NumPy du shard 0 (None avec le moteur LanceDB)
+        if self.num_shards > 1:                                                 # if : collection shardée
+            logger.info(f"Collection '{self.collection}' spread over {self.num_shards} shards: {[s.uri for s in self.shards]}") # logger.info : emplacements
+
+    # Étape 3.1 bis — Connexion et ouverture d'un shard
+    @staticmethod                                                               # @staticmethod : pas besoin de l'instance
+    def _connect(shard_id: int):                                                # def : méthode privée | _connect : connexion LanceDB d'un shard
+        """Connexion au dossier local ou à l'URI objet (s3://...) du shard."""
+        uri = shard_uri(shard_id)                                               # uri : emplacement du shard
+        if "://" in uri:                                                        # if : stockage objet (S3, MinIO...)
+            return lancedb.connect(uri, storage_options=LANCEDB_STORAGE_OPTIONS or None) # return : connexion distante avec ses options
+        return lancedb.connect(uri)                                             # return : connexion au dossier local
+
+    def _open_shard(self, shard_id: int, db=None) -> Shard:                     # def : méthode privée | _open_shard : table, tampon et miroir d'un shard | -> : retour | Shard
+        """Ouvre (ou crée) la table de la collection dans le shard."""
+        db = db if db is not None else self._connect(shard_id)                  # db : connexion du shard
+        table = self._get_or_create_table(db)                                   # table : table de la collection dans ce shard
+        memory_index = (InMemoryIndex.from_table(table, EMBEDDING_DIM, MEMORY_INDEX_DTYPE) # memory_index : miroir NumPy de la table (None avec le moteur LanceDB)
+                        if self.backend == "memory" else None)
+        doc_index = DocumentIndex(db, self.collection, EMBEDDING_DIM)           # doc_index : centroïdes des documents du shard
+        if len(doc_index) == 0 and table.count_rows() > 0:                      # if : collection indexée avant la recherche hiérarchique
+            self._index_pool.submit(doc_index.rebuild, table)                   # submit : calcul des centroïdes en arrière-plan (recherche à plat en attendant)
+        return Shard(shard_id, shard_uri(shard_id), db, table, memory_index, doc_index, # return : shard prêt (tampon d'écriture et instantané de lecture créés par le shard)
+                     on_write=self._bump_corpus_version, on_refresh=self._reload_corpus_version) # on_write : lot écrit | on_refresh : nouvelle version publiée
+
+    def _shard_for(self, source: str) -> Shard:                                 # def : méthode privée | _shard_for : shard qui héberge un document | -> : retour | Shard
+        return self.shards[shard_for_source(source, self.num_shards)]           # return : routage par hash de la source
+
+    def _fan_out(self, fn) -> list:                                             # def : méthode privée | _fan_out : appliquer fn à chaque shard | -> : retour | list : un résultat par shard
+        """Exécute fn(shard) sur tous les shards, en parallèle s'il y en a plusieurs."""
+        if self._search_pool is None:                                           # if : shard unique
+            return [fn(shard) for shard in self.shards]                         # return : appel direct (pas de changement de thread)
+        return list(self._search_pool.map(fn, self.shards))                     # return : appels parallèles (LanceDB libère le GIL pendant les scans)
 
     # Étape 3.2 — Méthode de vérification/création de la table
-    def _get_or_create_table(self):                                             # def : définir une méthode privée | _get_or_create_table : vérifie si la table existe
+    def _get_or_create_table(self, db):                                         # def : définir une méthode privée | _get_or_create_table : vérifie si la table existe | db : connexion du shard
         """Crée la table LanceDB si elle n'existe pas, sinon la retourne."""
-        if self.TABLE_NAME in self.db.table_names():                            # if : condition | in : vérifie si le nom de table est dans la liste des tables existantes
-            logger.info(f"Connected to existing table: {self.TABLE_NAME}")      # logger.info : confirmation de connexion
-            table = self.db.open_table(self.TABLE_NAME)                         # table : ouvrir la table existante
-            
-            # ✨ Créer un index FTS si ce n'est pas déjà fait (pour recherche hybride)
-            try:                                                                # try : tenter de créer l'index
-                table.create_fts_index("text", replace=True)                    # create_fts_index : index Full-Text Search sur la colonne 'text' | replace=True : recréer si existe déjà
-                logger.info("✅ FTS index created/updated on 'text' column")    # logger.info : confirmation création index
-            except Exception as e:                                              # except : si erreur (index déjà existant)
-                logger.debug(f"FTS index info: {e}")                            # logger.debug : log discret de l'info
-            
-            return table                                                        # return : retourner la table avec index
+        if self.table_name in db.table_names():                                 # if : condition | in : vérifie si le nom de table est dans la liste des tables existantes
+            logger.info(f"Connected to existing table: {self.table_name}")      # logger.info : confirmation de connexion
+            table = db.open_table(self.table_name)                              # table : ouvrir la table existante
+            self._migrate_chunk_index(table)                                    # self._migrate_chunk_index(...) : ajouter la colonne 'chunk_index' aux tables d'avant le voisinage
+
+            # ✨ Mettre à jour les index (FTS, scalaire) en arrière-plan : l'ouverture ne bloque plus sur la taille du corpus
+            self._index_pool.submit(self._build_indices, table)                 # submit : reconstruction différée des index
+            return table                                                        # return : retourner la table
         else:                                                                   # else : sinon (la table n'existe pas)
-            logger.info(f"Creating new table: {self.TABLE_NAME}")               # logger.info : message de création
+            logger.info(f"Creating new table: {self.table_name}")               # logger.info : message de création
             
-            # Définition du schéma minimal requis par LanceDB pour créer une table vide
-            schema = pa.schema([                                                # schema : définition des colonnes | pa.schema(...) : fonction pyarrow
-                pa.field("id", pa.string()),                                    # pa.field : colonne ID (chaîne)
-                pa.field("text", pa.string()),                                  # pa.field : colonne TEXTE (chaîne)
-                pa.field("vector", pa.list_(pa.float32(), EMBEDDING_DIM)),      # pa.field : colonne VECTEUR (liste de float32, taille EMBEDDING_DIM)
-                pa.field("source", pa.string()),                                # pa.field : colonne SOURCE (chaîne)
-                pa.field("page", pa.int32()),                                   # pa.field : colonne PAGE (entier)
-                pa.field("title", pa.string()),                                 # pa.field : colonne TITRE (chaîne)
-                pa.field("created_at", pa.string()),                            # pa.field : colonne DATE (chaîne)
-            ])                                                                  # ]) : fin du schéma
-
-            # Création de la table
-            table = self.db.create_table(                                       # table : objet table créée | = : assignation | self.db.create_table(...) : commande de création
-                self.TABLE_NAME,                                                # self.TABLE_NAME : nom
-                schema=schema                                                   # schema=schema : utilise le schéma défini
+            # Création de la table (schéma partagé avec l'écrivain Arrow)
+            table = db.create_table(                                            # table : objet table créée | = : assignation | db.create_table(...) : commande de création
+                self.table_name,                                                # self.table_name : nom
+                schema=CHUNK_SCHEMA                                             # schema=CHUNK_SCHEMA : utilise le schéma défini dans arrow_writer.py
             )
             
             # ✨ Créer l'index FTS immédiatement pour la nouvelle table
             table.create_fts_index("text")                                      # create_fts_index : index Full-Text Search sur la colonne 'text'
             logger.info("✅ FTS index created on new table")                     # logger.info : confirmation création index
             
+            self._ensure_scalar_index(table, "source")                          # self._ensure_scalar_index(...) : index BTree sur 'source' (suppression / upsert par document)
+            self._ensure_scalar_index(table, "chunk_index")                     # self._ensure_scalar_index(...) : index BTree sur 'chunk_index' (voisins d'un résultat)
             return table                                                        # return : retourner la table nouvellement créée avec index
 
+    # Étape 3.2 bis — Index scalaire (BTree) sur une colonne de métadonnées
+    @staticmethod                                                               # @staticmethod : pas besoin de l'instance
+    def _ensure_scalar_index(table, column: str):                               # def : méthode privée | _ensure_scalar_index : créer l'index s'il manque | column : colonne à indexer
+        """Crée un index scalaire sur la colonne si aucun n'existe (filtres `where` rapides)."""
+        try:                                                                    # try : l'index est une optimisation, jamais bloquant
+            if any(column in index.columns for index in table.list_indices()):  # if : index déjà présent
+                return                                                          # return : rien à faire
+            table.create_scalar_index(column)                                   # create_scalar_index : index BTree LanceDB
+            logger.info(f"✅ Scalar index created on '{column}' column")         # logger.info : confirmation
+        except Exception as e:                                                  # except : version LanceDB sans support ou table vide
+            logger.debug(f"Scalar index info ({column}): {e}")                  # logger.debug : log discret
+
+    # Étape 3.2 ter — Construction des index d'un shard (au démarrage, ou après une grosse ingestion)
+    def _build_indices(self, table):                                            # def : méthode privée | _build_indices : (re)construire les index d'une table
+        """Reconstruit l'index FTS et vérifie l'index scalaire de la table (appelé depuis le pool d'arrière-plan)."""
+        try:                                                                    # try : tenter de créer l'index
+            table.create_fts_index("text", replace=True)                        # create_fts_index : index Full-Text Search sur la colonne 'text' | replace=True : recréer si existe déjà
+            logger.info("✅ FTS index created/updated on 'text' column")        # logger.info : confirmation création index
+        except Exception as e:                                                  # except : si erreur (index déjà existant)
+            logger.debug(f"FTS index info: {e}")                                # logger.debug : log discret de l'info
+        self._ensure_scalar_index(table, "source")                              # self._ensure_scalar_index(...) : index BTree pour supprimer/filtrer par source
+        self._ensure_scalar_index(table, "chunk_index")                         # self._ensure_scalar_index(...) : index BTree pour les plages de voisins (LanceDB n'a pas d'index composite : 'source' + 'chunk_index')
+
+    def build_indices(self, background: bool = True) -> List[Future]:           # def : méthode | build_indices : reconstruire les index de tous les shards | background : ne pas attendre | -> : retour | List[Future]
+        """Écrit les tampons puis reconstruit les index de chaque shard, en arrière-plan par défaut (les recherches continuent)."""
+        self.flush()                                                            # self.flush() : indexer aussi les chunks encore en tampon
+        futures = [self._index_pool.submit(self._build_indices, shard.table) for shard in self.shards] # futures : une construction par shard
+        if not background:                                                      # if : appel bloquant demandé
+            for future in futures:                                              # for : attendre chaque shard
+                future.result()                                                 # result() : propage une éventuelle erreur
+        return futures                                                          # return : constructions en cours ou terminées
+
+    # Étape 3.2 quater — Migration : colonne 'chunk_index' des tables créées avant le voisinage
+    @staticmethod                                                               # @staticmethod : pas besoin de l'instance
+    def _migrate_chunk_index(table):                                            # def : méthode privée | _migrate_chunk_index : ajouter et remplir la colonne | table : table LanceDB existante
+        """Ajoute 'chunk_index' et le déduit du suffixe des ids déterministes (ids aléatoires -> 0), en une seule réécriture."""
+        if "chunk_index" in table.schema.names:                                 # if : table déjà à jour
+            return                                                              # return : rien à faire
+        table.add_columns(pa.field("chunk_index", pa.int32()))                  # add_columns : nouvelle colonne (nulle) sans réécrire les données
+        data = table.to_arrow()                                                 # data : table complète (migration unique)
+        if data.num_rows == 0:                                                  # if : table vide
+            return                                                              # return : rien à remplir
+        indices = [_chunk_index_from_id(chunk_id) for chunk_id in data.column("id").to_pylist()] # indices : position lue dans l'id "<hash source>-<index>"
+        data = data.set_column(data.schema.get_field_index("chunk_index"), "chunk_index", pa.array(indices, pa.int32())) # set_column : colonne remplie
+        table.merge_insert("id").when_matched_update_all().execute(data)        # merge_insert : une seule transaction LanceDB
+        logger.info(f"Migrated table {table.name}: 'chunk_index' filled for {data.num_rows} rows") # logger.info : confirmation
+
     # Étape 3.3 — Ajout de données
     def add_chunks(self, chunks: List[Chunk]):                                  # def : définir la méthode | add_chunks : ajouter des morceaux de texte
-        """Ajoute une liste de Chunks (objets Pydantic) à la base de données."""
-        data_to_add = []                                                        # data_to_add : liste pour les données formatées
-        for chunk in chunks:                                                    # for : boucle sur chaque objet Chunk
-            # 1. Calculer le vecteur pour le chunk - L'encodage des documents doit être fait juste avant l'ajout
-            if chunk.vector is None:                                            # if : condition | chunk.vector is None : si le vecteur n'a pas été calculé
-                vector_np = self.embedder.embed_query(chunk.text)               # vector_np : vecteur numpy | self.embedder.embed_query(...) : on encode le texte
-                chunk.vector = vector_np.tolist()                               # chunk.vector : stocker le vecteur dans l'objet Chunk (converti en liste Python)
-
-            # 2. Formater pour LanceDB - On utilise la méthode de conversion en dictionnaire de notre schéma (schemas.py)
-            data_to_add.append(chunk.to_lancedb_dict())                         # data_to_add.append(...) : ajouter le dictionnaire formaté
-
-        self.table.add(data_to_add)                                             # self.table.add(...) : commande d'insertion LanceDB
-        logger.info(f"Added {len(chunks)} new chunks to LanceDB.")              # logger.info : confirmation de l'ajout
-
-    # Étape 3.4 — Recherche Hybride (Mots-clés + Vecteurs)
-    def search(self, query: str, top_k: int) -> List[SearchResult]:             # def : définir la méthode | search : effectuer la recherche principale | -> : retour | List[SearchResult] : liste des résultats formatés
-        """Recherche Hybride combinant similarité vectorielle et recherche de texte intégral (FTS)."""
-        
+        """Ajoute une liste de Chunks (objets Pydantic) au tampon d'écriture Arrow de la base de données."""
+        if not chunks:                                                          # if : rien à ajouter
+            return                                                              # return : sortir
+
+        # 1. Calculer les vecteurs manquants en un seul lot - L'encodage des documents doit être fait juste avant l'ajout
+        vectors = self._embed_chunks(chunks)                                    # vectors : matrice numpy (n, EMBEDDING_DIM) float32
+
+        # 2. Mettre en tampon (RecordBatch Arrow) dans le shard de chaque document - L'écriture LanceDB se fait au seuil de taille ou de temps
+        by_shard = {}                                                           # by_shard : positions des chunks regroupées par shard
+        for i, chunk in enumerate(chunks):                                      # for : router chaque chunk
+            by_shard.setdefault(shard_for_source(chunk.metadata.source_path, self.num_shards), []).append(i) # setdefault : liste des positions du shard
+        for shard_id, positions in by_shard.items():                            # for : un lot par shard
+            shard = self.shards[shard_id]                                       # shard : shard cible
+            flushed = shard.writer.add([chunks[i] for i in positions], vectors[positions]) # flushed : True si le tampon du shard vient d'être écrit
+            logger.info(f"Buffered {len(positions)} new chunks for LanceDB shard {shard_id} (pending: {shard.writer.pending_rows}, flushed: {flushed}).") # logger.info : confirmation de l'ajout
+
+    # Étape 3.3 bis — Calcul groupé des vecteurs
+    def _embed_chunks(self, chunks: List[Chunk]) -> np.ndarray:                 # def : méthode privée | _embed_chunks : vecteurs de tous les chunks | -> : retour | np.ndarray : matrice float32
+        """Retourne la matrice des vecteurs, en encodant en un seul appel les chunks qui n'en ont pas."""
+        vectors = np.empty((len(chunks), EMBEDDING_DIM), dtype=np.float32)      # vectors : matrice pré-allouée
+        missing = [i for i, chunk in enumerate(chunks) if chunk.vector is None] # missing : positions des chunks sans vecteur
+        for i, chunk in enumerate(chunks):                                      # for : recopier les vecteurs déjà calculés
+            if chunk.vector is not None:                                        # if : vecteur présent
+                vectors[i] = chunk.vector                                       # vectors[i] : copie directe dans la matrice
+        if missing:                                                             # if : des vecteurs sont à calculer
+            embeddings = self.embedder.embed_documents([chunks[i].text for i in missing]) # embeddings : encodage par lot FastEmbed (au lieu d'un appel par chunk)
+            vectors[missing] = np.stack(embeddings)                             # vectors[missing] : insertion des nouveaux vecteurs
+        return vectors                                                          # return : matrice prête pour Arrow
+
+    # Étape 3.3 ter — Forcer l'écriture du tampon
+    def flush(self) -> int:                                                     # def : méthode | flush : écrire les chunks en attente | -> : retour | int : lignes écrites
+        """Écrit immédiatement les chunks en attente de tous les shards (fin d'ingestion, avant une recherche critique...)."""
+        return sum(self._fan_out(lambda shard: shard.writer.flush()))           # return : écritures des shards en parallèle
+
+    def refresh(self):                                                          # def : méthode | refresh : épingler la dernière version de chaque shard
+        """Publie aux recherches la dernière version validée de chaque shard (écritures d'un autre processus comprises)."""
+        self._fan_out(lambda shard: shard.refresh())                            # refresh() : nouveaux instantanés
+        self._reload_corpus_version()                                           # _reload_corpus_version : version du registre (même sans nouvelle version de table)
+
+    def count_rows(self) -> int:                                                # def : méthode | count_rows : nombre de chunks de la collection | -> : retour | int
+        """Nombre de chunks visibles par les recherches (instantanés courants), tous shards confondus."""
+        return sum(shard.row_count for shard in self.shards)                    # return : somme des comptages mis en cache à chaque nouvelle version
+
+    # Étape 3.3 quater — Gestion par source (suppression / upsert sans tout reconstruire)
+    def has_source(self, source: str) -> bool:                                  # def : méthode | has_source : la source est-elle déjà indexée ? | -> : retour | bool
+        """Indique si des chunks de cette source existent (dans la table ou dans le tampon d'écriture)."""
+        shard = self._shard_for(source)                                         # shard : seul shard pouvant contenir la source
+        if source in shard.writer.pending_sources:                              # if : la source attend encore dans le tampon Arrow
+            return True                                                         # return : déjà présente
+        return shard.table.count_rows(f"source = {_sql_quote(source)}") > 0     # return : comptage filtré (index scalaire possible sur 'source')
+
+    def delete_source(self, source: str) -> int:                                # def : méthode | delete_source : supprimer tous les chunks d'une source | -> : retour | int : nombre de chunks supprimés
+        """Supprime les chunks d'un document (coût proportionnel au document, pas au corpus)."""
+        shard = self._shard_for(source)                                         # shard : shard du document
+        shard.writer.flush()                                                    # flush() : écrire d'abord le tampon (il peut contenir cette source)
+        where = f"source = {_sql_quote(source)}"                                # where : filtre SQL sur la source
+        deleted = shard.table.count_rows(where)                                 # deleted : nombre de chunks concernés
+        if deleted:                                                             # if : il y a quelque chose à supprimer
+            shard.table.delete(where)                                           # shard.table.delete(...) : suppression logique LanceDB (deletion file, pas de réécriture complète)
+            shard.refresh()                                                     # shard.refresh() : publier la version sans le document
+        if shard.memory_index is not None:                                      # if : moteur en mémoire
+            shard.memory_index.remove_source(source)                            # remove_source : garder le miroir synchronisé
+        shard.doc_index.remove_source(source)                                   # remove_source : le document ne peut plus être sélectionné
+        if deleted:                                                             # if : le contenu a changé
+            self._bump_corpus_version()                                         # _bump_corpus_version : invalider les caches liés à la version du corpus
+        logger.info(f"Deleted {deleted} chunks of source: {source}")            # logger.info : confirmation
+        return deleted                                                          # return : nombre de chunks supprimés
+
+    def upsert_chunks(self, chunks: List[Chunk]):                               # def : méthode | upsert_chunks : remplacer les chunks d'un ou plusieurs documents
+        """Met à jour / insère les chunks par id déterministe et supprime les chunks obsolètes de leurs sources (merge_insert)."""
+        if not chunks:                                                          # if : rien à faire
+            return                                                              # return : sortir
+        vectors = self._embed_chunks(chunks)                                    # vectors : matrice float32 des chunks
+
+        # Un merge_insert par source : la clause "not matched by source" doit rester limitée au document réindexé
+        by_source = {}                                                          # by_source : positions des chunks regroupées par source
+        for i, chunk in enumerate(chunks):                                      # for : regrouper
+            by_source.setdefault(chunk.metadata.source_path, []).append(i)      # setdefault : liste des positions de la source
+        for source, positions in by_source.items():                             # for : chaque document
+            shard = self._shard_for(source)                                     # shard : shard du document
+            shard.writer.flush()                                                # flush() : le tampon ne doit pas réinsérer une ancienne version après l'upsert
+            batch = chunks_to_record_batch([chunks[i] for i in positions], vectors[positions]) # batch : RecordBatch Arrow du document
+            (shard.table.merge_insert("id")                                     # merge_insert("id") : jointure sur l'identifiant déterministe
+             .when_matched_update_all()                                         # when_matched_update_all : chunk existant -> mise à jour (texte/vecteur)
+             .when_not_matched_insert_all()                                     # when_not_matched_insert_all : nouveau chunk -> insertion
+             .when_not_matched_by_source_delete(f"source = {_sql_quote(source)}") # when_not_matched_by_source_delete : chunks disparus du document -> suppression
+             .execute(batch))                                                   # execute : une seule transaction LanceDB par document
+            if shard.memory_index is not None:                                  # if : moteur en mémoire
+                shard.memory_index.remove_source(source)                        # remove_source : retirer l'ancienne version du document (chunks disparus compris)
+                shard.memory_index.add_arrow(batch)                             # add_arrow : ajouter la nouvelle version
+            shard.doc_index.add_arrow(batch)                                    # add_arrow : centroïde recalculé sur la nouvelle version du document
+            shard.refresh()                                                     # shard.refresh() : les recherches passent d'un coup à la nouvelle version du document
+            logger.info(f"Upserted {len(positions)} chunks for source: {source}") # logger.info : confirmation
+        self._bump_corpus_version()                                             # _bump_corpus_version : documents réindexés
+
+    @property                                                                   # @property : accès en lecture seule
+    def corpus_version(self) -> int:                                            # def : propriété | corpus_version : version du contenu de la collection | -> : retour | int
+        """Incrémentée à chaque écriture, réindexation ou suppression (partagée entre processus via le registre, relue à chaque nouvel instantané)."""
+        return self._corpus_version                                             # return : version en mémoire (aucune lecture du registre par question)
+
+    def _bump_corpus_version(self):                                             # def : méthode privée | _bump_corpus_version : le contenu de la collection vient de changer
+        self.registry.bump_corpus_version(self.collection)                      # bump_corpus_version : incrément partagé entre processus
+        self._reload_corpus_version()                                           # _reload_corpus_version : version à jour pour les questions suivantes
+
+    def _reload_corpus_version(self):                                           # def : méthode privée | _reload_corpus_version : relire la version dans le registre
+        self._corpus_version = self.registry.corpus_version(self.collection)    # self._corpus_version : affectation atomique (lue sans verrou par les questions)
+
+    def fetch_results(self, ids: List[str], scores: Optional[List[float]] = None) -> List[SearchResult]: # def : méthode | fetch_results : relire des chunks par id (sources d'une réponse en cache) | scores : scores mémorisés | -> : retour | List[SearchResult]
+        """Relit les chunks encore présents, dans l'ordre des ids ; le score mémorisé remplace la distance."""
+        if not ids:                                                             # if : aucune source
+            return []                                                           # return : liste vide
+        where = f"id IN ({', '.join(_sql_quote(chunk_id) for chunk_id in ids)})" # where : filtre sur les ids
+        rows = {row["id"]: row for rows in self._fan_out(lambda shard: shard.read_table.search().where(where).limit(len(ids)).to_list()) for row in rows} # rows : id -> ligne (chunks supprimés depuis absents)
+        results = self.format_results([rows[chunk_id] for chunk_id in ids if chunk_id in rows]) # results : SearchResult dans l'ordre d'origine
+        if scores is not None:                                                  # if : scores mémorisés
+            score_of = dict(zip(ids, scores))                                   # score_of : id -> score du reranker au moment de la réponse
+            for result in results:                                              # for : chaque source
+                result.score = score_of[result.chunk.id]                        # score : celui affiché lors de la première réponse
+        return results                                                          # return : sources de la réponse
+
+    def list_sources(self) -> List[str]:                                        # def : méthode | list_sources : sources indexées | -> : retour | List[str]
+        """Retourne la liste triée des sources présentes dans la collection (tous shards)."""
+        columns = self._fan_out(lambda shard: shard.read_table.search().select(["source"]).limit(None).to_arrow().column("source").to_pylist()) # columns : seule la colonne 'source' est lue, shard par shard
+        return sorted({source for column in columns for source in column})      # return : sources uniques triées
+
+    def drop_collection(self, name: str):                                       # def : méthode | drop_collection : supprimer une collection de tous les shards
+        """Supprime la table de la collection dans chaque shard puis son enregistrement dans le registre."""
+        table_name = collection_table_name(name)                                # table_name : table à supprimer
+        for shard in self.shards:                                               # for : table des documents de chaque shard
+            if document_table_name(name) in shard.db.table_names():             # if : la table existe dans ce shard
+                shard.db.drop_table(document_table_name(name))                  # drop_table : suppression
+        for shard in self.shards[1:]:                                           # for : shards secondaires (le registre gère le shard 0)
+            if table_name in shard.db.table_names():                            # if : la table existe dans ce shard
+                shard.db.drop_table(table_name)                                 # drop_table : suppression
+        self.registry.drop(name)                                                # registry.drop(...) : table du shard 0 + enregistrement
+
+    def close(self):                                                            # def : méthode | close : libérer une collection avant sa suppression
+        """Abandonne les tampons d'écriture (et leurs minuteries) et arrête les pools de threads."""
+        dropped = sum(shard.writer.close() for shard in self.shards)            # dropped : lignes en tampon jamais écrites
+        self._index_pool.shutdown(wait=False, cancel_futures=True)              # shutdown : plus de construction d'index
+        if self._search_pool is not None:                                       # if : collection shardée
+            self._search_pool.shutdown(wait=False)                              # shutdown : plus de recherche parallèle
+        if dropped:                                                             # if : ingestion sans flush en cours
+            logger.info(f"Discarded {dropped} buffered chunks of collection '{self.collection}'") # logger.info : suivi
+
+    # Étape 3.3 quinquies — Jambes de la recherche (LanceDB ou index en mémoire, mêmes dictionnaires en sortie, fusion des shards par tas)
+    def _shard_sources(self, shard: Shard, sources: Optional[List[str]]) -> Optional[List[str]]: # def : méthode privée | _shard_sources : documents sélectionnés hébergés par le shard | -> : retour | None = pas de filtre
+        if sources is None:                                                     # if : recherche à plat
+            return None                                                         # return : aucun filtre
+        return [source for source in sources if shard_for_source(source, self.num_shards) == shard.shard_id] # return : routage par hash de la source
+
+    def _vector_leg(self, query_vector, limit: int, sources: Optional[List[str]] = None) -> List[dict]: # def : méthode privée | _vector_leg : top-k vectoriel | sources : documents retenus par le premier niveau (None = tous) | -> : retour | List[dict] : lignes au format LanceDB
+        """Recherche vectorielle pure via le moteur configuré, sur tous les shards (restreinte aux documents sélectionnés le cas échéant)."""
+        def shard_search(shard: Shard) -> List[dict]:                           # def : fonction locale | shard_search : top-k d'un shard
+            shard_sources = self._shard_sources(shard, sources)                 # shard_sources : préfiltre du shard
+            if shard_sources == []:                                             # if : aucun document sélectionné dans ce shard
+                return []                                                       # return : shard ignoré
+            if shard.memory_index is not None:                                  # if : moteur en mémoire
+                return shard.memory_index.search(query_vector, limit, sources=shard_sources) # return : GEMV + argpartition (lignes des documents retenus seulement)
+            query = shard.read_table.search(query_vector)                       # search : recherche vectorielle LanceDB
+            if shard_sources is not None:                                       # if : recherche hiérarchique
+                query = query.where(_sources_filter(shard_sources), prefilter=True) # where : chunks des documents retenus seulement (index BTree sur 'source')
+            return query.limit(limit).to_list()                                 # .limit : nombre de candidats | .to_list() : exécuter
+        return merge_top_k(self._fan_out(shard_search), limit)                  # return : top-k global
+
+    def _text_leg(self, query_vector, clean_query: str, limit: int, sources: Optional[List[str]] = None) -> List[dict]: # def : méthode privée | _text_leg : recherche "mots-clés" (sous-chaîne) | sources : documents retenus (None = tous) | -> : retour | List[dict]
+        """Top-k vectoriel restreint aux chunks dont le texte contient la requête nettoyée (équivalent du LIKE '%...%')."""
+        def shard_search(shard: Shard) -> List[dict]:                           # def : fonction locale | shard_search : top-k filtré d'un shard
+            shard_sources = self._shard_sources(shard, sources)                 # shard_sources : préfiltre du shard
+            if shard_sources == []:                                             # if : aucun document sélectionné dans ce shard
+                return []                                                       # return : shard ignoré
+            if shard.memory_index is not None:                                  # if : moteur en mémoire
+                return shard.memory_index.search(query_vector, limit, sources=shard_sources, text_contains=clean_query) # return : filtres documents + sous-chaîne, GEMV sur les candidats
+            where = f"text LIKE {_sql_quote('%' + clean_query + '%')}"          # where : filtre FTS SQL (requête échappée)
+            if shard_sources is not None:                                       # if : recherche hiérarchique
+                where = f"{_sources_filter(shard_sources)} AND {where}"         # where : documents retenus d'abord
+            return (shard.read_table.search(query_vector)                       # search : base vectorielle
+                    .where(where, prefilter=True)                               # where : préfiltre
+                    .limit(limit)                                               # .limit : top résultats FTS
+                    .to_list())                                                 # .to_list() : exécuter
+        return merge_top_k(self._fan_out(shard_search), limit)                  # return : top-k global
+
+    # Étape 3.3 sexies — Premier niveau de la recherche hiérarchique (documents)
+    def _select_documents(self, query_vector) -> Optional[List[str]]:           # def : méthode privée | _select_documents : documents les plus proches de la requête | -> : retour | None = recherche à plat
+        """Top HIERARCHICAL_TOP_DOCS documents par centroïde, tous shards confondus ; None si désactivé, inutile ou si un index de documents est encore en construction."""
+        if HIERARCHICAL_TOP_DOCS <= 0:                                          # if : recherche hiérarchique désactivée
+            return None                                                         # return : recherche à plat
+        if any(len(shard.doc_index) == 0 and shard.row_count > 0 for shard in self.shards): # if : centroïdes pas encore calculés (collection indexée avant)
+            return None                                                         # return : recherche à plat (rappel garanti)
+        if sum(len(shard.doc_index) for shard in self.shards) <= HIERARCHICAL_TOP_DOCS: # if : moins de documents que la sélection
+            return None                                                         # return : rien à élaguer
+        documents = merge_top_k(self._fan_out(lambda shard: shard.doc_index.search(query_vector, HIERARCHICAL_TOP_DOCS)), HIERARCHICAL_TOP_DOCS) # documents : meilleurs centroïdes (même distance que les chunks)
+        metrics.incr("retrieval.hierarchical_searches")                         # metrics.incr : recherche restreinte aux documents retenus
+        return [row["source"] for row in documents]                             # return : sources retenues
+
+    # Étape 3.4 — Jambes de la recherche hybride (Vecteurs + Mots-clés), sans fusion
+    def search_legs(self, query: str, top_k: int, query_vector: Optional[np.ndarray] = None) -> List[List[dict]]: # def : définir la méthode | search_legs : classements bruts d'une requête | query_vector : vecteur déjà calculé (encodage groupé des variantes) | -> : retour | [vectoriel, mots-clés]
+        """Retourne les deux classements (vectoriel top_k x 2, mots-clés top_k) d'une requête ; la fusion est laissée à l'appelant."""
         # 1. Nettoyage de la requête (important pour FTS)
-        clean_query = clean_text_basic(query)                                   # clean_query : requête nettoyée (sans accents/ponctuation pour FTS)
+        clean_query = clean_text_basic(query)                                   # clean_query : requête nettoyée
+
+        # 1 bis. Instantanés : les recherches lisent une version épinglée ; un instantané trop ancien est rafraîchi en arrière-plan
+        for shard in self.shards:                                               # for : chaque shard
+            shard.refresh_if_stale(SNAPSHOT_REFRESH_SECONDS)                    # refresh_if_stale : rattraper les écritures des autres processus
+
+        # 2. Encodage de la requête (pour la recherche vectorielle), sauf s'il a déjà été fait par lot
+        if query_vector is None:                                                # if : vecteur non fourni
+            query_vector = self.embedder.embed_query(query)                     # query_vector : vecteur numpy
+
+        # 2 bis. Recherche hiérarchique : documents les plus proches d'abord, chunks ensuite (HIERARCHICAL_TOP_DOCS > 0)
+        sources = self._select_documents(query_vector)                          # sources : documents retenus (None = tous les chunks)
+
+        # 3.1 Recherche Vectorielle (Sémantique)
+        vector_results = self._vector_leg(query_vector, top_k * 2, sources)     # vector_results : 2x plus de résultats pour la fusion
 
-        # 2. Encodage de la requête (pour la recherche vectorielle)
-        query_vector = self.embedder.embed_query(query)                         # query_vector : vecteur numpy de la requête
+        # 3.2 Recherche FTS (Mots-clés exacts)
+        fts_results = []                                                        # fts_results : liste résultats FTS
+        try:                                                                    # try : tenter recherche FTS
+            # Recherche FTS via SQL LIKE (simple mais efficace)
+            fts_results = self._text_leg(query_vector, clean_query, top_k, sources) # fts_results : top résultats mots-clés
+        except Exception:                                                       # except : si FTS échoue
+            pass                                                                # pass : continuer sans FTS
+        return [vector_results, fts_results]                                    # return : les deux classements
+
+    # Étape 3.5 — Recherche Hybride (Mots-clés + Vecteurs)
+    def search(self, query: str, top_k: int, query_vector: Optional[np.ndarray] = None) -> List[SearchResult]: # def : définir la méthode | search : recherche hybride | query_vector : vecteur déjà calculé (optionnel)
+        """Recherche Hybride combinant similarité vectorielle et recherche de texte intégral (FTS)."""
+        if query_vector is None:                                                # if : vecteur non fourni
+            query_vector = self.embedder.embed_query(query)                     # query_vector : vecteur numpy (réutilisé par le repli vectoriel)
 
         # 3. ✨ Exécution de la recherche HYBRIDE (Vectorielle + FTS avec Reciprocal Rank Fusion)
-        # LanceDB 0.25.3 : Fusion manuelle des résultats vectoriels et FTS avec algorithme RRF
+        # LanceDB 0.25.3 : Fusion des résultats vectoriels et FTS avec l'algorithme RRF (src/retrieval/fusion.py)
         try:                                                                    # try : essayer la recherche hybride
-            # 3.1 Recherche Vectorielle (Sémantique)
-            vector_results = (self.table.search(query_vector)                   # search : recherche vectorielle
-                              .limit(top_k * 2)                                 # .limit : prendre 2x plus pour la fusion
-                              .to_list())                                       # .to_list() : exécuter
-            
-            # 3.2 Recherche FTS (Mots-clés exacts)
-            # Utiliser where() pour simuler FTS si create_fts_index ne fonctionne pas parfaitement
-            fts_results = []                                                    # fts_results : liste résultats FTS
-            try:                                                                # try : tenter recherche FTS
-                # Recherche FTS via SQL LIKE (simple mais efficace)
-                fts_results = (self.table.search(query_vector)                  # search : base vectorielle
-                               .where(f"text LIKE '%{clean_query}%'", prefilter=True) # where : filtre FTS SQL
-                               .limit(top_k)                                    # .limit : top résultats FTS
-                               .to_list())                                      # .to_list() : exécuter
-            except Exception:                                                   # except : si FTS échoue
-                pass                                                            # pass : continuer sans FTS
-            
+            vector_results, fts_results = self.search_legs(query, top_k, query_vector=query_vector) # vector_results, fts_results : classements bruts
+
             # 3.3 Fusion Hybride avec Reciprocal Rank Fusion (RRF)
             if fts_results:                                                     # if : si FTS a des résultats
-                rrf_k = 60                                                      # rrf_k : constante RRF standard
-                doc_scores = {}                                                 # doc_scores : dictionnaire scores fusionnés
-                
-                # Ajouter scores vectoriels
-                for i, res in enumerate(vector_results):                        # for : parcourir résultats vectoriels
-                    doc_id = res['id']                                          # doc_id : identifiant unique
-                    doc_scores[doc_id] = {                                      # doc_scores : initialiser
-                        'data': res,                                            # data : résultat complet
-                        'vector_rank': i + 1,                                   # vector_rank : rang vectoriel
-                        'fts_rank': None                                        # fts_rank : pas encore calculé
-                    }
-                
-                # Ajouter scores FTS
-                for i, res in enumerate(fts_results):                           # for : parcourir résultats FTS
-                    doc_id = res['id']                                          # doc_id : identifiant
-                    if doc_id in doc_scores:                                    # if : document déjà dans vectoriel
-                        doc_scores[doc_id]['fts_rank'] = i + 1                  # fts_rank : ajouter rang FTS
-                    else:                                                       # else : nouveau document (FTS seulement)
-                        doc_scores[doc_id] = {                                  # doc_scores : créer entrée
-                            'data': res,
-                            'vector_rank': None,
-                            'fts_rank': i + 1
-                        }
-                
-                # Calculer score RRF final
-                for doc_id in doc_scores:                                       # for : parcourir tous documents
-                    v_rank = doc_scores[doc_id]['vector_rank'] or (top_k * 3)  # v_rank : rang vectoriel ou pénalité
-                    f_rank = doc_scores[doc_id]['fts_rank'] or (top_k * 3)     # f_rank : rang FTS ou pénalité
-                    rrf_score = (1 / (rrf_k + v_rank)) + (1 / (rrf_k + f_rank)) # rrf_score : formule RRF classique
-                    doc_scores[doc_id]['rrf_score'] = rrf_score                 # rrf_score : stocker score final
-                
-                # Trier par score RRF et prendre top_k
-                sorted_docs = sorted(doc_scores.values(), key=lambda x: x['rrf_score'], reverse=True)[:top_k] # sorted : tri par RRF
-                results = [doc['data'] for doc in sorted_docs]                  # results : extraire données
-                
+                fused_ids, _ = reciprocal_rank_fusion(                          # fused_ids : ids triés par score RRF
+                    [[res['id'] for res in vector_results], [res['id'] for res in fts_results]], # listes d'ids : vectoriel puis FTS
+                    missing_rank=top_k * 3,                                     # missing_rank : pénalité d'un document absent d'une liste
+                )
+                rows = {**{res['id']: res for res in fts_results}, **{res['id']: res for res in vector_results}} # rows : id -> résultat (la ligne vectorielle prime, elle porte la vraie distance)
+                results = [rows[doc_id] for doc_id in fused_ids[:top_k]]        # results : top_k fusionnés
+
                 logger.info(f"✅ Hybrid search (RRF fusion) completed: {len(vector_results)} vector + {len(fts_results)} FTS → {len(results)} final") # logger : succès
             else:                                                               # else : pas de résultats FTS
                 results = vector_results[:top_k]                                # results : vectoriel seulement
                 logger.info(f"✅ Vector-only search (FTS returned no results): {len(results)} results") # logger : vectoriel seul
-            
+
         except Exception as e:                                                  # except : si erreur globale
             logger.warning(f"Hybrid search failed, falling back to vector-only: {e}") # logger : avertissement
-            
+
             # Fallback : Recherche vectorielle simple
-            results = (self.table.search(query_vector)                          # results : recherche vectorielle
-                       .limit(top_k)                                            # .limit(top_k) : limite
-                       .to_list())                                              # .to_list() : exécuter
+            results = self._vector_leg(query_vector, top_k)                     # results : recherche vectorielle simple
+
+        return self.format_results(results)                                     # return : renvoyer la liste des SearchResult
+
+    # Étape 3.5 bis — Chunks voisins des résultats (contexte autour d'un passage)
+    def fetch_neighbors(self, hits: List[Tuple[str, int]], window: int) -> Dict[Tuple[str, int], dict]: # def : méthode | fetch_neighbors : lignes autour de chaque (source, chunk_index) | window : nombre de voisins de chaque côté | -> : retour | (source, index) -> ligne
+        """Lit les chunks à ±window de chaque résultat en une requête filtrée par shard (plages OR sur 'source' et 'chunk_index', index BTree)."""
+        ranges: Dict[int, Dict[str, List[Tuple[int, int]]]] = {}                # ranges : shard -> source -> plages [début, fin]
+        for source, index in hits:                                              # for : chaque résultat
+            ranges.setdefault(shard_for_source(source, self.num_shards), {}).setdefault(source, []).append((max(index - window, 0), index + window)) # setdefault : plage du résultat
+        rows: Dict[Tuple[str, int], dict] = {}                                  # rows : lignes trouvées
+        for shard_id, by_source in ranges.items():                              # for : une requête par shard concerné
+            where = " OR ".join(f"(source = {_sql_quote(source)} AND chunk_index BETWEEN {lo} AND {hi})" # where : union des plages
+                                for source, spans in by_source.items() for lo, hi in spans) # for : chaque plage de chaque source
+            found = self.shards[shard_id].read_table.search().where(where).limit(None).to_list() # found : lignes de l'instantané de lecture
+            rows.update({(row["source"], row["chunk_index"]): row for row in found}) # update : indexer par position
+        return rows                                                             # return : lignes voisines (résultats compris)
+
+    def expand_with_neighbors(self, results: List[SearchResult], window: int) -> List[SearchResult]: # def : méthode | expand_with_neighbors : recoller les voisins de chaque résultat | -> : retour | List[SearchResult]
+        """Remplace chaque résultat par le passage [i - window, i + window] de son document, dans l'ordre du texte.
+
+        Le score et le rang du résultat sont conservés ; un chunk déjà couvert par un résultat mieux classé n'est pas répété.
+        """
+        if window <= 0 or not results:                                          # if : voisinage désactivé ou rien à étendre
+            return results                                                      # return : résultats inchangés
+        rows = self.fetch_neighbors([(r.chunk.metadata.source_path, r.chunk.chunk_index) for r in results], window) # rows : une requête par shard pour tous les résultats
+        seen = set()                                                            # seen : (source, index) déjà utilisés par un résultat mieux classé
+        expanded = []                                                           # expanded : résultats étendus
+        for result in results:                                                  # for : du plus pertinent au moins pertinent
+            source, index = result.chunk.metadata.source_path, result.chunk.chunk_index # source, index : position du résultat
+            if (source, index) in seen:                                         # if : déjà inclus dans le passage d'un résultat précédent
+                continue                                                        # continue : pas de doublon dans le contexte
+            span = [i for i in range(max(index - window, 0), index + window + 1) # span : positions du passage présentes dans la table
+                    if (source, i) in rows and (i == index or (source, i) not in seen)] # if : voisin pas encore utilisé (le résultat lui-même toujours gardé)
+            seen.update((source, i) for i in span)                              # update : marquer le passage
+            if len(span) <= 1:                                                  # if : aucun voisin trouvé (premier chunk isolé, table non migrée...)
+                expanded.append(result)                                         # append : résultat inchangé
+                continue                                                        # continue : suivant
+            text = "\n".join(rows[(source, i)]["text"] for i in span)           # text : passage recollé dans l'ordre du document
+            expanded.append(result.model_copy(update={"chunk": result.chunk.model_copy(update={"text": text})})) # model_copy : résultat étendu (l'original n'est pas modifié)
+        metrics.incr("retrieval.neighbor_chunks", len(seen) - len(expanded))    # metrics.incr : voisins ajoutés au contexte
+        return expanded                                                         # return : résultats étendus
 
+    # Étape 3.6 — Conversion des lignes LanceDB en SearchResult
+    def format_results(self, results: List[dict]) -> List[SearchResult]:        # def : définir la méthode | format_results : lignes brutes -> objets Pydantic | -> : retour | List[SearchResult]
+        """Reconstitue Chunk et SearchResult (score = 1 - distance, rang = position) pour des lignes déjà classées."""
         # 4. Formatage et conversion en objet SearchResult
         formatted_results = []                                                  # formatted_results : liste de sortie finale
         for i, res in enumerate(results):                                       # for : boucle sur chaque résultat brut
@@ -177,7 +491,7 @@ class VectorStore:
                 text=res['text'],                                               # text : contenu
                 vector=res['vector'],                                           # vector : vecteur stocké
                 metadata=metadata,                                              # metadata : infos source
-                chunk_index=0 # Non utilisé pour la recherche
+                chunk_index=res.get('chunk_index') or 0                         # chunk_index : position stockée (0 pour une table non migrée)
             )
 
 
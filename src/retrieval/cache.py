@@ -1,106 +1,321 @@
 # Objectif — Cache sémantique 100% LanceDB (sans FAISS)
 #            Si une requête est similaire à une ancienne, on renvoie la réponse direct.
+#            Table bornée : schéma explicite, TTL, éviction LRU, dédoublonnage, index vectoriel et compaction périodique.
+#            Niveau exact en mémoire devant LanceDB : une question déjà posée (à la casse et aux espaces près) ne paie ni embedding ni recherche.
 
 import logging
-from typing import Optional
-from datetime import datetime
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+from datetime import datetime, timedelta, timezone
+from time import time
 
 import numpy as np
+import pyarrow as pa
 import lancedb
 
-from src.core.config import MODELS_DIR
+from src.core.config import (MODELS_DIR, DEFAULT_COLLECTION, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_TTL_SECONDS,
+                             SEMANTIC_CACHE_DEDUP_THRESHOLD, SEMANTIC_CACHE_INDEX_MIN_ENTRIES, SEMANTIC_CACHE_MAINTENANCE_EVERY, SEMANTIC_CACHE_EXACT_ENTRIES)
+from src.core.metrics import metrics
 from src.indexing.embedder import FastEmbedder
+from src.indexing.collection_registry import validate_collection_name
+from src.retrieval.query_expansion import normalize_query
 
 logger = logging.getLogger(__name__)
 
 CACHE_TABLE_NAME = "semantic_cache"
 
 
+def cache_table_name(collection: str = DEFAULT_COLLECTION) -> str:
+    """Table du cache d'une collection (chaque collection a son propre cache sémantique)."""
+    collection = validate_collection_name(collection)
+    return CACHE_TABLE_NAME if collection == DEFAULT_COLLECTION else f"{CACHE_TABLE_NAME}_{collection}"
+
+
+def cache_schema(dim: int) -> pa.Schema:
+    """Schéma explicite de la table du cache (plus de ligne factice pour inférer les types)."""
+    return pa.schema([
+        pa.field("id", pa.string()),                                            # id : identifiant de l'entrée (clé des mises à jour)
+        pa.field("query", pa.string()),                                         # query : requête texte
+        pa.field("answer", pa.string()),                                        # answer : réponse générée
+        pa.field("embedding", pa.list_(pa.float32(), dim)),                     # embedding : vecteur de la requête (taille fixe, indexable)
+        pa.field("ts", pa.string()),                                            # ts : date de création ISO (lisible)
+        pa.field("created_at", pa.float64()),                                   # created_at : création en secondes epoch (TTL)
+        pa.field("last_hit", pa.float64()),                                     # last_hit : dernier accès en secondes epoch (éviction LRU)
+        pa.field("hits", pa.int32()),                                           # hits : nombre de réutilisations
+        pa.field("chunk_ids", pa.list_(pa.string())),                           # chunk_ids : chunks du contexte de la réponse (sources affichées)
+        pa.field("scores", pa.list_(pa.float32())),                             # scores : score du reranker de chaque chunk
+        pa.field("sources", pa.list_(pa.string())),                             # sources : documents utilisés (invalidation ciblée)
+        pa.field("corpus_version", pa.int64()),                                 # corpus_version : version de la collection au moment de la réponse
+    ])
+
+
+def _sql_quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"                                 # 'valeur' échappée pour les filtres LanceDB
+
+
 class LanceSemanticCache:
-    """Cache sémantique basé sur LanceDB (100% local, zéro FAISS)."""
-    
-    def __init__(self, db: lancedb.DBConnection, table, embedder: FastEmbedder, threshold: float = 0.90):
+    """Cache sémantique basé sur LanceDB (100% local, zéro FAISS), borné en taille et en âge."""
+
+    def __init__(self, db: lancedb.DBConnection, table, embedder: FastEmbedder, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES, ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS, exact_entries: int = SEMANTIC_CACHE_EXACT_ENTRIES):
         self.db = db                                                            # self.db : connexion à la base LanceDB
         self.table = table                                                      # self.table : table du cache
         self.embedder = embedder                                                # self.embedder : notre FastEmbedder pour encoder les requêtes
         self.threshold = threshold                                              # threshold : seuil cosine (>0.90 = quasi identique)
+        self.max_entries = max_entries                                          # max_entries : borne (souple) du nombre d'entrées
+        self.ttl_seconds = ttl_seconds                                          # ttl_seconds : âge maximum d'une réponse (0 = illimité)
+        self._pending_hits: Dict[str, Tuple[float, int]] = {}                   # _pending_hits : id -> (dernier accès, hits), écrits en un lot à la maintenance
+        self._hits_lock = threading.Lock()                                      # _hits_lock : lookup et maintenance dans des threads différents
+        self._maintenance_lock = threading.Lock()                               # _maintenance_lock : une seule maintenance à la fois
+        self._writes = 0                                                        # _writes : écritures depuis la dernière maintenance
+        self.exact_entries = exact_entries                                      # exact_entries : capacité du niveau exact (0 = désactivé)
+        self._exact: "OrderedDict[str, Tuple[str, float, int, Dict[str, Any]]]" = OrderedDict() # _exact : requête normalisée -> (id, created_at, hits, réponse)
+        self._exact_lock = threading.Lock()                                     # _exact_lock : sessions Streamlit parallèles
+
+    def _search(self, q_vec: np.ndarray) -> Optional[dict]:
+        """Plus proche entrée non expirée (distance cosinus, même métrique que l'index vectoriel)."""
+        query = self.table.search(q_vec, vector_column_name="embedding").metric("cosine") # recherche top-1 (index IVF-HNSW si construit)
+        if self.ttl_seconds > 0:                                                # if : TTL actif
+            query = query.where(f"created_at >= {time() - self.ttl_seconds}", prefilter=True) # where : entrées expirées ignorées avant même leur suppression
+        res = query.select(["id", "answer", "created_at", "hits", "chunk_ids", "scores", "sources", "corpus_version", "_distance"]).limit(1).to_list() # select : pas de relecture des vecteurs
+        return res[0] if res else None
 
-    def _cosine(self, a: np.ndarray, b: np.ndarray) -> float:
-        """Calcule la similarité cosine entre deux vecteurs."""
-        a = a / (np.linalg.norm(a) + 1e-9)                                      # normalisation vecteur a
-        b = b / (np.linalg.norm(b) + 1e-9)                                      # normalisation vecteur b
-        return float(np.dot(a, b))                                              # produit scalaire = cosine
+    def _remember_exact(self, key: str, entry_id: str, created_at: float, hits: int, entry: Dict[str, Any]):
+        """Place une entrée en tête du niveau exact, en évinçant la moins récemment utilisée au-delà de exact_entries."""
+        if self.exact_entries <= 0:
+            return
+        with self._exact_lock:
+            self._exact[key] = (entry_id, created_at, hits, entry)
+            self._exact.move_to_end(key)
+            while len(self._exact) > self.exact_entries:
+                self._exact.popitem(last=False)                                 # popitem : plus ancienne question
 
-    def lookup(self, query: str) -> Optional[str]:
-        """Retourne une réponse si une requête similaire existe."""
+    def _forget_exact(self, predicate) -> int:
+        """Retire du niveau exact les entrées dont (id, réponse) vérifie predicate."""
+        with self._exact_lock:
+            keys = [key for key, (entry_id, _, _, entry) in self._exact.items() if predicate(entry_id, entry)]
+            for key in keys:
+                del self._exact[key]
+            return len(keys)
+
+    def _lookup_exact(self, key: str) -> Optional[Dict[str, Any]]:
+        """Niveau 1 : même question normalisée, sans embedding ni LanceDB."""
+        with self._exact_lock:
+            found = self._exact.get(key)
+            if found is None:
+                return None
+            entry_id, created_at, hits, entry = found
+            if self.ttl_seconds > 0 and created_at < time() - self.ttl_seconds: # if : réponse expirée, même règle que la table
+                del self._exact[key]
+                return None
+            self._exact.move_to_end(key)                                        # move_to_end : entrée la plus récente (LRU)
+        self._record_hit(entry_id, hits)                                        # _record_hit : l'entrée LanceDB reste récemment utilisée
+        return dict(entry)                                                      # dict : copie (l'appelant ne modifie pas le cache)
+
+    def lookup(self, query: str) -> Optional[Dict[str, Any]]:
+        """Retourne la réponse d'une requête similaire et ses sources (answer, chunk_ids, scores, sources, corpus_version), sinon None."""
         try:
-            q_vec = self.embedder.embed_query(query)                                # q_vec : encoder la requête
+            key = normalize_query(query)                                        # key : clé du niveau exact
+            exact = self._lookup_exact(key)                                     # exact : même question déjà servie
+            metrics.observe("semantic_cache.exact_hit_ratio", 1.0 if exact else 0.0) # observe : la moyenne est le taux de hit du niveau exact
+            if exact is not None:
+                metrics.incr("semantic_cache.exact_hits")
+                metrics.incr("semantic_cache.hits")
+                return exact
 
-            # Recherche Top-1 dans LanceDB
-            res = (
-                self.table.search(q_vec)
-                .limit(1)
-                .to_list()
-            )
+            q_vec = self.embedder.embed_query(query)                            # q_vec : encoder la requête
+            best = self._search(q_vec)                                          # best : meilleur résultat
 
-            if not res:                                                             # if : si aucun résultat
+            if best is None:                                                    # if : si aucun résultat
+                metrics.observe("semantic_cache.semantic_hit_ratio", 0.0)       # observe : taux de hit du niveau LanceDB (requêtes qui l'atteignent)
+                metrics.incr("semantic_cache.misses")
                 return None
 
-            best = res[0]                                                           # best : meilleur résultat
-            best_vec = np.array(best["embedding"], dtype=np.float32)                # best_vec : vecteur du meilleur résultat
-            sim = self._cosine(q_vec, best_vec)                                     # sim : similarité cosine
+            sim = 1.0 - best["_distance"]                                       # sim : similarité cosine
 
-            if sim >= self.threshold:                                               # if : si similarité suffisante
-                logger.info(f"Cache hit! Similarity: {sim:.3f}")                    # logger.info : log du cache hit
-                return best["answer"]                                               # return : réponse cachée
+            if sim >= self.threshold:                                           # if : si similarité suffisante
+                logger.info(f"Cache hit! Similarity: {sim:.3f}")                # logger.info : log du cache hit
+                self._record_hit(best["id"], best["hits"])                      # _record_hit : accès mémorisé pour l'éviction LRU
+                metrics.observe("semantic_cache.semantic_hit_ratio", 1.0)
+                metrics.incr("semantic_cache.semantic_hits")
+                metrics.incr("semantic_cache.hits")
+                entry = {field: best[field] for field in ("answer", "chunk_ids", "scores", "sources", "corpus_version")} # entry : réponse cachée et ses sources
+                self._remember_exact(key, best["id"], best["created_at"], best["hits"], entry) # _remember_exact : la même question sera servie sans embedding
+                return dict(entry)                                              # return : copie de la réponse cachée
 
-            logger.info(f"Cache miss (best sim: {sim:.3f})")                        # logger.info : cache miss
+            logger.info(f"Cache miss (best sim: {sim:.3f})")                    # logger.info : cache miss
+            metrics.observe("semantic_cache.semantic_hit_ratio", 0.0)
+            metrics.incr("semantic_cache.misses")
             return None
         except Exception as e:
             logger.error(f"⚠️ Cache lookup failed (corruption suspected): {e}")
             return None
 
-    def store(self, query: str, answer: str):
-        """Ajoute une entrée au cache."""
+    def _record_hit(self, entry_id: str, stored_hits: int):
+        """Mémorise l'accès en RAM : une écriture LanceDB par hit créerait une version de table à chaque question."""
+        with self._hits_lock:
+            _, hits = self._pending_hits.get(entry_id, (0.0, stored_hits or 0)) # hits : compteur le plus récent (table ou accès pas encore écrits)
+            self._pending_hits[entry_id] = (time(), hits + 1)                   # dernier accès + compteur
+
+    def store(self, query: str, answer: str, results: Sequence = (), corpus_version: int = 0):
+        """Ajoute une entrée au cache (ou remplace une question quasi identique déjà stockée) avec les SearchResult du contexte."""
         try:
-            q_vec = self.embedder.embed_query(query).tolist()                       # q_vec : encoder la requête et convertir en liste
-            self.table.add([{                                                       # self.table.add : ajouter une entrée
-                "query": query,                                                     # "query" : requête texte
-                "answer": answer,                                                   # "answer" : réponse générée
-                "embedding": q_vec,                                                 # "embedding" : vecteur de la requête
-                "ts": datetime.utcnow().isoformat()                                 # "ts" : timestamp UTC
-            }])
-            logger.info("Answer stored in cache")                                   # logger.info : confirmation
+            q_vec = self.embedder.embed_query(query)                            # q_vec : encoder la requête
+            now = time()                                                        # now : horodatage epoch
+            row = {
+                "id": uuid.uuid4().hex,                                         # "id" : nouvelle entrée
+                "query": query,                                                 # "query" : requête texte
+                "answer": answer,                                               # "answer" : réponse générée
+                "embedding": np.asarray(q_vec, dtype=np.float32).tolist(),      # "embedding" : vecteur de la requête
+                "ts": datetime.now(timezone.utc).isoformat(),                   # "ts" : timestamp UTC
+                "created_at": now,                                              # "created_at" : début du TTL
+                "last_hit": now,                                                # "last_hit" : une entrée neuve n'est pas la première évincée
+                "hits": 0,                                                      # "hits" : aucune réutilisation
+                "chunk_ids": [r.chunk.id for r in results],                     # "chunk_ids" : chunks du contexte
+                "scores": [float(r.score) for r in results],                    # "scores" : scores du reranker
+                "sources": sorted({r.chunk.metadata.source_path for r in results}), # "sources" : documents dont dépend la réponse
+                "corpus_version": corpus_version,                               # "corpus_version" : version du corpus interrogé
+            }
+            duplicate = self._search(q_vec)                                     # duplicate : entrée la plus proche
+            if duplicate is not None and 1.0 - duplicate["_distance"] >= SEMANTIC_CACHE_DEDUP_THRESHOLD: # if : même question (à la formulation près)
+                row["id"] = duplicate["id"]                                     # "id" : l'entrée existante est remplacée
+                self._forget_exact(lambda entry_id, _: entry_id == row["id"])   # _forget_exact : les autres formulations pointaient vers l'ancienne réponse
+                self.table.merge_insert("id").when_matched_update_all().when_not_matched_insert_all().execute(pa.Table.from_pylist([row], schema=self.table.schema)) # merge_insert : remplacement sans doublon
+                metrics.incr("semantic_cache.deduplicated")
+            else:
+                self.table.add(pa.Table.from_pylist([row], schema=self.table.schema)) # self.table.add : ajouter une entrée
+            self._remember_exact(normalize_query(query), row["id"], now, 0, {field: row[field] for field in ("answer", "chunk_ids", "scores", "sources", "corpus_version")})
+            logger.info("Answer stored in cache")                               # logger.info : confirmation
+            self._writes += 1                                                   # _writes : une écriture de plus
+            if self._writes >= SEMANTIC_CACHE_MAINTENANCE_EVERY:                # if : maintenance due
+                self._writes = 0
+                threading.Thread(target=self.maintain, daemon=True, name="vev-cache-maintenance").start() # Thread : maintenance hors du chemin de la requête
         except Exception as e:
             logger.error(f"⚠️ Failed to store in cache: {e}")
 
+    def maintain(self):
+        """Écrit les accès en attente, supprime les entrées expirées, évince les moins récemment utilisées, indexe et compacte la table."""
+        if not self._maintenance_lock.acquire(blocking=False):                  # if : maintenance déjà en cours
+            return
+        try:
+            # 1. Accès (LRU) en un seul merge_insert partiel
+            with self._hits_lock:
+                pending, self._pending_hits = self._pending_hits, {}
+            if pending:
+                self.table.merge_insert("id").when_matched_update_all().execute(pa.table({ # merge_insert : colonnes last_hit / hits seulement
+                    "id": list(pending),
+                    "last_hit": pa.array([last_hit for last_hit, _ in pending.values()], pa.float64()),
+                    "hits": pa.array([hits for _, hits in pending.values()], pa.int32()),
+                }))
+
+            # 2. Expiration (TTL)
+            if self.ttl_seconds > 0:
+                expired = self.table.count_rows(f"created_at < {time() - self.ttl_seconds}") # expired : entrées trop anciennes
+                if expired:
+                    self.table.delete(f"created_at < {time() - self.ttl_seconds}")
+                    metrics.incr("semantic_cache.expired", expired)
+
+            # 3. Éviction LRU au-delà de max_entries
+            count = self.table.count_rows()                                     # count : taille après expiration
+            if count > self.max_entries:
+                data = self.table.search().select(["id", "last_hit"]).limit(None).to_arrow() # data : colonnes utiles seulement
+                oldest = np.argsort(data.column("last_hit").to_numpy())[:count - self.max_entries] # oldest : accès les plus anciens
+                victims = [data.column("id")[int(i)].as_py() for i in oldest]   # victims : ids à évincer
+                for start in range(0, len(victims), 1000):                      # for : filtres SQL de taille raisonnable
+                    self.table.delete(f"id IN ({', '.join(_sql_quote(v) for v in victims[start:start + 1000])})")
+                evicted = set(victims)
+                self._forget_exact(lambda entry_id, _: entry_id in evicted)     # _forget_exact : pas de réponse servie depuis la mémoire après son éviction
+                metrics.incr("semantic_cache.evicted", len(victims))
+                count -= len(victims)
+
+            # 4. Index vectoriel une fois le cache assez grand (le scan exact reste plus rapide en dessous)
+            if count >= SEMANTIC_CACHE_INDEX_MIN_ENTRIES and not any("embedding" in index.columns for index in self.table.list_indices()):
+                self.table.create_index(metric="cosine", vector_column_name="embedding", index_type="IVF_HNSW_SQ") # create_index : IVF-HNSW quantifié, même métrique que _search
+                logger.info(f"Vector index created on cache table {self.table.name} ({count} entries)")
+
+            # 5. Compaction des fragments (une écriture par réponse) et mise à jour incrémentale de l'index
+            self.table.optimize(cleanup_older_than=timedelta(hours=1))          # optimize : compaction + versions anciennes supprimées
+            logger.info(f"Cache maintenance done on {self.table.name}: {count} entries")
+        except Exception as e:
+            logger.warning(f"Cache maintenance failed: {e}")
+        finally:
+            self._maintenance_lock.release()
+
+    def invalidate_source(self, source: str) -> int:
+        """Supprime les réponses construites sur un document réindexé ou supprimé ; les autres entrées restent valides."""
+        where = f"array_has(sources, {_sql_quote(source)})"                     # where : entrées qui citent la source
+        try:
+            self._forget_exact(lambda _, entry: source in entry["sources"])     # _forget_exact : niveau mémoire invalidé en premier
+            invalidated = self.table.count_rows(where)                          # invalidated : entrées concernées
+            if invalidated:
+                self.table.delete(where)                                        # delete : suppression ciblée (pas de vidage complet)
+                metrics.incr("semantic_cache.invalidated", invalidated)
+            return invalidated
+        except Exception as e:
+            logger.error(f"⚠️ Cache invalidation failed for {source}: {e}")
+            return 0
+
+    def drop(self):
+        """Supprime la table du cache (utilisé quand une collection est supprimée)."""
+        self.db.drop_table(self.table.name)                                     # drop_table : supprimer la table semantic_cache_<collection>
+        self._forget_exact(lambda *_: True)                                     # _forget_exact : vider aussi le niveau mémoire
+        logger.info(f"Dropped cache table {self.table.name}")
+
+
+def _migrate_cache_table(db: lancedb.DBConnection, table_name: str, schema: pa.Schema):
+    """Recrée une table d'un ancien format (ligne factice, colonnes manquantes) au schéma courant, en gardant ses réponses."""
+    old = db.open_table(table_name).to_arrow().to_pylist()                      # old : anciennes entrées (petite table)
+    now = time()
+    rows = []
+    for entry in old:
+        if not entry.get("query"):                                              # if : ancienne ligne factice
+            continue
+        try:
+            created_at = datetime.fromisoformat(entry.get("ts") or "").replace(tzinfo=timezone.utc).timestamp() # created_at : ancien timestamp UTC
+        except ValueError:
+            created_at = now
+        defaults = {"id": uuid.uuid4().hex, "ts": datetime.fromtimestamp(created_at, timezone.utc).isoformat(), "created_at": created_at, "last_hit": created_at, "hits": 0,
+                    "chunk_ids": [], "scores": [], "sources": [], "corpus_version": 0} # sources inconnues : l'entrée n'est invalidée que par TTL / LRU
+        rows.append({name: entry[name] if entry.get(name) is not None else defaults.get(name) for name in schema.names}) # une ligne au nouveau schéma
+    table = db.create_table(table_name, schema=schema, mode="overwrite")        # create_table : table vide au schéma explicite
+    if rows:
+        table.add(pa.Table.from_pylist(rows, schema=schema))
+    logger.info(f"Migrated cache table {table_name} ({len(rows)} entries kept)")
+    return table
+
+
+def drop_semantic_cache(collection: str) -> bool:
+    """Supprime la table du cache d'une collection si elle existe, sans la créer ni l'ouvrir."""
+    db = lancedb.connect(str(MODELS_DIR / "lancedb_cache"))
+    table_name = cache_table_name(collection)
+    if table_name not in db.table_names():
+        return False
+    db.drop_table(table_name)
+    logger.info(f"Dropped cache table {table_name}")
+    return True
+
 
-def init_semantic_cache(embedder: FastEmbedder) -> Optional[LanceSemanticCache]:
+def init_semantic_cache(embedder: FastEmbedder, collection: str = DEFAULT_COLLECTION) -> Optional[LanceSemanticCache]:
     """
-    Initialise le cache sémantique LanceDB (100% local, pas de FAISS).
+    Initialise le cache sémantique LanceDB d'une collection (100% local, pas de FAISS).
     """
     try:
         cache_dir = MODELS_DIR / "lancedb_cache"                                # cache_dir : dossier du cache
         cache_dir.mkdir(parents=True, exist_ok=True)                            # mkdir : créer le dossier si nécessaire
 
         db = lancedb.connect(str(cache_dir))                                    # db : connexion à LanceDB
+        table_name = cache_table_name(collection)                               # table_name : table du cache de cette collection
+        schema = cache_schema(embedder.dimension)                               # schema : schéma explicite
 
-        # Schéma simple pour le cache
-        if CACHE_TABLE_NAME in db.table_names():                                # if : si la table existe déjà
-            table = db.open_table(CACHE_TABLE_NAME)                             # table : ouvrir la table existante
+        if table_name in db.table_names():                                      # if : si la table existe déjà
+            table = db.open_table(table_name)                                   # table : ouvrir la table existante
+            if table.schema != schema:                                          # if : ancien format (ligne factice, pas de TTL / LRU)
+                table = _migrate_cache_table(db, table_name, schema)            # table : table recréée au schéma courant
             logger.info(f"Opened existing cache table ({table.count_rows()} entries)") # logger.info : nombre d'entrées
         else:
-            # Créer la table avec un schéma dummy
-            table = db.create_table(
-                CACHE_TABLE_NAME,
-                data=[{
-                    "query": "",                                                # query : requête vide (dummy)
-                    "answer": "",                                               # answer : réponse vide (dummy)
-                    "embedding": [0.0] * embedder.dimension,                    # embedding : vecteur zéro (dummy)
-                    "ts": ""                                                    # ts : timestamp vide (dummy)
-                }],
-                mode="overwrite"
-            )
+            table = db.create_table(table_name, schema=schema)                  # table : table vide, aucun vecteur factice
             logger.info("Created new cache table")                              # logger.info : création table
 
         logger.info("✅ LanceDB semantic cache initialized (FAISS-free)")        # logger.info : succès
@@ -108,4 +323,4 @@ def init_semantic_cache(embedder: FastEmbedder) -> Optional[LanceSemanticCache]:
 
     except Exception as e:                                                      # except : en cas d'erreur
         logger.warning(f"Failed to init LanceDB cache, running without cache: {e}") # logger.warning : avertissement
-        return None                                                             # return : None si échec
\ No newline at end of file
+        return None                                                             # return : None si échec
@@ -0,0 +1,26 @@
+# Objectif — Fusionner plusieurs classements (jambes vectorielle / mots-clés, variantes de la requête) par Reciprocal Rank Fusion, calculée en NumPy
+
+# Étape 1 — Importer les dépendances
+from typing import List, Optional, Sequence, Tuple                              # from : importer depuis le typage | typing : module types | List, Optional, Sequence, Tuple : types génériques
+import numpy as np                                                              # import : charger le module de calcul | numpy : matrice des rangs
+
+# Étape 2 — Constante RRF
+RRF_K = 60                                                                      # RRF_K : constante RRF standard (amortit l'écart entre les premiers rangs)
+
+# Étape 3 — Fusion RRF vectorisée
+def reciprocal_rank_fusion(ranked_lists: Sequence[Sequence[str]], k: int = RRF_K, missing_rank: Optional[int] = None, # def : définir la fonction | reciprocal_rank_fusion : classement fusionné | ranked_lists : listes d'ids, du meilleur au pire | k : constante RRF | missing_rank : rang attribué à un id absent d'une liste (None = aucune contribution)
+                           weights: Optional[Sequence[float]] = None) -> Tuple[List[str], np.ndarray]: # weights : poids de chaque liste (défaut : 1) | -> : retour | (ids triés, scores RRF)
+    """Score RRF = somme sur les listes de poids / (k + rang) ; une seule matrice (listes x ids), sans boucle sur les paires."""
+    ids = list(dict.fromkeys(doc_id for ranked in ranked_lists for doc_id in ranked)) # ids : union des ids (ordre de première apparition = départage stable)
+    if not ids:                                                                 # if : aucune liste non vide
+        return [], np.zeros(0)                                                  # return : résultat vide
+    position = {doc_id: i for i, doc_id in enumerate(ids)}                      # position : id -> colonne de la matrice
+    ranks = np.full((len(ranked_lists), len(ids)), np.inf if missing_rank is None else float(missing_rank)) # ranks : rang de chaque id dans chaque liste (absent = missing_rank ou infini)
+    for row, ranked in enumerate(ranked_lists):                                 # for : chaque liste (quelques dizaines d'ids)
+        ranked = list(dict.fromkeys(ranked))                                    # ranked : doublons retirés (le meilleur rang compte)
+        ranks[row, [position[doc_id] for doc_id in ranked]] = np.arange(1, len(ranked) + 1) # affectation groupée des rangs 1..n
+    contributions = 1.0 / (k + ranks)                                           # contributions : 1 / (k + rang), 0 pour un rang infini
+    list_weights = np.ones(len(ranked_lists)) if weights is None else np.asarray(weights, dtype=float) # list_weights : poids par liste
+    scores = list_weights @ contributions                                       # scores : somme pondérée sur les listes (un produit matrice-vecteur)
+    order = np.argsort(-scores, kind="stable")                                  # order : tri décroissant, stable pour les égalités
+    return [ids[i] for i in order], scores[order]                               # return : ids fusionnés et leurs scores
@@ -1,47 +1,153 @@
-# Objectif — Améliorer la requête utilisateur en imaginant une réponse (HyDE) pour améliorer la recherche vectorielle
+# Objectif — Améliorer la requête utilisateur en imaginant une réponse (HyDE) ou en la reformulant (multi-requêtes) pour améliorer la recherche, uniquement quand la première recherche est peu sûre
 
 # Étape 1 — Importer les dépendances
 import logging                                                                  # import : charger le module standard | logging : gestion des journaux
-from typing import List                                                         # from : importer depuis le typage | typing : module types | List : type liste générique
-from src.core.config import LLM_CONTEXT_WINDOW                                  # from : importer la constante | src.core.config : configuration projet | LLM_CONTEXT_WINDOW : taille de la fenêtre de contexte
-from src.generation.llm_engine import LLMEngine                                 # from : importer le moteur LLM | src.generation.llm_engine : notre classe Llama.cpp (moteur IA)
+import threading                                                                # import : charger le module standard | threading : verrou du cache HyDE
+import re                                                                       # import : charger le module standard | re : nettoyage des puces / numéros des reformulations
+import unicodedata                                                              # import : charger le module standard | unicodedata : normalisation Unicode de la requête (clé de cache)
+from collections import OrderedDict                                             # from : importer depuis collections | OrderedDict : cache LRU des documents hypothétiques
+from typing import List, Optional, Sequence                                     # from : importer depuis le typage | typing : module types | List, Optional, Sequence : types génériques
+from src.core.config import HYDE_MAX_TOKENS, HYDE_TEMPERATURE, HYDE_MIN_TOP_SCORE, HYDE_MIN_MARGIN, HYDE_CACHE_SIZE, MULTI_QUERY_VARIANTS, MULTI_QUERY_MAX_TOKENS # from : importer les constantes | src.core.config : configuration projet | HYDE_* : budget, seuils de confiance et taille du cache | MULTI_QUERY_* : nombre et budget des reformulations
+from src.core.metrics import metrics                                            # from : importer le registre | src.core.metrics : compteurs et durées HyDE
+from src.core.schemas import SearchResult                                       # from : importer le schéma | src.core.schemas : résultats de la première recherche
+from src.generation.llm_engine import LLMEngine, LLMGenerationError             # from : importer le moteur LLM | src.generation.llm_engine : notre classe Llama.cpp (moteur IA) et son erreur de génération
 
 # Étape 2 — Configurer le logging
 logger = logging.getLogger(__name__)                                            # logger : objet enregistreur | = : assignation | logging.getLogger(__name__) : récupérer le logger actuel
 
+# Étape 2 bis — Normaliser une requête (clé de cache)
+def normalize_query(query: str) -> str:                                         # def : définir la fonction | normalize_query : forme canonique d'une question | -> : retour | str
+    """Minuscules, Unicode NFKC, espaces compactés, ponctuation finale retirée : "Quoi  de neuf ?" == "quoi de neuf"."""
+    text = unicodedata.normalize("NFKC", query).casefold()                      # text : forme Unicode canonique en minuscules
+    return " ".join(text.split()).rstrip(" ?!.;:")                              # return : espaces compactés, ponctuation finale retirée
+
 # Étape 3 — Définir la classe de transformation
 class QueryExpander:                                                            # class : définir une classe | QueryExpander : outil pour améliorer la requête
-    
+
     # Étape 3.1 — Constructeur (initialisation)
-    def __init__(self, llm_engine: LLMEngine):                                  # def : constructeur | self : instance | llm_engine : objet moteur LLM (Qwen)
+    def __init__(self, llm_engine: LLMEngine, cache_size: int = HYDE_CACHE_SIZE): # def : constructeur | self : instance | llm_engine : objet moteur LLM (Qwen) | cache_size : nombre de documents HyDE gardés en mémoire
         self.llm = llm_engine                                                   # self.llm : stocker l'instance du moteur IA
+        self.cache_size = cache_size                                            # self.cache_size : capacité du cache LRU
+        self._cache: "OrderedDict[str, str]" = OrderedDict()                    # self._cache : requête normalisée -> document hypothétique
+        self._variants_cache: "OrderedDict[str, List[str]]" = OrderedDict()     # self._variants_cache : requête normalisée -> reformulations
+        self._lock = threading.Lock()                                           # self._lock : protège le cache (sessions Streamlit parallèles)
+
+    # Étape 3.2 — Décider si HyDE est utile
+    def should_expand(self, first_pass: Sequence[SearchResult]) -> bool:        # def : méthode | should_expand : la première recherche est-elle peu sûre ? | first_pass : résultats de la requête originale | -> : retour | bool
+        """HyDE seulement si le meilleur score est bas, ou s'il ne se détache pas du reste du top-k (marge faible)."""
+        if not first_pass:                                                      # if : aucun résultat
+            return True                                                         # return : HyDE peut trouver ce que la question courte rate
+        scores = sorted((r.score for r in first_pass), reverse=True)            # scores : scores de similarité (1 - distance), du meilleur au pire
+        top = scores[0]                                                         # top : meilleur score
+        margin = top - sum(scores) / len(scores)                                # margin : écart entre le meilleur et la moyenne du top-k
+        if top >= HYDE_MIN_TOP_SCORE and margin >= HYDE_MIN_MARGIN:             # if : première recherche confiante
+            metrics.incr("hyde.skipped")                                        # metrics.incr : HyDE évité
+            logger.info(f"HyDE skipped: first pass is confident (top={top:.3f}, margin={margin:.3f}).") # logger.info : décision
+            return False                                                        # return : pas de génération
+        logger.info(f"HyDE needed: low-confidence first pass (top={top:.3f}, margin={margin:.3f}).") # logger.info : décision
+        return True                                                             # return : générer le document hypothétique
+
+    # Étape 3.3 — Générer (ou relire) le document hypothétique
+    def hypothetical_document(self, query: str, stop_event: Optional[threading.Event] = None) -> Optional[str]: # def : méthode | hypothetical_document : document HyDE de la requête | stop_event : arrêt anticipé (échéance du pipeline) | -> : retour | Optional[str] : None si le LLM échoue ou est interrompu
+        """Génère un document hypothétique court (HYDE_MAX_TOKENS), mis en cache par requête normalisée."""
+        key = normalize_query(query)                                            # key : clé de cache
+        with self._lock:                                                        # with : section critique
+            if key in self._cache:                                              # if : déjà généré pour cette question
+                self._cache.move_to_end(key)                                    # move_to_end : entrée la plus récente (LRU)
+                metrics.incr("hyde.cache_hits")                                 # metrics.incr : génération évitée
+                return self._cache[key]                                         # return : document en cache
+        if self.llm is None:                                                    # if : moteur LLM indisponible
+            return None                                                         # return : pas de HyDE
+
+        # 1. Définir le prompt - HyDE demande au LLM d'imaginer une réponse (un paragraphe suffit à déplacer le vecteur)
+        hyde_prompt = (                                                         # hyde_prompt : chaîne de prompt
+            f"Rédige un court paragraphe factuel (quelques phrases) qui répondrait le mieux à la question : {query}\n\n" # f"..." : instruction pour un texte court (budget de tokens)
+            f"Réponds en utilisant un style factuel et ne t'excuse pas de ne pas connaître la réponse, invente-la de manière plausible." # Instruction sur le style (inventer une réponse plausible)
+        )
+
+        # 2. Générer le document hypothétique - La recherche vectorielle sera effectuée sur cet *hypothétique* document, pas sur la question courte
+        try:                                                                    # try : moteur indisponible, file pleine ou erreur llama.cpp
+            with metrics.timer("hyde.seconds"):                                 # with : coût de la génération (secondes)
+                document = self.llm.generate(prompt=hyde_prompt, max_tokens=HYDE_MAX_TOKENS, temperature=HYDE_TEMPERATURE, metric_prefix="hyde", stop_event=stop_event) # document : réponse du LLM | max_tokens : petit budget (au lieu de toute la fenêtre de contexte) | metric_prefix : tokens comptés sous "hyde.*" | stop_event : interruptible
+        except LLMGenerationError as e:                                         # except : génération impossible
+            logger.warning(f"HyDE generation failed: {e}")                      # logger.warning : recherche avec la question seule
+            metrics.incr("hyde.failures")                                       # metrics.incr : échec
+            return None                                                         # return : pas de HyDE
+        if stop_event is not None and stop_event.is_set():                      # if : génération interrompue -> document partiel, ni utilisé ni mis en cache
+            return None                                                         # return : pas de HyDE
+        if not document:                                                        # if : document vide
+            metrics.incr("hyde.failures")                                       # metrics.incr : échec
+            return None                                                         # return : pas de HyDE
+        metrics.incr("hyde.generated")                                          # metrics.incr : génération effectuée
+        with self._lock:                                                        # with : section critique
+            self._cache[key] = document                                         # mise en cache
+            if len(self._cache) > self.cache_size:                              # if : cache plein
+                self._cache.popitem(last=False)                                 # popitem(last=False) : retirer l'entrée la plus ancienne
+        return document                                                         # return : document hypothétique
+
+    # Étape 3.3 bis — Générer (ou relire) des reformulations courtes (mode multi-requêtes)
+    def paraphrase_queries(self, query: str, n: int = MULTI_QUERY_VARIANTS) -> List[str]: # def : méthode | paraphrase_queries : variantes de la question | n : nombre de reformulations | -> : retour | List[str] : vide si le LLM échoue
+        """Demande n reformulations en un seul appel LLM (une par ligne), mises en cache par requête normalisée."""
+        key = normalize_query(query)                                            # key : clé de cache
+        with self._lock:                                                        # with : section critique
+            if key in self._variants_cache:                                     # if : déjà reformulée
+                self._variants_cache.move_to_end(key)                           # move_to_end : entrée la plus récente (LRU)
+                metrics.incr("multi_query.cache_hits")                          # metrics.incr : génération évitée
+                return list(self._variants_cache[key][:n])                      # return : reformulations en cache
+        if self.llm is None:                                                    # if : moteur LLM indisponible
+            return []                                                           # return : pas de variantes
+
+        # 1. Définir le prompt - des reformulations courtes (vocabulaire différent) coûtent bien moins de tokens qu'un document HyDE
+        prompt = (                                                              # prompt : chaîne de prompt
+            f"Donne {n} reformulations courtes et différentes de la question suivante, une par ligne, sans numéro ni explication.\n" # f"..." : format ligne par ligne (facile à découper)
+            f"Question : {query}"                                               # question originale
+        )
+
+        # 2. Générer puis découper les lignes
+        try:                                                                    # try : moteur indisponible, file pleine ou erreur llama.cpp
+            with metrics.timer("multi_query.seconds"):                          # with : coût de la génération (secondes)
+                output = self.llm.generate(prompt=prompt, max_tokens=MULTI_QUERY_MAX_TOKENS, temperature=HYDE_TEMPERATURE, metric_prefix="multi_query") # output : texte du LLM | metric_prefix : tokens comptés sous "multi_query.*"
+        except LLMGenerationError as e:                                         # except : génération impossible
+            logger.warning(f"Multi-query generation failed: {e}")               # logger.warning : recherche avec la question seule
+            metrics.incr("multi_query.failures")                                # metrics.incr : échec
+            return []                                                           # return : pas de variantes
+        if not output:                                                          # if : réponse vide
+            metrics.incr("multi_query.failures")                                # metrics.incr : échec
+            return []                                                           # return : pas de variantes
+        variants = []                                                           # variants : reformulations retenues
+        seen = {key}                                                            # seen : formes normalisées déjà présentes (la question originale comprise)
+        for line in output.splitlines():                                        # for : une reformulation par ligne
+            variant = re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", line).strip()     # variant : ligne sans puce ni numéro
+            if variant and normalize_query(variant) not in seen:                # if : ligne non vide et nouvelle
+                seen.add(normalize_query(variant))                              # seen.add : éviter les doublons
+                variants.append(variant)                                        # variants.append : variante retenue
+        variants = variants[:n]                                                 # variants : au plus n reformulations
+        metrics.incr("multi_query.generated")                                   # metrics.incr : génération effectuée
+        with self._lock:                                                        # with : section critique
+            self._variants_cache[key] = variants                                # mise en cache
+            if len(self._variants_cache) > self.cache_size:                     # if : cache plein
+                self._variants_cache.popitem(last=False)                        # popitem(last=False) : retirer l'entrée la plus ancienne
+        return list(variants)                                                   # return : reformulations
 
-    # Étape 3.2 — Méthode principale (utilise HyDE uniquement)
-    def expand_query(self, query: str) -> List[str]:                            # def : méthode principale | expand_query : fonction pour l'expansion | -> : retour | List[str] : renvoie la requête originale + le document HyDE
+    # Étape 3.4 — Méthode principale (HyDE adaptatif)
+    def expand_query(self, query: str, first_pass: Optional[Sequence[SearchResult]] = None) -> List[str]: # def : méthode principale | expand_query : fonction pour l'expansion | first_pass : résultats de la requête originale (None = HyDE systématique) | -> : retour | List[str] : renvoie la requête originale (+ le document HyDE)
         """
-        Génère un document hypothétique (HyDE) pour améliorer la recherche vectorielle.
+        Génère un document hypothétique (HyDE) pour améliorer la recherche vectorielle, si la première recherche est peu sûre.
         Retourne la requête originale plus le document HyDE généré.
         """
         expanded_queries = [query]                                              # expanded_queries : liste des requêtes (commence avec l'originale)
+        if first_pass is not None and not self.should_expand(first_pass):       # if : première recherche suffisante
+            return expanded_queries                                             # return : requête originale seule
 
         try:                                                                    # try : bloc de sécurité
-            # 1. Définir le prompt - HyDE demande au LLM d'imaginer une réponse détaillée
-            hyde_prompt = (                                                     # hyde_prompt : chaîne de prompt
-                f"Rédige un document hypothétique, long et détaillé, qui répondrait le mieux à la question : {query}\n\n" # f"..." : instruction pour générer du texte long
-                f"Réponds en utilisant un style factuel et ne t'excuse pas de ne pas connaître la réponse, invente-la de manière plausible." # Instruction sur le style (inventer une réponse plausible)
-            )
-
-            # 2. Générer le document hypothétique - La recherche vectorielle sera effectuée sur cet *hypothétique* document, pas sur la question courte
-            hypothetical_document = self.llm.generate(                          # hypothetical_document : variable pour la réponse du LLM
-                prompt=hyde_prompt,                                             # prompt : utiliser l'instruction HyDE
-                max_tokens=LLM_CONTEXT_WINDOW,                                  # max_tokens : générer jusqu'à la taille de la fenêtre de contexte
-                temperature=0.9                                                 # temperature : 0.9 pour encourager la créativité (nécessaire pour HyDE)
-            )
-            expanded_queries.append(hypothetical_document)                      # expanded_queries.append(...) : ajout du document hypothétique comme requête de recherche
-            logger.info("Generated HyDE document for search.")                  # logger.info : confirmation de l'action
+            hypothetical_document = self.hypothetical_document(query)           # hypothetical_document : document généré ou relu du cache
+            if hypothetical_document:                                           # if : génération réussie
+                expanded_queries.append(hypothetical_document)                  # expanded_queries.append(...) : ajout du document hypothétique comme requête de recherche
+                logger.info("Generated HyDE document for search.")              # logger.info : confirmation de l'action
 
         except Exception as e:                                                  # except : si le LLM échoue
+            metrics.incr("hyde.failures")                                       # metrics.incr : échec
             logger.warning(f"Query expansion (HyDE) failed with LLM: {e}")      # logger.warning : on prévient mais on ne stoppe pas
 
         # HyDE génère déjà un contenu unique, donc pas besoin de nettoyer les doublons.
-        return expanded_queries                                                 # return : renvoyer la requête originale + le document HyDE
\ No newline at end of file
+        return expanded_queries                                                 # return : renvoyer la requête originale + le document HyDE
@@ -1,60 +1,181 @@
 # Objectif — Affiner les résultats de recherche en utilisant un modèle de scoring puissant (MXBai Rerank v2) pour filtrer les faux positifs
 
 # Étape 1 — Importer les dépendances
+import hashlib                                                                  # import : charger le module standard | hashlib : empreinte de la requête normalisée (clé du cache de scores)
 import logging                                                                  # import : charger le module standard | logging : gestion des journaux
-from typing import List, Tuple                                                  # from : importer depuis le typage | typing : module types | List, Tuple : types génériques
+import threading                                                                # import : charger le module standard | threading : verrou du cache de scores
+from collections import OrderedDict                                             # from : importer depuis collections | OrderedDict : cache LRU des scores
+import numpy as np                                                              # import : charger le module de calcul | numpy : tri des paires par longueur et remise en ordre des scores
+from typing import Dict, List, Optional, Sequence, Tuple                        # from : importer depuis le typage | typing : module types | Dict, List, Optional, Sequence, Tuple : types génériques
 from sentence_transformers import CrossEncoder                                  # from : importer depuis la librairie | sentence_transformers : framework de modèles sémantiques | CrossEncoder : classe de modèle pour le Reranking
-from src.core.config import RERANK_TOP_K                                        # from : importer la constante | src.core.config : configuration projet | RERANK_TOP_K : nombre de résultats finaux à conserver
-from src.core.schemas import SearchResult                                       # from : importer le schéma | src.core.schemas : notre objet résultat de recherche
+from src.core.config import RERANK_TOP_K, RERANK_BACKEND, RERANK_ONNX_INT8_FILE, RERANK_BATCH_SIZE, RERANK_MAX_LENGTH, RERANK_TORCH_THREADS, RERANK_CACHE_SIZE, RERANK_CASCADE, RERANK_CASCADE_MARGIN, RERANK_CASCADE_BATCH, RERANK_CASCADE_GAP # from : importer la constante | src.core.config : configuration projet | RERANK_TOP_K : nombre de résultats finaux à conserver | RERANK_* : moteur d'inférence, lots, troncature, cache et cascade
+from src.retrieval.query_expansion import normalize_query                       # from : importer la normalisation | src.retrieval.query_expansion : même forme canonique que le cache HyDE
+from src.core.metrics import metrics                                            # from : importer le registre | src.core.metrics : durée et volume du reranking
+from src.core.schemas import SearchResult, source_hash                          # from : importer le schéma | src.core.schemas : notre objet résultat de recherche
 
 # Étape 2 — Configurer le logging et le modèle
 logger = logging.getLogger(__name__)                                            # logger : objet enregistreur | = : assignation | logging.getLogger(__name__) : récupérer le logger actuel
 RERANK_MODEL_NAME = "mixedbread-ai/mxbai-rerank-base-v1"                             # RERANK_MODEL_NAME : nom du modèle Reranker (MXBai Base)
+RERANK_BACKENDS = ("torch", "onnx", "onnx-int8")                                # RERANK_BACKENDS : moteurs d'inférence acceptés
+
+# Étape 2 bis — Charger le CrossEncoder avec le moteur demandé
+def load_cross_encoder(backend: str = RERANK_BACKEND, max_length: int = RERANK_MAX_LENGTH) -> CrossEncoder: # def : définir la fonction | load_cross_encoder : modèle prêt à prédire | backend : "torch", "onnx" ou "onnx-int8" | max_length : troncature en tokens | -> : retour | CrossEncoder
+    """Même modèle et même API `predict` ; seul le moteur change (ONNX Runtime, éventuellement quantifié int8, pour le CPU)."""
+    if backend not in RERANK_BACKENDS:                                          # if : moteur inconnu
+        raise ValueError(f"Unknown reranker backend '{backend}', expected one of {RERANK_BACKENDS}.") # raise : configuration invalide
+    if backend == "torch":                                                      # if : moteur historique
+        if RERANK_TORCH_THREADS > 0:                                            # if : nombre de threads imposé
+            import torch                                                        # import : PyTorch (déjà requis par sentence-transformers)
+            torch.set_num_threads(RERANK_TORCH_THREADS)                         # set_num_threads : éviter la contention avec llama.cpp
+        return CrossEncoder(RERANK_MODEL_NAME, max_length=max_length)           # return : modèle PyTorch
+    model_kwargs = {"file_name": RERANK_ONNX_INT8_FILE} if backend == "onnx-int8" else None # model_kwargs : fichier ONNX quantifié (None = onnx/model.onnx)
+    return CrossEncoder(RERANK_MODEL_NAME, max_length=max_length, backend="onnx", model_kwargs=model_kwargs) # return : modèle ONNX Runtime
+
+# Étape 2 ter — Cache des scores du CrossEncoder
+class RerankScoreCache:                                                         # class : définir une classe | RerankScoreCache : (requête normalisée, chunk, modèle) -> score
+    """Cache LRU borné des scores : seules les paires absentes sont envoyées au modèle ; invalidé par source (suppression, réindexation)."""
+
+    def __init__(self, max_entries: int = RERANK_CACHE_SIZE):                   # def : constructeur | max_entries : capacité du cache
+        self.max_entries = max_entries                                          # self.max_entries : capacité LRU
+        self._scores: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict() # self._scores : (hash requête, id chunk, modèle) -> score
+        self._lock = threading.Lock()                                           # self._lock : protège le cache (sessions Streamlit parallèles)
+
+    @staticmethod                                                               # @staticmethod : pas besoin de l'instance
+    def query_key(query: str) -> str:                                           # def : méthode | query_key : empreinte de la requête normalisée | -> : retour | str
+        return hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()[:16] # return : 16 caractères hexadécimaux
+
+    def get_many(self, query_key: str, chunk_ids: Sequence[str], model: str) -> Dict[str, float]: # def : méthode | get_many : scores déjà connus | -> : retour | id chunk -> score
+        found = {}                                                              # found : scores trouvés
+        with self._lock:                                                        # with : section critique
+            for chunk_id in chunk_ids:                                          # for : chaque candidat
+                key = (query_key, chunk_id, model)                              # key : clé complète
+                if key in self._scores:                                         # if : score en cache
+                    self._scores.move_to_end(key)                               # move_to_end : entrée la plus récente (LRU)
+                    found[chunk_id] = self._scores[key]                         # found : score relu
+        return found                                                            # return : scores en cache
+
+    def put_many(self, query_key: str, scores: Dict[str, float], model: str):   # def : méthode | put_many : mémoriser des scores calculés
+        with self._lock:                                                        # with : section critique
+            for chunk_id, score in scores.items():                              # for : chaque score calculé
+                self._scores[(query_key, chunk_id, model)] = score              # mise en cache
+            while len(self._scores) > self.max_entries:                         # while : cache plein
+                self._scores.popitem(last=False)                                # popitem(last=False) : retirer l'entrée la plus ancienne
+
+    def invalidate_source(self, source: str) -> int:                            # def : méthode | invalidate_source : oublier les chunks d'une source | -> : retour | int : entrées retirées
+        """Les ids de chunks commencent par le hash de leur source : un document supprimé ou réindexé ne garde aucun score périmé."""
+        prefix = f"{source_hash(source)}-"                                      # prefix : préfixe des ids de la source
+        with self._lock:                                                        # with : section critique
+            stale = [key for key in self._scores if key[1].startswith(prefix)]  # stale : entrées de la source
+            for key in stale:                                                   # for : chaque entrée périmée
+                del self._scores[key]                                           # del : retrait
+        return len(stale)                                                       # return : nombre d'entrées retirées
+
+    def __len__(self) -> int:                                                   # def : méthode spéciale | __len__ : nombre d'entrées
+        return len(self._scores)                                                # return : taille du cache
 
 # Étape 3 — Définir la classe Reranker
 class Reranker:                                                                 # class : définir une classe | Reranker : outil pour réévaluer les documents
     
     # Étape 3.1 — Constructeur (Chargement du modèle)
-    def __init__(self):                                                         # def : constructeur | self : instance de la classe
-        logger.info(f"Loading Reranker model: {RERANK_MODEL_NAME}")             # logger.info : afficher le modèle en cours de chargement
+    def __init__(self, backend: Optional[str] = None):                          # def : constructeur | self : instance de la classe | backend : moteur d'inférence (défaut : RERANK_BACKEND)
+        self.backend = backend or RERANK_BACKEND                                # self.backend : moteur demandé
+        logger.info(f"Loading Reranker model: {RERANK_MODEL_NAME} (backend={self.backend})") # logger.info : afficher le modèle en cours de chargement
         try:                                                                    # try : tenter d'exécuter le bloc suivant
             # CrossEncoder charge un modèle pour évaluer la relation paire (query, document)
-            self.model = CrossEncoder(RERANK_MODEL_NAME)                        # self.model : instance du modèle | CrossEncoder(...) : constructeur du Reranker
+            self.model = load_cross_encoder(self.backend)                       # self.model : instance du modèle | load_cross_encoder(...) : constructeur du Reranker avec le moteur choisi
             logger.info("Reranker model loaded successfully.")                   # logger.info : confirmation de chargement réussi
-        except Exception as e:                                                  # except : si une erreur survient (problème de téléchargement ou PyTorch)
+        except Exception as e:                                                  # except : si une erreur survient (problème de téléchargement, PyTorch ou ONNX Runtime absent)
             logger.error(f"Error loading Reranker model: {e}")                  # logger.error : afficher l'erreur
             self.model = None                                                   # self.model : mettre à None si échec
+        self.score_cache = RerankScoreCache()                                   # self.score_cache : scores déjà calculés (trafic répété, reformulations)
+        if self.model is None and self.backend != "torch":                      # if : moteur ONNX indisponible (optimum / onnxruntime non installés)
+            logger.warning("Falling back to the PyTorch reranker.")             # logger.warning : repli
+            self.backend = "torch"                                              # self.backend : moteur historique
+            try:                                                                # try : second essai
+                self.model = load_cross_encoder(self.backend)                   # self.model : modèle PyTorch
+            except Exception as e:                                              # except : échec définitif
+                logger.error(f"Error loading Reranker model: {e}")              # logger.error : afficher l'erreur
+
+    # Étape 3.1 bis — Prédiction par lots triés par longueur
+    def predict(self, pairs: List[Tuple[str, str]]) -> np.ndarray:              # def : définir la méthode | predict : scores des paires dans leur ordre d'origine | -> : retour | np.ndarray
+        """Trie les paires par longueur (moins de padding par lot), prédit, puis remet les scores dans l'ordre d'origine."""
+        order = np.argsort([len(query) + len(text) for query, text in pairs], kind="stable") # order : paires de longueurs voisines dans le même lot
+        with metrics.timer("rerank.seconds"):                                   # with : coût du CrossEncoder
+            sorted_scores = self.model.predict([pairs[i] for i in order], batch_size=RERANK_BATCH_SIZE, show_progress_bar=False) # sorted_scores : scores dans l'ordre trié | show_progress_bar=False : désactiver la barre de chargement
+        metrics.observe("rerank.pairs", len(pairs))                             # metrics.observe : volume par appel
+        sorted_scores = np.asarray(sorted_scores, dtype=np.float64).reshape(-1) # sorted_scores : vecteur numpy à plat
+        if len(sorted_scores) != len(pairs):                                    # if : le modèle n'a pas rendu un score par paire
+            raise ValueError(f"Reranker returned {len(sorted_scores)} scores for {len(pairs)} pairs.") # raise : erreur explicite plutôt qu'un décalage silencieux
+        scores = np.empty(len(pairs), dtype=np.float64)                         # scores : résultat dans l'ordre d'origine
+        scores[order] = sorted_scores                                           # scores[order] : annuler le tri
+        return scores                                                           # return : un score par paire
+
+    # Étape 3.1 ter — Scores CrossEncoder (cache d'abord, modèle pour les paires absentes)
+    def _score(self, query: str, results: Sequence[SearchResult]) -> Dict[str, float]: # def : méthode privée | _score : scores des candidats | -> : retour | id chunk -> score
+        """Relit les scores en cache et n'envoie au CrossEncoder que les paires absentes."""
+        # 1. Relire les scores déjà calculés (même question normalisée, même chunk, même modèle)
+        query_key = RerankScoreCache.query_key(query)                           # query_key : empreinte de la requête
+        model_key = f"{RERANK_MODEL_NAME}@{self.backend}"                       # model_key : un score ne vaut que pour le modèle qui l'a produit
+        chunk_scores = self.score_cache.get_many(query_key, [result.chunk.id for result in results], model_key) # chunk_scores : id chunk -> score
+        misses = list({result.chunk.id: result for result in results if result.chunk.id not in chunk_scores}.values()) # misses : candidats à noter (sans doublon)
+        metrics.incr("rerank.cache_hits", len(chunk_scores))                    # metrics.incr : paires évitées
+
+        # 2. Calculer les nouveaux scores de pertinence des paires absentes du cache - Le modèle donne un score de 0 à 1 (ou plus, selon le modèle) indiquant la pertinence
+        if misses:                                                              # if : au moins une paire inconnue
+            pairs = [(query, result.chunk.text) for result in misses]           # pairs : paires (requête, document), format requis par le CrossEncoder
+            new_scores = self.predict(pairs)                                    # new_scores : scores de pertinence | self.predict(...) : appel au Reranker (lots triés par longueur, tronqués à RERANK_MAX_LENGTH)
+            computed = {result.chunk.id: float(score) for result, score in zip(misses, new_scores)} # computed : id chunk -> score | float(...) : extraction de la valeur Python native
+            self.score_cache.put_many(query_key, computed, model_key)           # put_many : mise en cache
+            chunk_scores.update(computed)                                       # chunk_scores : tous les scores
+        return chunk_scores                                                     # return : score de chaque candidat
+
+    # Étape 3.1 quater — Cascade : étage cosinus, puis CrossEncoder sur la bande incertaine avec arrêt anticipé
+    def cascade_scores(self, query: str, results: Sequence[SearchResult], query_vector: Sequence[float], margin: float = RERANK_CASCADE_MARGIN, gap: float = RERANK_CASCADE_GAP) -> Dict[str, float]: # def : méthode | cascade_scores : scores d'une partie seulement des candidats | query_vector : vecteur de la requête | margin, gap : bande incertaine et écart d'arrêt | -> : retour | id chunk -> score
+        """Trie par cosinus (vecteurs stockés), écarte les candidats loin sous le k-ième, puis note la bande par lots jusqu'à ce que le top-k soit acquis."""
+        query_vector = np.asarray(query_vector, dtype=np.float32)               # query_vector : vecteur numpy
+        vectors = np.asarray([result.chunk.vector for result in results], dtype=np.float32) # vectors : vecteurs des candidats (déjà en mémoire)
+        cheap = vectors @ query_vector / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector) + 1e-12) # cheap : cosinus bi-encodeur (un produit matrice-vecteur)
+        order = np.argsort(-cheap, kind="stable")                               # order : candidats du plus au moins proche
+        k = min(RERANK_TOP_K, len(results))                                     # k : taille du contexte final à garantir
+        floor = cheap[order[k - 1]] - margin                                    # floor : bas de la bande incertaine
+        band = [results[i] for i in order if cheap[i] >= floor]                 # band : candidats qui peuvent encore entrer dans le top-k
+
+        chunk_scores: Dict[str, float] = {}                                     # chunk_scores : scores CrossEncoder obtenus
+        for start in range(0, len(band), RERANK_CASCADE_BATCH):                 # for : lots successifs, du plus au moins proche
+            batch_scores = self._score(query, band[start:start + RERANK_CASCADE_BATCH]) # batch_scores : scores du lot (cache compris)
+            chunk_scores.update(batch_scores)                                   # chunk_scores : cumul
+            if len(chunk_scores) >= k and start + RERANK_CASCADE_BATCH < len(band): # if : top-k rempli et candidats restants
+                kth = sorted(chunk_scores.values(), reverse=True)[k - 1]        # kth : k-ième meilleur score
+                if kth - max(batch_scores.values()) >= gap:                     # if : le dernier lot est loin sous le top-k -> les suivants (moins proches) aussi
+                    metrics.incr("rerank.cascade_early_stops")                  # metrics.incr : arrêt anticipé
+                    break                                                       # break : top-k considéré comme acquis
+        metrics.incr("rerank.cascade_pairs_saved", len({result.chunk.id for result in results}) - len(chunk_scores)) # metrics.incr : paires non envoyées au CrossEncoder
+        return chunk_scores                                                     # return : scores des candidats notés
 
     # Étape 3.2 — Méthode de Reranking
-    def rerank(self, query: str, results: List[SearchResult]) -> List[SearchResult]: # def : définir la méthode | rerank : fonction principale de réévaluation | results : liste des SearchResult trouvés | -> : retour | List[SearchResult] : liste affinée
+    def rerank(self, query: str, results: List[SearchResult], top_k: Optional[int] = None, query_vector: Optional[Sequence[float]] = None) -> List[SearchResult]: # def : définir la méthode | rerank : fonction principale de réévaluation | results : liste des SearchResult trouvés | top_k : nombre gardé (défaut : RERANK_TOP_K, len(results) pour tout garder) | query_vector : vecteur de la requête (active la cascade si RERANK_CASCADE) | -> : retour | List[SearchResult] : liste affinée
         """
         Réévalue une liste de SearchResult par rapport à la requête en utilisant un modèle Reranker.
         """
+        top_k = top_k or RERANK_TOP_K                                           # top_k : taille de la liste renvoyée
         if not self.model or not results:                                       # if : si le modèle n'est pas chargé OU la liste est vide
-            logger.warning("Reranker is inactive or no results to process.")     # logger.warning : on prévient
-            return results[:RERANK_TOP_K]                                       # return : renvoyer les premiers résultats sans modification
-
-        # 1. Préparer les paires (Requête, Document) pour le modèle
-        pairs = [                                                               # pairs : liste des paires (requête, document)
-            (query, result.chunk.text)                                          # (query, result.chunk.text) : format requis par le CrossEncoder
-            for result in results                                               # for result in results : pour chaque document trouvé
-        ]                                                                       # ] : fin de la liste
+            logger.warning("Reranker is inactive or no results to process.")    # logger.warning : on prévient
+            return results[:top_k]                                              # return : renvoyer les premiers résultats sans modification
 
-        # 2. Calculer les nouveaux scores de pertinence - Le modèle donne un score de 0 à 1 (ou plus, selon le modèle) indiquant la pertinence
-        new_scores = self.model.predict(pairs, show_progress_bar=False)         # new_scores : scores de pertinence | self.model.predict(...) : appel au Reranker | show_progress_bar=False : désactiver la barre de chargement
+        # 1-2. Scores de pertinence : cascade (bande incertaine seulement) ou tous les candidats
+        if RERANK_CASCADE and query_vector is not None and all(result.chunk.vector for result in results): # if : cascade activée et vecteurs disponibles
+            chunk_scores = self.cascade_scores(query, results, query_vector)    # chunk_scores : candidats de la bande incertaine
+        else:                                                                   # else : reranking complet
+            chunk_scores = self._score(query, results)                          # chunk_scores : tous les candidats
 
-        # 3. Mettre à jour les scores et coupler résultats/scores
-        scored_results = []                                                     # scored_results : liste temporaire pour le tri
-        for i, score in enumerate(new_scores):                                  # for : boucle sur les nouveaux scores
-            result = results[i]                                                 # result : résultat original
-            result.score = score.item()                                         # result.score : mise à jour du score | .item() : extraction de la valeur Python native
-            scored_results.append(result)                                       # scored_results.append(...) : ajout à la liste
+        # 3. Copier les résultats avec leurs nouveaux scores - les objets reçus ne sont pas modifiés (ils peuvent être partagés entre requêtes)
+        scored_results = [result.model_copy(update={"score": chunk_scores[result.chunk.id]}) for result in results if result.chunk.id in chunk_scores] # scored_results : copies notées
 
         # 4. Trier les résultats par le nouveau score (du plus pertinent au moins)
         scored_results.sort(key=lambda x: x.score, reverse=True)                # scored_results.sort(...) : tri de la liste | key=lambda x: x.score : clé de tri est le nouveau score | reverse=True : tri descendant
 
         # 5. Limiter et renvoyer le TOP-K final
-        final_results = scored_results[:RERANK_TOP_K]                           # final_results : les RERANK_TOP_K premiers
+        final_results = scored_results[:top_k]                                  # final_results : les top_k premiers
         logger.info(f"Reranked and kept top {len(final_results)} results.")     # logger.info : confirmation du nombre final
         
         # On met à jour les rangs après le tri
@@ -0,0 +1,64 @@
+# Objectif — Cache des résultats de recherche : vecteur de la requête -> chunks retenus par le reranker, pour qu'une question reformulée saute HyDE, la recherche et le reranking même quand sa réponse n'est pas réutilisable
+
+# Étape 1 — Importer les dépendances
+import threading                                                                # import : charger le module standard | threading : verrou du cache
+from collections import OrderedDict                                             # from : importer depuis collections | OrderedDict : cache LRU des résultats
+from typing import List, Optional, Sequence, Tuple                              # from : importer depuis le typage | typing : module types | List, Optional, Sequence, Tuple : types génériques
+import numpy as np                                                              # import : charger le module de calcul | numpy : similarité cosinus avec toutes les requêtes en cache
+from src.core.config import RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_THRESHOLD     # from : importer les constantes | src.core.config : capacité et seuil du cache
+from src.core.metrics import metrics                                            # from : importer le registre | src.core.metrics : hits / misses du cache
+from src.core.schemas import SearchResult                                       # from : importer le schéma | src.core.schemas : résultats reranqués mémorisés
+
+# Étape 2 — Définir le cache
+class RetrievalResultCache:                                                     # class : définir une classe | RetrievalResultCache : (collection, vecteur de requête) -> (ids des chunks, scores)
+    """Cache LRU en mémoire, par collection : une entrée n'est servie que pour la version du corpus sur laquelle elle a été calculée."""
+
+    def __init__(self, threshold: float = RETRIEVAL_CACHE_THRESHOLD, max_entries: int = RETRIEVAL_CACHE_SIZE): # def : constructeur | threshold : similarité cosinus minimale | max_entries : capacité (0 = désactivé)
+        self.threshold = threshold                                              # self.threshold : seuil propre (plus souple que celui des réponses)
+        self.max_entries = max_entries                                          # self.max_entries : capacité LRU
+        self._entries: "OrderedDict[int, Tuple[str, np.ndarray, int, List[str], List[float]]]" = OrderedDict() # self._entries : n° -> (collection, vecteur, version, ids, scores)
+        self._next_id = 0                                                       # self._next_id : numéro de la prochaine entrée
+        self._lock = threading.Lock()                                           # self._lock : protège le cache (sessions Streamlit parallèles)
+
+    # Étape 2.1 — Relire les chunks d'une requête proche
+    def lookup(self, collection: str, query_vector: np.ndarray, corpus_version: int) -> Optional[Tuple[List[str], List[float]]]: # def : méthode | lookup : chunks d'une requête voisine | -> : retour | (ids, scores) ou None
+        """Retourne les ids et scores reranqués de la requête en cache la plus proche (cosinus >= threshold), sinon None."""
+        if self.max_entries <= 0:                                               # if : cache désactivé
+            return None                                                         # return : rien en cache
+        query = np.asarray(query_vector, dtype=np.float32)                      # query : vecteur float32
+        query = query / max(float(np.linalg.norm(query)), 1e-12)                # query : normalisé (cosinus = produit scalaire)
+        with self._lock:                                                        # with : section critique
+            stale = [key for key, entry in self._entries.items() if entry[0] == collection and entry[2] != corpus_version] # stale : entrées calculées sur un autre corpus
+            for key in stale:                                                   # for : chaque entrée périmée
+                del self._entries[key]                                          # del : retrait
+            keys = [key for key, entry in self._entries.items() if entry[0] == collection] # keys : entrées de la collection
+            if keys:                                                            # if : au moins une requête en cache
+                similarities = np.stack([self._entries[key][1] for key in keys]) @ query # similarities : un GEMV sur au plus max_entries vecteurs
+                best = int(np.argmax(similarities))                             # best : requête la plus proche
+                if similarities[best] >= self.threshold:                        # if : assez proche
+                    self._entries.move_to_end(keys[best])                       # move_to_end : entrée la plus récente (LRU)
+                    _, _, _, ids, scores = self._entries[keys[best]]            # ids, scores : résultats mémorisés
+                    metrics.incr("retrieval_cache.hits")                        # metrics.incr : HyDE, recherche et reranking évités
+                    return list(ids), list(scores)                              # return : copies
+        metrics.incr("retrieval_cache.misses")                                  # metrics.incr : pipeline complet
+        return None                                                             # return : rien d'assez proche
+
+    # Étape 2.2 — Mémoriser les chunks retenus
+    def put(self, collection: str, query_vector: np.ndarray, results: Sequence[SearchResult], corpus_version: int): # def : méthode | put : mémoriser le contexte reranqué d'une requête
+        if self.max_entries <= 0 or not results:                                # if : cache désactivé ou aucun résultat
+            return                                                              # return : rien à mémoriser
+        vector = np.asarray(query_vector, dtype=np.float32)                     # vector : vecteur float32
+        vector = vector / max(float(np.linalg.norm(vector)), 1e-12)             # vector : normalisé une fois pour toutes
+        with self._lock:                                                        # with : section critique
+            self._entries[self._next_id] = (collection, vector, corpus_version, [r.chunk.id for r in results], [float(r.score) for r in results]) # mise en cache
+            self._next_id += 1                                                  # _next_id : numéro suivant
+            while len(self._entries) > self.max_entries:                        # while : cache plein
+                self._entries.popitem(last=False)                               # popitem(last=False) : retirer l'entrée la plus ancienne
+
+    def clear(self, collection: Optional[str] = None):                          # def : méthode | clear : oublier une collection (ou tout le cache)
+        with self._lock:                                                        # with : section critique
+            for key in [key for key, entry in self._entries.items() if collection is None or entry[0] == collection]: # for : entrées concernées
+                del self._entries[key]                                          # del : retrait
+
+    def __len__(self) -> int:                                                   # def : méthode spéciale | __len__ : nombre d'entrées
+        return len(self._entries)                                               # return : taille du cache
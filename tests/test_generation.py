@@ -0,0 +1,314 @@
+# Objectif — Tester les composants de Génération (état KV du prompt système, pool de moteurs, décodage par lots) sans charger de modèle GGUF.
+
+# Étape 1 — Importer les dépendances et les outils du projet
+import pickle                                                                   # import : charger le module standard | pickle : écrire un état KV persisté à la main
+import threading                                                                # import : charger le module standard | threading : verrou du moteur, threads du pool
+from types import SimpleNamespace                                               # from : importer depuis types | SimpleNamespace : structures llama.cpp simulées
+import time                                                                     # import : charger le module standard | time : attente de la mise en file
+import pytest                                                                   # import : charger le framework de test | pytest : vérifier les erreurs levées
+import numpy as np                                                              # import : charger le module de calcul | numpy : tokens et logits simulés
+from llama_cpp import LlamaState                                                # from : importer l'état | llama_cpp : état KV sérialisable
+import src.generation.batch_scheduler as batch_scheduler_module                 # import : charger le module | batch_scheduler_module : API llama.cpp remplacée
+from src.generation.batch_scheduler import BatchScheduler                       # from : importer l'ordonnanceur | src.generation.batch_scheduler : décodage par lots
+import src.generation.llm_engine as llm_engine_module                           # import : charger le module | llm_engine_module : dossier des états KV redirigé
+from src.core.metrics import metrics                                            # from : importer le registre | src.core.metrics : compteurs du pool
+from src.generation.llm_engine import LLMEngine                                 # from : importer le moteur | src.generation.llm_engine : moteur llama.cpp
+import src.generation.llm_pool as llm_pool_module                               # import : charger le module | llm_pool_module : affinité CPU simulée
+from src.generation.llm_pool import LLMOverloadedError, LLMPool, QUEUE_FULL_MESSAGE # from : importer le pool | src.generation.llm_pool : file bornée et refus
+import src.generation.speculative as speculative_module                         # import : charger le module | speculative_module : dossier des modèles et Llama remplacés
+from src.generation.speculative import ModelDraft, PromptLookupDraft, TrackedDraft, make_draft_model # from : importer les brouillons | src.generation.speculative : décodage spéculatif
+
+# Étape 2 — Faux modèle llama.cpp : un prefill écrit ses tokens, save_state / load_state copient le contexte
+class FakeLlama:                                                                # class : définir une classe | FakeLlama : contexte llama.cpp simulé
+    n_batch = 512                                                               # n_batch : fait partie de la clé du fichier d'état
+
+    def __init__(self, reject_state: bool = False):                             # def : constructeur | reject_state : load_state refuse tout état (autre version de llama.cpp)
+        self.input_ids = np.zeros(64, dtype=np.intc)                            # input_ids : tokens du contexte
+        self.n_tokens = 0                                                       # n_tokens : tokens évalués
+        self.prefills = 0                                                       # prefills : nombre de prefills du bloc système
+        self.saves = 0                                                          # saves : nombre d'états produits
+        self.reject_state = reject_state                                        # reject_state : comportement de load_state
+
+    def reset(self):                                                            # def : méthode | reset : contexte vide
+        self.n_tokens = 0                                                       # n_tokens : remis à zéro
+
+    def eval(self, tokens):                                                     # def : méthode | eval : prefill
+        self.input_ids[self.n_tokens:self.n_tokens + len(tokens)] = tokens      # input_ids : tokens écrits dans le contexte
+        self.n_tokens += len(tokens)                                            # n_tokens : avancée
+        self.prefills += 1                                                      # prefills : compteur
+
+    def save_state(self) -> LlamaState:                                         # def : méthode | save_state : état du contexte | -> : retour | LlamaState
+        self.saves += 1                                                         # saves : compteur (sert de graine pour distinguer les états)
+        return LlamaState(input_ids=self.input_ids.copy(), scores=np.ones((4, 8), dtype=np.float32), n_tokens=self.n_tokens, # LlamaState : tokens + logits
+                          llama_state=b"kv", llama_state_size=2, seed=self.saves) # llama_state : octets KV simulés | seed : numéro de l'état
+
+    def load_state(self, state: LlamaState):                                    # def : méthode | load_state : restaurer un état
+        if self.reject_state:                                                   # if : état refusé
+            raise RuntimeError("Failed to set llama state data")                # raise : message de llama-cpp-python
+        self.input_ids, self.n_tokens = state.input_ids.copy(), state.n_tokens  # restauration
+
+def make_engine(model: FakeLlama) -> LLMEngine:                                 # def : définir la fonction | make_engine : moteur sans fichier GGUF | -> : retour | LLMEngine
+    engine = LLMEngine.__new__(LLMEngine)                                       # engine : constructeur sauté
+    engine._lock, engine.model, engine.system_prompt = threading.Lock(), model, "SYS" # état minimal de warm_prefix
+    engine._prefix_tokens, engine._prefix_state = [7, 8, 9, 10], None           # _prefix_tokens : bloc système déjà tokenisé
+    return engine                                                               # return : moteur prêt
+
+# Étape 3 — Test de l'état KV persisté (réutilisé, ou supprimé et recalculé s'il est inutilisable)
+def test_warm_prefix_reuses_valid_state_and_recomputes_unusable_ones(tmp_path, monkeypatch): # def : définir la fonction de test
+    """Vérifie qu'un état valide évite le prefill, et qu'un état aux tokens différents ou refusé par load_state est remplacé."""
+    monkeypatch.setattr(llm_engine_module, "LLM_PREFIX_CACHE_DIR", tmp_path)    # LLM_PREFIX_CACHE_DIR : états dans un dossier temporaire
+    engine = make_engine(FakeLlama())                                           # engine : premier démarrage
+    engine.warm_prefix()                                                        # warm_prefix : prefill puis écriture du fichier
+    path = engine._prefix_path()                                                # path : fichier d'état
+    assert engine.model.prefills == 1 and path.exists()                         # assert : état calculé et persisté
+    assert engine._prefix_state.scores.shape == (1, 8)                          # assert : seule la dernière ligne de logits est gardée
+
+    engine = make_engine(FakeLlama())                                           # engine : redémarrage
+    engine.warm_prefix()                                                        # warm_prefix : relecture du fichier
+    assert engine.model.prefills == 0 and engine._prefix_state.n_tokens == 4    # assert : aucun prefill
+
+    stale = LlamaState(input_ids=np.array([1, 2, 3, 4], dtype=np.intc), scores=np.ones((1, 8), dtype=np.float32), n_tokens=4, # stale : état d'un autre tokenizer
+                       llama_state=b"kv", llama_state_size=2, seed=-1)          # seed : -1 = état périmé
+    path.write_bytes(pickle.dumps(stale))                                       # write_bytes : fichier périmé
+    engine = make_engine(FakeLlama())                                           # engine : redémarrage après mise à jour du modèle
+    engine.warm_prefix()                                                        # warm_prefix : tokens différents -> recalcul
+    assert engine.model.prefills == 1 and pickle.loads(path.read_bytes()).seed == 1 # assert : fichier périmé supprimé puis réécrit avec le nouvel état
+
+    def read_only_disk(*args, **kwargs):                                        # def : fonction locale | read_only_disk : écriture de l'état impossible
+        raise OSError("Read-only file system")                                  # raise : disque en lecture seule
+    monkeypatch.setattr(llm_engine_module.pickle, "dump", read_only_disk)       # pickle.dump : le nouvel état ne peut pas être persisté
+    engine = make_engine(FakeLlama(reject_state=True))                          # engine : llama.cpp refuse l'état (taille différente)
+    engine.warm_prefix()                                                        # warm_prefix : load_state lève -> suppression puis recalcul
+    assert engine.model.prefills == 1 and engine._prefix_state is not None      # assert : état recalculé et gardé en RAM
+    assert list(tmp_path.iterdir()) == []                                       # assert : fichier refusé supprimé, aucun fichier partiel laissé
+
+# Étape 4 — Faux moteur pour le pool : chaque génération attend le feu vert du test
+class BlockingEngine:                                                           # class : définir une classe | BlockingEngine : LLMEngine simulé (aucun modèle)
+    concurrency = 1                                                             # concurrency : un thread du pool
+
+    def __init__(self):                                                         # def : constructeur
+        self.started = threading.Event()                                        # started : une génération occupe l'instance
+        self.release = threading.Event()                                        # release : fin des générations autorisée
+        self.prompts = []                                                       # prompts : générations réellement exécutées
+
+    def generate(self, prompt, **kwargs):                                       # def : méthode | generate : bloque jusqu'à release
+        self.prompts.append(prompt)                                             # append : génération exécutée
+        self.started.set()                                                      # set : instance occupée
+        self.release.wait(5)                                                    # wait : génération en cours
+        return f"answer to {prompt}"                                            # return : texte généré
+
+    def generate_stream(self, prompt, **kwargs):                                # def : méthode | generate_stream : un seul morceau
+        yield self.generate(prompt)                                             # yield : texte généré
+
+def run_in_thread(target, *args, **kwargs) -> dict:                             # def : définir la fonction | run_in_thread : appel bloquant en arrière-plan | -> : retour | dict : résultat
+    result = {}                                                                 # result : valeur de retour (clé "value")
+    thread = threading.Thread(target=lambda: result.setdefault("value", target(*args, **kwargs)), daemon=True) # thread : appel bloquant
+    thread.start()                                                              # start : lancement
+    result["thread"] = thread                                                   # thread : à attendre avec join
+    return result                                                               # return : résultat à venir
+
+# Étape 5 — Test des tranches de cœurs
+def test_core_slices_are_disjoint_or_disabled_when_they_do_not_fit(monkeypatch): # def : définir la fonction de test
+    """Vérifie que chaque instance reçoit sa tranche de cœurs autorisés, et qu'aucune n'est épinglée si elles ne tiennent pas toutes."""
+    monkeypatch.setattr(llm_pool_module.os, "sched_getaffinity", lambda pid: {8, 9, 10, 11, 12, 13}, raising=False) # sched_getaffinity : 6 cœurs autorisés (taskset)
+    assert llm_pool_module.core_slices(2, 3) == [[8, 9, 10], [11, 12, 13]]      # assert : tranches consécutives et disjointes
+    assert llm_pool_module.core_slices(3, 2) == [[8, 9], [10, 11], [12, 13]]    # assert : trois instances de deux cœurs
+    assert llm_pool_module.core_slices(2, 4) == [[], []]                        # assert : 8 cœurs demandés pour 6 -> pas d'épinglage
+
+# Étape 6 — Test du refus quand la file est pleine et de l'échéance dépassée pendant l'attente
+def test_pool_rejects_when_queue_is_full_and_skips_interrupted_queued_generations(): # def : définir la fonction de test
+    """Vérifie que la file pleine lève LLMOverloadedError (compté dans llm_pool.rejected) et qu'une génération interrompue dans la file n'est pas exécutée."""
+    engine = BlockingEngine()                                                   # engine : instance unique
+    pool = LLMPool([engine], queue_size=1, queue_timeout=0.05)                  # pool : une génération en cours + une en attente au plus
+    first = run_in_thread(pool.generate, "first")                               # first : occupe l'instance
+    assert engine.started.wait(5)                                               # assert : génération en cours
+    stop_event = threading.Event()                                              # stop_event : échéance HyDE
+    queued = run_in_thread(pool.generate, "queued", metric_prefix="hyde", stop_event=stop_event) # queued : remplit la file
+    while pool._queue.qsize() < 1:                                              # while : attendre que la génération soit en file
+        time.sleep(0.001)                                                       # sleep : courte attente
+
+    rejected = metrics.snapshot()["counters"].get("llm_pool.rejected", 0)       # rejected : compteur avant le refus
+    with pytest.raises(LLMOverloadedError) as error:                            # pytest.raises : file pleine au-delà de queue_timeout
+        pool.generate("overflow")                                               # generate : refusée
+    assert str(error.value) == QUEUE_FULL_MESSAGE                               # assert : message montré à l'utilisateur
+    with pytest.raises(LLMOverloadedError):                                     # pytest.raises : même refus en streaming
+        next(pool.generate_stream("overflow"))                                  # next : relevée à la première itération
+    assert metrics.snapshot()["counters"]["llm_pool.rejected"] == rejected + 2  # assert : refus comptés
+
+    interrupted = metrics.snapshot()["counters"].get("hyde.interrupted", 0)     # interrupted : compteur avant l'arrêt
+    stop_event.set()                                                            # set : échéance dépassée pendant l'attente
+    engine.release.set()                                                        # release : fin de la première génération
+    first["thread"].join(5)                                                     # join : attendre la première génération
+    queued["thread"].join(5)                                                    # join : attendre la génération en file
+    assert first["value"] == "answer to first" and queued["value"] == ""        # assert : génération en file abandonnée
+    assert engine.prompts == ["first"]                                          # assert : le moteur n'a jamais reçu la génération interrompue
+    assert metrics.snapshot()["counters"]["hyde.interrupted"] == interrupted + 1 # assert : abandon compté
+
+# Étape 7 — Faux contexte llama.cpp pour l'ordonnanceur par lots : le cache KV est une liste de tokens par séquence
+class FakeBatch:                                                                # class : définir une classe | FakeBatch : LlamaBatch simulé
+    def __init__(self, n_tokens, embd, n_seq_max, verbose):                     # def : constructeur | n_tokens : capacité du lot
+        self.batch = SimpleNamespace(token=[0] * n_tokens, pos=[0] * n_tokens, n_seq_id=[0] * n_tokens, # batch : structure llama_batch
+                                     seq_id=[[0] for _ in range(n_tokens)], logits=[False] * n_tokens, n_tokens=0) # seq_id : une séquence par token
+
+    def reset(self):                                                            # def : méthode | reset : lot vide
+        self.batch.n_tokens = 0                                                 # n_tokens : remis à zéro
+
+class FakeContext:                                                              # class : définir une classe | FakeContext : LlamaContext simulé
+    gate = None                                                                 # gate : si défini, la création du contexte attend ce feu vert (requêtes accumulées dans la file)
+    fail = False                                                                # fail : la création du contexte échoue (mémoire insuffisante)
+
+    def __init__(self, model, params, verbose):                                 # def : constructeur
+        if FakeContext.fail:                                                    # if : échec demandé
+            raise RuntimeError("Failed to create llama_context")                # raise : message de llama-cpp-python
+        if FakeContext.gate is not None:                                        # if : démarrage retenu
+            FakeContext.gate.wait(5)                                            # wait : feu vert du test
+        self.kv, self.steps, self.copies, self.removed = {}, [], [], []         # kv : tokens par séquence | steps : séquences de chaque pas | copies, removed : appels au cache KV
+
+    def decode(self, batch):                                                    # def : méthode | decode : écrire les tokens du lot dans le cache KV
+        b = batch.batch                                                         # b : structure llama_batch
+        for j in range(b.n_tokens):                                             # for : chaque token du lot
+            kv = self.kv.setdefault(b.seq_id[j][0], [])                         # kv : cache de la séquence
+            assert b.pos[j] == len(kv)                                          # assert : positions contiguës (bloc système copié compris)
+            kv.append(b.token[j])                                               # append : token évalué
+        self.steps.append({b.seq_id[j][0] for j in range(b.n_tokens)})          # steps : séquences décodées ensemble
+        time.sleep(0.001)                                                       # sleep : un pas prend du temps
+
+    def kv_cache_seq_cp(self, src, dst, p0, p1):                                # def : méthode | kv_cache_seq_cp : partager un préfixe
+        self.copies.append((src, dst, p0, p1))                                  # copies : appel mémorisé
+        self.kv[dst] = list(self.kv[src][p0:p1])                                # kv : préfixe copié
+
+    def kv_cache_seq_rm(self, seq_id, p0, p1):                                  # def : méthode | kv_cache_seq_rm : vider une séquence
+        self.removed.append(seq_id)                                             # removed : appel mémorisé
+        self.kv[seq_id] = []                                                    # kv : séquence vidée
+
+class FakeSampler:                                                              # class : définir une classe | FakeSampler : LlamaSampler simulé (tokens 101, 102, ...)
+    def __init__(self):                                                         # def : constructeur
+        self.calls = 0                                                          # calls : tokens échantillonnés
+
+    def __getattr__(self, name):                                                # def : méthode spéciale | __getattr__ : add_top_k, add_temp... sans effet
+        return lambda *args: None                                               # return : réglage ignoré
+
+    def sample(self, ctx, index):                                               # def : méthode | sample : token suivant
+        self.calls += 1                                                         # calls : un de plus
+        return 100 + self.calls                                                 # return : jamais de fin de génération (max_tokens ou annulation)
+
+    def close(self):                                                            # def : méthode | close : rien à libérer
+        pass                                                                    # pass : aucun effet
+
+@pytest.fixture                                                                 # @pytest.fixture : ordonnanceur branché sur le faux contexte
+def scheduler(monkeypatch):                                                     # def : définir la fonction | scheduler : BatchScheduler de 2 places, bloc système [1, 2, 3]
+    fake_llama_cpp = SimpleNamespace(llama_context_params=SimpleNamespace(from_buffer_copy=lambda params: SimpleNamespace()), # fake_llama_cpp : API C simulée
+                                     LLAMA_DEFAULT_SEED=0, llama_vocab_is_eog=lambda vocab, token: False) # llama_vocab_is_eog : fin par max_tokens seulement
+    monkeypatch.setattr(batch_scheduler_module, "llama_cpp", fake_llama_cpp)    # llama_cpp : aucun appel natif
+    monkeypatch.setattr(batch_scheduler_module, "LlamaBatch", FakeBatch)        # LlamaBatch : lot simulé
+    monkeypatch.setattr(batch_scheduler_module, "LlamaContext", FakeContext)    # LlamaContext : contexte simulé
+    monkeypatch.setattr(batch_scheduler_module, "LlamaSampler", FakeSampler)    # LlamaSampler : échantillonneur simulé
+    monkeypatch.setattr(FakeContext, "gate", None)                              # gate : démarrage immédiat par défaut
+    monkeypatch.setattr(FakeContext, "fail", False)                             # fail : contexte créé par défaut
+    llama = SimpleNamespace(n_batch=16, context_params=None, _model=SimpleNamespace(vocab=None), # llama : poids et tokenizer simulés
+                            detokenize=lambda tokens: f"<{tokens[0]}>".encode("utf-8")) # detokenize : texte lisible par token
+    return BatchScheduler(llama, n_seq=2, prefix_tokens=[1, 2, 3], n_ctx=512)   # return : ordonnanceur (thread démarré à la première requête)
+
+# Étape 8 — Test de l'admission dans le lot et du partage du bloc système
+def test_batch_scheduler_admits_up_to_n_seq_and_shares_the_system_prefix(scheduler): # def : définir la fonction de test
+    """Vérifie que deux requêtes sont décodées ensemble (la troisième attend une place), que le bloc système est copié et que chaque séquence est vidée à la fin."""
+    FakeContext.gate = threading.Event()                                        # gate : les requêtes s'accumulent avant le premier pas
+    results = [run_in_thread(lambda tokens: "".join(scheduler.stream(tokens, 2, system=True)), [1, 2, 3, 10 + i]) for i in range(3)] # results : trois réponses RAG simultanées
+    while scheduler._pending.qsize() < 3:                                       # while : attendre les trois requêtes dans la file
+        time.sleep(0.001)                                                       # sleep : courte attente
+    FakeContext.gate.set()                                                      # set : contexte prêt
+    for result in results:                                                      # for : chaque requête
+        result["thread"].join(5)                                                # join : attendre la réponse
+
+    ctx = scheduler._ctx                                                        # ctx : faux contexte
+    assert [result["value"] for result in results] == ["<101><102>"] * 3        # assert : chaque séquence a son échantillonneur et sa limite
+    assert ctx.steps[0] == {2} and ctx.kv[2] == [1, 2, 3]                       # assert : bloc système calculé une fois dans la séquence réservée
+    assert max(len(step) for step in ctx.steps) == 2 and {0, 1} in ctx.steps    # assert : deux séquences par pas au plus, décodées ensemble
+    assert len(ctx.copies) == 3 and {(src, p0, p1) for src, _, p0, p1 in ctx.copies} == {(2, 0, 3)} # assert : bloc système (séquence 2, positions 0-3) copié pour chaque réponse RAG
+    assert sorted(ctx.removed) == sorted(dst for _, dst, _, _ in ctx.copies)    # assert : chaque séquence terminée est vidée
+
+    assert "".join(scheduler.stream([4, 5], 1, system=False)) == "<101>"        # assert : génération sans bloc système (HyDE)
+    assert len(ctx.copies) == 3                                                 # assert : aucune copie du bloc système
+
+# Étape 9 — Test de l'abandon d'un flux (place libérée au pas suivant)
+def test_batch_scheduler_frees_an_abandoned_sequence(scheduler):                # def : définir la fonction de test
+    """Vérifie qu'un flux fermé en cours de décodage vide sa séquence et compte l'interruption."""
+    interrupted = metrics.snapshot()["counters"].get("cancel.interrupted", 0)   # interrupted : compteur avant l'abandon
+    stream = scheduler.stream([4, 5], 10_000, metric_prefix="cancel")           # stream : génération sans fin prévue
+    assert next(stream) == "<101>"                                              # assert : premier token rendu
+    stream.close()                                                              # close : le consommateur arrête de lire
+    deadline = time.monotonic() + 5                                             # deadline : attente maximale
+    while not scheduler._ctx.removed and time.monotonic() < deadline:           # while : attendre le pas suivant
+        time.sleep(0.001)                                                       # sleep : courte attente
+    assert len(scheduler._ctx.removed) == 1 and scheduler._ctx.kv[scheduler._ctx.removed[0]] == []         # assert : séquence vidée
+    assert metrics.snapshot()["counters"]["cancel.interrupted"] == interrupted + 1 # assert : abandon compté
+
+# Étape 10 — Test de l'échec de création du contexte
+def test_batch_scheduler_raises_when_the_context_cannot_be_created(scheduler):  # def : définir la fonction de test
+    """Vérifie que les requêtes reçoivent une erreur (et non une réponse vide, qui serait mise en cache)."""
+    FakeContext.fail = True                                                     # fail : mémoire insuffisante
+    for _ in range(2):                                                          # for : première requête et suivantes
+        with pytest.raises(RuntimeError, match="Batch scheduler failed to start"): # pytest.raises : erreur relevée par le flux
+            list(scheduler.stream([4, 5], 5))                                   # list : consommer le flux
+
+# Étape 11 — Test du choix du brouillon selon LLM_DRAFT
+def test_make_draft_model_parses_the_spec(tmp_path, monkeypatch):               # def : définir la fonction de test
+    """Vérifie que "" désactive, que prompt_lookup ne charge rien, et qu'un GGUF n'est chargé que s'il existe et diffère du modèle cible."""
+    loaded = []                                                                 # loaded : chemins passés à Llama
+    def fake_llama(model_path, **kwargs):                                       # def : fonction | fake_llama : chargement simulé
+        if "broken" in model_path:                                              # if : fichier illisible
+            raise ValueError("Failed to load model from file")                  # raise : erreur de llama.cpp
+        loaded.append(model_path)                                               # append : chargement enregistré
+        return SimpleNamespace(path=model_path)                                 # return : faux modèle
+    monkeypatch.setattr(speculative_module, "Llama", fake_llama)                # setattr : aucun GGUF réel chargé
+    monkeypatch.setattr(speculative_module, "LLM_DIR", tmp_path)                # setattr : dossier des modèles redirigé
+    monkeypatch.setattr(speculative_module, "LLM_MODEL_FILE", "target.gguf")    # setattr : modèle cible
+    for name in ("target.gguf", "draft.gguf", "broken.gguf"):                   # for : fichiers présents
+        (tmp_path / name).write_bytes(b"GGUF")                                  # write_bytes : faux fichier
+
+    assert make_draft_model("") is None                                         # assert : décodage spéculatif désactivé
+    assert isinstance(make_draft_model("prompt_lookup"), PromptLookupDraft)     # assert : brouillon sans modèle
+    assert make_draft_model("off") is None and make_draft_model("missing.gguf") is None # assert : fichier absent -> génération classique
+    assert make_draft_model("target.gguf") is None                              # assert : le modèle cible ne se sert pas de brouillon
+    assert make_draft_model("broken.gguf") is None                              # assert : échec de chargement -> génération classique
+    assert loaded == []                                                         # assert : aucun modèle chargé jusqu'ici
+
+    draft = make_draft_model("draft.gguf")                                      # draft : petit modèle
+    assert isinstance(draft, ModelDraft) and draft.model.path == str(tmp_path / "draft.gguf") # assert : brouillon par petit modèle
+    assert loaded == [str(tmp_path / "draft.gguf")]                             # assert : chargé une seule fois
+
+# Étape 12 — Faux brouillon : propositions fixées à l'avance
+class ScriptedDraft(TrackedDraft):                                              # class : définir une classe | ScriptedDraft : brouillon dont les propositions sont connues
+    def __init__(self, proposals):                                              # def : constructeur | proposals : une proposition par appel
+        super().__init__(num_pred_tokens=3)                                     # super().__init__ : suivi de l'acceptation
+        self.proposals = list(proposals)                                        # self.proposals : propositions restantes
+
+    def propose(self, input_ids):                                               # def : méthode | propose : proposition suivante
+        return np.array(self.proposals.pop(0), dtype=np.intc)                   # return : tokens proposés
+
+# Étape 13 — Test du calcul de l'acceptation
+def test_tracked_draft_counts_accepted_tokens_until_the_first_mismatch():       # def : définir la fonction de test
+    """Vérifie les tokens proposés et acceptés : préfixe commun avec le brouillon, proposition vide, nouvelle génération sans mesure."""
+    def totals():                                                               # def : fonction | totals : nombre et somme des observations llm.draft_*
+        observations = metrics.snapshot()["observations"]                       # observations : agrégats du registre
+        return {name: (observations.get(name, {}).get("count", 0), observations.get(name, {}).get("total", 0.0)) for name in ("llm.draft_proposed_tokens", "llm.draft_accepted_tokens", "llm.draft_acceptance")} # return : (count, total) par métrique
+    def delta(before):                                                          # def : fonction | delta : observations depuis before
+        return {name: (count - before[name][0], total - before[name][1]) for name, (count, total) in totals().items()} # return : écarts
+
+    draft = ScriptedDraft([[7, 8, 9], [5, 6, 4], [], [1, 1, 1], [2, 2, 2]])     # draft : cinq pas
+    before = totals()                                                           # before : registre avant le test
+    assert draft(np.array([1, 2], dtype=np.intc)).tolist() == [7, 8, 9]         # assert : brouillon rendu à Llama.generate
+    assert delta(before) == {"llm.draft_proposed_tokens": (1, 3), "llm.draft_accepted_tokens": (0, 0), "llm.draft_acceptance": (0, 0)} # assert : premier pas -> rien à vérifier
+
+    before = totals()                                                           # before : deuxième pas
+    draft(np.array([1, 2, 7, 8, 5], dtype=np.intc))                             # appel : 7 et 8 gardés, 9 remplacé par 5
+    assert delta(before) == {"llm.draft_proposed_tokens": (1, 3), "llm.draft_accepted_tokens": (1, 2), "llm.draft_acceptance": (1, pytest.approx(2 / 3))} # assert : acceptation jusqu'au premier désaccord
+
+    before = totals()                                                           # before : troisième pas
+    draft(np.array([1, 2, 7, 8, 5, 5, 6, 4, 3], dtype=np.intc))                 # appel : brouillon entièrement accepté, proposition suivante vide
+    assert delta(before) == {"llm.draft_proposed_tokens": (0, 0), "llm.draft_accepted_tokens": (1, 3), "llm.draft_acceptance": (1, pytest.approx(1.0))} # assert : tout accepté, brouillon vide non compté
+
+    before = totals()                                                           # before : quatrième pas
+    draft(np.array([1, 2, 7, 8, 5, 5, 6, 4, 3, 0], dtype=np.intc))              # appel : pas de brouillon précédent à vérifier
+    draft(np.array([9, 9, 9], dtype=np.intc))                                   # appel : nouvelle génération (préfixe différent)
+    assert delta(before) == {"llm.draft_proposed_tokens": (2, 6), "llm.draft_accepted_tokens": (0, 0), "llm.draft_acceptance": (0, 0)} # assert : aucune acceptation mesurée hors de la même génération
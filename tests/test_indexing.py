@@ -0,0 +1,163 @@
+# Objectif — Tester les composants d'Indexation (écriture Arrow groupée, identifiants déterministes, collections, index en mémoire, shards) sans charger de modèle IA.
+
+# Étape 1 — Importer les dépendances et les outils du projet
+import pytest                                                                   # import : charger le framework de test | pytest : vérifier les erreurs levées
+import numpy as np                                                              # import : charger le module de calcul | numpy : vecteurs de test
+import lancedb                                                                  # import : charger la base | lancedb : table des documents dans un dossier temporaire
+import pyarrow as pa                                                            # import : charger le module | pyarrow : vérifier les types de colonnes
+from unittest.mock import MagicMock                                             # from : importer un outil de simulation | MagicMock : fausse table LanceDB
+from src.core.config import EMBEDDING_DIM                                       # from : importer la constante | src.core.config : dimension des vecteurs
+from src.core.schemas import Chunk, SourceMetadata, make_chunk_id               # from : importer les schémas | src.core.schemas : structures de données | make_chunk_id : identifiant déterministe
+from src.indexing.arrow_writer import ArrowBatchWriter, chunks_to_record_batch  # from : importer l'écrivain | src.indexing.arrow_writer : écriture Arrow
+from src.indexing.collection_registry import collection_table_name              # from : importer le nommage | src.indexing.collection_registry : collections nommées
+from src.indexing.doc_index import DocumentIndex, mean_document_vectors         # from : importer l'index des documents | src.indexing.doc_index : premier niveau de la recherche hiérarchique
+from src.indexing.memory_index import InMemoryIndex                             # from : importer l'index | src.indexing.memory_index : recherche exacte en mémoire
+from src.indexing.shards import merge_top_k, shard_for_source                   # from : importer le sharding | src.indexing.shards : routage et fusion
+import src.indexing.vector_store as vector_store_module                         # import : charger le module | vector_store_module : rediriger les shards vers un dossier temporaire
+
+# Étape 2 — Fonction utilitaire : créer des chunks de test
+def make_chunks(n: int, source: str = "doc.pdf"):                               # def : définir la fonction | make_chunks : n chunks simulés
+    metadata = SourceMetadata(source_type="test", source_path=source)           # metadata : source simulée
+    return [Chunk(text=f"Chunk {i}", metadata=metadata, chunk_index=i) for i in range(n)] # return : liste de Chunk
+
+def make_document(n: int, source: str):                                         # def : définir la fonction | make_document : n chunks aux ids déterministes (ingestion courante)
+    metadata = SourceMetadata(source_type="test", source_path=source)           # metadata : source simulée
+    return [Chunk(id=make_chunk_id(source, i), text=f"{source} part {i}", metadata=metadata, chunk_index=i) for i in range(n)] # return : liste de Chunk
+
+def open_store(tmp_path, monkeypatch, **kwargs):                                # def : définir la fonction | open_store : VectorStore dans un dossier temporaire
+    monkeypatch.setattr(vector_store_module, "shard_uri", lambda shard_id: str(tmp_path / f"shard_{shard_id}")) # shard_uri : bases LanceDB temporaires
+    embedder = MagicMock(model_name="test-embedder", dimension=EMBEDDING_DIM)   # embedder : faux FastEmbedder
+    embedder.embed_documents.side_effect = lambda texts: list(np.random.rand(len(texts), EMBEDDING_DIM)) # embed_documents : vecteurs aléatoires
+    return vector_store_module.VectorStore(embedder=embedder, num_shards=1, **kwargs) # return : collection vide
+
+# Étape 3 — Test de la conversion en RecordBatch
+def test_record_batch_has_fixed_size_float32_vectors():                         # def : définir la fonction de test
+    """Vérifie que la colonne vecteur est une liste de taille fixe float32 construite depuis numpy."""
+    batch = chunks_to_record_batch(make_chunks(3), np.random.rand(3, EMBEDDING_DIM)) # batch : conversion de 3 chunks
+
+    assert batch.num_rows == 3                                                  # assert : 3 lignes
+    assert batch.schema.field("vector").type == pa.list_(pa.float32(), EMBEDDING_DIM) # assert : type vecteur attendu par LanceDB
+    assert batch.column("source").to_pylist() == ["doc.pdf"] * 3                # assert : métadonnées aplaties
+
+# Étape 4 — Test des seuils de flush
+def test_writer_flushes_once_size_threshold_is_reached():                       # def : définir la fonction de test
+    """Vérifie que l'écrivain tamponne puis écrit en un seul `table.add` au seuil de taille."""
+    table = MagicMock()                                                         # table : fausse table LanceDB
+    writer = ArrowBatchWriter(table, flush_rows=5, flush_seconds=3600)          # writer : seuil de 5 lignes, pas de seuil de temps
+
+    assert writer.add(make_chunks(3), np.random.rand(3, EMBEDDING_DIM)) is False # assert : sous le seuil -> pas d'écriture
+    assert table.add.call_count == 0                                            # assert : rien n'a été écrit
+
+    assert writer.add(make_chunks(3), np.random.rand(3, EMBEDDING_DIM)) is True # assert : seuil atteint -> écriture
+    assert table.add.call_count == 1                                            # assert : une seule écriture pour les deux lots
+    assert table.add.call_args[0][0].num_rows == 6                              # assert : les 6 lignes sont dans la même écriture
+    assert writer.pending_rows == 0                                             # assert : tampon vidé
+
+def test_writer_flushes_on_timer_without_further_writes():                      # def : définir la fonction de test
+    """Vérifie que le seuil de temps écrit le tampon même si aucun lot n'arrive ensuite."""
+    table = MagicMock()                                                         # table : fausse table LanceDB
+    writer = ArrowBatchWriter(table, flush_rows=100, flush_seconds=0.05)        # writer : seuil de taille hors d'atteinte
+
+    assert writer.add(make_chunks(3), np.random.rand(3, EMBEDDING_DIM)) is False # assert : sous les seuils -> pas d'écriture immédiate
+    writer._timer.join(timeout=5)                                               # join : attendre la minuterie
+    assert table.add.call_count == 1                                            # assert : écrit par la minuterie
+    assert writer.pending_rows == 0                                             # assert : tampon vidé
+
+# Étape 5 — Test des identifiants déterministes (clé de l'upsert)
+def test_chunk_ids_are_deterministic_per_source_and_index():                    # def : définir la fonction de test
+    """Vérifie que la réindexation d'un même document produit les mêmes ids, et des ids distincts entre sources."""
+    assert make_chunk_id("/data/raw/doc.pdf", 3) == make_chunk_id("/data/raw/doc.pdf", 3) # assert : même source + même index -> même id
+    assert make_chunk_id("/data/raw/doc.pdf", 3) != make_chunk_id("/data/raw/doc.pdf", 4) # assert : index différent -> id différent
+    assert make_chunk_id("/data/raw/doc.pdf", 3) != make_chunk_id("/data/raw/other.pdf", 3) # assert : source différente -> id différent
+
+# Étape 6 — Test du nommage des collections
+def test_collection_table_names():                                              # def : définir la fonction de test
+    """Vérifie que la collection par défaut garde la table historique et que les noms invalides sont refusés."""
+    assert collection_table_name("default") == "vev_rag_data"                   # assert : rétrocompatibilité de la table historique
+    assert collection_table_name("Team A") == "vev_rag_team_a"                  # assert : nom normalisé -> table dédiée
+    with pytest.raises(ValueError):                                             # with pytest.raises : une erreur est attendue
+        collection_table_name("x'; DROP")                                       # collection_table_name(...) : nom refusé (sûr dans les filtres SQL)
+# Étape 7 — Test de l'index exact en mémoire
+def test_memory_index_search_upsert_and_delete():                               # def : définir la fonction de test
+    """Vérifie le top-k exact (format LanceDB), le remplacement par id et la suppression par source."""
+    index = InMemoryIndex(dim=4, initial_capacity=2)                            # index : petite capacité pour tester l'agrandissement
+    vectors = np.eye(4, dtype=np.float32)                                       # vectors : 4 vecteurs orthogonaux
+    payloads = [{"text": f"t{i}", "source": "a.pdf" if i < 2 else "b.pdf"} for i in range(4)] # payloads : deux sources
+    index.add([f"id{i}" for i in range(4)], vectors, payloads)                  # index.add : insertion
+
+    results = index.search(np.array([0.0, 0.0, 1.0, 0.1]), top_k=2)             # results : requête proche de id2
+    assert [r["id"] for r in results] == ["id2", "id3"]                         # assert : ordre exact par cosinus
+    assert results[0]["_distance"] == pytest.approx(2 - 2 / np.sqrt(1.01), abs=1e-5) # assert : distance L2² entre vecteurs normalisés
+
+    index.add(["id0"], np.array([[0.0, 0.0, 1.0, 0.0]]), [{"text": "t0", "source": "a.pdf"}]) # index.add : upsert de id0
+    assert len(index) == 4                                                      # assert : remplacement, pas de doublon
+    assert index.remove_source("b.pdf") == 2                                    # assert : deux chunks retirés
+    assert [r["id"] for r in index.search(np.array([0.0, 0.0, 1.0, 0.0]), top_k=5)] == ["id0", "id1"] # assert : seuls les chunks de a.pdf restent
+    assert index.search(np.ones(4), top_k=5, text_contains="t1")[0]["id"] == "id1" # assert : filtre sous-chaîne
+
+# Étape 8 — Test du routage et de la fusion des shards
+def test_shard_routing_and_heap_merge():                                        # def : définir la fonction de test
+    """Vérifie que le routage par source est stable et que la fusion garde le top-k global trié."""
+    assert shard_for_source("/data/raw/doc.pdf", 1) == 0                        # assert : shard unique
+    assert shard_for_source("/data/raw/doc.pdf", 4) == shard_for_source("/data/raw/doc.pdf", 4) # assert : routage déterministe
+    assert len({shard_for_source(f"doc-{i}.pdf", 4) for i in range(50)}) == 4   # assert : les documents se répartissent sur tous les shards
+
+    shard_a = [{"id": "a1", "_distance": 0.1}, {"id": "a2", "_distance": 0.5}]  # shard_a : résultats triés du shard A
+    shard_b = [{"id": "b1", "_distance": 0.2}, {"id": "b2", "_distance": 0.3}]  # shard_b : résultats triés du shard B
+    assert [r["id"] for r in merge_top_k([shard_a, shard_b], 3)] == ["a1", "b1", "b2"] # assert : top-3 global
+
+# Étape 9 — Test de l'index des documents (recherche hiérarchique)
+def test_document_index_centroids_selection_and_updates(tmp_path):              # def : définir la fonction de test
+    """Vérifie le centroïde normalisé par source, la sélection des documents proches et la mise à jour par upsert / suppression."""
+    sources, means, counts = mean_document_vectors(["b.pdf", "a.pdf", "b.pdf"], np.array([[1.0, 0.0], [0.0, 2.0], [0.0, 1.0]])) # mean_document_vectors : regroupement par source
+    assert sources == ["a.pdf", "b.pdf"] and counts.tolist() == [1, 2]          # assert : une ligne par document
+    assert means[1] == pytest.approx([2 ** -0.5, 2 ** -0.5])                    # assert : moyenne normalisée
+
+    index = DocumentIndex(lancedb.connect(str(tmp_path)), "default", EMBEDDING_DIM) # index : table vev_docs_data vide
+    batch = chunks_to_record_batch(make_chunks(3, "a.pdf") + make_chunks(2, "b.pdf"), np.eye(5, EMBEDDING_DIM)) # batch : a.pdf sur les axes 0-2, b.pdf sur les axes 3-4
+    index.add_arrow(batch)                                                      # add_arrow : un centroïde par document
+    assert len(index) == 2 and index.table.count_rows() == 2                    # assert : table et miroir synchronisés
+    assert [r["source"] for r in index.search(np.eye(1, EMBEDDING_DIM, 4)[0], 1)] == ["b.pdf"] # assert : document le plus proche
+
+    index.add_arrow(chunks_to_record_batch(make_chunks(1, "b.pdf"), np.eye(1, EMBEDDING_DIM, 0))) # add_arrow : b.pdf réindexé près de l'axe 0
+    assert index.search(np.eye(1, EMBEDDING_DIM, 0)[0], 1)[0]["source"] == "b.pdf" and len(index) == 2 # assert : centroïde remplacé, pas de doublon
+    index.remove_source("b.pdf")                                                # remove_source : suppression du document
+    assert [r["source"] for r in index.search(np.ones(EMBEDDING_DIM), 5)] == ["a.pdf"] # assert : seul a.pdf reste sélectionnable
+
+# Étape 10 — Test de l'upsert et de la suppression par source
+def test_upsert_removes_stale_chunks_and_delete_bumps_corpus_version(tmp_path, monkeypatch): # def : définir la fonction de test
+    """Vérifie que has_source voit le tampon, qu'un upsert remplace les anciennes lignes (ids aléatoires) et les chunks disparus, et que delete_source change la version du corpus."""
+    store = open_store(tmp_path, monkeypatch)                                   # store : collection vide
+    store.add_chunks(make_chunks(3, "doc.pdf"))                                 # add_chunks : ancienne ingestion (ids uuid), encore en tampon
+    assert store.has_source("doc.pdf") and store.table.count_rows() == 0        # assert : source connue avant toute écriture
+    store.flush()                                                               # flush : écriture des 3 lignes
+
+    store.upsert_chunks(make_document(2, "doc.pdf"))                            # upsert_chunks : réindexation au format déterministe
+    assert sorted(store.table.to_arrow().column("id").to_pylist()) == [make_chunk_id("doc.pdf", i) for i in range(2)] # assert : lignes uuid remplacées, pas de doublon
+    store.upsert_chunks(make_document(4, "other.pdf"))                          # upsert_chunks : nouveau document
+    store.upsert_chunks(make_document(1, "other.pdf"))                          # upsert_chunks : version plus courte du document
+    assert store.table.count_rows("source = 'other.pdf'") == 1                  # assert : chunks disparus supprimés (when_not_matched_by_source_delete)
+
+    version = store.corpus_version                                              # version : avant la suppression
+    assert store.delete_source("other.pdf") == 1                                # assert : un chunk supprimé
+    assert store.corpus_version == version + 1                                  # assert : caches dérivés du corpus invalidés
+    assert not store.has_source("other.pdf") and store.count_rows() == 2        # assert : seul doc.pdf reste visible
+
+# Étape 11 — Test de l'isolation des recherches (instantané épinglé)
+def test_search_pinned_to_snapshot_ignores_concurrent_write_until_refresh(tmp_path, monkeypatch): # def : définir la fonction de test
+    """Vérifie qu'une écriture d'un autre processus n'est visible des recherches qu'après refresh()."""
+    monkeypatch.setattr(vector_store_module, "SNAPSHOT_REFRESH_SECONDS", 3600.0) # SNAPSHOT_REFRESH_SECONDS : pas de rattrapage automatique pendant le test
+    store = open_store(tmp_path, monkeypatch)                                   # store : collection vide
+    store.upsert_chunks(make_document(2, "a.pdf"))                              # upsert_chunks : écriture suivie d'un nouvel instantané
+    version = store.shards[0].read_version                                      # version : instantané courant
+    query_vector = np.random.rand(EMBEDDING_DIM)                                # query_vector : requête quelconque
+
+    other = lancedb.connect(str(tmp_path / "shard_0")).open_table(store.table_name) # other : connexion d'un autre processus
+    other.add(chunks_to_record_batch(make_document(3, "b.pdf"), np.random.rand(3, EMBEDDING_DIM))) # add : écriture concurrente
+    def sources():                                                              # def : fonction locale | sources : documents vus par la jambe vectorielle
+        return {row["source"] for row in store.search_legs("part", 10, query_vector=query_vector)[0]} # return : sources des résultats
+
+    assert sources() == {"a.pdf"} and store.count_rows() == 2                   # assert : l'écriture concurrente est invisible
+    assert store.shards[0].read_version == version                              # assert : instantané inchangé
+    store.refresh()                                                             # refresh : épingler la dernière version
+    assert sources() == {"a.pdf", "b.pdf"} and store.count_rows() == 5          # assert : l'écriture est visible après le rafraîchissement
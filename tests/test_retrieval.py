@@ -1,13 +1,32 @@
 # Objectif — Tester si le pipeline de recherche (HyDE, LanceDB Search, Reranker) fonctionne et si la pertinence est maintenue.
 
 # Étape 1 — Importer les dépendances et les outils du projet
+from datetime import datetime                                                   # from : importer depuis le module datetime | datetime : horodatage de l'ancienne entrée
 import pytest                                                                   # import : charger le framework de test | pytest : outil d'exécution des tests
+import threading                                                                # import : charger le module standard | threading : arrêt du préchauffage
+from time import monotonic                                                      # from : importer l'horloge | monotonic : intervalle entre deux questions rejouées
 import os                                                                       # import : charger le module système | os : pour manipuler les chemins
+import lancedb                                                                  # import : charger la base | lancedb : créer une table à l'ancien schéma
+from concurrent.futures import ThreadPoolExecutor                               # from : importer le pool | ThreadPoolExecutor : vrai pool du pipeline (échéance HyDE)
+import numpy as np                                                              # import : charger le module de calcul | numpy : vecteurs de test
+import pyarrow as pa                                                            # import : charger le module | pyarrow : table à l'ancien schéma
 from unittest.mock import MagicMock                                             # from : importer un outil de simulation | unittest.mock : module de simulation | MagicMock : classe pour simuler des objets
-from src.core.config import RERANK_TOP_K                                        # from : importer la constante | src.core.config : configuration
+from src.core.config import EMBEDDING_DIM, RERANK_ONNX_INT8_FILE, RERANK_TOP_K                         # from : importer les constantes | src.core.config : configuration
+import src.indexing.vector_store as vector_store_module                         # import : charger le module | vector_store_module : rediriger les shards vers un dossier temporaire
+from src.indexing.arrow_writer import CHUNK_SCHEMA, chunks_to_record_batch      # from : importer le schéma | src.indexing.arrow_writer : table "ancienne version" à migrer
+from src.generation.context_packer import ContextPacker                         # from : importer le packer | src.generation.context_packer : contexte borné en tokens
+from src.generation.llm_engine import GENERATION_FAILED_MESSAGE, LLMGenerationError # from : importer l'erreur | src.generation.llm_engine : échec de génération signalé à l'agent
+from src.generation.llm_pool import LLMOverloadedError, QUEUE_FULL_MESSAGE      # from : importer le refus | src.generation.llm_pool : file pleine
+import src.retrieval.cache as cache_module                                      # import : charger le module | cache_module : cache sémantique dans un dossier temporaire
+from src.retrieval.fusion import reciprocal_rank_fusion                         # from : importer la fusion | src.retrieval.fusion : RRF vectorisée
 from src.retrieval.query_expansion import QueryExpander                         # from : importer l'expander | src.retrieval.query_expansion : outil HyDE
-from src.retrieval.reranker import Reranker                                     # from : importer le reranker | src.retrieval.reranker : outil MXBai
-from src.core.schemas import SearchResult, Chunk, SourceMetadata                # from : importer les schémas | src.core.schemas : structures de données
+import src.retrieval.reranker as reranker_module                                # import : charger le module | reranker_module : remplacer le constructeur CrossEncoder
+from src.retrieval.reranker import Reranker, RerankScoreCache                   # from : importer le reranker | src.retrieval.reranker : outil MXBai et cache des scores
+from src.retrieval.result_cache import RetrievalResultCache                     # from : importer le cache | src.retrieval.result_cache : contexte reranqué des questions voisines
+from src.core.schemas import GeneratedAnswer, SearchResult, Chunk, SourceMetadata, make_chunk_id # from : importer les schémas | src.core.schemas : structures de données | make_chunk_id : ids déterministes (source + position)
+from src.core.metrics import metrics                                            # from : importer le registre | src.core.metrics : compteurs HyDE
+import main as main_module                                                      # import : charger le module | main_module : constantes HyDE modifiables par test
+import warmup_cache                                                             # import : charger le script | warmup_cache : préchauffage des caches
 from main import VEVAgent                                                       # from : importer l'agent | main : classe orchestratrice
 
 # Étape 2 — Définir un Fixture (Données de test simulées) - Les fixtures sont des fonctions qui fournissent des données réutilisables aux tests
@@ -16,9 +35,10 @@ def mock_agent():
     # Simuler le LLMEngine pour les tests (pour ne pas démarrer Qwen !)
     llm_mock = MagicMock()                                                      # llm_mock : objet simulé | MagicMock() : crée une fausse implémentation
     llm_mock.generate.return_value = "This is a hypothetical document about the meaning of life." # llm_mock.generate.return_value : la fausse réponse de Qwen pour HyDE
+    llm_mock.count_tokens.side_effect = lambda text: len(text.split())          # llm_mock.count_tokens : un token par mot (budget de contexte calculable)
 
     # Simuler les résultats de recherche LanceDB (simuler des morceaux de texte)
-    def mock_search(query, top_k):                                              # def : définir la fonction de recherche simulée
+    def mock_search(query, top_k, query_vector=None):                           # def : définir la fonction de recherche simulée | query_vector : vecteur déjà encodé par _prepare_answer
         chunks = [                                                              # chunks : liste des morceaux simulés
             Chunk(text=f"High score result {i}", metadata=SourceMetadata(source_type="test", source_path="doc.pdf"), chunk_index=i) # Chunk : création de l'objet Chunk
             for i in range(top_k)                                               # for : boucle pour créer 'top_k' morceaux
@@ -29,11 +49,13 @@ def mock_agent():
     # Créer une fausse instance de l'agent
     agent = VEVAgent()                                                          # agent : instance de l'agent VEV
     agent.llm = llm_mock                                                        # agent.llm : remplacer le vrai LLM par la simulation
+    agent.query_expander.llm = llm_mock                                         # agent.query_expander.llm : HyDE utilise aussi la simulation (pas le pool global)
     agent.vector_store.search = mock_search                                     # agent.vector_store.search : remplacer la vraie recherche par la simulation
     
     # Simuler le Reranker (pour avoir un modèle chargé)
     agent.reranker.model = MagicMock()                                          # agent.reranker.model : simuler le modèle MXBai
-    agent.reranker.model.predict.return_value = [0.95, 0.20, 0.85, 0.10, 0.75]  # agent.reranker.model.predict.return_value : les scores de pertinence du Reranker
+    scores = [0.95, 0.20, 0.85, 0.10, 0.75, 0.30, 0.05, 0.04, 0.03, 0.02]       # scores : pertinence des 10 candidats (ordre de la recherche)
+    agent.reranker.model.predict.side_effect = lambda pairs, **kwargs: np.resize(scores, len(pairs)) # predict : un score par paire, comme le CrossEncoder
     
     return agent                                                                # return : retourner l'agent simulé
 
@@ -52,6 +74,42 @@ def test_query_expansion_hyde_generates_two_queries(mock_agent):
     # 3. Vérifier que le document HyDE a été généré
     assert "hypothetical document" in expanded[1]                                # assert : vérifier que le deuxième élément est le texte simulé du LLM
 
+# Étape 3 bis — Test du HyDE adaptatif (seuils de confiance et cache)
+def test_adaptive_hyde_skips_confident_queries_and_caches_documents():          # def : définir la fonction de test
+    """Vérifie que HyDE est évité si la première recherche est sûre, et qu'un document généré est relu du cache."""
+    llm = MagicMock()                                                           # llm : faux moteur LLM
+    llm.generate.return_value = "A short hypothetical paragraph."               # llm.generate.return_value : faux document HyDE
+    expander = QueryExpander(llm_engine=llm)                                    # expander : HyDE adaptatif
+    metadata = SourceMetadata(source_type="test", source_path="doc.pdf")        # metadata : source simulée
+    def results(scores):                                                        # def : fonction locale | results : SearchResult aux scores donnés
+        return [SearchResult(chunk=Chunk(text=f"r{i}", metadata=metadata, chunk_index=i), score=s, rank=i + 1) for i, s in enumerate(scores)] # return : première recherche simulée
+
+    assert expander.expand_query("Q ?", first_pass=results([0.9, 0.6, 0.5])) == ["Q ?"] # assert : meilleur score net -> pas de LLM
+    assert llm.generate.call_count == 0                                         # assert : aucune génération
+
+    assert len(expander.expand_query("Q ?", first_pass=results([0.3, 0.29, 0.28]))) == 2 # assert : scores bas et plats -> HyDE
+    assert len(expander.expand_query("  q ", first_pass=results([0.3, 0.29, 0.28]))) == 2 # assert : même requête normalisée -> document du cache
+    assert llm.generate.call_count == 1                                         # assert : une seule génération pour les deux appels
+    llm.generate.side_effect = LLMGenerationError(GENERATION_FAILED_MESSAGE)    # generate : moteur en échec
+    assert expander.expand_query("Autre ?", first_pass=results([0.3, 0.29, 0.28])) == ["Autre ?"] # assert : recherche avec la question seule
+
+# Étape 3 ter — Test des reformulations et de la fusion RRF (mode multi-requêtes)
+def test_multi_query_paraphrases_and_rank_fusion():                             # def : définir la fonction de test
+    """Vérifie le découpage des reformulations (un seul appel LLM, cache) et l'ordre de la fusion RRF."""
+    llm = MagicMock()                                                           # llm : faux moteur LLM
+    llm.generate.return_value = "1. Quel est l'objectif du projet ?\n- Quel est le but de ce projet\n\n* À quoi sert ce projet ?" # numéros, puces, ligne vide et doublon de la question
+    expander = QueryExpander(llm_engine=llm)                                    # expander : outil d'expansion
+    variants = expander.paraphrase_queries("Quel est le but de ce projet ?", n=3) # variants : reformulations nettoyées
+    assert variants == ["Quel est l'objectif du projet ?", "À quoi sert ce projet ?"] # assert : puces retirées, question originale écartée
+    assert expander.paraphrase_queries("quel est le but de ce projet", n=3) == variants # assert : relu du cache
+    assert llm.generate.call_count == 1                                         # assert : un seul appel LLM
+
+    ids, scores = reciprocal_rank_fusion([["a", "b", "c"], ["c", "b"], ["b", "d"]]) # ids, scores : fusion de trois classements
+    assert ids == ["b", "c", "a", "d"]                                          # assert : "b" est bien classé partout, "c" deux fois
+    assert scores[0] == pytest.approx(1 / 62 + 1 / 62 + 1 / 61)                 # assert : somme des 1 / (k + rang)
+    assert reciprocal_rank_fusion([["a"], ["b"]])[0] == ["a", "b"]              # assert : égalité -> ordre de première apparition
+    assert reciprocal_rank_fusion([["a"], ["b"]], weights=[1.0, 2.0])[0] == ["b", "a"] # assert : la liste de poids 2 l'emporte
+
 # Étape 4 — Test du Reranking (Scores et Limite)
 def test_reranker_sorts_and_limits_results(mock_agent):                         # def : définir la fonction de test | test_reranker_sorts... : nom
     """Vérifie si le reranker prend bien le TOP_K final avec les bons scores."""
@@ -65,13 +123,289 @@ def test_reranker_sorts_and_limits_results(mock_agent):
     # 3. Vérifier la limite
     assert len(final_results) == RERANK_TOP_K                                   # assert : vérifier que la liste finale est bien limitée à 5 (RERANK_TOP_K)
     
-    # 4. Vérifier l'ordre des scores (le tri doit se baser sur [0.95, 0.85, 0.75, 0.20, 0.10]) - # Le score de 0.95 doit être en première position (rank 1)
+    # 4. Vérifier l'ordre des scores (le tri doit se baser sur [0.95, 0.85, 0.75, 0.30, 0.20]) - # Le score de 0.95 doit être en première position (rank 1)
     assert final_results[0].score == 0.95                                       # assert : vérifier que le meilleur score est en première position
     assert final_results[0].rank == 1                                           # assert : vérifier que le rang est 1
     
     # 5. Vérifier le plus mauvais score gardé (le score 0.10 a été filtré)
     assert final_results[-1].score == 0.20                                      # assert : vérifier que le dernier score est le cinquième plus haut
 
+# Étape 4 bis — Test du cache des scores du Reranker
+def test_reranker_score_cache_scores_only_misses_and_invalidates_by_source():   # def : définir la fonction de test
+    """Vérifie que seules les paires absentes du cache sont notées, sans modifier les résultats reçus, et que la réindexation d'une source purge ses scores."""
+    reranker = Reranker.__new__(Reranker)                                       # reranker : instance sans chargement du modèle
+    reranker.backend, reranker.score_cache = "torch", RerankScoreCache()        # moteur et cache neufs
+    reranker.model = MagicMock()                                                # reranker.model : faux CrossEncoder
+    reranker.model.predict.side_effect = lambda pairs, **kwargs: [len(text) / 100 for _, text in pairs] # score = longueur du texte
+    def results(source, texts):                                                 # def : fonction locale | results : SearchResult d'une source
+        metadata = SourceMetadata(source_type="test", source_path=source)       # metadata : source simulée
+        return [SearchResult(chunk=Chunk(id=make_chunk_id(source, i), text=t, metadata=metadata, chunk_index=i), score=0.5, rank=i + 1) for i, t in enumerate(texts)] # return : résultats de la première recherche
+
+    first = results("a.pdf", ["short", "a much longer text"])                   # first : deux candidats
+    ranked = reranker.rerank("Quel sujet ?", first, top_k=2)                    # ranked : notés par le modèle
+    assert [r.chunk.text for r in ranked] == ["a much longer text", "short"]    # assert : tri par score
+    assert [r.score for r in first] == [0.5, 0.5]                               # assert : objets d'origine intacts
+
+    reranker.rerank("quel sujet", first + results("b.pdf", ["other"]), top_k=3) # même requête normalisée + un nouveau chunk
+    assert len(reranker.model.predict.call_args_list[-1].args[0]) == 1          # assert : seule la paire inconnue est notée
+    assert reranker.score_cache.invalidate_source("a.pdf") == 2                 # assert : les scores de la source réindexée sont retirés
+    assert len(reranker.score_cache) == 1                                       # assert : les autres sources restent en cache
+
+# Étape 4 ter — Test de la cascade (étage cosinus + arrêt anticipé)
+def test_cascade_scores_only_uncertain_band():                                  # def : définir la fonction de test
+    """Vérifie que les candidats loin sous le k-ième cosinus ne sont jamais notés et que la cascade s'arrête quand le top-k est acquis."""
+    reranker = Reranker.__new__(Reranker)                                       # reranker : instance sans chargement du modèle
+    reranker.backend, reranker.score_cache = "torch", RerankScoreCache()        # moteur et cache neufs
+    reranker.model = MagicMock()                                                # reranker.model : faux CrossEncoder
+    reranker.model.predict.side_effect = lambda pairs, **kwargs: [1.0 if "good" in text else 0.0 for _, text in pairs] # "good" = pertinent
+    metadata = SourceMetadata(source_type="test", source_path="doc.pdf")        # metadata : source simulée
+    cosines = [0.99] * 5 + [0.95] * 5 + [0.90] * 5 + [0.10] * 5                 # cosines : trois paliers proches du top-k, un palier très loin
+    results = [                                                                 # results : candidats avec vecteurs 2D (cosinus choisi avec la requête [1, 0])
+        SearchResult(chunk=Chunk(id=f"c{i}", text=("good" if i < 5 else "bad") + f" {i}", vector=[c, (1 - c * c) ** 0.5], metadata=metadata, chunk_index=i), score=0.0, rank=i + 1)
+        for i, c in enumerate(cosines)                                          # for : chaque candidat
+    ]
+    scores = reranker.cascade_scores("question", results, [1.0, 0.0], margin=0.15, gap=0.5) # scores : candidats notés
+    assert len(scores) == 10                                                    # assert : deux lots notés, arrêt avant le troisième (bande de 15), le palier lointain jamais noté
+    assert sorted(scores, key=scores.get, reverse=True)[:5] == [f"c{i}" for i in range(5)] # assert : même top-k que le reranking complet
+
+# Étape 4 quater — Test du contexte borné en tokens
+def test_context_packer_fills_budget_by_relevance_and_trims_sentences():        # def : définir la fonction de test
+    """Vérifie que le budget est respecté, que les chunks entrent par pertinence et qu'un chunk trop long garde les phrases proches de la question."""
+    count_tokens = MagicMock(side_effect=lambda text: len(text.split()))        # count_tokens : un mot = un token
+    packer = ContextPacker(count_tokens=count_tokens)                           # packer : contexte borné
+    metadata = SourceMetadata(source_type="test", source_path="doc.pdf")        # metadata : source simulée
+    long_text = " ".join(["Filler sentence without interest here."] * 20 + ["The launch date of VEV is March."]) # long_text : 126 mots, une seule phrase utile
+    results = [SearchResult(chunk=Chunk(id=f"c{i}", text=t, metadata=metadata, chunk_index=i), score=1.0 - i / 10, rank=i + 1) for i, t in enumerate(["VEV is a local RAG agent.", long_text])] # results : classés par pertinence
+
+    texts = packer.pack("When is the launch date of VEV?", results, budget=60)  # texts : contexte construit
+    assert texts[0] == "VEV is a local RAG agent."                              # assert : le premier chunk tient en entier
+    assert "The launch date of VEV is March." in texts[1] and len(texts[1]) < len(long_text) # assert : chunk réduit, la phrase pertinente est gardée en priorité
+    assert sum(len(t.split()) for t in texts) <= 60                             # assert : budget respecté
+    packer.pack("When?", results, budget=60)                                    # second appel avec les mêmes chunks
+    assert [c.args[0] for c in count_tokens.call_args_list].count(long_text) == 1 # assert : chaque chunk n'est tokenisé qu'une fois
+
+# Étape 4 quinquies — Test des chunks voisins (colonne chunk_index, migration et requête groupée)
+def test_neighbor_expansion_stitches_passages_and_migrates_old_tables(tmp_path, monkeypatch): # def : définir la fonction de test
+    """Vérifie qu'une table sans 'chunk_index' est migrée à l'ouverture et que chaque résultat est remplacé par son passage, sans répéter un chunk."""
+    monkeypatch.setattr(vector_store_module, "shard_uri", lambda shard_id: str(tmp_path / f"shard_{shard_id}")) # shard_uri : base LanceDB temporaire
+    metadata = SourceMetadata(source_type="test", source_path="doc.pdf")        # metadata : source simulée
+    chunks = [Chunk(id=make_chunk_id("doc.pdf", i), text=f"Part {i}.", metadata=metadata, chunk_index=i) for i in range(8)] # chunks : un document de 8 chunks
+    old_schema = CHUNK_SCHEMA.remove(CHUNK_SCHEMA.get_field_index("chunk_index")) # old_schema : schéma d'avant le voisinage
+    batch = chunks_to_record_batch(chunks, np.random.rand(8, EMBEDDING_DIM))    # batch : lignes au format courant
+    old_table = pa.Table.from_batches([batch]).drop_columns(["chunk_index"]).cast(old_schema) # old_table : mêmes lignes sans la colonne
+    lancedb.connect(str(tmp_path / "shard_0")).create_table("vev_rag_data", old_table) # create_table : table "ancienne version"
+
+    store = vector_store_module.VectorStore(embedder=MagicMock(model_name="test-embedder", dimension=EMBEDDING_DIM), num_shards=1) # store : ouverture (migration comprise)
+    assert store.table.to_arrow().column("chunk_index").to_pylist() == list(range(8)) # assert : positions déduites des ids déterministes
+
+    hits = [SearchResult(chunk=chunks[i], score=1.0 - r / 10, rank=r + 1) for r, i in enumerate([4, 5, 0])] # hits : 4 et 5 voisins, 0 en bord de document
+    expanded = store.expand_with_neighbors(hits, window=1)                      # expanded : passages
+    assert [r.chunk.text for r in expanded] == ["Part 3.\nPart 4.\nPart 5.", "Part 0.\nPart 1."] # assert : 5 déjà couvert par le passage de 4, 0 sans voisin à gauche
+    assert [r.score for r in expanded] == [1.0, 0.8]                            # assert : score du résultat conservé
+    assert hits[0].chunk.text == "Part 4."                                      # assert : résultats d'origine intacts
+    assert store.expand_with_neighbors(hits, window=0) == hits                  # assert : voisinage désactivé
+
+# Étape 4 sexies — Test du cache sémantique borné (migration, dédoublonnage, TTL, éviction LRU, invalidation par source)
+def test_semantic_cache_dedupes_expires_and_evicts_least_recently_used(tmp_path, monkeypatch): # def : définir la fonction de test
+    """Vérifie qu'une ancienne table (ligne factice) est migrée, qu'une question quasi identique remplace son entrée, que la maintenance applique TTL et LRU, que le niveau exact sert une question répétée et qu'un document modifié n'invalide que ses réponses."""
+    monkeypatch.setattr(cache_module, "MODELS_DIR", tmp_path)                   # MODELS_DIR : cache dans un dossier temporaire
+    vectors = {q: v / np.linalg.norm(v) for q, v in zip(["old", "q1", "q2", "q3"], np.eye(4, 8) + 0.1)} # vectors : une direction par question
+    vectors["Q1 ?"] = vectors["q1"]                                             # "Q1 ?" : même question, autre formulation
+    embedder = MagicMock(dimension=8)                                           # embedder : faux FastEmbedder
+    embedder.embed_query.side_effect = lambda q: vectors[q]                     # embed_query : vecteur fixe par question
+    lancedb.connect(str(tmp_path / "lancedb_cache")).create_table("semantic_cache", data=[ # create_table : table au format d'origine
+        {"query": "", "answer": "", "embedding": [0.0] * 8, "ts": ""},          # ligne factice
+        {"query": "old", "answer": "old answer", "embedding": vectors["old"].tolist(), "ts": datetime.utcnow().isoformat()}]) # ancienne réponse
+
+    cache = cache_module.init_semantic_cache(embedder)                          # cache : table migrée
+    assert cache.table.count_rows() == 1 and cache.lookup("old")["answer"] == "old answer" # assert : ligne factice retirée, réponse conservée
+    cache.store("q1", "first"); cache.store("Q1 ?", "second")                   # même question deux fois
+    assert cache.table.count_rows() == 2 and cache.lookup("q1")["answer"] == "second" # assert : entrée remplacée, pas de doublon
+    assert cache.lookup("  Q1 ")["answer"] == "second"                          # assert : même question normalisée servie par le niveau exact (aucun vecteur connu pour ce texte)
+
+    results = {source: [SearchResult(chunk=Chunk(id=f"{source}#0", text="t", metadata=SourceMetadata(source_type="pdf", source_path=source), chunk_index=0), score=0.9, rank=1)] for source in ("a.pdf", "b.pdf")} # results : contexte d'une réponse par document
+    cache.store("q2", "a2", results["a.pdf"], 1); cache.store("q3", "a3", results["b.pdf"], 1) # deux entrées de plus, construites sur deux documents
+    cache.lookup("old")                                                         # "old" redevient récemment utilisée
+    cache.max_entries = 3                                                       # borne atteinte
+    cache.maintain()                                                            # maintenance : accès écrits puis éviction
+    assert sorted(cache.table.to_arrow().column("query").to_pylist()) == ["old", "q2", "q3"] # assert : l'entrée de q1 (dernier accès avant l'ajout de q2) évincée
+    assert cache.invalidate_source("a.pdf") == 1                                # assert : seule la réponse construite sur a.pdf est retirée
+    hit = cache.lookup("q3")                                                    # hit : entrée restante
+    assert (hit["answer"], hit["chunk_ids"], hit["sources"], hit["corpus_version"]) == ("a3", ["b.pdf#0"], ["b.pdf"], 1) # assert : sources restituées avec la réponse
+    cache.ttl_seconds = 1e-6                                                    # tout est expiré
+    assert cache.lookup("q3") is None                                           # assert : une entrée expirée n'est jamais servie
+    cache.maintain()                                                            # maintenance : suppression des entrées expirées
+    assert cache.table.count_rows() == 0                                        # assert : table vidée
+
+# Étape 4 septies — Test du cache des résultats (question voisine, seuil propre, version du corpus)
+def test_retrieval_result_cache_serves_paraphrases_of_the_same_corpus_version(): # def : définir la fonction de test
+    """Vérifie qu'une question voisine réutilise les chunks reranqués et qu'un corpus modifié ou une autre collection ne les réutilise jamais."""
+    cache = RetrievalResultCache(threshold=0.85, max_entries=2)                 # cache : deux entrées au plus
+    metadata = SourceMetadata(source_type="test", source_path="doc.pdf")        # metadata : source commune
+    results = [SearchResult(chunk=Chunk(id=f"c{i}", text=f"t{i}", metadata=metadata, chunk_index=i), score=0.9 - i / 10, rank=i + 1) for i in range(3)] # results : contexte reranqué
+    cache.put("data", np.array([1.0, 0.0, 0.0]), results, corpus_version=3)     # put : question d'origine
+    ids, scores = cache.lookup("data", np.array([0.95, 0.2, 0.0]), corpus_version=3) # lookup : reformulation (cosinus ~0.98)
+    assert ids == ["c0", "c1", "c2"] and np.allclose(scores, [0.9, 0.8, 0.7])   # assert : ordre et scores du reranker conservés
+    assert cache.lookup("data", np.array([0.5, 0.8, 0.0]), corpus_version=3) is None # assert : sous le seuil (cosinus ~0.53)
+    assert cache.lookup("team", np.array([1.0, 0.0, 0.0]), corpus_version=3) is None # assert : autre collection
+    assert cache.lookup("data", np.array([1.0, 0.0, 0.0]), corpus_version=4) is None and len(cache) == 0 # assert : corpus modifié -> entrée périmée retirée
+
+# Étape 4 octies — Test de la réponse en streaming (tokens au fil du décodage, réponse structurée à la fin)
+def test_ask_query_stream_yields_tokens_then_assembles_the_answer():            # def : définir la fonction de test
+    """Vérifie que les tokens sont rendus un par un, que la réponse complète passe par finish (cache), qu'une réponse en cache est rendue d'un coup et qu'un échec n'est pas mis en cache."""
+    agent = MagicMock()                                                         # agent : pipeline simulé (recherche et prompt déjà testés ailleurs)
+    agent.llm.generate_stream.return_value = iter(["La ", "réponse", "."])      # generate_stream : trois tokens
+    finish = MagicMock(side_effect=lambda text, failed=False: GeneratedAnswer(query="q", answer=text, sources=[], processing_time=0.1)) # finish : mise en cache + réponse structurée
+    agent._prepare_answer.return_value = (None, "prompt", finish)               # _prepare_answer : prompt prêt, rien en cache
+    stream = VEVAgent.ask_query_stream(agent, "q")                              # stream : flux de la réponse
+    assert stream.answer is None and not agent._prepare_answer.called           # assert : rien n'est calculé avant la première itération
+    assert list(stream) == ["La ", "réponse", "."]                              # assert : tokens dans l'ordre du décodage
+    finish.assert_called_once_with("La réponse.")                               # assert : texte complet mis en cache
+    assert stream.answer.answer == "La réponse."                                # assert : réponse structurée disponible à la fin
+
+    cached = GeneratedAnswer(query="q", answer="En cache.", sources=[], processing_time=0.0) # cached : réponse du cache sémantique
+    agent._prepare_answer.return_value = (cached, "", None)                     # _prepare_answer : réponse immédiate
+    stream = VEVAgent.ask_query_stream(agent, "q")                              # stream : nouveau flux
+    assert list(stream) == ["En cache."] and stream.answer is cached            # assert : texte entier d'un coup, sans génération
+
+    def tokens_then_failure(**kwargs):                                          # def : fonction locale | tokens_then_failure : contexte plein en cours de décodage
+        yield "La "                                                             # yield : début de réponse
+        raise LLMGenerationError(GENERATION_FAILED_MESSAGE)                     # raise : échec llama.cpp
+    agent._prepare_answer.return_value = (None, "prompt", finish)               # _prepare_answer : génération à faire
+    agent.llm.generate_stream.side_effect = tokens_then_failure                 # generate_stream : échoue après un token
+    assert list(VEVAgent.ask_query_stream(agent, "q")) == ["La ", f"\n{GENERATION_FAILED_MESSAGE}"] # assert : message d'erreur à la suite du texte affiché
+    finish.assert_called_with(f"La \n{GENERATION_FAILED_MESSAGE}", failed=True) # assert : réponse signalée en échec (pas de mise en cache)
+    agent.llm.generate.side_effect = LLMOverloadedError(QUEUE_FULL_MESSAGE)     # generate : file du pool pleine
+    assert VEVAgent.ask_query(agent, "q").answer == QUEUE_FULL_MESSAGE          # assert : message de surcharge rendu tel quel
+    finish.assert_called_with(QUEUE_FULL_MESSAGE, failed=True)                  # assert : jamais mis en cache
+
+# Étape 4 nonies — Test de la suppression d'une collection (tampon, minuterie et cache)
+def test_drop_collection_discards_buffered_rows_and_existing_cache_only(tmp_path, monkeypatch): # def : définir la fonction de test
+    """Vérifie qu'une collection créée puis alimentée (une partie encore en tampon) disparaît avec son cache, que son écrivain est fermé et qu'aucune table de cache n'est créée pour rien."""
+    monkeypatch.setattr(vector_store_module, "shard_uri", lambda shard_id: str(tmp_path / f"shard_{shard_id}")) # shard_uri : bases LanceDB temporaires
+    monkeypatch.setattr(cache_module, "MODELS_DIR", tmp_path)                   # MODELS_DIR : caches dans un dossier temporaire
+    embedder = MagicMock(model_name="test-embedder", dimension=EMBEDDING_DIM)   # embedder : faux FastEmbedder
+    embedder.embed_documents.side_effect = lambda texts: list(np.random.rand(len(texts), EMBEDDING_DIM)) # embed_documents : vecteurs aléatoires
+    agent = MagicMock(stores={}, caches={}, cache=None, embedder=embedder, retrieval_cache=RetrievalResultCache()) # agent : état de VEVAgent sans les modèles
+    agent.vector_store = vector_store_module.VectorStore(embedder=embedder, num_shards=1) # vector_store : collection par défaut (registre)
+
+    team = VEVAgent.get_store(agent, "team")                                    # team : nouvelle collection
+    metadata = SourceMetadata(source_type="test", source_path="doc.pdf")        # metadata : source simulée
+    chunks = [Chunk(id=make_chunk_id("doc.pdf", i), text=f"t{i}", metadata=metadata, chunk_index=i) for i in range(4)] # chunks : un document
+    team.add_chunks(chunks[:2]); team.flush()                                   # deux lignes écrites
+    team.add_chunks(chunks[2:])                                                 # deux lignes en tampon (ingestion sans flush)
+    cache_module.init_semantic_cache(embedder, "team")                          # table de cache laissée par une session précédente
+    writer = team.shards[0].writer                                              # writer : tampon du shard
+
+    VEVAgent.drop_collection(agent, "team")                                     # drop_collection : suppression complète
+    assert "team" not in agent.vector_store.registry.names() and "team" not in agent.stores # assert : collection oubliée
+    assert writer.pending_rows == 0 and writer._timer.finished.is_set()         # assert : tampon abandonné, minuterie annulée
+    with pytest.raises(RuntimeError):                                           # pytest.raises : l'écrivain est fermé
+        writer.add(chunks[:1], np.random.rand(1, EMBEDDING_DIM))                # add : refusé
+    cache_tables = lancedb.connect(str(tmp_path / "lancedb_cache")).table_names # cache_tables : tables du cache sémantique
+    assert cache_module.cache_table_name("team") not in cache_tables()          # assert : cache existant supprimé
+
+    VEVAgent.get_store(agent, "solo")                                           # solo : collection sans cache
+    VEVAgent.drop_collection(agent, "solo")                                     # drop_collection : pas de table de cache à supprimer
+    assert cache_module.cache_table_name("solo") not in cache_tables()          # assert : aucune table créée pour être supprimée aussitôt
+
+# Étape 4 decies — Test de l'échéance HyDE (génération interrompue, repli sur la première recherche)
+def test_retrieve_stops_late_hyde_and_falls_back_when_hyde_fails(monkeypatch):  # def : définir la fonction de test
+    """Vérifie qu'un HyDE trop lent est interrompu (hyde_stop) et qu'un HyDE en échec laisse la première recherche seule."""
+    monkeypatch.setattr(main_module, "QUERY_EXPANSION_MODE", "hyde")            # QUERY_EXPANSION_MODE : mode HyDE
+    monkeypatch.setattr(main_module, "HYDE_DEADLINE_SECONDS", 0.05)             # HYDE_DEADLINE_SECONDS : échéance courte
+    metadata = SourceMetadata(source_type="test", source_path="doc.pdf")        # metadata : source simulée
+    first_pass = [SearchResult(chunk=Chunk(text=f"r{i}", metadata=metadata, chunk_index=i), score=1 - i / 10, rank=i + 1) for i in range(RERANK_TOP_K + 2)] # first_pass : première recherche
+    search_future = MagicMock(**{"result.return_value": first_pass})            # search_future : recherche déjà terminée
+    agent = MagicMock(pipeline_pool=ThreadPoolExecutor(max_workers=1))          # agent : vrai pool du pipeline, reste simulé
+    agent.query_expander.should_expand.return_value = True                      # should_expand : première recherche peu sûre
+    agent.reranker.rerank.side_effect = lambda query, results, top_k, query_vector: list(results) # rerank : scores inchangés
+    stops = []                                                                  # stops : événements d'arrêt reçus par HyDE
+    def slow_hyde(query, store, stop):                                          # def : fonction locale | slow_hyde : génération qui dépasse l'échéance
+        stops.append(stop)                                                      # append : mémoriser l'événement
+        stop.wait(5)                                                            # wait : rend la main dès que l'agent abandonne
+        return []                                                               # return : aucun candidat
+    agent._hyde_search.side_effect = slow_hyde                                  # _hyde_search : HyDE trop lent
+    missed = metrics.snapshot()["counters"].get("hyde.deadline_missed", 0)      # missed : compteur avant l'appel
+
+    context = VEVAgent._retrieve(agent, "q", MagicMock(), None, search_future)  # context : contexte reranqué
+    assert [r.chunk.text for r in context] == [f"r{i}" for i in range(RERANK_TOP_K)] # assert : première recherche seule
+    assert stops[0].is_set()                                                    # assert : génération interrompue
+    assert metrics.snapshot()["counters"]["hyde.deadline_missed"] == missed + 1 # assert : échéance manquée comptée
+
+    agent._hyde_search.side_effect = RuntimeError("embedding failed")           # _hyde_search : HyDE en échec
+    failures = metrics.snapshot()["counters"].get("hyde.failures", 0)           # failures : compteur avant l'appel
+    context = VEVAgent._retrieve(agent, "q", MagicMock(), None, search_future)  # context : contexte reranqué
+    assert [r.chunk.text for r in context] == [f"r{i}" for i in range(RERANK_TOP_K)] # assert : repli sur la première recherche
+    assert metrics.snapshot()["counters"]["hyde.failures"] == failures + 1      # assert : échec compté
+    agent.pipeline_pool.shutdown()                                              # shutdown : libérer le thread
+
+# Étape 4 undecies — Test du choix du moteur du CrossEncoder (torch, ONNX, ONNX int8)
+def test_load_cross_encoder_selects_backend_and_reranker_falls_back_to_torch(monkeypatch): # def : définir la fonction de test
+    """Vérifie les arguments passés au CrossEncoder pour chaque moteur, le refus d'un moteur inconnu et le repli PyTorch."""
+    cross_encoder = MagicMock()                                                 # cross_encoder : faux constructeur CrossEncoder
+    monkeypatch.setattr(reranker_module, "CrossEncoder", cross_encoder)         # CrossEncoder : aucun modèle téléchargé
+
+    reranker_module.load_cross_encoder("torch", max_length=128)                 # torch : moteur historique
+    assert cross_encoder.call_args.kwargs == {"max_length": 128}                # assert : pas d'argument ONNX
+    reranker_module.load_cross_encoder("onnx", max_length=128)                  # onnx : ONNX Runtime
+    assert cross_encoder.call_args.kwargs == {"max_length": 128, "backend": "onnx", "model_kwargs": None} # assert : fichier ONNX par défaut
+    reranker_module.load_cross_encoder("onnx-int8", max_length=128)             # onnx-int8 : modèle quantifié
+    assert cross_encoder.call_args.kwargs["model_kwargs"] == {"file_name": RERANK_ONNX_INT8_FILE} # assert : fichier int8 demandé
+    with pytest.raises(ValueError):                                             # pytest.raises : moteur inconnu refusé
+        reranker_module.load_cross_encoder("tensorrt")                          # load_cross_encoder : configuration invalide
+
+    def onnx_missing(name, **kwargs):                                           # def : fonction locale | onnx_missing : ONNX Runtime absent, PyTorch présent
+        if "backend" in kwargs:                                                 # if : moteur ONNX demandé
+            raise ImportError("onnxruntime is not installed")                   # raise : comme sans optimum / onnxruntime
+        return MagicMock()                                                      # return : modèle PyTorch simulé
+    cross_encoder.side_effect = onnx_missing                                    # side_effect : premier chargement en échec
+    reranker = Reranker(backend="onnx")                                         # reranker : ONNX demandé
+    assert reranker.backend == "torch" and reranker.model is not None           # assert : repli sur PyTorch
+
+# Étape 4 duodecies — Test des lots triés par longueur
+def test_reranker_predict_sorts_pairs_by_length_and_restores_order():           # def : définir la fonction de test
+    """Vérifie que le modèle reçoit les paires triées par longueur et que les scores reviennent dans l'ordre d'origine."""
+    reranker = Reranker.__new__(Reranker)                                       # reranker : sans chargement de modèle
+    reranker.model = MagicMock()                                                # model : faux CrossEncoder
+    reranker.model.predict.side_effect = lambda pairs, **kwargs: [float(len(text)) for _, text in pairs] # predict : score = longueur du texte
+    pairs = [("q", "x" * 30), ("q", "x" * 10), ("q", "x" * 20), ("q", "x" * 10)] # pairs : longueurs dans le désordre
+
+    scores = reranker.predict(pairs)                                            # scores : un score par paire
+    assert [len(text) for _, text in reranker.model.predict.call_args.args[0]] == [10, 10, 20, 30] # assert : lot trié par longueur
+    assert scores.tolist() == [30.0, 10.0, 20.0, 10.0]                          # assert : scores remis dans l'ordre d'origine
+
+    reranker.model.predict.side_effect = lambda pairs, **kwargs: [0.5]          # predict : un seul score pour quatre paires
+    with pytest.raises(ValueError, match="1 scores for 4 pairs"):               # pytest.raises : décalage refusé
+        reranker.predict(pairs)                                                 # predict : erreur explicite
+
+# Étape 4 terdecies — Test du préchauffage (lecture des questions, dédoublonnage, débit limité)
+def test_warmup_reads_dedupes_and_replays_queries_at_limited_rate(tmp_path):    # def : définir la fonction de test
+    """Vérifie la lecture des fichiers .txt numérotés et .jsonl, le tri par fréquence, le débit maximal et l'arrêt du préchauffage."""
+    text_file = tmp_path / "Test_queries_ai.txt"                                # text_file : format des fichiers de tests
+    text_file.write_text('### Text\n\n1. "What is AI?"\nExpected answer: A field.\n\n2) "Who coined it?"\n', encoding="utf-8") # write_text : questions numérotées
+    log_file = tmp_path / "queries.jsonl"                                       # log_file : journal de requêtes
+    log_file.write_text('{"query": "who coined it?"}\n\n{"question": "What is RAG?"}\n{"query": "Who coined it?"}\n{"other": 1}\n', encoding="utf-8") # write_text : champ query ou question
+    assert warmup_cache.read_queries(text_file) == ["What is AI?", "Who coined it?"] # assert : titres et réponses attendues ignorés
+    assert warmup_cache.read_queries(log_file) == ["who coined it?", "What is RAG?", "Who coined it?"] # assert : lignes vides et sans question ignorées
+
+    queries = warmup_cache.select_queries(warmup_cache.read_queries(text_file) + warmup_cache.read_queries(log_file)) # queries : questions dédoublonnées
+    assert queries == ["Who coined it?", "What is AI?", "What is RAG?"]         # assert : la plus posée d'abord, sous sa formulation la plus fréquente
+    assert warmup_cache.select_queries(queries * 2 + ["what is rag"], top=1) == ["What is RAG?"] # assert : top N par fréquence
+
+    agent = MagicMock()                                                         # agent : faux VEVAgent
+    started = []                                                                # started : instant de chaque question
+    agent.ask_query.side_effect = lambda query, collection=None: started.append(monotonic()) or MagicMock(processing_time=0.0) # ask_query : réponse immédiate
+    stats = warmup_cache.warm_up(agent, queries, collection="team", qps=20)     # stats : trois questions à 20 par seconde au plus
+    assert stats == {"warmed": 3, "failed": 0} and agent.ask_query.call_args.kwargs == {"collection": "team"} # assert : toutes rejouées sur la collection
+    assert all(later - earlier >= 0.045 for earlier, later in zip(started, started[1:])) # assert : au moins 1/qps secondes entre deux questions
+
+    stop_event = threading.Event()                                              # stop_event : arrêt du préchauffage (fermeture de l'application)
+    agent.ask_query.side_effect = lambda query, collection=None: stop_event.set() or MagicMock(processing_time=0.0) # ask_query : arrêt demandé pendant la première question
+    assert warmup_cache.warm_up(agent, queries, qps=0, stop_event=stop_event) == {"warmed": 1, "failed": 0} # assert : questions suivantes abandonnées
+    agent.ask_query.side_effect = RuntimeError("LLM busy")                      # ask_query : échec
+    assert warmup_cache.warm_up(agent, queries[:1], qps=0) == {"warmed": 0, "failed": 1} # assert : échec compté sans interrompre
+
 # Étape 5 — Test de l'Intégration du Pipeline (Demander une requête complète)
 def test_full_rag_pipeline_returns_generated_answer(mock_agent):                 # def : définir la fonction de test | test_full_rag_pipeline... : nom
     """Vérifie si l'appel final renvoie l'objet GeneratedAnswer avec des sources."""
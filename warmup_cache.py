@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Script pour préchauffer le cache sémantique de VEV RAG (après un déploiement ou un clear_cache.py)
+
+Rejoue une liste de questions dans le pipeline complet, à débit limité, pour que les
+premiers utilisateurs trouvent leurs réponses déjà en cache.
+
+Lancé comme script, seul le niveau persistant est conservé : les réponses écrites dans
+la table LanceDB du cache sémantique. Le niveau exact et le cache des résultats reranqués
+vivent dans la mémoire du processus et disparaissent avec lui ; pour les remplir aussi,
+définir WARMUP_QUERY_FILES : app.py rejoue alors les questions dans un thread d'arrière-plan
+au démarrage (start_background_warmup).
+
+Usage:
+    python warmup_cache.py                                   # Questions de data/Test_queries_*.txt
+    python warmup_cache.py logs/queries.jsonl --top 200      # 200 questions les plus fréquentes d'un journal JSONL
+    python warmup_cache.py questions.txt --qps 0.1           # Une question toutes les 10 secondes au plus
+    python warmup_cache.py --dry-run                         # Lister les questions sans les exécuter
+"""
+
+import argparse
+import json
+import os
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+from time import monotonic
+from typing import Dict, Iterable, List, Optional
+
+from src.retrieval.query_expansion import normalize_query
+
+# Chemins par défaut
+PROJECT_ROOT = Path(__file__).parent
+DEFAULT_QUERY_FILES = sorted((PROJECT_ROOT / "data").glob("Test_queries_*.txt"))
+
+NUMBERED_QUESTION = re.compile(r'^\s*\d+[.)]\s*"?(.+?)"?\s*$')                  # 1. "Question ?" (format des fichiers Test_queries_*.txt)
+
+
+def read_queries(path: Path, field: str = "query") -> List[str]:
+    """Lit les questions d'un fichier : .jsonl (une requête par ligne, champ `field`) ou texte (une question par ligne)."""
+    lines = path.read_text(encoding="utf-8").splitlines()
+    if path.suffix == ".jsonl":
+        queries = []
+        for line in lines:
+            if line.strip():
+                record = json.loads(line)
+                query = record.get(field) or record.get("question")    # question : nom de champ alternatif
+                if query:
+                    queries.append(str(query))
+        return queries
+    numbered = [m.group(1) for m in map(NUMBERED_QUESTION.match, lines) if m]
+    if numbered:                                                                # fichiers de tests : lignes "Expected answer" et titres ignorés
+        return numbered
+    return [line.strip() for line in lines if line.strip() and not line.lstrip().startswith("#")]
+
+
+def select_queries(queries: Iterable[str], top: Optional[int] = None) -> List[str]:
+    """Dédoublonne par question normalisée et trie par fréquence (les plus posées d'abord, formulation la plus fréquente)."""
+    counts = Counter()
+    wordings: Dict[str, Counter] = {}
+    for query in queries:
+        key = normalize_query(query)
+        if key:
+            counts[key] += 1
+            wordings.setdefault(key, Counter())[query.strip()] += 1
+    return [wordings[key].most_common(1)[0][0] for key, _ in counts.most_common(top)]
+
+
+def warm_up(agent, queries: List[str], collection: Optional[str] = None, qps: float = 0.2,
+            stop_event: Optional[threading.Event] = None) -> Dict[str, int]:
+    """Rejoue les questions dans agent.ask_query, au plus `qps` questions par seconde (0 = sans limite)."""
+    interval = 1.0 / qps if qps > 0 else 0.0
+    stop_event = stop_event or threading.Event()
+    stats = {"warmed": 0, "failed": 0}
+    next_start = monotonic()
+    for i, query in enumerate(queries, 1):
+        if stop_event.wait(max(0.0, next_start - monotonic())):                 # attente du créneau (interruptible)
+            break
+        next_start = monotonic() + interval                                     # débit limité : la génération compte dans l'intervalle
+        try:
+            answer = agent.ask_query(query, collection=collection)
+            stats["warmed"] += 1
+            print(f"[{i}/{len(queries)}] {answer.processing_time:6.2f}s  {query}")
+        except Exception as e:
+            stats["failed"] += 1
+            print(f"[{i}/{len(queries)}] ❌ {query}: {e}")
+    return stats
+
+
+def start_background_warmup(agent, files: List[Path], qps: float, field: str = "query",
+                            top: Optional[int] = None) -> Optional[threading.Thread]:
+    """Préchauffe depuis le processus de service (tous les niveaux du cache), dans un thread démon."""
+    queries = select_queries((query for path in files if path.exists() for query in read_queries(path, field)), top)
+    if not queries:
+        return None
+    thread = threading.Thread(target=warm_up, args=(agent, queries), kwargs={"qps": qps},
+                              name="vev-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Préchauffer le cache sémantique de VEV RAG en rejouant des questions"
+    )
+    parser.add_argument(
+        "files",
+        nargs="*",
+        type=Path,
+        default=DEFAULT_QUERY_FILES,
+        help="Fichiers de questions (.txt ou .jsonl), par défaut data/Test_queries_*.txt"
+    )
+    parser.add_argument(
+        "--field",
+        default="query",
+        help="Champ de la question dans les fichiers .jsonl"
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=None,
+        help="Ne rejouer que les N questions les plus fréquentes"
+    )
+    parser.add_argument(
+        "--collection",
+        default=None,
+        help="Collection interrogée (défaut : collection par défaut)"
+    )
+    parser.add_argument(
+        "--qps",
+        type=float,
+        default=0.2,
+        help="Questions par seconde au plus (0 = sans limite), pour ne pas ralentir le trafic réel"
+    )
+    parser.add_argument(
+        "--nice",
+        type=int,
+        default=10,
+        help="Priorité CPU réduite du processus (POSIX), le trafic réel reste prioritaire"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Lister les questions sans les exécuter"
+    )
+
+    args = parser.parse_args()
+
+    queries = select_queries((query for path in args.files for query in read_queries(path, args.field)), args.top)
+
+    print("\n" + "="*60)
+    print(f"🔥 VEV RAG - Préchauffage du Cache ({len(queries)} questions)")
+    print("="*60 + "\n")
+
+    if args.dry_run or not queries:
+        for query in queries:
+            print(f"  - {query}")
+        return
+
+    if args.nice and hasattr(os, "nice"):
+        os.nice(args.nice)
+
+    from main import VEVAgent                                                   # import tardif : --dry-run n'ouvre ni LanceDB ni le reranker
+    from src.retrieval.cache import init_semantic_cache
+
+    try:
+        agent = VEVAgent()
+    except RuntimeError:
+        print("❌ Agent indisponible (modèle LLM manquant ?)")
+        return
+    agent.cache = init_semantic_cache(embedder=agent.embedder)                  # même cache que app.py
+    if agent.cache is None:
+        print("❌ Cache sémantique indisponible, rien à préchauffer")
+        return
+
+    stats = warm_up(agent, queries, collection=args.collection, qps=args.qps)
+
+    print("\n" + "="*60)
+    print(f"✅ Préchauffage terminé : {stats['warmed']} réponses en cache LanceDB, {stats['failed']} échecs")
+    print("="*60)
+
+
+if __name__ == "__main__":
+    main()